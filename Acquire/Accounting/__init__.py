@@ -19,6 +19,7 @@ from ._lineitem import *
 from ._receipt import *
 from ._decimal import *
 from ._transactioninfo import *
+from ._transactionkeys import *
 from ._ledger import *
 from ._refund import *
 
@@ -1,6 +1,17 @@
 
 __all__ = ["Account"]
 
+# the number of seconds after which a line item that is still pending
+# in the running balance of an account is reconciled by a reader
+_pending_timeout = 600
+
+# the maximum number of attempts to make to update the running balance
+# of an account before giving up, and the smallest and largest time
+# (in seconds) to back off between contended attempts
+_max_balance_attempts = 20
+_min_backoff = 0.01
+_max_backoff = 1.0
+
 
 def _account_root():
     return "accounting/accounts"
@@ -41,6 +52,20 @@ def _get_hourly_datetime(datetime):
                               tzinfo=datetime.tzinfo)
 
 
+def _get_daily_datetime(datetime):
+    """Return the datetime for the start of the day of 'datetime',
+       e.g. 5.42pm on April 3rd would return midnight on April 3rd
+    """
+    return _get_hourly_datetime(datetime).replace(hour=0)
+
+
+def _get_monthly_datetime(datetime):
+    """Return the datetime for the start of the month of 'datetime',
+       e.g. 5.42pm on April 3rd would return midnight on April 1st
+    """
+    return _get_daily_datetime(datetime).replace(day=1)
+
+
 def _get_key_from_hour(start, datetime):
     """Return a key encoding the passed date, starting the key with 'start',
        but only up unto the specified hour
@@ -92,6 +117,77 @@ def _get_hour_from_key(key):
         raise AccountError("Could not find a date in the key '%s'" % key)
 
 
+def _get_date_from_key(key):
+    """Return the datetime of the start of the day or month that is
+       encoded in the passed daily or monthly balance key
+    """
+    import re as _re
+    m = _re.search(r"(\d\d\d\d)-(\d\d)(-(\d\d))?$", key)
+
+    if m:
+        from Acquire.ObjectStore import date_and_time_to_datetime \
+            as _date_and_time_to_datetime
+        import datetime as _datetime
+
+        day = m.groups()[3]
+
+        if day is None:
+            day = 1
+
+        return _date_and_time_to_datetime(
+                    _datetime.date(year=int(m.groups()[0]),
+                                   month=int(m.groups()[1]),
+                                   day=int(day)),
+                    _datetime.time())
+    else:
+        from Acquire.Accounting import AccountError
+        raise AccountError("Could not find a date in the key '%s'" % key)
+
+
+def _find_last_key_before(bucket, prefix, delimiters, before):
+    """Return the last key that starts with 'prefix' that sorts at or
+       before 'before', or None if there is no such key. The keys are
+       searched level by level, using each of 'delimiters' in turn
+       to list the next level of the keys
+    """
+    from Acquire.ObjectStore import ObjectStore as _ObjectStore
+    from Acquire.ObjectStore import ObjectStoreError as _ObjectStoreError
+
+    try:
+        (prefixes, names) = _ObjectStore.list_prefixes(
+                                    bucket=bucket, prefix=prefix,
+                                    delimiter=delimiters[0])
+    except _ObjectStoreError:
+        # there are no keys with this prefix. Any other error is
+        # raised, rather than hidden by re-summing from the start
+        return None
+
+    if len(delimiters) == 1:
+        # this is the last level, so just look at the objects
+        prefixes = []
+
+    children = [(name, False) for name in names] + \
+               [(p, True) for p in prefixes]
+
+    for (child, is_prefix) in sorted(children, reverse=True):
+        if is_prefix:
+            if child > before and not before.startswith(child):
+                # every key below this prefix is after 'before'
+                continue
+
+            key = _find_last_key_before(bucket=bucket, prefix=child,
+                                        delimiters=delimiters[1:],
+                                        before=before)
+
+            if key is not None:
+                return key
+
+        elif child <= before:
+            return child
+
+    return None
+
+
 def _get_datetime_from_key(key):
     """Return the datetime that is encoded in the passed key
 
@@ -122,6 +218,20 @@ def _get_datetime_from_key(key):
         raise AccountError("Could not find a datetime in the key '%s'" % key)
 
 
+def _get_time_ordered_key(key):
+    """Return the passed transaction key (without the account prefix)
+       in a form that sorts in time order. The key starts with the
+       datetime, which is written without microseconds for a whole
+       number of seconds. Such a key ('...:01/uid') would otherwise
+       sort after the keys in the same second with microseconds
+       ('...:01.300000/uid')
+    """
+    if len(key) > 19 and key[19] == "/":
+        return "%s.000000%s" % (key[0:19], key[19:])
+    else:
+        return key
+
+
 def _sum_transactions(transactions):
     """Internal function that sums all of the transactions identified
     by the passed keys.  by the passed keys. This returns a tuple of
@@ -136,6 +246,13 @@ def _sum_transactions(transactions):
     """
     from Acquire.Accounting import Balance as _Balance
     from Acquire.Accounting import TransactionInfo as _TransactionInfo
+    from Acquire.Accounting import TransactionKeys as _TransactionKeys
+
+    transactions = list(transactions)
+
+    if all(isinstance(t, str) for t in transactions):
+        # decode and sum the keys in bulk using integer arithmetic
+        return _TransactionKeys(transactions).sum()
 
     balance = _Balance()
 
@@ -294,16 +411,32 @@ class Account:
         # make sure that this is saved to the object store
         self._save_account(bucket)
 
-    def _get_transactions_between(self, start_datetime, end_datetime,
-                                  bucket=None):
-        """Return all of the object store keys for transactions in this
-           account beteen 'start_datetime' and 'end_datetime' (inclusive, e.g.
-           start_datetime < transaction <= end_datetime). This will return an
-           empty list if there were no transactions in this time
+        # a new account starts with a running balance of zero
+        from Acquire.Accounting import Balance as _Balance
+        self._save_new_running_balance(_Balance(), bucket=bucket)
+
+    def _iter_transaction_keys_between(self, start_datetime, end_datetime,
+                                       page_size=None, start_after=None,
+                                       bucket=None):
+        """Iterate over the keys of all transactions in this account
+           that could lie between 'start_datetime' and 'end_datetime',
+           in time order. Transaction keys sort by the time of the
+           transaction, so this is a single ordered listing of the object
+           store that starts at 'start_datetime' and stops after
+           'end_datetime'. The keys are not decoded, so they include
+           transactions up to a second either side of the range, which
+           the caller must filter out. The keys within each second are
+           sorted in time order (see _get_time_ordered_key) before they
+           are returned. The listing is resumed after the transaction
+           key 'start_after' (in this order) if this is passed, and
+           is read from the object store 'page_size' keys at a time
         """
-        # convert both times to UTC
         from Acquire.ObjectStore import datetime_to_datetime \
             as _datetime_to_datetime
+        from Acquire.ObjectStore import datetime_to_string \
+            as _datetime_to_string
+        from Acquire.ObjectStore import ObjectStore as _ObjectStore
+        from Acquire.ObjectStore import ObjectStoreError as _ObjectStoreError
         import datetime as _datetime
 
         if start_datetime is None or end_datetime is None:
@@ -312,70 +445,202 @@ class Account:
         start_datetime = _datetime_to_datetime(start_datetime)
         end_datetime = _datetime_to_datetime(end_datetime)
 
-        # get the day for each time
-        start_day = start_datetime.toordinal()
-        end_day = end_datetime.toordinal()
+        bucket = self._get_account_bucket(bucket)
+        prefix = "%s/" % self._transactions_key()
 
-        if end_datetime.time() == _datetime.time():
-            # this ends on midnight of the first day - do not
-            # include this last day as nothing will match
-            end_day -= 1
+        # times with a whole number of seconds are written without
+        # microseconds, and so can sort out of order with other times
+        # in the same second. Start and stop the listing one second
+        # either side of the range to be safe
+        second = _datetime.timedelta(seconds=1)
 
-        from Acquire.ObjectStore import string_to_datetime \
-            as _string_to_datetime
-        from Acquire.ObjectStore import date_to_string as _date_to_string
-        from Acquire.ObjectStore import ObjectStore as _ObjectStore
+        try:
+            start_key = "%s%s" % (
+                prefix, _datetime_to_string(start_datetime - second))
+        except OverflowError:
+            # this is the start of time
+            start_key = None
+
+        if start_after is not None:
+            # resume the listing at the start of the second of the passed
+            # transaction key, as keys in the same second can be listed
+            # either side of it, and then skip up to and including it
+            start_key = max("%s%s" % (prefix, start_after[0:19]),
+                            start_key or "")
+            start_after = _get_time_ordered_key(start_after)
+
+        try:
+            stop_after = "%s%s" % (
+                prefix, _datetime_to_string(end_datetime + second))
+        except OverflowError:
+            # this is the end of time
+            stop_after = None
+
+        if page_size is None:
+            page_size = 1000
+
+        def _in_time_order(keys):
+            keys = sorted(keys,
+                          key=lambda k: _get_time_ordered_key(k[len(prefix):]))
+
+            if start_after is None:
+                return keys
+
+            return [k for k in keys
+                    if _get_time_ordered_key(k[len(prefix):]) > start_after]
+
+        # the keys listed in the current second
+        second = None
+        keys_in_second = []
+
+        try:
+            keys = _ObjectStore.iter_object_names(bucket=bucket,
+                                                  prefix=prefix,
+                                                  start_after=start_key,
+                                                  page_size=page_size)
+
+            for key in keys:
+                # the key starts with the datetime, so this can be
+                # compared as a string without decoding the key
+                if stop_after is not None and \
+                        key[0:len(stop_after)] > stop_after:
+                    break
+
+                key_second = key[len(prefix):len(prefix) + 19]
+
+                if key_second != second:
+                    for k in _in_time_order(keys_in_second):
+                        yield k
+
+                    second = key_second
+                    keys_in_second = []
+
+                keys_in_second.append(key)
+        except _ObjectStoreError:
+            # there are no transactions
+            return
+
+        for k in _in_time_order(keys_in_second):
+            yield k
+
+    def _iter_transactions_between(self, start_datetime, end_datetime,
+                                   bucket=None):
+        """Iterate over the TransactionInfo of all transactions in this
+           account between 'start_datetime' and 'end_datetime' (i.e.
+           start_datetime < transaction <= end_datetime), in time order
+        """
+        from Acquire.ObjectStore import datetime_to_datetime \
+            as _datetime_to_datetime
         from Acquire.Accounting import TransactionInfo as _TransactionInfo
 
-        bucket = self._get_account_bucket()
+        keys = self._iter_transaction_keys_between(
+                                        start_datetime=start_datetime,
+                                        end_datetime=end_datetime,
+                                        bucket=bucket)
 
-        num_days = end_day - start_day
+        start_datetime = _datetime_to_datetime(start_datetime)
+        end_datetime = _datetime_to_datetime(end_datetime)
 
-        if num_days < 7:
-            # sufficiently few days that a day-by-day search is enough
-            transactions = []
-            for day in range(start_day, end_day+1):
-                day_date = _datetime.datetime.fromordinal(day)
-                day_string = _date_to_string(day_date)
+        for key in keys:
+            transaction = _TransactionInfo.from_key(key)
+            datetime = transaction.datetime()
 
-                prefix = "%s/%s" % (self._transactions_key(), day_string)
+            if datetime > start_datetime and datetime <= end_datetime:
+                yield transaction
 
-                try:
-                    keys = _ObjectStore.get_all_object_names(bucket=bucket,
-                                                             prefix=prefix)
-                except:
-                    keys = []
+    def _sum_transactions_between(self, start_datetime, end_datetime,
+                                  bucket=None):
+        """Return the Balance obtained by summing all of the transactions
+           in this account between 'start_datetime' and 'end_datetime'
+           (i.e. start_datetime < transaction <= end_datetime). The keys
+           are decoded, filtered and summed in bulk, rather than being
+           converted one at a time into TransactionInfo objects
+        """
+        from Acquire.Accounting import TransactionKeys as _TransactionKeys
 
-                for key in keys:
-                    transaction = _TransactionInfo.from_key(key)
-                    datetime = transaction.datetime()
-                    if datetime > start_datetime and datetime <= end_datetime:
-                        transactions.append(transaction)
+        keys = self._iter_transaction_keys_between(
+                                        start_datetime=start_datetime,
+                                        end_datetime=end_datetime,
+                                        bucket=bucket)
 
-            return transactions
+        return _TransactionKeys(keys).filter(
+                                        start_datetime=start_datetime,
+                                        end_datetime=end_datetime).sum()
 
-        # elif num_days < 300:  Try a better algorithm for weeks and months
+    def _get_transactions_between(self, start_datetime, end_datetime,
+                                  bucket=None):
+        """Return all of the transactions in this account beteen
+           'start_datetime' and 'end_datetime' (inclusive, e.g.
+           start_datetime < transaction <= end_datetime). This will return an
+           empty list if there were no transactions in this time
+        """
+        return list(self._iter_transactions_between(
+                                    start_datetime=start_datetime,
+                                    end_datetime=end_datetime,
+                                    bucket=bucket))
+
+    def iter_transactions(self, start_datetime=None, end_datetime=None,
+                          codes=None, page_size=None, start_after=None,
+                          bucket=None):
+        """Iterate over the transactions recorded in this account
+           between 'start_datetime' and 'end_datetime' (i.e.
+           start_datetime < transaction <= end_datetime), in time
+           order. This is a single ordered listing of the transaction
+           keys, read 'page_size' at a time, so the whole statement is
+           never held in memory
 
-        else:
-            # likely more than years - easier to just scan all transactions
-            # on the account
-            prefix = self._transactions_key()
+            Args:
+                start_datetime (datetime, default=None): Start of the
+                statement (defaults to the beginning of time)
+                end_datetime (datetime, default=None): End of the
+                statement (defaults to actually now)
+                codes (list, default=None): Only return transactions
+                with these TransactionCodes (or their two-letter values)
+                page_size (int, default=None): Number of keys to list
+                from the object store at a time
+                start_after (str, default=None): Resume the statement
+                after the transaction with this key (as returned by
+                TransactionInfo.to_key)
+                bucket (dict, default=None): Bucket to load data from
 
-            try:
-                keys = _ObjectStore.get_all_object_names(bucket=bucket,
-                                                         prefix=prefix)
-            except:
-                keys = []
+            Returns:
+                generator: TransactionInfo for each transaction
+        """
+        from Acquire.ObjectStore import datetime_to_datetime \
+            as _datetime_to_datetime
+        from Acquire.Accounting import TransactionInfo as _TransactionInfo
+        from Acquire.Accounting import TransactionCode as _TransactionCode
+        import datetime as _datetime
 
-            transactions = []
+        if self.is_null():
+            return
 
-            for key in keys:
-                transaction = _TransactionInfo.from_key(key)
-                datetime = transaction.datetime()
-                if datetime > start_datetime and datetime <= end_datetime:
-                    transactions.append(transaction)
+        if start_datetime is None:
+            start_datetime = _datetime.datetime.fromordinal(1)
+
+        start_datetime = _datetime_to_datetime(start_datetime)
+        end_datetime = self._get_now(end_datetime)
+
+        if codes is not None:
+            codes = set(_TransactionCode(code).value for code in codes)
 
-            return transactions
+        keys = self._iter_transaction_keys_between(
+                                        start_datetime=start_datetime,
+                                        end_datetime=end_datetime,
+                                        page_size=page_size,
+                                        start_after=start_after,
+                                        bucket=bucket)
+
+        for key in keys:
+            # filter on the code before decoding the key
+            if codes is not None and key.rsplit("/", 1)[-1][0:2] not in codes:
+                continue
+
+            transaction = _TransactionInfo.from_key(key)
+            datetime = transaction.datetime()
+
+            if datetime > start_datetime and datetime <= end_datetime:
+                yield transaction
 
     def _get_balance_key(self, now=None):
         """Return the balance key for the passed time. This is the key
@@ -390,221 +655,824 @@ class Account:
             return _get_key_from_hour(start=self._balance_key(),
                                       datetime=self._get_now(now))
 
-    def _find_last_balance_key(self, now=None, bucket=None):
-        """Return the key containing the last hourly balance update before
-           'now' (defaults to actual now if not set)
+    def _get_daily_balance_key(self, now=None):
+        """Return the key of the object that holds the starting balance
+           of the account on the day of the passed datetime
         """
+        if self.is_null():
+            return None
+        else:
+            return _get_key_from_day(start=self._daily_balance_key(),
+                                     datetime=self._get_now(now))
+
+    def _get_monthly_balance_key(self, now=None):
+        """Return the key of the object that holds the starting balance
+           of the account in the month of the passed datetime
+        """
+        if self.is_null():
+            return None
+        else:
+            return _get_key_from_month(start=self._monthly_balance_key(),
+                                       datetime=self._get_now(now))
+
+    def _load_balance_snapshot(self, key, bucket=None):
+        """Return the balance snapshot at 'key', or None if
+           this snapshot has not been written
+        """
+        from Acquire.Accounting import Balance as _Balance
         from Acquire.ObjectStore import ObjectStore as _ObjectStore
+
+        bucket = self._get_account_bucket(bucket)
+
+        try:
+            data = _ObjectStore.get_object_from_json(bucket=bucket, key=key)
+        except:
+            return None
+
+        if data is None:
+            return None
+
+        return _Balance.from_data(data)
+
+    def _save_balance_snapshot(self, key, balance, datetime, bucket=None):
+        """Save 'balance' as the snapshot at 'key' of the balance at
+           'datetime'. Snapshots of times in the future are not saved,
+           as transactions could still be recorded before then
+        """
+        from Acquire.ObjectStore import ObjectStore as _ObjectStore
+        from Acquire.ObjectStore import get_datetime_now as _get_datetime_now
+
+        if datetime > _get_datetime_now():
+            return
+
+        bucket = self._get_account_bucket(bucket)
+        _ObjectStore.set_object_from_json(bucket=bucket, key=key,
+                                          data=balance.to_data())
+
+    def _get_monthly_balance(self, now=None, bucket=None):
+        """Calculate and return the balance at the start of the
+           month of 'now' (defaults to actually now if not specified).
+           If there is no snapshot for this month then this is
+           calculated from the last monthly snapshot before 'now'
+        """
+        from Acquire.Accounting import Balance as _Balance
+        from Acquire.ObjectStore import datetime_to_datetime \
+            as _datetime_to_datetime
+        import datetime as _datetime
+
+        now = self._get_now(now)
+        bucket = self._get_account_bucket(bucket)
+
+        monthly_key = self._get_monthly_balance_key(now)
+        monthly_balance = self._load_balance_snapshot(monthly_key, bucket)
+
+        if monthly_balance is not None:
+            return monthly_balance
+
+        # monthly keys are start/YYYY-MM, so search the years and
+        # then the months for the last snapshot
+        last_key = _find_last_key_before(
+                            bucket=bucket,
+                            prefix="%s/" % self._monthly_balance_key(),
+                            delimiters=["-", "/"], before=monthly_key)
+
+        last_balance = None
+
+        if last_key is not None:
+            last_balance = self._load_balance_snapshot(last_key, bucket)
+
+        if last_balance is None:
+            # there are no snapshots, so start from the beginning of time
+            last_balance = _Balance()
+            last_time = _datetime_to_datetime(
+                                    _datetime.datetime.fromordinal(1))
+        else:
+            last_time = _get_date_from_key(last_key)
+
+        monthly_time = _get_monthly_datetime(now)
+
+        monthly_balance = last_balance + self._sum_transactions_between(
+                                        start_datetime=last_time,
+                                        end_datetime=monthly_time,
+                                        bucket=bucket)
+
+        self._save_balance_snapshot(monthly_key, monthly_balance,
+                                    monthly_time, bucket)
+
+        return monthly_balance
+
+    def _get_daily_balance(self, now=None, bucket=None):
+        """Calculate and return the balance at the start of the day
+           of 'now' (defaults to actually now if not specified). If
+           there is no snapshot for this day then this is calculated
+           from the snapshot at the start of the month
+        """
         now = self._get_now(now)
         bucket = self._get_account_bucket(bucket)
-        start = self._balance_key()
 
-        # look for any balance keys from today
-        prefix = _get_key_from_day(start=start, datetime=now)
+        daily_key = self._get_daily_balance_key(now)
+        daily_balance = self._load_balance_snapshot(daily_key, bucket)
+
+        if daily_balance is not None:
+            return daily_balance
+
+        daily_time = _get_daily_datetime(now)
+        monthly_time = _get_monthly_datetime(now)
+
+        daily_balance = self._get_monthly_balance(now=now, bucket=bucket)
+
+        if daily_time != monthly_time:
+            daily_balance = daily_balance + self._sum_transactions_between(
+                                        start_datetime=monthly_time,
+                                        end_datetime=daily_time,
+                                        bucket=bucket)
+
+        self._save_balance_snapshot(daily_key, daily_balance,
+                                    daily_time, bucket)
+
+        return daily_balance
+
+    def _get_hourly_balance(self, now=None, bucket=None):
+        """Calculate and return the balance at the top of the hour
+           for 'now' (defaults to actually now if not specified). If
+           there is no snapshot for this hour then this is calculated
+           from the snapshot at the start of the day
+        """
+        now = self._get_now(now)
+        hourly_key = self._get_balance_key(now)
+
+        if hourly_key in self._last_update:
+            return self._last_update[hourly_key]["hourly_balance"]
+
+        bucket = self._get_account_bucket(bucket)
+
+        hourly_balance = self._load_balance_snapshot(hourly_key, bucket)
+        hourly_now_time = _get_hourly_datetime(now)
+
+        if hourly_balance is None:
+            daily_time = _get_daily_datetime(now)
+            hourly_balance = self._get_daily_balance(now=now, bucket=bucket)
+
+            if hourly_now_time != daily_time:
+                hourly_balance = hourly_balance + \
+                    self._sum_transactions_between(
+                                            start_datetime=daily_time,
+                                            end_datetime=hourly_now_time,
+                                            bucket=bucket)
+
+            self._save_balance_snapshot(hourly_key, hourly_balance,
+                                        hourly_now_time, bucket)
+
+        self._last_update[hourly_key] = \
+            {"hourly_balance": hourly_balance,
+             "last_update_time": hourly_now_time,
+             "last_update_balance": hourly_balance}
+
+        return hourly_balance
+
+    def compact_balances(self, until=None, bucket=None):
+        """Fill in all of the missing daily and monthly balance
+           snapshots of this account up to 'until' (defaults to
+           actually now). This is a single ordered pass through the
+           transactions since the last compaction, and can be run
+           in the background so that historical balances can
+           always be found in a few reads. This returns the number
+           of snapshots that were written
+
+            Args:
+                until (datetime, default=None): Time up to which
+                snapshots will be written
+                bucket (dict, default=None): Bucket to load data from
+
+            Returns:
+                int: Number of snapshots written
+        """
+        if self.is_null():
+            return 0
+
+        from Acquire.Accounting import Balance as _Balance
+        from Acquire.Accounting import TransactionInfo as _TransactionInfo
+        from Acquire.ObjectStore import ObjectStore as _ObjectStore
+        from Acquire.ObjectStore import get_datetime_now as _get_datetime_now
+        from Acquire.ObjectStore import datetime_to_string \
+            as _datetime_to_string
+        from Acquire.ObjectStore import string_to_datetime \
+            as _string_to_datetime
+        import datetime as _datetime
+
+        bucket = self._get_account_bucket(bucket)
+
+        now = _get_datetime_now()
+
+        if until is None:
+            until = now
+        else:
+            until = min(self._get_now(until), now)
+
+        end_time = _get_daily_datetime(until)
+
+        # start from where the last compaction finished, or else from
+        # the month of the first transaction in the account
         try:
-            keys = _ObjectStore.get_all_object_names(bucket=bucket,
-                                                     prefix=prefix)
+            data = _ObjectStore.get_object_from_json(
+                                    bucket=bucket,
+                                    key=self._compacted_balance_key())
         except:
-            keys = []
+            data = None
+
+        if data is not None:
+            balance = _Balance.from_data(data["balance"])
+            start_time = _string_to_datetime(data["datetime"])
+
+            if start_time >= end_time:
+                return 0
+
+            # the balance includes all transactions up to start_time
+            after_time = start_time
+        else:
+            try:
+                first_key = next(iter(_ObjectStore.iter_object_names(
+                            bucket=bucket,
+                            prefix="%s/" % self._transactions_key(),
+                            page_size=1)))
+            except:
+                # no transactions, so no snapshots are needed
+                return 0
+
+            first_time = _TransactionInfo.from_key(first_key).datetime()
+
+            balance = _Balance()
+            start_time = _get_monthly_datetime(first_time)
+
+            # the range of transactions excludes its start, so start
+            # just before the month to include a transaction made
+            # exactly at midnight on its first day
+            after_time = start_time - _datetime.timedelta(microseconds=1)
+
+        # find the snapshots that already exist from start_time, listing
+        # from just before its day and month (snapshot keys sort by date)
+        existing = set()
+
+        for (root, last_key) in [
+                (self._daily_balance_key(),
+                 self._get_daily_balance_key(_get_last_day(start_time))),
+                (self._monthly_balance_key(),
+                 self._get_monthly_balance_key(_get_last_month(start_time)))]:
+            try:
+                existing.update(_ObjectStore.iter_object_names(
+                                            bucket=bucket,
+                                            prefix="%s/" % root,
+                                            start_after=last_key))
+            except:
+                pass
+
+        transactions = self._iter_transactions_between(
+                                        start_datetime=after_time,
+                                        end_datetime=end_time,
+                                        bucket=bucket)
+
+        pending = next(transactions, None)
+        day_time = start_time
+        last_time = start_time
+        nwritten = 0
+
+        while day_time <= end_time:
+            while pending is not None and pending.datetime() <= day_time:
+                balance = balance + pending
+                pending = next(transactions, None)
+
+            keys = [self._get_daily_balance_key(day_time)]
+
+            if day_time.day == 1:
+                keys.append(self._get_monthly_balance_key(day_time))
+
+            for key in keys:
+                if key not in existing:
+                    self._save_balance_snapshot(key, balance, day_time,
+                                                bucket)
+                    nwritten += 1
+
+            last_time = day_time
+            day_time = day_time + _datetime.timedelta(days=1)
+
+        _ObjectStore.set_object_from_json(
+                    bucket=bucket, key=self._compacted_balance_key(),
+                    data={"datetime": _datetime_to_string(last_time),
+                          "balance": balance.to_data()})
+
+        return nwritten
+
+    @staticmethod
+    def compact_all_balances(until=None, bucket=None):
+        """Fill in all of the missing daily and monthly balance snapshots
+           of every account, returning the total number of snapshots
+           written. This is designed to be run as a periodic background
+           task
+
+            Args:
+                until (datetime, default=None): Time up to which
+                snapshots will be written
+                bucket (dict, default=None): Bucket to load data from
+
+            Returns:
+                int: Number of snapshots written
+        """
+        from Acquire.ObjectStore import ObjectStore as _ObjectStore
 
-        if len(keys) > 0:
-            keys.sort()
-            return keys[-1]
+        if bucket is None:
+            from Acquire.Service import get_service_account_bucket \
+                as _get_service_account_bucket
+            bucket = _get_service_account_bucket()
 
-        # look for any balance keys from yesterday
-        # (we do this to stop big lookups for active accounts when
-        #  we jump between months)
-        now = _get_last_day(now)
-        prefix = _get_key_from_day(start=start, datetime=now)
         try:
-            keys = _ObjectStore.get_all_object_names(bucket=bucket,
-                                                     prefix=prefix)
+            (_prefixes, names) = _ObjectStore.list_prefixes(
+                                            bucket=bucket,
+                                            prefix="%s/" % _account_root())
         except:
-            keys = []
+            names = []
+
+        nwritten = 0
+
+        for name in names:
+            uid = name.split("/")[-1]
+            account = Account(uid=uid, bucket=bucket)
+            nwritten += account.compact_balances(until=until, bucket=bucket)
 
-        if len(keys) > 0:
-            keys.sort()
-            return keys[-1]
+        return nwritten
+
+    def balance(self, now=None, bucket=None):
+        """Get the balance of the account at 'now' (defaults to actually now).
+           This returns a Balance object for the balance, that includes
+           (1) the current real balance of the account,
+           neglecting any outstanding liabilities or accounts receivable,
+           (2) the current total liabilities,
+           and (3) the current total accounts receivable
+
+           where 'liability' is the current total liabilities,
+           where 'receivable' is the current total accounts receivable, and
+           where 'spent_today' is how much has been spent today (from midnight
+           until now)
+
+           If 'now' is not passed then the materialised running balance
+           of the account is returned, which is a single read from the
+           object store. Otherwise the balance is calculated from the
+           hourly balances and the transactions recorded since
+
+           Args:
+                now (datetime, default=None): Time at which to get the balance
+                bucket (dict, default=None): Bucket to use for calculations
+
+            Returns:
+                Balance: the balance, liability and receivable
+        """
+        if now is None:
+            return self._get_running_balance(bucket=bucket)
+
+        now = self._get_now(now)
+        bucket = self._get_account_bucket(bucket)
+
+        # get the key to the hourly balance for now
+        hourly_key = self._get_balance_key(now)
 
-        # look for any balance keys from this month
-        prefix = _get_key_from_month(start=start, datetime=now)
         try:
-            keys = _ObjectStore.get_all_object_names(bucket=bucket,
-                                                     prefix=prefix)
+            hourly_update = self._last_update[hourly_key]
         except:
-            keys = []
+            hourly_update = None
 
-        if len(keys) > 0:
-            keys.sort()
-            return keys[-1]
+        from Acquire.ObjectStore import ObjectStore as _ObjectStore
+        bucket = self._get_account_bucket()
 
-        for _ in range(0, 6):
-            now = _get_last_month(now)
-            prefix = _get_key_from_month(start=start, datetime=now)
-            try:
-                keys = _ObjectStore.get_all_object_names(bucket=bucket,
-                                                         prefix=prefix)
-            except:
-                keys = []
+        if hourly_update is None:
+            hourly_balance = self._get_hourly_balance(bucket=bucket,
+                                                      now=now)
+            last_update_time = _get_hourly_datetime(now)
+            last_update_balance = hourly_balance
+        else:
+            hourly_balance = hourly_update["hourly_balance"]
+            last_update_time = hourly_update["last_update_time"]
+            last_update_balance = hourly_update["last_update_balance"]
 
-            if len(keys) > 0:
-                keys.sort()
-                return keys[-1]
+        if last_update_time >= now:
+            # the last update of this balance was in the future - go from
+            # the current hour
+            last_update_time = _get_hourly_datetime(now)
+            last_update_balance = hourly_balance
+
+        # next, get the transactions that have taken place since the last
+        # update and sum them to get the current balance
+        total = last_update_balance + self._sum_transactions_between(
+                                 start_datetime=last_update_time,
+                                 end_datetime=now, bucket=bucket)
+
+        self._last_update[hourly_key] = {"hourly_balance": hourly_balance,
+                                         "last_update_time": now,
+                                         "last_update_balance": total}
+
+        return total
+
+    def _sum_all_transactions(self, exclude=None, bucket=None):
+        """Return the balance obtained by summing every transaction
+           that has been recorded in this account, except for those
+           whose keys are in 'exclude'
+        """
+        from Acquire.ObjectStore import ObjectStore as _ObjectStore
+
+        bucket = self._get_account_bucket(bucket)
 
-        # wow - no balance keys at all over the last 6 months. Look for
-        # *any* balance keys
         try:
-            keys = _ObjectStore.get_all_object_names(bucket=bucket,
-                                                     prefix=prefix)
+            keys = _ObjectStore.get_all_object_names(
+                        bucket=bucket,
+                        prefix="%s/" % self._transactions_key())
         except:
             keys = []
 
-        if len(keys) > 0:
-            keys.sort()
-            # can only return the latest key before 'now'
-            for i in range(len(keys)-1, 0, -1):
-                key = keys[i]
-                hourly_time = _get_hour_from_key(key)
+        if exclude:
+            exclude = set(exclude)
+            keys = [key for key in keys if key not in exclude]
 
-                if hourly_time < now:
-                    return key
+        return _sum_transactions(keys)
 
-        # no balance keys at all! Set a balance key for the beginning of time
-        from Acquire.ObjectStore import datetime_to_datetime \
-            as _datetime_to_datetime
+    def _save_new_running_balance(self, balance, bucket=None):
+        """Save 'balance' as the running balance of this account, if
+           (and only if) there is no running balance yet. This returns
+           whether or not the balance was saved
+        """
+        from Acquire.ObjectStore import ObjectStore as _ObjectStore
+        from Acquire.ObjectStore import PreconditionFailedError \
+            as _PreconditionFailedError
+        import json as _json
+
+        data = {"balance": balance.to_data(), "version": 1, "pending": {}}
+
+        try:
+            _ObjectStore.set_object_if_absent(
+                            bucket=bucket, key=self._running_balance_key(),
+                            data=_json.dumps(data).encode("utf-8"))
+            return True
+        except _PreconditionFailedError:
+            return False
+
+    def _create_running_balance(self, bucket=None):
+        """Create the materialised running balance of this account from
+           the sum of all of its transactions. This is only needed for
+           accounts that were created before running balances were
+           recorded. The balance is created while holding the account's
+           mutex, and line items are only written once the running
+           balance exists (see _record_line_item). This means that every
+           line item is either in the sum, or is applied afterwards
+           by its writer, but never both
+        """
+        from Acquire.ObjectStore import ObjectStore as _ObjectStore
+        from Acquire.ObjectStore import LeaseMutex as _LeaseMutex
+
+        bucket = self._get_account_bucket(bucket)
+        key = self._running_balance_key()
+
+        m = _LeaseMutex(key, timeout=600, lease_time=600, bucket=bucket)
+
+        try:
+            if _ObjectStore.get_all_object_names(bucket=bucket, prefix=key):
+                # someone else created the running balance first
+                return
+
+            self._save_new_running_balance(
+                        self._sum_all_transactions(bucket=bucket),
+                        bucket=bucket)
+        finally:
+            m.unlock()
+
+    def _load_running_balance(self, bucket=None):
+        """Return the data and etag of the materialised running balance
+           of this account, creating the running balance if needed
+        """
+        from Acquire.ObjectStore import ObjectStore as _ObjectStore
+        from Acquire.ObjectStore import ObjectStoreError as _ObjectStoreError
+        import json as _json
+
+        bucket = self._get_account_bucket(bucket)
+
+        while True:
+            try:
+                (data, etag) = _ObjectStore.get_object_and_etag(
+                                        bucket=bucket,
+                                        key=self._running_balance_key())
+                break
+            except _ObjectStoreError:
+                self._create_running_balance(bucket=bucket)
+
+        data = _json.loads(data)
+
+        if "pending" not in data:
+            data["pending"] = {}
+
+        return (data, etag)
+
+    def _update_running_balance(self, update, current=None, bucket=None):
+        """Update the materialised running balance of this account by
+           calling 'update(data)' on its data, where 'data' is a dict
+           of the "balance", its "version" and the "pending" line items.
+           The function returns the new data, or None if no change is
+           needed. The update uses a conditional write, and is retried
+           (calling 'update' again) if another process updates the
+           balance at the same time. 'current' is the (data, etag)
+           to try first, e.g. as returned by a previous update.
+           Retries back off exponentially (with jitter), and an
+           AccountError is raised if the balance is still contended
+           after _max_balance_attempts. Any line item that has been
+           recorded as pending is then left for a reader to reconcile.
+           This returns the (Balance, (data, etag)) after the update
+        """
         from Acquire.Accounting import Balance as _Balance
-        import datetime as _datetime
-        hourly_time = _datetime_to_datetime(_datetime.datetime.fromordinal(1))
+        from Acquire.ObjectStore import ObjectStore as _ObjectStore
+        from Acquire.ObjectStore import PreconditionFailedError \
+            as _PreconditionFailedError
+        import copy as _copy
+        import json as _json
+        import random as _random
+        import time as _time
 
-        hourly_key = self._get_balance_key(now=hourly_time)
-        hourly_balance = _Balance()
-        _ObjectStore.set_object_from_json(bucket=bucket, key=hourly_key,
-                                          data=hourly_balance.to_data())
+        bucket = self._get_account_bucket(bucket)
 
-        return hourly_key
+        for attempt in range(0, _max_balance_attempts):
+            if attempt > 0:
+                # someone else updated the balance - back off (with full
+                # jitter) so that contending writers spread out
+                cap = min(_max_backoff,
+                          _min_backoff * (2 ** min(attempt, 16)))
+                _time.sleep(_random.uniform(_min_backoff,
+                                            max(cap, _min_backoff)))
 
-    def _get_hourly_balance(self, now=None, bucket=None):
-        """Calculate and return the balance at the top of the hour
-           for 'now' (defaults to actually now if not specified)
+            if current is None:
+                current = self._load_running_balance(bucket=bucket)
+
+            (data, etag) = current
+            new_data = update(_copy.deepcopy(data))
+
+            if new_data is None:
+                return (_Balance.from_data(data["balance"]), current)
+
+            new_data["version"] = data.get("version", 0) + 1
+
+            try:
+                etag = _ObjectStore.set_object_if_match(
+                                bucket=bucket,
+                                key=self._running_balance_key(),
+                                data=_json.dumps(new_data).encode("utf-8"),
+                                etag=etag)
+                return (_Balance.from_data(new_data["balance"]),
+                        (new_data, etag))
+            except _PreconditionFailedError:
+                current = None
+
+        from Acquire.Accounting import AccountError
+        raise AccountError(
+            "Could not update the running balance of account %s after "
+            "%d attempts as it is being updated by too many other "
+            "processes. Please try again later." %
+            (self.uid(), _max_balance_attempts))
+
+    def _get_running_balance(self, bucket=None):
+        """Return the materialised running balance of this account. This
+           is a single read from the object store, unless the line items
+           of a writer that crashed need to be reconciled
         """
-        now = self._get_now(now)
-        hourly_key = self._get_balance_key(now)
+        from Acquire.Accounting import Balance as _Balance
 
-        if hourly_key in self._last_update:
-            return self._last_update[hourly_key]["hourly_balance"]
+        if self.is_null():
+            return _Balance()
+
+        (data, etag) = self._load_running_balance(bucket=bucket)
+
+        if len(self._get_stale_pending(data)) > 0:
+            return self._reconcile_running_balance(current=(data, etag),
+                                                   bucket=bucket)
+
+        return _Balance.from_data(data["balance"])
+
+    def _get_stale_pending(self, data):
+        """Return the keys of the pending line items in the passed
+           running balance data that have been pending for longer than
+           _pending_timeout, i.e. whose writer has crashed or given up
+        """
+        from Acquire.ObjectStore import get_datetime_now as _get_datetime_now
+        from Acquire.ObjectStore import string_to_datetime \
+            as _string_to_datetime
+
+        now = _get_datetime_now()
+        stale = []
+
+        for (item_key, started) in data["pending"].items():
+            age = (now - _string_to_datetime(started)).total_seconds()
+
+            if age > _pending_timeout:
+                stale.append(item_key)
+
+        return stale
+
+    def _reconcile_running_balance(self, current=None, bucket=None):
+        """Reconcile the stale pending line items of this account's
+           running balance. Items that were written are applied to the
+           balance, while items that were never written are dropped.
+           Writers never write an item that has been pending for more
+           than half of _pending_timeout, so a dropped item cannot be
+           written later. This returns the reconciled balance
+        """
+        from Acquire.Accounting import Balance as _Balance
+        from Acquire.Accounting import TransactionInfo as _TransactionInfo
+        from Acquire.ObjectStore import ObjectStore as _ObjectStore
+
+        bucket = self._get_account_bucket(bucket)
+
+        if current is None:
+            current = self._load_running_balance(bucket=bucket)
+
+        stale = self._get_stale_pending(current[0])
+
+        if len(stale) == 0:
+            return _Balance.from_data(current[0]["balance"])
+
+        results = _ObjectStore.get_objects(bucket=bucket, keys=stale)
+        written = [key for (key, result) in results.items()
+                   if not isinstance(result, Exception)]
+
+        def _reconcile(data):
+            keys = [key for key in stale if key in data["pending"]]
+
+            if len(keys) == 0:
+                return None
+
+            applied = [key for key in keys if key in written]
+
+            for key in keys:
+                del data["pending"][key]
+
+            if len(applied) > 0:
+                data["balance"] = (
+                    _Balance.from_data(data["balance"]) + _sum_transactions(
+                        [_TransactionInfo.from_key(key) for key in applied])
+                    ).to_data()
+
+            return data
+
+        return self._update_running_balance(_reconcile, current=current,
+                                            bucket=bucket)[0]
+
+    def _begin_line_items(self, item_keys, current=None, bucket=None):
+        """Record in the running balance of this account that the line
+           items at 'item_keys' are about to be written, so that they
+           can be reconciled if the writer crashes before applying them.
+           This returns the (data, etag) of the running balance
+        """
+        from Acquire.ObjectStore import get_datetime_now_to_string \
+            as _get_datetime_now_to_string
 
-        from Acquire.Accounting import Balance as _Balance
-        from Acquire.ObjectStore import ObjectStore as _ObjectStore
-        bucket = self._get_account_bucket(bucket)
+        started = _get_datetime_now_to_string()
 
-        try:
-            data = _ObjectStore.get_object_from_json(bucket=bucket,
-                                                     key=hourly_key)
-            hourly_balance = _Balance.from_data(data)
-        except:
-            hourly_balance = None
+        def _begin(data):
+            for item_key in item_keys:
+                data["pending"][item_key] = started
 
-        hourly_now_time = _get_hourly_datetime(now)
+            return data
 
-        if hourly_balance is None:
-            # look for the last balance key...
-            last_balance_key = self._find_last_balance_key(now=now,
-                                                           bucket=bucket)
+        return self._update_running_balance(_begin, current=current,
+                                            bucket=bucket)[1]
 
-            if last_balance_key is None:
-                from Acquire.Accounting import AccountError
-                raise AccountError(
-                    "The first balance of the account %s has not been set?"
-                    % str(self))
+    def _check_can_write(self, item_keys, current):
+        """Raise an AccountError if the line items at 'item_keys' have
+           been pending for too long to be written safely, i.e. the
+           running balance may be reconciled before they are written
+        """
+        from Acquire.ObjectStore import get_datetime_now as _get_datetime_now
+        from Acquire.ObjectStore import string_to_datetime \
+            as _string_to_datetime
 
-            data = _ObjectStore.get_object_from_json(bucket=bucket,
-                                                     key=last_balance_key)
+        now = _get_datetime_now()
+        pending = current[0]["pending"]
 
-            last_balance = _Balance.from_data(data)
-            last_balance_time = _get_hour_from_key(last_balance_key)
+        for item_key in item_keys:
+            age = (now - _string_to_datetime(pending[item_key]))
 
-            transactions = self._get_transactions_between(
-                                        start_datetime=last_balance_time,
-                                        end_datetime=hourly_now_time)
+            if age.total_seconds() > 0.5 * _pending_timeout:
+                from Acquire.Accounting import AccountError
+                raise AccountError(
+                    "Cannot write the line items to account %s as it took "
+                    "too long (%s) to record them as pending" %
+                    (str(self), age))
+
+    def _apply_line_items(self, item_keys, current=None, bucket=None):
+        """Apply the transactions of the pending line items at
+           'item_keys', which have been written, to the running balance
+           of this account, returning the updated balance. Items that
+           are no longer pending have already been applied by
+           _reconcile_running_balance, so are skipped
+        """
+        from Acquire.Accounting import Balance as _Balance
+        from Acquire.Accounting import TransactionInfo as _TransactionInfo
 
-            total = _sum_transactions(transactions)
+        def _apply(data):
+            keys = [key for key in item_keys if key in data["pending"]]
 
-            hourly_balance = last_balance + total
+            if len(keys) == 0:
+                return None
 
-        _ObjectStore.set_object_from_json(bucket=bucket,
-                                          key=hourly_key,
-                                          data=hourly_balance.to_data())
+            for key in keys:
+                del data["pending"][key]
+
+            data["balance"] = (
+                _Balance.from_data(data["balance"]) + _sum_transactions(
+                    [_TransactionInfo.from_key(key) for key in keys])
+                ).to_data()
+
+            return data
+
+        return self._update_running_balance(_apply, current=current,
+                                            bucket=bucket)[0]
+
+    def _record_line_item(self, item_key, line_item, bucket=None):
+        """Write the passed line item to 'item_key' and then apply the
+           transaction encoded in 'item_key' to the running balance
+           of this account, returning the updated balance. The item
+           is recorded as pending before it is written, so that
+           the balance is reconciled if this process crashes before
+           the item is applied. If the running balance is too busy to
+           apply the item then an AccountError is raised, and the
+           written item is applied by the next reader to reconcile
+           the balance
+        """
+        from Acquire.ObjectStore import ObjectStore as _ObjectStore
 
-        self._last_update[hourly_key] = \
-            {"hourly_balance": hourly_balance,
-             "last_update_time": hourly_now_time,
-             "last_update_balance": hourly_balance}
+        bucket = self._get_account_bucket(bucket)
 
-        return hourly_balance
+        current = self._begin_line_items([item_key], bucket=bucket)
+        self._check_can_write([item_key], current)
 
-    def balance(self, now=None, bucket=None):
-        """Get the balance of the account at 'now' (defaults to actually now).
-           This returns a Balance object for the balance, that includes
-           (1) the current real balance of the account,
-           neglecting any outstanding liabilities or accounts receivable,
-           (2) the current total liabilities,
-           and (3) the current total accounts receivable
+        _ObjectStore.set_object_from_json(bucket=bucket, key=item_key,
+                                          data=line_item.to_data())
 
-           where 'liability' is the current total liabilities,
-           where 'receivable' is the current total accounts receivable, and
-           where 'spent_today' is how much has been spent today (from midnight
-           until now)
+        return self._apply_line_items([item_key], current=current,
+                                      bucket=bucket)
+
+    def verify_balance(self, repair=False, bucket=None):
+        """Verify the materialised running balance of this account
+           against the sum of all of the transactions recorded in the
+           account, returning whether or not they agree. Stale pending
+           line items are reconciled first, and line items that are
+           still pending are left out of the sum.
+           If 'repair' is True then a running balance that disagrees is
+           replaced by the summed balance. Only repair an account that
+           is not receiving transactions, as a transaction that is
+           recorded while the sum is calculated may otherwise be
+           counted twice
 
-           Args:
-                bucket (dict, default=None): Bucket to use for calculations
+            Args:
+                repair (bool, default=False): Whether or not to repair
+                a running balance that is wrong
+                bucket (dict, default=None): Bucket to load data from
 
             Returns:
-                tuple (Decimal, Decimal, Decimal, Decimal): balance, liability,
-                receivable, spent_today
+                bool: True if the running balance was correct, else False
         """
-        now = self._get_now(now)
-        bucket = self._get_account_bucket(bucket)
+        if self.is_null():
+            return True
 
-        # get the key to the hourly balance for now
-        hourly_key = self._get_balance_key(now)
+        from Acquire.Accounting import Balance as _Balance
+        from Acquire.ObjectStore import ObjectStore as _ObjectStore
+        from Acquire.ObjectStore import PreconditionFailedError \
+            as _PreconditionFailedError
+        import json as _json
 
-        try:
-            hourly_update = self._last_update[hourly_key]
-        except:
-            hourly_update = None
+        bucket = self._get_account_bucket(bucket)
+        key = self._running_balance_key()
 
-        from Acquire.ObjectStore import ObjectStore as _ObjectStore
-        bucket = self._get_account_bucket()
+        self._reconcile_running_balance(bucket=bucket)
+        (data, etag) = self._load_running_balance(bucket=bucket)
 
-        if hourly_update is None:
-            hourly_balance = self._get_hourly_balance(bucket=bucket,
-                                                      now=now)
-            last_update_time = _get_hourly_datetime(now)
-            last_update_balance = hourly_balance
-        else:
-            hourly_balance = hourly_update["hourly_balance"]
-            last_update_time = hourly_update["last_update_time"]
-            last_update_balance = hourly_update["last_update_balance"]
+        running_balance = _Balance.from_data(data["balance"])
 
-        if last_update_time >= now:
-            # the last update of this balance was in the future - go from
-            # the current hour
-            last_update_time = _get_hourly_datetime(now)
-            last_update_balance = hourly_balance
+        # line items that have been written, but not yet applied by
+        # their writer, are not yet part of the running balance
+        balance = self._sum_all_transactions(exclude=data["pending"].keys(),
+                                             bucket=bucket)
 
-        # next, get the transactions that have taken place since the last
-        # update and sum them to get the current balance
-        transactions = self._get_transactions_between(
-                                 start_datetime=last_update_time,
-                                 end_datetime=now, bucket=bucket)
+        if balance == running_balance:
+            return True
 
-        total = last_update_balance + _sum_transactions(transactions)
+        if repair:
+            data["balance"] = balance.to_data()
+            data["version"] = data.get("version", 0) + 1
 
-        self._last_update[hourly_key] = {"hourly_balance": hourly_balance,
-                                         "last_update_time": now,
-                                         "last_update_balance": total}
+            try:
+                _ObjectStore.set_object_if_match(
+                                    bucket=bucket, key=key,
+                                    data=_json.dumps(data).encode("utf-8"),
+                                    etag=etag)
+            except _PreconditionFailedError:
+                from Acquire.Accounting import AccountError
+                raise AccountError(
+                    "Cannot repair the balance of account %s as it was "
+                    "updated during the repair. Please try again." % str(self))
 
-        return total
+        return False
 
     def name(self):
         """Return the name of this account
@@ -786,7 +1654,7 @@ class Account:
         l = _LineItem(debit_note.uid(), refund.authorisation())
 
         bucket = self._get_account_bucket()
-        _ObjectStore.set_object_from_json(bucket, item_key, l.to_data())
+        self._record_line_item(item_key, l, bucket=bucket)
 
         return (uid, now)
 
@@ -846,7 +1714,7 @@ class Account:
                 # we have not moved into the next hour
                 break
 
-        _ObjectStore.set_object_from_json(bucket, item_key, l.to_data())
+        self._record_line_item(item_key, l, bucket=bucket)
 
         return (uid, now)
 
@@ -918,7 +1786,7 @@ class Account:
                 # we have not moved into another hour
                 break
 
-        _ObjectStore.set_object_from_json(bucket, item_key, l.to_data())
+        self._record_line_item(item_key, l, bucket=bucket)
 
         return (uid, now)
 
@@ -979,7 +1847,7 @@ class Account:
                 # we are safely in the same hour
                 break
 
-        _ObjectStore.set_object_from_json(bucket, item_key, l.to_data())
+        self._record_line_item(item_key, l, bucket=bucket)
 
         return (uid, now)
 
@@ -1051,7 +1919,7 @@ class Account:
         # original transaction in the transaction record
         l = _LineItem(debit_note.uid(), debit_note.authorisation())
 
-        _ObjectStore.set_object_from_json(bucket, item_key, l.to_data())
+        self._record_line_item(item_key, l, bucket=bucket)
 
         return (uid, now)
 
@@ -1193,10 +2061,7 @@ class Account:
                 # record the transaction
                 break
 
-        _ObjectStore.set_object_from_json(bucket=bucket, key=item_key,
-                                          data=line_item.to_data())
-
-        balance = self.balance(bucket=bucket)
+        balance = self._record_line_item(item_key, line_item, bucket=bucket)
 
         if balance.available(overdraft_limit=self._overdraft_limit) < 0:
             # This transaction has helped push the account beyond the
@@ -1213,9 +2078,9 @@ class Account:
             item_key = "%s/%s" % (self._transactions_key(),
                                   info.to_key())
 
-            _ObjectStore.set_object_from_json(bucket=bucket, key=item_key,
-                                              data=line_item.to_data())
+            self._record_line_item(item_key, line_item, bucket=bucket)
 
+            from Acquire.Accounting import InsufficientFundsError
             raise InsufficientFundsError(
                 "You cannot debit '%s' from account %s as there "
                 "are insufficient funds in this account." %
@@ -1223,6 +2088,335 @@ class Account:
 
         return (uid, now, receipt_by)
 
+    def _write_line_items(self, line_items, max_workers=None, bucket=None):
+        """Concurrently write all of the passed line items (a dictionary
+           of LineItems indexed by their item keys), and then apply all
+           of their transactions to the running balance of this account
+           in a single update, returning the updated balance. If any
+           of the line items cannot be written then those that were
+           written are rescinded and the error is raised. Items whose
+           write failed are left pending, so that they are reconciled
+           from whatever was actually written
+        """
+        from Acquire.ObjectStore import ObjectStore as _ObjectStore
+
+        bucket = self._get_account_bucket(bucket)
+
+        current = self._begin_line_items(list(line_items.keys()),
+                                         bucket=bucket)
+        self._check_can_write(list(line_items.keys()), current)
+
+        objects = {}
+        for (item_key, line_item) in line_items.items():
+            objects[item_key] = line_item.to_data()
+
+        results = _ObjectStore.set_objects_from_json(bucket=bucket,
+                                                     objects=objects,
+                                                     max_workers=max_workers)
+
+        written = []
+        error = None
+
+        for (item_key, result) in results.items():
+            if isinstance(result, Exception):
+                error = result
+            else:
+                written.append(item_key)
+
+        if error is None:
+            return self._apply_line_items(written, current=current,
+                                          bucket=bucket)
+
+        rescinds = self._get_rescinded_line_items(written)
+        current = self._begin_line_items(list(rescinds.keys()),
+                                         current=current, bucket=bucket)
+        self._check_can_write(list(rescinds.keys()), current)
+
+        results = _ObjectStore.set_objects_from_json(
+            bucket=bucket,
+            objects={key: item.to_data() for (key, item) in rescinds.items()},
+            max_workers=max_workers)
+
+        rescinded = [key for (key, result) in results.items()
+                     if not isinstance(result, Exception)]
+
+        # the written items and their rescinds sum to zero
+        self._apply_line_items(written + rescinded, current=current,
+                               bucket=bucket)
+
+        for result in results.values():
+            if isinstance(result, Exception):
+                from Acquire.Accounting import UnbalancedLedgerError
+                raise UnbalancedLedgerError(
+                    "Unable to rescind the line items of account %s "
+                    "after a failed write (%s): %s" %
+                    (str(self), str(error), str(result)))
+
+        raise error
+
+    def _get_rescinded_line_items(self, item_keys):
+        """Return a dictionary of the line items (indexed by item key)
+           that rescind the line items at the passed item keys
+        """
+        from Acquire.Accounting import TransactionInfo as _TransactionInfo
+        from Acquire.Accounting import LineItem as _LineItem
+
+        line_items = {}
+
+        for item_key in item_keys:
+            info = _TransactionInfo.from_key(item_key).rescind()
+            key = "%s/%s" % (self._transactions_key(), info.to_key())
+            line_items[key] = _LineItem(uid=info.dated_uid(),
+                                        authorisation=None)
+
+        return line_items
+
+    def _rescind_notes(self, notes, max_workers=None, bucket=None):
+        """Rescind the line items that were written to this account
+           for the passed debit and/or credit notes, which must have
+           been created from transactions. This returns the updated
+           balance of the account
+        """
+        from Acquire.Accounting import TransactionInfo as _TransactionInfo
+        from Acquire.Accounting import TransactionCode as _TransactionCode
+        from Acquire.Accounting import DebitNote as _DebitNote
+
+        item_keys = []
+
+        for note in notes:
+            if isinstance(note, _DebitNote):
+                if note.is_provisional():
+                    code = _TransactionCode.CURRENT_LIABILITY
+                else:
+                    code = _TransactionCode.DEBIT
+            elif note.is_provisional():
+                code = _TransactionCode.ACCOUNT_RECEIVABLE
+            else:
+                code = _TransactionCode.CREDIT
+
+            item_keys.append("%s/%s/%s" % (
+                                self._transactions_key(), note.uid(),
+                                _TransactionInfo.encode(code, note.value())))
+
+        return self._write_line_items(
+                                self._get_rescinded_line_items(item_keys),
+                                max_workers=max_workers, bucket=bucket)
+
+    def _rescind_note(self, note, bucket=None):
+        """Rescind the line item that was written to this account for
+           the passed debit or credit note
+        """
+        return self._rescind_notes([note], bucket=bucket)
+
+    def _create_batch_uid(self, datetime_key, used_uids):
+        """Return a new UID for a line item written at 'datetime_key'
+           that is not in 'used_uids'. Every item in a batch shares the
+           same datetime, so the random parts must not collide
+        """
+        from Acquire.ObjectStore import create_uuid as _create_uuid
+
+        while True:
+            uid = "%s/%s" % (datetime_key, _create_uuid()[0:8])
+
+            if uid not in used_uids:
+                used_uids.add(uid)
+                return uid
+
+    def _batch_debit(self, debits, is_provisional, receipt_by,
+                     used_uids=None, max_workers=None, bucket=None):
+        """Debit all of the passed 'debits' (a list of (transaction,
+           authorisation) pairs) from this account as a single batch.
+           The authorisations must already have been verified. The
+           available funds are checked once for the total value, all
+           line items are written concurrently, and the running balance
+           is updated once. If this pushes the account beyond its
+           overdraft limit then the whole batch is rescinded and an
+           InsufficientFundsError is raised. The UIDs of the debits
+           are added to 'used_uids', and do not collide with any UID
+           already in this set.
+
+           Note that this function is private as it should only be
+           called by Ledger.perform_batch
+
+            Args:
+                debits (list): List of (Transaction, Authorisation)
+                is_provisional (bool): If True the debits will be
+                recorded as liabilities
+                receipt_by (datetime): Datetime by which provisional
+                debits should be receipted
+                used_uids (set, default=None): UIDs that must not be used
+                max_workers (int, default=None): Number of concurrent writes
+                bucket (dict, default=None): Bucket to load data from
+
+            Returns:
+                list: (uid, now, receipt_by) for each debit
+        """
+        if self.is_null():
+            from Acquire.Accounting import AccountError
+            raise AccountError("You cannot debit a null account!")
+
+        from Acquire.Accounting import create_decimal as _create_decimal
+        from Acquire.Accounting import LineItem as _LineItem
+        from Acquire.Accounting import TransactionInfo as _TransactionInfo
+        from Acquire.Accounting import TransactionCode as _TransactionCode
+        from Acquire.ObjectStore import datetime_to_string \
+            as _datetime_to_string
+        from Acquire.ObjectStore import datetime_to_datetime \
+            as _datetime_to_datetime
+        from Acquire.ObjectStore import get_datetime_future \
+            as _get_datetime_future
+
+        bucket = self._get_account_bucket(bucket)
+
+        if used_uids is None:
+            used_uids = set()
+
+        total = _create_decimal(0)
+        for (transaction, _authorisation) in debits:
+            total += transaction.value()
+
+        balance = self.balance(bucket=bucket)
+
+        if balance.available(self.get_overdraft_limit()) < total:
+            from Acquire.Accounting import InsufficientFundsError
+            raise InsufficientFundsError(
+                "You cannot debit '%s' from account %s as there "
+                "are insufficient funds in this account." %
+                (total, str(self)))
+
+        if is_provisional:
+            code = _TransactionCode.CURRENT_LIABILITY
+        else:
+            code = _TransactionCode.DEBIT
+
+        while True:
+            now = self._get_safe_now()
+
+            if is_provisional:
+                if receipt_by is None:
+                    receipt_by = _get_datetime_future(days=7)
+                else:
+                    receipt_by = _datetime_to_datetime(receipt_by)
+
+                delta = (receipt_by - now).total_seconds()
+                if delta < 3600:
+                    from Acquire.Accounting import AccountError
+                    raise AccountError(
+                        "You cannot request a receipt to be provided less "
+                        "than 1 hour into the future! %s versus %s is only "
+                        "%s second(s) in the future!" %
+                        (_datetime_to_string(receipt_by),
+                         _datetime_to_string(now), delta))
+            else:
+                receipt_by = None
+
+            datetime_key = _datetime_to_string(now)
+            batch_uids = set(used_uids)
+
+            uids = []
+            line_items = {}
+
+            for (transaction, authorisation) in debits:
+                uid = self._create_batch_uid(datetime_key, batch_uids)
+                encoded_value = _TransactionInfo.encode(code,
+                                                        transaction.value())
+                item_key = "%s/%s/%s" % (self._transactions_key(),
+                                         uid, encoded_value)
+
+                uids.append(uid)
+                line_items[item_key] = _LineItem(uid, authorisation)
+
+            now2 = self._get_safe_now()
+
+            if now.hour == now2.hour:
+                # we are still in the same hour, so it is safe to
+                # record the transactions
+                break
+
+        used_uids.update(uids)
+
+        balance = self._write_line_items(line_items, max_workers=max_workers,
+                                         bucket=bucket)
+
+        if balance.available(overdraft_limit=self._overdraft_limit) < 0:
+            # other debits have happened at the same time, and together
+            # they have pushed the account beyond the overdraft limit
+            self._write_line_items(
+                    self._get_rescinded_line_items(line_items.keys()),
+                    max_workers=max_workers, bucket=bucket)
+
+            from Acquire.Accounting import InsufficientFundsError
+            raise InsufficientFundsError(
+                "You cannot debit '%s' from account %s as there "
+                "are insufficient funds in this account." %
+                (total, str(self)))
+
+        return [(uid, now, receipt_by) for uid in uids]
+
+    def _batch_credit(self, debit_notes, max_workers=None, bucket=None):
+        """Credit the values of all of the passed 'debit_notes' to this
+           account as a single batch. All line items are written
+           concurrently and the running balance is updated once.
+
+           Note that this function is private as it should only be
+           called by Ledger.perform_batch
+
+            Args:
+                debit_notes (list): DebitNotes holding the values to be
+                credited to this account
+                max_workers (int, default=None): Number of concurrent writes
+                bucket (dict, default=None): Bucket to load data from
+
+            Returns:
+                list: (uid, now) for each credit
+        """
+        if self.is_null():
+            from Acquire.Accounting import AccountError
+            raise AccountError("You cannot credit a null account!")
+
+        from Acquire.Accounting import LineItem as _LineItem
+        from Acquire.Accounting import TransactionInfo as _TransactionInfo
+        from Acquire.Accounting import TransactionCode as _TransactionCode
+        from Acquire.ObjectStore import datetime_to_string \
+            as _datetime_to_string
+
+        bucket = self._get_account_bucket(bucket)
+
+        while True:
+            now = self._get_safe_now()
+            datetime_key = _datetime_to_string(now)
+            batch_uids = set()
+
+            uids = []
+            line_items = {}
+
+            for debit_note in debit_notes:
+                if debit_note.is_provisional():
+                    code = _TransactionCode.ACCOUNT_RECEIVABLE
+                else:
+                    code = _TransactionCode.CREDIT
+
+                uid = self._create_batch_uid(datetime_key, batch_uids)
+                encoded_value = _TransactionInfo.encode(code,
+                                                        debit_note.value())
+                item_key = "%s/%s/%s" % (self._transactions_key(),
+                                         uid, encoded_value)
+
+                uids.append(uid)
+                line_items[item_key] = _LineItem(debit_note.uid(),
+                                                 debit_note.authorisation())
+
+            now2 = self._get_safe_now()
+
+            if now.hour == now2.hour:
+                # we are safely in the same hour
+                break
+
+        self._write_line_items(line_items, max_workers=max_workers,
+                               bucket=bucket)
+
+        return [(uid, now) for uid in uids]
+
     def get_overdraft_limit(self):
         """Return the overdraft limit of this account
 
@@ -1312,6 +2506,43 @@ class Account:
         else:
             return "%s/balance" % self._key()
 
+    def _daily_balance_key(self):
+        """Return the root key for the daily balance snapshots
+           for this account in the object store
+        """
+        if self.is_null():
+            return None
+        else:
+            return "%s/daily_balance" % self._key()
+
+    def _monthly_balance_key(self):
+        """Return the root key for the monthly balance snapshots
+           for this account in the object store
+        """
+        if self.is_null():
+            return None
+        else:
+            return "%s/monthly_balance" % self._key()
+
+    def _compacted_balance_key(self):
+        """Return the key of the object that records the time up to
+           which all of the balance snapshots of this account have
+           been written, together with the balance at that time
+        """
+        if self.is_null():
+            return None
+        else:
+            return "%s/compacted_balance" % self._key()
+
+    def _running_balance_key(self):
+        """Return the key for the materialised running balance of
+           this account in the object store
+        """
+        if self.is_null():
+            return None
+        else:
+            return "%s/running_balance" % self._key()
+
     def _load_account(self, bucket=None):
         """Load the current state of the account from the object store"""
         if self.is_null():
@@ -317,8 +317,9 @@ class Accounts:
             return account
 
         # make sure that no-one has created this account before
-        from Acquire.ObjectStore import Mutex as _Mutex
-        m = _Mutex(account_key, timeout=600, lease_time=600, bucket=bucket)
+        from Acquire.ObjectStore import LeaseMutex as _LeaseMutex
+        m = _LeaseMutex(account_key, timeout=600, lease_time=600,
+                        bucket=bucket)
 
         try:
             account_uid = _ObjectStore.get_string_object(bucket, account_key)
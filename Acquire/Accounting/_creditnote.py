@@ -333,6 +333,14 @@ class CreditNote:
 
         (uid, datetime) = account._credit(debit_note, bucket=bucket)
 
+        self._set_credited(debit_note=debit_note, account=account,
+                           uid=uid, datetime=datetime)
+
+    def _set_credited(self, debit_note, account, uid, datetime):
+        """Internal function used to set the data of this note once
+           the value of 'debit_note' has been credited to 'account'
+           with the passed uid and datetime
+        """
         self._account_uid = account.uid()
         self._debit_account_uid = debit_note.account_uid()
         self._datetime = datetime
@@ -344,6 +352,17 @@ class CreditNote:
         if self._is_provisional:
             self._receipt_by = debit_note.receipt_by()
 
+    @staticmethod
+    def _create_from_batch(debit_note, account, uid, datetime):
+        """Internal function used by Ledger.perform_batch to create
+           the credit note for a debit note whose value has already
+           been credited to 'account' by Account._batch_credit
+        """
+        note = CreditNote()
+        note._set_credited(debit_note=debit_note, account=account,
+                           uid=uid, datetime=datetime)
+        return note
+
     @staticmethod
     def from_data(data):
         """Construct and return a new CreditNote from the passed json-decoded
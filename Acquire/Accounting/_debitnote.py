@@ -359,11 +359,6 @@ class DebitNote:
             if not isinstance(authorisation, _Authorisation):
                 raise TypeError("Authorisation must be of type Authorisation")
 
-        self._transaction = transaction
-        self._account_uid = account.uid()
-        self._authorisation = authorisation
-        self._is_provisional = is_provisional
-
         (uid, datetime, receipt_by) = account._debit(
                         transaction=transaction,
                         authorisation=authorisation,
@@ -371,6 +366,22 @@ class DebitNote:
                         is_provisional=is_provisional,
                         receipt_by=receipt_by, bucket=bucket)
 
+        self._set_debited(transaction=transaction, account=account,
+                          authorisation=authorisation,
+                          is_provisional=is_provisional, uid=uid,
+                          datetime=datetime, receipt_by=receipt_by)
+
+    def _set_debited(self, transaction, account, authorisation,
+                     is_provisional, uid, datetime, receipt_by):
+        """Internal function used to set the data of this note once
+           the value of 'transaction' has been debited from 'account'
+           with the passed uid, datetime and receipt_by
+        """
+        self._transaction = transaction
+        self._account_uid = account.uid()
+        self._authorisation = authorisation
+        self._is_provisional = is_provisional
+
         from Acquire.ObjectStore import datetime_to_datetime \
             as _datetime_to_datetime
         self._datetime = _datetime_to_datetime(datetime)
@@ -382,6 +393,20 @@ class DebitNote:
         else:
             assert(receipt_by is None)
 
+    @staticmethod
+    def _create_from_batch(transaction, account, authorisation,
+                           is_provisional, uid, datetime, receipt_by):
+        """Internal function used by Ledger.perform_batch to create
+           the debit note for a transaction that has already been
+           debited from 'account' by Account._batch_debit
+        """
+        note = DebitNote()
+        note._set_debited(transaction=transaction, account=account,
+                          authorisation=authorisation,
+                          is_provisional=is_provisional, uid=uid,
+                          datetime=datetime, receipt_by=receipt_by)
+        return note
+
     def to_data(self):
         """Return this DebitNote as a dictionary that can be encoded as json
 
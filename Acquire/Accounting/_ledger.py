@@ -79,6 +79,48 @@ class Ledger:
                                               Ledger.get_key(record.uid()),
                                               record.to_data())
 
+    @staticmethod
+    def save_transactions(records, bucket=None, max_workers=None):
+        """Save all of the passed transaction records to the object
+           store. The records are written concurrently using up to
+           'max_workers' threads
+
+           Args:
+                records (list): TransactionRecords to save
+                bucket (dict, default=None): Bucket to save data from
+                max_workers (int, default=None): Number of concurrent writes
+           Returns:
+                None
+        """
+        from Acquire.Accounting import TransactionRecord as _TransactionRecord
+
+        objects = {}
+
+        for record in records:
+            if not isinstance(record, _TransactionRecord):
+                raise TypeError("You can only write TransactionRecord objects "
+                                "to the ledger!")
+
+            if not record.is_null():
+                objects[Ledger.get_key(record.uid())] = record.to_data()
+
+        if len(objects) == 0:
+            return
+
+        if bucket is None:
+            from Acquire.Service import get_service_account_bucket \
+                as _get_service_account_bucket
+            bucket = _get_service_account_bucket()
+
+        from Acquire.ObjectStore import ObjectStore as _ObjectStore
+
+        results = _ObjectStore.set_objects_from_json(bucket, objects,
+                                                     max_workers=max_workers)
+
+        for result in results.values():
+            if isinstance(result, Exception):
+                raise result
+
     @staticmethod
     def refund(refund, bucket=None):
         """Create and record a new transaction from the passed refund. This
@@ -414,7 +456,7 @@ class Ledger:
             # the transaction - first retract the credit notes...
             try:
                 for credit_note in credit_notes.values():
-                    credit_account._delete_note(credit_note, bucket=bucket)
+                    credit_account._rescind_note(credit_note, bucket=bucket)
             except Exception as e:
                 from Acquire.Accounting import UnbalancedLedgerError
                 raise UnbalancedLedgerError(
@@ -426,7 +468,7 @@ class Ledger:
             # now refund all of the debit notes
             try:
                 for debit_note in debit_notes:
-                    debit_account._delete_note(debit_note, bucket=bucket)
+                    debit_account._rescind_note(debit_note, bucket=bucket)
             except Exception as e:
                 from Acquire.Accounting import UnbalancedLedgerError
                 raise UnbalancedLedgerError(
@@ -443,13 +485,13 @@ class Ledger:
             # delete all of the notes...
             for debit_note in debit_notes:
                 try:
-                    debit_account._delete_note(debit_note, bucket=bucket)
+                    debit_account._rescind_note(debit_note, bucket=bucket)
                 except:
                     pass
 
-            for credit_note in credit_notes:
+            for credit_note in credit_notes.values():
                 try:
-                    credit_account._delete_note(credit_note, bucket=bucket)
+                    credit_account._rescind_note(credit_note, bucket=bucket)
                 except:
                     pass
 
@@ -460,9 +502,211 @@ class Ledger:
         return Ledger._record_to_ledger(paired_notes, is_provisional,
                                         bucket=bucket)
 
+    @staticmethod
+    def perform_batch(transfers, is_provisional=False, receipt_by=None,
+                      max_workers=None, bucket=None):
+        """Perform a batch of transfers, where each transfer is a tuple
+           of (debit_account, credit_account, transaction, authorisation).
+           This is much faster than calling 'perform' for each transfer,
+           as the transfers are grouped by account. The available funds
+           of each debit account are checked once for the total of its
+           debits, the line items of each account are written
+           concurrently (using up to 'max_workers' threads) with a single
+           update of the account balance, and the transaction records
+           are written to the ledger in bulk. Returns the (already
+           recorded) TransactionRecords, in the same order as the
+           transfers. Transfers with zero value are not recorded.
+
+           Note that the batch is all-or-nothing. If any of the transfers
+           fails then all of the completed debits and credits are
+           rescinded, and the error is raised.
+
+           Args:
+                transfers (list): List of (Account, Account, Transaction,
+                Authorisation) for the debit account, credit account,
+                transaction and authorisation of each transfer
+                is_provisional (bool, default=False): Whether the transfers
+                are provisional
+                receipt_by (datetime, default=None): Date by which
+                provisional transfers must be receipted
+                max_workers (int, default=None): Number of concurrent writes
+                bucket (dict): Bucket to load data from
+
+            Returns:
+                list: List of TransactionRecords
+        """
+        from Acquire.Accounting import Account as _Account
+        from Acquire.Identity import Authorisation as _Authorisation
+        from Acquire.Accounting import DebitNote as _DebitNote
+        from Acquire.Accounting import CreditNote as _CreditNote
+        from Acquire.Accounting import Transaction as _Transaction
+        from Acquire.Accounting import PairedNote as _PairedNote
+        from Acquire.ObjectStore import get_datetime_future \
+            as _get_datetime_future
+
+        if is_provisional:
+            is_provisional = True
+
+            if receipt_by is None:
+                # ensure the receipt_by date for all notes is the same
+                receipt_by = _get_datetime_future(days=7)
+        else:
+            is_provisional = False
+
+        batch = []
+
+        for transfer in transfers:
+            try:
+                (debit_account, credit_account,
+                 transaction, authorisation) = transfer
+            except Exception:
+                raise TypeError(
+                    "Each transfer must be a tuple of (debit_account, "
+                    "credit_account, transaction, authorisation)")
+
+            if not isinstance(debit_account, _Account):
+                raise TypeError("The Debit Account must be of type Account")
+
+            if not isinstance(credit_account, _Account):
+                raise TypeError("The Credit Account must be of type Account")
+
+            if not isinstance(transaction, _Transaction):
+                raise TypeError("The Transaction must be of type Transaction")
+
+            if not isinstance(authorisation, _Authorisation):
+                raise TypeError(
+                    "The Authorisation must be of type Authorisation")
+
+            # zero transactions are not worth recording
+            if transaction.value() > 0:
+                batch.append(transfer)
+
+        if len(batch) == 0:
+            return []
+
+        if bucket is None:
+            from Acquire.Service import get_service_account_bucket \
+                as _get_service_account_bucket
+            bucket = _get_service_account_bucket()
+
+        # check all of the authorisations before anything is written
+        for (debit_account, _, transaction, authorisation) in batch:
+            debit_account.assert_valid_authorisation(
+                                    authorisation=authorisation,
+                                    resource=transaction.fingerprint(),
+                                    accept_partial_match=True)
+
+        # first, debit all of the transactions, one account at a time.
+        # If any debit fails then all completed debits are rescinded
+        debit_notes = [None] * len(batch)
+        debited = {}
+        used_uids = set()
+
+        try:
+            for (account, indexes) in Ledger._group_by_account(batch, 0):
+                results = account._batch_debit(
+                    debits=[(batch[i][2], batch[i][3]) for i in indexes],
+                    is_provisional=is_provisional, receipt_by=receipt_by,
+                    used_uids=used_uids, max_workers=max_workers,
+                    bucket=bucket)
+
+                notes = []
+                for (i, (uid, datetime, note_receipt_by)) in \
+                        zip(indexes, results):
+                    notes.append(_DebitNote._create_from_batch(
+                                    transaction=batch[i][2], account=account,
+                                    authorisation=batch[i][3],
+                                    is_provisional=is_provisional, uid=uid,
+                                    datetime=datetime,
+                                    receipt_by=note_receipt_by))
+                    debit_notes[i] = notes[-1]
+
+                debited[account.uid()] = (account, notes)
+        except Exception as e:
+            Ledger._rescind_batch(debited, e, max_workers, bucket)
+            raise e
+
+        # now credit the value of the debit notes, one account at a time.
+        # If any credit fails then all completed credits and all of the
+        # debits are rescinded
+        credit_notes = {}
+        credited = {}
+
+        try:
+            for (account, indexes) in Ledger._group_by_account(batch, 1):
+                notes = [debit_notes[i] for i in indexes]
+                results = account._batch_credit(debit_notes=notes,
+                                                max_workers=max_workers,
+                                                bucket=bucket)
+
+                credited_notes = []
+                for (debit_note, (uid, datetime)) in zip(notes, results):
+                    credited_notes.append(_CreditNote._create_from_batch(
+                                            debit_note=debit_note,
+                                            account=account, uid=uid,
+                                            datetime=datetime))
+                    credit_notes[debit_note.uid()] = credited_notes[-1]
+
+                credited[account.uid()] = (account, credited_notes)
+        except Exception as e:
+            Ledger._rescind_batch(credited, e, max_workers, bucket)
+            Ledger._rescind_batch(debited, e, max_workers, bucket)
+            raise e
+
+        try:
+            paired_notes = _PairedNote.create(debit_notes, credit_notes)
+        except Exception as e:
+            Ledger._rescind_batch(credited, e, max_workers, bucket)
+            Ledger._rescind_batch(debited, e, max_workers, bucket)
+            raise e
+
+        # now write the paired entries to the ledger. The below function
+        # is guaranteed not to raise an exception
+        return Ledger._record_to_ledger(paired_notes, is_provisional,
+                                        bucket=bucket,
+                                        max_workers=max_workers)
+
+    @staticmethod
+    def _group_by_account(batch, index):
+        """Internal function that groups the transfers in the passed
+           batch by the account at 'index' in each transfer. This
+           returns a list of (account, indexes of its transfers)
+        """
+        groups = {}
+
+        for (i, transfer) in enumerate(batch):
+            account = transfer[index]
+
+            if account.uid() in groups:
+                groups[account.uid()][1].append(i)
+            else:
+                groups[account.uid()] = (account, [i])
+
+        return list(groups.values())
+
+    @staticmethod
+    def _rescind_batch(notes, error, max_workers, bucket):
+        """Internal function used to rescind all of the passed notes
+           (a dictionary of (account, notes) indexed by account UID)
+           after 'error' caused a batch to fail
+        """
+        for (account, account_notes) in notes.values():
+            try:
+                account._rescind_notes(account_notes,
+                                       max_workers=max_workers,
+                                       bucket=bucket)
+            except Exception as e:
+                from Acquire.Accounting import UnbalancedLedgerError
+                raise UnbalancedLedgerError(
+                    "We have an unbalanced ledger as it was not "
+                    "possible to rescind the notes of account %s after "
+                    "a batch failed. Batch error = %s. Rescind error = %s" %
+                    (str(account), str(error), str(e)))
+
     @staticmethod
     def _record_to_ledger(paired_notes, is_provisional=False,
-                          receipt=None, refund=None, bucket=None):
+                          receipt=None, refund=None, bucket=None,
+                          max_workers=None):
         """Internal function used to generate and record transaction records
            from the passed paired debit- and credit-note(s). This will write
            the transaction record(s) to the object store, and will also return
@@ -475,6 +719,7 @@ class Ledger:
                 receipt (Receipt, default=None): Receipt to use
                 refund (Refund): Refund to use
                 bucket (dict): Bucket to read data from
+                max_workers (int, default=None): Number of concurrent writes
 
            Returns:
                 TransactionRecord: Holds record of transactions
@@ -517,10 +762,11 @@ class Ledger:
                 if refund is not None:
                     record._refund = refund
 
-                Ledger.save_transaction(record, bucket)
-
                 records.append(record)
 
+            Ledger.save_transactions(records, bucket,
+                                     max_workers=max_workers)
+
             return records
 
         except:
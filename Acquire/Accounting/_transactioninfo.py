@@ -78,6 +78,7 @@ class TransactionInfo:
         t = TransactionInfo()
         t._uid = self._uid[-1::-1]
         t._value = self._value
+        t._receipted_value = self._receipted_value
         t._datetime = self._datetime
 
         if self._code is TransactionCode.DEBIT:
@@ -85,8 +86,10 @@ class TransactionInfo:
         elif self._code is TransactionCode.CREDIT:
             t._code = TransactionCode.DEBIT
         elif self._code is TransactionCode.CURRENT_LIABILITY:
+            t._code = self._code
             t._value = -(self._value)
         elif self._code is TransactionCode.ACCOUNT_RECEIVABLE:
+            t._code = self._code
             t._value = -(self._value)
         else:
             raise PermissionError(
@@ -0,0 +1,237 @@
+
+from array import array as _array
+
+__all__ = ["TransactionKeys"]
+
+# the number of micro-units in one unit of value
+_units = 1000000
+
+# the codes of all transactions, and of those that can have
+# separate original and receipted values
+_codes = {"CR", "DR", "CL", "AR", "RR", "SR", "RF", "SF"}
+_receipt_codes = {"RR", "SR"}
+
+# the ordinal of the first day of the epoch used for timestamps
+_epoch_ordinal = 719163  # date(1970, 1, 1).toordinal()
+
+
+def _parse_micro_units(value):
+    """Return the passed fixed-point value string (e.g. '000100.005000')
+       as an integer number of micro-units (e.g. 100005000)
+    """
+    (whole, _, frac) = value.partition(".")
+    frac = int((frac + "000000")[0:6])
+
+    if whole.startswith("-"):
+        return -(int(whole[1:] or "0") * _units + frac)
+    else:
+        return int(whole or "0") * _units + frac
+
+
+def _datetime_to_timestamp(datetime):
+    """Return the passed datetime as an integer number of microseconds
+       since the epoch (in UTC)
+    """
+    from Acquire.ObjectStore import datetime_to_datetime \
+        as _datetime_to_datetime
+    datetime = _datetime_to_datetime(datetime)
+
+    days = datetime.toordinal() - _epoch_ordinal
+    seconds = datetime.hour * 3600 + datetime.minute * 60 + datetime.second
+
+    return (days * 86400 + seconds) * _units + datetime.microsecond
+
+
+class TransactionKeys:
+    """This class decodes a list of transaction keys (as written to the
+       object store by an Account) into compact columns of the
+       transaction codes, the values and receipted values (as integer
+       micro-units) and the timestamps (as integer microseconds since
+       the epoch). This lets large numbers of transactions be filtered
+       and summed using integer arithmetic, with the result only
+       converted to Decimal at the end
+    """
+    def __init__(self, keys=None):
+        """Construct, decoding the passed list of transaction keys"""
+        self._codes = []
+        self._values = _array("q")
+        self._receipted_values = _array("q")
+        self._timestamps = _array("q")
+
+        if keys is None:
+            return
+
+        days = {}
+
+        codes = self._codes
+        values = self._values
+        receipted_values = self._receipted_values
+        timestamps = self._timestamps
+
+        for key in keys:
+            try:
+                (datetime, _uid, part) = key.rsplit("/", 3)[-3:]
+
+                code = part[0:2]
+
+                if code not in _codes:
+                    raise ValueError()
+
+                (value, _, receipted_value) = part[2:].partition("T")
+                value = _parse_micro_units(value)
+
+                if receipted_value:
+                    if code not in _receipt_codes:
+                        raise ValueError()
+
+                    receipted_value = _parse_micro_units(receipted_value)
+                else:
+                    receipted_value = value
+
+                # the datetime is YYYY-MM-DDTHH:MM:SS[.ffffff] in UTC.
+                # There are very few distinct days, so cache these
+                day = datetime[0:10]
+
+                try:
+                    ndays = days[day]
+                except KeyError:
+                    import datetime as _datetime
+                    ndays = _datetime.date.fromisoformat(day).toordinal() - \
+                        _epoch_ordinal
+                    days[day] = ndays
+
+                if len(datetime) not in (19, 26) or datetime[10] != "T":
+                    raise ValueError()
+
+                seconds = int(datetime[11:13]) * 3600 + \
+                    int(datetime[14:16]) * 60 + int(datetime[17:19])
+
+                if len(datetime) == 26:
+                    microseconds = int(datetime[20:26])
+                else:
+                    microseconds = 0
+
+                timestamp = (ndays * 86400 + seconds) * _units + microseconds
+            except Exception:
+                # use the (slower) full parser for unusual keys
+                (code, value, receipted_value, timestamp) = \
+                    TransactionKeys._decode_slow(key)
+
+            codes.append(code)
+            values.append(value)
+            receipted_values.append(receipted_value)
+            timestamps.append(timestamp)
+
+    @staticmethod
+    def _decode_slow(key):
+        """Decode the passed key using TransactionInfo.from_key,
+           returning the tuple of (code, value, receipted_value,
+           timestamp)
+        """
+        from Acquire.Accounting import TransactionInfo as _TransactionInfo
+        t = _TransactionInfo.from_key(key)
+
+        value = _parse_micro_units("%.6f" % t.original_value())
+
+        if t.receipted_value() is None:
+            receipted_value = value
+        else:
+            receipted_value = _parse_micro_units(
+                                        "%.6f" % t.receipted_value())
+
+        return (t._code.value, value, receipted_value,
+                _datetime_to_timestamp(t.datetime()))
+
+    def __len__(self):
+        return len(self._codes)
+
+    def __str__(self):
+        return "TransactionKeys(size=%d)" % len(self)
+
+    def codes(self):
+        """Return the two-letter transaction codes of the transactions"""
+        return self._codes
+
+    def values(self):
+        """Return the (original) values of the transactions,
+           as integer micro-units
+        """
+        return self._values
+
+    def receipted_values(self):
+        """Return the receipted values of the transactions, as integer
+           micro-units. This is the same as the value for transactions
+           that are not receipts
+        """
+        return self._receipted_values
+
+    def timestamps(self):
+        """Return the times of the transactions, as integer
+           microseconds since the epoch
+        """
+        return self._timestamps
+
+    def filter(self, start_datetime=None, end_datetime=None):
+        """Return a new TransactionKeys that holds only the transactions
+           between 'start_datetime' and 'end_datetime' (i.e.
+           start_datetime < transaction <= end_datetime)
+        """
+        if start_datetime is None:
+            start = None
+        else:
+            start = _datetime_to_timestamp(start_datetime)
+
+        if end_datetime is None:
+            end = None
+        else:
+            end = _datetime_to_timestamp(end_datetime)
+
+        result = TransactionKeys()
+
+        for (i, timestamp) in enumerate(self._timestamps):
+            if start is not None and timestamp <= start:
+                continue
+            elif end is not None and timestamp > end:
+                continue
+
+            result._codes.append(self._codes[i])
+            result._values.append(self._values[i])
+            result._receipted_values.append(self._receipted_values[i])
+            result._timestamps.append(timestamp)
+
+        return result
+
+    def sum(self):
+        """Return the Balance that results from summing all of the
+           transactions. The values are totalled for each transaction
+           code using integer arithmetic, and are only converted
+           to Decimal at the end
+        """
+        totals = {}
+        receipted_totals = {}
+
+        for (code, value, receipted_value) in zip(self._codes, self._values,
+                                                  self._receipted_values):
+            totals[code] = totals.get(code, 0) + value
+            receipted_totals[code] = receipted_totals.get(code, 0) + \
+                receipted_value
+
+        balance = totals.get("CR", 0) - totals.get("DR", 0) \
+            - receipted_totals.get("RR", 0) \
+            + receipted_totals.get("SR", 0) \
+            + totals.get("RF", 0) - totals.get("SF", 0)
+
+        liability = totals.get("CL", 0) - totals.get("RR", 0)
+        receivable = totals.get("AR", 0) - totals.get("SR", 0)
+
+        from Acquire.Accounting import Balance as _Balance
+        from Acquire.Accounting import create_decimal as _create_decimal
+        from decimal import Decimal as _Decimal
+
+        def _to_decimal(value):
+            return _create_decimal(_Decimal(value).scaleb(-6))
+
+        return _Balance(balance=_to_decimal(balance),
+                        liability=_to_decimal(liability),
+                        receivable=_to_decimal(receivable),
+                        _is_safe=True)
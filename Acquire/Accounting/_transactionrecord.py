@@ -411,10 +411,10 @@ class TransactionRecord:
             bucket = _get_service_account_bucket()
 
         from Acquire.Accounting import Ledger as _Ledger
-        from Acquire.ObjectStore import Mutex as _Mutex
+        from Acquire.ObjectStore import LeaseMutex as _LeaseMutex
 
         try:
-            mutex = _Mutex(uid, timeout=600, lease_time=600)
+            mutex = _LeaseMutex(uid, timeout=600, lease_time=600)
         except Exception as e:
             raise LedgerError("Cannot secure a Ledger mutex for transaction "
                               "'%s'. Error = %s" % (uid, str(e)))
@@ -567,6 +567,75 @@ class Account:
         self._refresh(force_update)
         return self._balance.is_overdrawn(self._overdraft_limit)
 
+    def statement(self, start_datetime=None, end_datetime=None, codes=None,
+                  page_size=None):
+        """Iterate over the transactions recorded in this account
+           between 'start_datetime' and 'end_datetime' (i.e.
+           start_datetime < transaction <= end_datetime), in time order.
+           The statement is fetched from the accounting service one
+           page of 'page_size' transactions at a time, so it can be
+           streamed without holding it all in memory
+
+           Args:
+                start_datetime (datetime, default=None): Start of the
+                statement (defaults to the beginning of time)
+                end_datetime (datetime, default=None): End of the
+                statement (defaults to now)
+                codes (list, default=None): Only return transactions
+                with these TransactionCodes
+                page_size (int, default=None): Number of transactions
+                to fetch from the service at a time
+           Returns:
+                generator: TransactionInfo for each transaction
+        """
+        if self.is_null():
+            return
+
+        if not self.is_logged_in():
+            raise PermissionError(
+                "You cannot get the statement of this account "
+                "until after the owner has successfully authenticated.")
+
+        from Acquire.Client import Authorisation as _Authorisation
+        from Acquire.Accounting import TransactionInfo as _TransactionInfo
+        from Acquire.Accounting import TransactionCode as _TransactionCode
+        from Acquire.ObjectStore import datetime_to_string \
+            as _datetime_to_string
+
+        service = self.accounting_service()
+
+        args = {"account_name": self.name(),
+                "account_uid": self.uid()}
+
+        if start_datetime is not None:
+            args["start_datetime"] = _datetime_to_string(start_datetime)
+
+        if end_datetime is not None:
+            args["end_datetime"] = _datetime_to_string(end_datetime)
+
+        if codes is not None:
+            args["codes"] = [_TransactionCode(code).value for code in codes]
+
+        if page_size is not None:
+            args["page_size"] = int(page_size)
+
+        while True:
+            auth = _Authorisation(
+                            resource="get_statement %s" % self._account_uid,
+                            user=self._user)
+            args["authorisation"] = auth.to_data()
+
+            result = service.call_function(function="get_statement",
+                                           args=args)
+
+            for key in result["transactions"]:
+                yield _TransactionInfo.from_key(key)
+
+            if "start_after" not in result:
+                return
+
+            args["start_after"] = result["start_after"]
+
     def deposit(self, value, description=None):
         """Deposit 'value' into this account. This will raise a charge
            to your real money account to transfer value into this account.
@@ -306,6 +306,44 @@ class Cheque:
                 list: List of CreditNotes
 
         """
+        (args, account_uid, accounting_service) = self._cash_args(
+                                            spend=spend, resource=resource,
+                                            receipt_within=receipt_within)
+
+        result = accounting_service.call_function(function="cash_cheque",
+                                                  args=args)
+
+        return self._credit_notes_from_result(result=result, spend=spend,
+                                              account_uid=account_uid)
+
+    async def acash(self, spend, resource, receipt_within=3600):
+        """Coroutine version of cash, which sends the cheque to the
+           accounting service using a non-blocking call
+
+           Args:
+                spend (Decimal): Value to withdraw
+                resource (str): Resource to spend value on
+                receipt_within (datetime, default=3600): Time to receipt
+                the cashing of this cheque by
+           Returns:
+                list: List of CreditNotes
+        """
+        (args, account_uid, accounting_service) = self._cash_args(
+                                            spend=spend, resource=resource,
+                                            receipt_within=receipt_within)
+
+        result = await accounting_service.acall_function(
+                                            function="cash_cheque", args=args)
+
+        return self._credit_notes_from_result(result=result, spend=spend,
+                                              account_uid=account_uid)
+
+    def _cash_args(self, spend, resource, receipt_within):
+        """Internal function that signs this cheque and returns the
+           arguments to send to the accounting service to cash it,
+           together with the UID of the account that will be paid
+           and the accounting service itself
+        """
         if self._cheque is None:
             raise PaymentError("You cannot cash a null cheque!")
 
@@ -332,17 +370,22 @@ class Cheque:
             as _decimal_to_string
         from Acquire.ObjectStore import datetime_to_string \
             as _datetime_to_string
+
+        args = {"cheque": self.to_data(),
+                "spend": _decimal_to_string(spend),
+                "resource": str(resource),
+                "account_uid": account_uid,
+                "receipt_by": _datetime_to_string(receipt_by)}
+
+        return (args, account_uid, accounting_service)
+
+    def _credit_notes_from_result(self, result, spend, account_uid):
+        """Internal function that extracts and validates the CreditNotes
+           returned by the accounting service when cashing this cheque
+        """
         from Acquire.ObjectStore import string_to_list \
             as _string_to_list
 
-        result = accounting_service.call_function(
-            function="cash_cheque",
-            args={"cheque": self.to_data(),
-                  "spend": _decimal_to_string(spend),
-                  "resource": str(resource),
-                  "account_uid": account_uid,
-                  "receipt_by": _datetime_to_string(receipt_by)})
-
         credit_notes = None
 
         try:
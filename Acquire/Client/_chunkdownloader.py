@@ -1,5 +1,5 @@
 
-__all__ = ["ChunkDownloader"]
+__all__ = ["ChunkDownloader", "ParallelChunkDownloader"]
 
 
 class ChunkDownloader:
@@ -98,6 +98,29 @@ class ChunkDownloader:
         if not self.is_open():
             return False
 
+        (chunk, num_chunks) = self._fetch_chunk(self._next_index)
+
+        if chunk is not None:
+            self._FILE.write(chunk)
+            self._FILE.flush()
+            chunk = None
+
+            self._next_index = self._next_index + 1
+
+        if num_chunks is not None:
+            if self._next_index >= num_chunks:
+                # nothing more to download
+                self.close()
+
+        return True
+
+    def _fetch_chunk(self, chunk_index):
+        """Internal function that downloads, validates and decompresses
+           the chunk at 'chunk_index'. This returns a tuple of the
+           (chunk, num_chunks). The chunk is None if it is not
+           available, and num_chunks is only set if the file has
+           been closed and 'chunk_index' is beyond its end
+        """
         service = self.service()
 
         if service is None:
@@ -109,18 +132,21 @@ class ChunkDownloader:
         secret = _Hash.multi_md5(self._secret,
                                  "%s%s%d" % (self._drive_uid,
                                              self._file_uid,
-                                             self._next_index))
+                                             chunk_index))
 
         args = {}
         args["uid"] = self._uid
         args["drive_uid"] = self._drive_uid
         args["file_uid"] = self._file_uid
-        args["chunk_index"] = self._next_index
+        args["chunk_index"] = chunk_index
         args["secret"] = secret
 
         response = service.call_function(function="download_chunk",
                                          args=args)
 
+        chunk = None
+        num_chunks = None
+
         if "meta" in response:
             import json as _json
             meta = _json.loads(response["meta"])
@@ -139,22 +165,16 @@ class ChunkDownloader:
                     "Problem downloading - checksums don't agree: %s vs %s" %
                     (checksum, md5))
 
-            import bz2 as _bz2
-            chunk = _bz2.decompress(chunk)
-            self._FILE.write(chunk)
-            self._FILE.flush()
-            chunk = None
-
-            self._next_index = self._next_index + 1
+            # chunks uploaded by older clients do not record the codec
+            from Acquire.Client import uncompress as _uncompress
+            chunk = _uncompress(inputdata=chunk,
+                                compression_type=meta.get("compression",
+                                                          "bz2"))
 
         if "num_chunks" in response:
             num_chunks = int(response["num_chunks"])
 
-            if self._next_index >= num_chunks:
-                # nothing more to download
-                self.close()
-
-        return True
+        return (chunk, num_chunks)
 
     def download(self, filename=None, dir=None):
         """Download as much of the file as possible to 'filename'. You
@@ -267,3 +287,115 @@ class ChunkDownloader:
         c._service = service
 
         return c
+
+
+class ParallelChunkDownloader(ChunkDownloader):
+    """This is a ChunkDownloader that keeps a window of chunk requests
+       in flight at once. The chunks are downloaded, validated and
+       decompressed by 'workers' threads (the codecs release the GIL),
+       and are written to the local file in order via a reorder
+       buffer. Like ChunkDownloader, download() can be called
+       repeatedly to tail a file while it is still being uploaded
+    """
+    def __init__(self, drive_uid=None, file_uid=None, workers=4,
+                 window=None):
+        """Create a new ParallelChunkDownloader that downloads the
+           specified file using 'workers' threads, with up to
+           'window' (default 2 x workers) chunk requests in flight
+        """
+        ChunkDownloader.__init__(self, drive_uid=drive_uid,
+                                 file_uid=file_uid)
+
+        workers = int(workers)
+
+        if workers < 1:
+            raise ValueError("The number of workers must be at least 1")
+
+        if window is None:
+            window = 2 * workers
+        else:
+            window = max(1, int(window))
+
+        self._workers = workers
+        self._window = window
+
+    def download(self, filename=None, dir=None):
+        """Download as much of the file as possible to 'filename'. You
+           can call this repeatedly with the same filename (or with
+           no filename set) to stream the file back as it is written
+        """
+        self._start_download(filename=filename, dir=dir)
+        downloaded_filename = self._downloaded_filename
+
+        if not self.is_open():
+            return downloaded_filename
+
+        from concurrent.futures import ThreadPoolExecutor \
+            as _ThreadPoolExecutor
+
+        executor = _ThreadPoolExecutor(max_workers=self._workers)
+
+        # chunk index => future of a chunk request that is in flight
+        pending = {}
+        next_request = self._next_index
+        num_chunks = None
+
+        try:
+            while True:
+                while len(pending) < self._window and \
+                        (num_chunks is None or next_request < num_chunks):
+                    pending[next_request] = executor.submit(
+                                                self._fetch_chunk,
+                                                next_request)
+                    next_request += 1
+
+                future = pending.pop(self._next_index, None)
+
+                if future is None:
+                    break
+
+                (chunk, end) = future.result()
+
+                if chunk is not None:
+                    self._FILE.write(chunk)
+                    chunk = None
+                    self._next_index = self._next_index + 1
+                elif end is not None:
+                    num_chunks = end
+                    if self._next_index >= num_chunks:
+                        break
+                else:
+                    # the next chunk has not been uploaded yet. Stop
+                    # here - a later call to download will resume
+                    break
+        finally:
+            for future in pending.values():
+                future.cancel()
+
+            executor.shutdown(wait=True)
+
+            if self._FILE is not None:
+                self._FILE.flush()
+
+        if num_chunks is not None and self._next_index >= num_chunks:
+            # nothing more to download
+            self.close()
+
+        return downloaded_filename
+
+    @staticmethod
+    def from_data(data, privkey=None, service=None, workers=4, window=None):
+        """Return a ParallelChunkDownloader from a json-deserialised
+           dictionary (see ChunkDownloader.from_data)
+        """
+        downloader = ChunkDownloader.from_data(data=data, privkey=privkey,
+                                               service=service)
+
+        c = ParallelChunkDownloader(workers=workers, window=window)
+        c._uid = downloader._uid
+        c._drive_uid = downloader._drive_uid
+        c._file_uid = downloader._file_uid
+        c._secret = getattr(downloader, "_secret", None)
+        c._service = downloader._service
+
+        return c
@@ -1,5 +1,43 @@
 
-__all__ = ["ChunkUploader"]
+__all__ = ["ChunkUploader", "ParallelChunkUploader"]
+
+
+def _compress_chunk(chunk, compression_type=None, level=None, threads=None):
+    """Internal function that compresses the passed chunk, returning
+       the compressed data, its md5 checksum, the codec used and
+       the size of the uncompressed chunk.
+       The codec is chosen for each chunk by sampling the chunk
+       (see Acquire.Client.choose_compression), so chunks that are
+       already compressed or incompressible are sent as they are.
+       If 'compression_type' is None then the default codec is
+       used, or a cheaper one if the chunk is only marginally
+       compressible
+    """
+    from Acquire.Crypto import Hash as _Hash
+    from Acquire.Client import choose_compression as _choose_compression
+
+    if isinstance(chunk, str):
+        chunk = chunk.encode("utf-8")
+
+    decision = _choose_compression(data=chunk,
+                                   compression_type=compression_type,
+                                   level=level)
+
+    compression_type = decision["compression_type"]
+    uncompressed_size = len(chunk)
+
+    if compression_type != "none":
+        from Acquire.Client import compress as _compress
+        compressed = _compress(inputdata=chunk,
+                               compression_type=compression_type,
+                               level=decision["level"], threads=threads)
+
+        if len(compressed) < len(chunk):
+            chunk = compressed
+        else:
+            compression_type = "none"
+
+    return (chunk, _Hash.md5(chunk), compression_type, uncompressed_size)
 
 
 class ChunkUploader:
@@ -16,6 +54,8 @@ class ChunkUploader:
         self._file_uid = None
         self._chunk_idx = None
         self._service = None
+        self._compression = None
+        self._compression_level = None
 
         if drive_uid is not None:
             self._drive_uid = str(drive_uid)
@@ -45,6 +85,39 @@ class ChunkUploader:
         """Return the service that created this uploader"""
         return self._service
 
+    def set_compression(self, compression_type=None, level=None):
+        """Set the codec (and level) used to compress the chunks
+           that are uploaded from now on. Each chunk records the
+           codec used, so this can be changed part way through
+           an upload. If 'compression_type' is None then the
+           default from Acquire.Client.set_default_compression
+           is used. Chunks that are not worth compressing are
+           uploaded uncompressed whichever codec is set
+        """
+        if compression_type is not None:
+            from Acquire.Client import get_codec as _get_codec
+            compression_type = _get_codec(compression_type).name
+
+        self._compression = compression_type
+        self._compression_level = level
+
+    def compression_type(self):
+        """Return the codec used to compress uploaded chunks, or None
+           if this chooses the default codec for each chunk
+        """
+        return self._compression
+
+    def _get_compression(self):
+        """Internal function that returns the (compression_type,
+           level, threads) used to compress the next chunk
+        """
+        from Acquire.Client import get_default_compression \
+            as _get_default_compression
+
+        threads = _get_default_compression()["threads"]
+
+        return (self._compression, self._compression_level, threads)
+
     def upload(self, chunk):
         """Upload the next chunk of the file"""
         if self.is_null():
@@ -56,36 +129,47 @@ class ChunkUploader:
             raise PermissionError("Cannot upload a chunk to a null service!")
 
         # first, compress the chunk
-        from Acquire.ObjectStore import bytes_to_string as _bytes_to_string
-        from Acquire.Crypto import Hash as _Hash
-        import bz2 as _bz2
-
-        if isinstance(chunk, str):
-            chunk = chunk.encode("utf-8")
-
-        chunk = _bz2.compress(chunk)
-        md5 = _Hash.md5(chunk)
-        chunk = _bytes_to_string(chunk)
+        (compression, level, threads) = self._get_compression()
+        (chunk, md5, compression, size) = _compress_chunk(
+                                        chunk, compression_type=compression,
+                                        level=level, threads=threads)
 
         if self._chunk_idx is None:
             self._chunk_idx = 0
         else:
             self._chunk_idx = self._chunk_idx + 1
 
+        self._upload_chunk(chunk=chunk, checksum=md5,
+                           chunk_index=self._chunk_idx,
+                           compression=compression,
+                           uncompressed_size=size)
+
+    def _upload_chunk(self, chunk, checksum, chunk_index, compression="bz2",
+                      uncompressed_size=None):
+        """Internal function that uploads the passed chunk (compressed
+           using 'compression' from 'uncompressed_size' bytes) as the
+           chunk at index 'chunk_index'
+        """
+        from Acquire.Crypto import Hash as _Hash
+
         secret = _Hash.multi_md5(self._secret,
                                  "%s%s%d" % (self._drive_uid,
                                              self._file_uid,
-                                             self._chunk_idx))
+                                             chunk_index))
 
         args = {}
         args["drive_uid"] = self._drive_uid
         args["file_uid"] = self._file_uid
-        args["chunk_index"] = self._chunk_idx
+        args["chunk_index"] = chunk_index
         args["secret"] = secret
         args["data"] = chunk
-        args["checksum"] = md5
+        args["checksum"] = checksum
+        args["compression"] = compression
+
+        if uncompressed_size is not None:
+            args["uncompressed_size"] = int(uncompressed_size)
 
-        service.call_function(function="upload_chunk", args=args)
+        self.service().call_function(function="upload_chunk", args=args)
 
     def is_open(self):
         """Return whether or not the file is open (has been written to)"""
@@ -172,3 +256,192 @@ class ChunkUploader:
         c._service = service
 
         return c
+
+
+class ParallelChunkUploader(ChunkUploader):
+    """This is a ChunkUploader that compresses and uploads up to
+       'workers' chunks at a time. Each chunk is uploaded with an
+       explicit index, so chunks can arrive in any order, and each
+       chunk is retried up to 'max_retries' times. The compression
+       codecs release the GIL, so the chunks are compressed in parallel
+       in the same worker threads that upload them. Closing the
+       uploader waits for all of the chunks to be uploaded before
+       the file is finalised
+    """
+    def __init__(self, drive_uid=None, file_uid=None, workers=4,
+                 max_retries=3):
+        """Create a new ParallelChunkUploader that uploads the specified
+           file to the specified drive using 'workers' threads
+        """
+        ChunkUploader.__init__(self, drive_uid=drive_uid, file_uid=file_uid)
+
+        workers = int(workers)
+
+        if workers < 1:
+            raise ValueError("The number of workers must be at least 1")
+
+        import threading as _threading
+
+        self._workers = workers
+        self._max_retries = max(0, int(max_retries))
+        self._executor = None
+        self._futures = []
+        self._lock = _threading.Lock()
+
+        # limit the number of chunks held in memory waiting for upload
+        self._slots = _threading.BoundedSemaphore(2 * workers)
+
+    def upload(self, chunk):
+        """Queue the next chunk of the file for upload. This returns
+           as soon as there is space in the queue. Any error raised
+           while uploading an earlier chunk is raised here
+        """
+        if self.is_null():
+            raise PermissionError("Cannot upload a chunk to a null uploader!")
+
+        if self.service() is None:
+            raise PermissionError("Cannot upload a chunk to a null service!")
+
+        self._raise_failed()
+
+        with self._lock:
+            if self._executor is None:
+                from concurrent.futures import ThreadPoolExecutor \
+                    as _ThreadPoolExecutor
+                self._executor = _ThreadPoolExecutor(
+                                        max_workers=self._workers)
+
+            if self._chunk_idx is None:
+                self._chunk_idx = 0
+            else:
+                self._chunk_idx = self._chunk_idx + 1
+
+            chunk_index = self._chunk_idx
+
+        self._slots.acquire()
+
+        try:
+            future = self._executor.submit(self._compress_and_upload,
+                                           chunk, chunk_index,
+                                           self._get_compression())
+        except:
+            self._slots.release()
+            raise
+
+        future.add_done_callback(lambda _: self._slots.release())
+
+        with self._lock:
+            self._futures.append(future)
+
+    def upload_file(self, filename, chunk_size=8*1024*1024):
+        """Read the file called 'filename' in chunks of 'chunk_size'
+           bytes and queue each chunk for upload. Call close() to
+           wait for the upload to complete and finalise the file
+        """
+        chunk_size = int(chunk_size)
+
+        if chunk_size < 1:
+            raise ValueError("The chunk size must be at least 1 byte")
+
+        with open(filename, "rb") as FILE:
+            while True:
+                chunk = FILE.read(chunk_size)
+
+                if not chunk:
+                    break
+
+                self.upload(chunk)
+
+    def _compress_and_upload(self, chunk, chunk_index, compression):
+        """Internal function run in a worker thread to compress and
+           upload the chunk at 'chunk_index', retrying failed uploads.
+           'compression' is the (compression_type, level, threads)
+           used to compress the chunk
+        """
+        (compression, level, threads) = compression
+        (chunk, md5, compression, size) = _compress_chunk(
+                                        chunk, compression_type=compression,
+                                        level=level, threads=threads)
+
+        import time as _time
+
+        attempt = 0
+
+        while True:
+            try:
+                self._upload_chunk(chunk=chunk, checksum=md5,
+                                   chunk_index=chunk_index,
+                                   compression=compression,
+                                   uncompressed_size=size)
+                return
+            except PermissionError:
+                # retrying will not help
+                raise
+            except Exception:
+                if attempt >= self._max_retries:
+                    raise
+
+                _time.sleep(0.25 * (2 ** attempt))
+                attempt += 1
+
+    def _raise_failed(self):
+        """Internal function that raises the error of the first
+           chunk that failed to upload (if any)
+        """
+        with self._lock:
+            futures = [f for f in self._futures if f.done()]
+
+        for future in futures:
+            future.result()
+
+    def wait(self):
+        """Wait until all of the queued chunks have been uploaded,
+           raising the error of the first chunk that failed
+        """
+        with self._lock:
+            futures = self._futures
+
+        for future in futures:
+            future.result()
+
+        with self._lock:
+            self._futures = [f for f in self._futures if f not in futures]
+
+    def close(self):
+        """Wait for all of the chunks to be uploaded and then close the
+           uploader - this will finalise the file. If any chunk
+           failed to upload then the error is raised and the
+           file is not finalised
+        """
+        try:
+            self.wait()
+        except:
+            # the file cannot be finalised, so abandon the upload
+            self._chunk_idx = None
+            raise
+        finally:
+            with self._lock:
+                executor = self._executor
+                self._executor = None
+
+            if executor is not None:
+                executor.shutdown(wait=True)
+
+        ChunkUploader.close(self)
+
+    @staticmethod
+    def from_data(data, privkey=None, service=None, workers=4,
+                  max_retries=3):
+        """Return a ParallelChunkUploader from a json-deserialised
+           dictionary (see ChunkUploader.from_data)
+        """
+        uploader = ChunkUploader.from_data(data=data, privkey=privkey,
+                                           service=service)
+
+        c = ParallelChunkUploader(workers=workers, max_retries=max_retries)
+        c._drive_uid = uploader._drive_uid
+        c._file_uid = uploader._file_uid
+        c._secret = getattr(uploader, "_secret", None)
+        c._service = uploader._service
+
+        return c
@@ -171,7 +171,7 @@ class Drive:
         else:
             return self._creds.storage_service()
 
-    def chunk_upload(self, filename, dir=None, aclrules=None):
+    def chunk_upload(self, filename, dir=None, aclrules=None, workers=None):
         """Start a chunked upload of a file called 'filename' (just the
            filename - not the full path - if you want to specify a certain
            directory in the Drive then specify that in 'dir').
@@ -184,7 +184,10 @@ class Drive:
            the last version of the file, or inherited from the drive.
 
            This will return a ChunkUploader which can be used to actually
-           upload the file
+           upload the file. If 'workers' is set then this will return
+           a ParallelChunkUploader, which compresses and uploads
+           up to 'workers' chunks at once (e.g. via its upload_file
+           function)
         """
         if self.is_null():
             raise PermissionError("Cannot upload a file to a null drive!")
@@ -196,10 +199,12 @@ class Drive:
         filemeta = _FileMeta(filename=filename)
         filemeta._set_drive_metadata(self._metadata, self._creds)
 
-        return filemeta.open().chunk_upload(aclrules=aclrules)
+        return filemeta.open().chunk_upload(aclrules=aclrules,
+                                            workers=workers)
 
     def upload(self, filename, dir=None, uploaded_name=None, aclrules=None,
-               force_par=False):
+               force_par=False, compression_type=None,
+               compression_level=None):
         """Upload the file at 'filename' to this drive, assuming we have
            write access to this drive (or all files in the directory
            at 'filename' if this is really a directory).
@@ -215,6 +220,9 @@ class Drive:
            ACL rules used to grant access to this file via 'aclrules'.
            If this is not set, then the rules will be derived from either
            the last version of the file, or inherited from the drive.
+           The file is compressed using the codec 'compression_type'
+           at level 'compression_level' (or the default codec if
+           these are not set)
         """
         if self.is_null():
             raise PermissionError("Cannot upload a file to a null drive!")
@@ -234,7 +242,9 @@ class Drive:
                 self.upload(filename="%s/%s" % (filename, f),
                             uploaded_name="%s/%s" % (uploaded_name, f),
                             dir=None, aclrules=aclrules,
-                            force_par=force_par)
+                            force_par=force_par,
+                            compression_type=compression_type,
+                            compression_level=compression_level)
 
             from Acquire.Client import DirMeta as _DirMeta
             dirmeta = _DirMeta(name=uploaded_name)
@@ -248,14 +258,18 @@ class Drive:
 
             return filemeta.open().upload(filename=filename,
                                           force_par=force_par,
-                                          aclrules=aclrules)
+                                          aclrules=aclrules,
+                                          compression_type=compression_type,
+                                          compression_level=compression_level)
 
     def chunk_download(self, filename, dir=None, download_name=None,
-                       version=None):
+                       version=None, workers=None):
         """Download the file 'filename' from the Drive to directory 'dir' on
            this computer (or current directory if not specified), calling
            the downloaded file 'download_filename' (or 'filename' if not
-           specified). Force transfer using an OSPar is force_par is True
+           specified). Force transfer using an OSPar is force_par is True.
+           If 'workers' is set then this returns a ParallelChunkDownloader
+           that downloads many chunks at once
         """
         if self.is_null():
             raise PermissionError("Cannot upload a file to a null drive!")
@@ -265,7 +279,8 @@ class Drive:
         filemeta._set_drive_metadata(self._metadata, self._creds)
 
         return filemeta.open().chunk_download(filename=download_name,
-                                              version=version, dir=dir)
+                                              version=version, dir=dir,
+                                              workers=workers)
 
     def download(self, filename, dir=None, download_name=None,
                  version=None, force_par=False):
@@ -350,18 +365,11 @@ class Drive:
             return Drive._list_drives(drive_uid=self._metadata.uid(),
                                       creds=self._creds)
 
-    def list_files(self, dir=None, filename=None, include_metadata=False):
-        """Return a list of the FileMetas of all of the files contained
-           in this drive. If 'dir' is specified then list only the
-           files that are contained in 'dir'. If 'filename' is specified
-           then return only the files that match the passed filename
+    def _list_files_args(self, dir=None, filename=None,
+                         include_metadata=False):
+        """Internal function that returns the arguments to send to the
+           storage service to list the files in this drive
         """
-        if self.is_null():
-            return []
-
-        from Acquire.ObjectStore import string_to_list as _string_to_list
-        from Acquire.Storage import FileMeta as _FileMeta
-
         if include_metadata:
             include_metadata = True
         else:
@@ -387,8 +395,14 @@ class Drive:
             args["par_uid"] = par.uid()
             args["secret"] = self._creds.secret()
 
-        response = self.storage_service().call_function(function="list_files",
-                                                        args=args)
+        return args
+
+    def _list_files_from_response(self, response):
+        """Internal function that returns the FileMetas from the
+           response of the storage service to 'list_files'
+        """
+        from Acquire.ObjectStore import string_to_list as _string_to_list
+        from Acquire.Storage import FileMeta as _FileMeta
 
         files = _string_to_list(response["files"], _FileMeta)
 
@@ -397,6 +411,39 @@ class Drive:
 
         return files
 
+    def list_files(self, dir=None, filename=None, include_metadata=False):
+        """Return a list of the FileMetas of all of the files contained
+           in this drive. If 'dir' is specified then list only the
+           files that are contained in 'dir'. If 'filename' is specified
+           then return only the files that match the passed filename
+        """
+        if self.is_null():
+            return []
+
+        args = self._list_files_args(dir=dir, filename=filename,
+                                     include_metadata=include_metadata)
+
+        response = self.storage_service().call_function(function="list_files",
+                                                        args=args)
+
+        return self._list_files_from_response(response)
+
+    async def alist_files(self, dir=None, filename=None,
+                          include_metadata=False):
+        """Coroutine version of list_files, which lists the files
+           using a non-blocking call to the storage service
+        """
+        if self.is_null():
+            return []
+
+        args = self._list_files_args(dir=dir, filename=filename,
+                                     include_metadata=include_metadata)
+
+        response = await self.storage_service().acall_function(
+                                            function="list_files", args=args)
+
+        return self._list_files_from_response(response)
+
     def location(self, name=None, version=None):
         """Return the unique location identifying the passed file
            (or directory). If no name is specified, this this will
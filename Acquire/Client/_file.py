@@ -1,6 +1,9 @@
 
 __all__ = ["File"]
 
+# the number of bytes requested per call when reading to the end of a file
+_read_size = 8 * 1024 * 1024
+
 
 class File:
     """This class provides a handle to a user's file on a Drive.
@@ -76,10 +79,12 @@ class File:
         else:
             return "File(name='%s')" % self._metadata.name()
 
-    def chunk_upload(self, aclrules=None):
+    def chunk_upload(self, aclrules=None, workers=None):
         """Start a chunk-upload of a new version of this file. This
            will return a chunk-uploader that can be used to upload
-           a file chunk-by-chunk
+           a file chunk-by-chunk. If 'workers' is set then this
+           returns a ParallelChunkUploader that uploads up to
+           'workers' chunks at a time
         """
         if self.is_null():
             raise PermissionError("Cannot download a null File!")
@@ -137,13 +142,26 @@ class File:
 
         self._metadata = filemeta
 
+        if workers is not None:
+            from Acquire.Client import ParallelChunkUploader \
+                as _ParallelChunkUploader
+            return _ParallelChunkUploader.from_data(response["uploader"],
+                                                    privkey=privkey,
+                                                    service=storage_service,
+                                                    workers=workers)
+
         from Acquire.Client import ChunkUploader as _ChunkUploader
         return _ChunkUploader.from_data(response["uploader"],
                                         privkey=privkey,
                                         service=storage_service)
 
-    def upload(self, filename, force_par=False, aclrules=None):
-        """Upload 'filename' as the new version of this file"""
+    def upload(self, filename, force_par=False, aclrules=None,
+               compression_type=None, compression_level=None):
+        """Upload 'filename' as the new version of this file. The file
+           is compressed using the codec 'compression_type' at level
+           'compression_level' (or the default codec if these are
+           not set - see Acquire.Client.set_default_compression)
+        """
         if self.is_null():
             raise PermissionError("Cannot download a null File!")
 
@@ -168,7 +186,9 @@ class File:
                                  remote_filename=uploaded_name,
                                  drive_uid=drive_uid,
                                  aclrules=aclrules,
-                                 local_cutoff=local_cutoff)
+                                 local_cutoff=local_cutoff,
+                                 compression_type=compression_type,
+                                 compression_level=compression_level)
 
         try:
             args = {"filehandle": filehandle.to_data()}
@@ -226,9 +246,11 @@ class File:
             raise
 
     def chunk_download(self, filename=None, version=None,
-                       dir=None):
+                       dir=None, workers=None):
         """Return a ChunkDownloader to download this file
-           chunk-by-chunk
+           chunk-by-chunk. If 'workers' is set then this returns
+           a ParallelChunkDownloader that downloads up to
+           2 x 'workers' chunks at a time
         """
         if self.is_null():
             raise PermissionError("Cannot download a null File!")
@@ -270,32 +292,30 @@ class File:
         response = storage_service.call_function(
                                 function="download", args=args)
 
-        from Acquire.Client import ChunkDownloader as _ChunkDownloader
-        downloader = _ChunkDownloader.from_data(response["downloader"],
+        if workers is not None:
+            from Acquire.Client import ParallelChunkDownloader \
+                as _ParallelChunkDownloader
+            downloader = _ParallelChunkDownloader.from_data(
+                                                response["downloader"],
                                                 privkey=privkey,
-                                                service=storage_service)
+                                                service=storage_service,
+                                                workers=workers)
+        else:
+            from Acquire.Client import ChunkDownloader as _ChunkDownloader
+            downloader = _ChunkDownloader.from_data(response["downloader"],
+                                                    privkey=privkey,
+                                                    service=storage_service)
 
         downloader._start_download(filename=filename, dir=dir)
 
         return downloader
 
-    def download(self, filename=None, version=None,
-                 dir=None, force_par=False):
-        """Download this file into the local directory
-           the local directory, or 'dir' if specified,
-           calling the file 'filename' (or whatever it is called
-           on the Drive if not specified). If a local
-           file exists with this name, then a new, unique filename
-           will be used. This returns the local filename of the
-           downloaded file (with full absolute path)
-
-           Note that this only downloads files for which you
-           have read-access. If the file is not readable then
-           an exception is raised and nothing is returned
-
-           If 'version' is specified then download a specific version
-           of the file. Otherwise download the version associated
-           with this file object
+    def _download_args(self, version=None, force_par=False,
+                       function="download"):
+        """Internal function that returns the arguments to send to the
+           storage service to call 'function' to download this file,
+           together with the private key used to decrypt the response
+           and the storage service itself
         """
         if self.is_null():
             raise PermissionError("Cannot download a null File!")
@@ -303,14 +323,8 @@ class File:
         if self._creds is None:
             raise PermissionError("We have not properly opened the file!")
 
-        if filename is None:
-            filename = self._metadata.name()
-
         drive_uid = self._metadata.drive().uid()
 
-        from Acquire.Client import create_new_file as \
-            _create_new_file
-
         if self._creds.is_user():
             privkey = self._creds.user().session_key()
         else:
@@ -324,8 +338,8 @@ class File:
         if self._creds.is_user():
             from Acquire.Client import Authorisation as _Authorisation
             authorisation = _Authorisation(
-                        resource="download %s %s" % (drive_uid,
-                                                     self._metadata.name()),
+                        resource="%s %s %s" % (function, drive_uid,
+                                               self._metadata.name()),
                         user=self._creds.user())
             args["authorisation"] = authorisation.to_data()
         elif self._creds.is_par():
@@ -346,8 +360,19 @@ class File:
 
         storage_service = self._creds.storage_service()
 
-        response = storage_service.call_function(
-                                function="download", args=args)
+        return (args, privkey, storage_service)
+
+    def _download_from_response(self, response, privkey, storage_service,
+                                filename=None, dir=None):
+        """Internal function that downloads the file described by
+           the 'response' of the storage service to 'download',
+           returning the local filename of the downloaded file
+        """
+        if filename is None:
+            filename = self._metadata.name()
+
+        from Acquire.Client import create_new_file as \
+            _create_new_file
 
         from Acquire.Client import FileMeta as _FileMeta
         filemeta = _FileMeta.from_data(response["filemeta"])
@@ -406,6 +431,183 @@ class File:
 
         return filename
 
+    def download(self, filename=None, version=None,
+                 dir=None, force_par=False):
+        """Download this file into the local directory
+           the local directory, or 'dir' if specified,
+           calling the file 'filename' (or whatever it is called
+           on the Drive if not specified). If a local
+           file exists with this name, then a new, unique filename
+           will be used. This returns the local filename of the
+           downloaded file (with full absolute path)
+
+           Note that this only downloads files for which you
+           have read-access. If the file is not readable then
+           an exception is raised and nothing is returned
+
+           If 'version' is specified then download a specific version
+           of the file. Otherwise download the version associated
+           with this file object
+        """
+        (args, privkey, storage_service) = self._download_args(
+                                                version=version,
+                                                force_par=force_par)
+
+        response = storage_service.call_function(
+                                function="download", args=args)
+
+        return self._download_from_response(response=response,
+                                            privkey=privkey,
+                                            storage_service=storage_service,
+                                            filename=filename, dir=dir)
+
+    async def adownload(self, filename=None, version=None,
+                        dir=None, force_par=False):
+        """Coroutine version of download. The call to the storage
+           service is non-blocking, while the transfer and writing
+           of the file data is run in the event loop's default
+           executor
+        """
+        (args, privkey, storage_service) = self._download_args(
+                                                version=version,
+                                                force_par=force_par)
+
+        response = await storage_service.acall_function(
+                                function="download", args=args)
+
+        import asyncio as _asyncio
+        import functools as _functools
+        loop = _asyncio.get_event_loop()
+
+        return await loop.run_in_executor(
+                        None, _functools.partial(
+                                self._download_from_response,
+                                response=response, privkey=privkey,
+                                storage_service=storage_service,
+                                filename=filename, dir=dir))
+
+    def read(self, offset=0, length=None, version=None):
+        """Read and return 'length' bytes of this file, starting from
+           byte 'offset' (or read to the end of the file if 'length'
+           is None). Fewer bytes are returned if the range extends
+           beyond the end of the file. Only the part of the file
+           that contains the range is transferred - this is the
+           range itself for uncompressed files, or the chunks that
+           overlap the range for chunked files. Files that were
+           uploaded compressed as a single object are downloaded
+           in full, as there is no way to map the range onto
+           the compressed data
+
+           If 'version' is specified then read from a specific version
+           of the file. Otherwise read from the version associated
+           with this file object
+        """
+        offset = int(offset)
+
+        if offset < 0:
+            raise ValueError("The offset must be 0 or greater")
+
+        if length is not None:
+            length = int(length)
+
+            if length < 0:
+                raise ValueError("The length must be 0 or greater")
+
+        (args, _, storage_service) = self._download_args(
+                                                version=version,
+                                                function="read_range")
+
+        parts = []
+        position = offset
+        remaining = length
+
+        while remaining is None or remaining > 0:
+            if remaining is None:
+                size = _read_size
+            else:
+                size = remaining
+
+            args["offset"] = position
+            args["length"] = size
+
+            response = storage_service.call_function(function="read_range",
+                                                     args=args)
+
+            if "data" in response:
+                from Acquire.ObjectStore import string_to_bytes \
+                    as _string_to_bytes
+                data = _string_to_bytes(response["data"])
+            elif "chunks" in response:
+                data = self._read_from_chunks(response["chunks"],
+                                              position, size)
+            else:
+                return self._read_from_download(offset=offset,
+                                                length=length,
+                                                version=version)
+
+            if len(data) == 0:
+                break
+
+            parts.append(data)
+            position += len(data)
+
+            if remaining is not None:
+                remaining -= len(data)
+
+        return b"".join(parts)
+
+    @staticmethod
+    def _read_from_chunks(chunks, offset, length):
+        """Internal function that validates and decompresses the
+           passed chunks (as returned by the read_range function of
+           the storage service), returning the 'length' bytes
+           starting from byte 'offset' of the file
+        """
+        from Acquire.ObjectStore import string_to_bytes as _string_to_bytes
+        from Acquire.Client import uncompress as _uncompress
+        from Acquire.Crypto import Hash as _Hash
+
+        parts = []
+        end = offset + length
+
+        for chunk in chunks:
+            meta = chunk["meta"]
+            data = _string_to_bytes(chunk["chunk"])
+
+            md5 = _Hash.md5(data)
+
+            if md5 != meta["checksum"]:
+                from Acquire.Storage import FileValidationError
+                raise FileValidationError(
+                    "Problem reading - checksums don't agree: %s vs %s" %
+                    (meta["checksum"], md5))
+
+            data = _uncompress(inputdata=data,
+                               compression_type=meta.get("compression",
+                                                         "bz2"))
+
+            start = int(chunk["offset"])
+            parts.append(data[max(0, offset - start):max(0, end - start)])
+
+        return b"".join(parts)
+
+    def _read_from_download(self, offset, length, version=None):
+        """Internal function that reads the range of the file by
+           downloading the whole file to a temporary directory
+        """
+        import tempfile as _tempfile
+
+        with _tempfile.TemporaryDirectory() as tempdir:
+            filename = self.download(dir=tempdir, version=version)
+
+            with open(filename, "rb") as FILE:
+                FILE.seek(offset)
+
+                if length is None:
+                    return FILE.read()
+                else:
+                    return FILE.read(length)
+
     def list_versions(self, include_metadata=False):
         """Return a list of all of the versions of this file.
            If 'include_metadata' is True then this will include
@@ -1,9 +1,613 @@
 
-__all__ = ["create_new_file", "compress", "uncompress"]
+__all__ = ["create_new_file", "compress", "uncompress",
+           "register_codec", "get_codec", "list_codecs",
+           "set_default_compression", "get_default_compression",
+           "register_magic_number", "get_file_format",
+           "estimate_compressibility", "choose_compression",
+           "set_compression_policy", "get_compression_policy"]
+
+
+class _Transform:
+    """Internal class that wraps a compressor or decompressor object
+       so that all codecs present the same 'process' and 'flush'
+       interface
+    """
+    def __init__(self, process, flush=None):
+        self._process = process
+        self._flush = flush
+
+    def process(self, data):
+        """Process (compress or decompress) the passed block of data"""
+        return self._process(data)
+
+    def flush(self):
+        """Return any data remaining at the end of the stream"""
+        if self._flush is None:
+            return b""
+        else:
+            return self._flush()
+
+
+class Codec:
+    """This is the base class of all of the compression codecs. A
+       codec has a 'name' that is recorded with the compressed data,
+       so that the right codec can be used to decompress it.
+       Derived classes must implement 'compressor' and 'decompressor'.
+       'level' is the compression level (None for the codec default)
+       and 'threads' the number of threads to use to compress
+       (ignored by codecs that are single-threaded)
+    """
+    name = None
+    module = None
+
+    def is_available(self):
+        """Return whether or not the module needed by this codec
+           is installed
+        """
+        if self.module is None:
+            return True
+
+        import importlib as _importlib
+
+        try:
+            _importlib.import_module(self.module)
+            return True
+        except ImportError:
+            return False
+
+    def _import(self):
+        """Import and return the module needed by this codec"""
+        import importlib as _importlib
+
+        try:
+            return _importlib.import_module(self.module)
+        except ImportError:
+            raise ValueError(
+                "Cannot use the '%s' compression codec as the module '%s' "
+                "is not installed. Please install it, e.g. via "
+                "'pip install %s'" % (self.name, self.module,
+                                      self.module.split(".")[0]))
+
+    def compressor(self, level=None, threads=None):
+        """Return a new compressor for a stream of data"""
+        raise NotImplementedError()
+
+    def decompressor(self):
+        """Return a new decompressor for a stream of data"""
+        raise NotImplementedError()
+
+    def compress(self, data, level=None, threads=None):
+        """Compress and return the passed data"""
+        c = self.compressor(level=level, threads=threads)
+        return c.process(data) + c.flush()
+
+    def decompress(self, data):
+        """Decompress and return the passed data"""
+        d = self.decompressor()
+        return d.process(data) + d.flush()
+
+
+class _NoneCodec(Codec):
+    """Codec that does not compress the data"""
+    name = "none"
+
+    def compressor(self, level=None, threads=None):
+        return _Transform(bytes)
+
+    def decompressor(self):
+        return _Transform(bytes)
+
+
+class _Bz2Codec(Codec):
+    """Codec that uses bz2 (default level 9)"""
+    name = "bz2"
+    module = "bz2"
+
+    def compressor(self, level=None, threads=None):
+        if level is None:
+            level = 9
+
+        c = self._import().BZ2Compressor(int(level))
+        return _Transform(c.compress, c.flush)
+
+    def decompressor(self):
+        d = self._import().BZ2Decompressor()
+        return _Transform(d.decompress)
+
+
+class _ZlibCodec(Codec):
+    """Codec that uses zlib (default level 6)"""
+    name = "zlib"
+    module = "zlib"
+
+    def compressor(self, level=None, threads=None):
+        if level is None:
+            level = 6
+
+        c = self._import().compressobj(int(level))
+        return _Transform(c.compress, c.flush)
+
+    def decompressor(self):
+        d = self._import().decompressobj()
+        return _Transform(d.decompress, d.flush)
+
+
+class _ZstdCodec(Codec):
+    """Codec that uses zstandard (default level 3). This supports
+       multi-threaded compression by setting 'threads' (-1 means
+       use all cores)
+    """
+    name = "zstd"
+    module = "zstandard"
+
+    def compressor(self, level=None, threads=None):
+        if level is None:
+            level = 3
+
+        if threads is None:
+            threads = 0
+
+        c = self._import().ZstdCompressor(
+                            level=int(level), threads=int(threads),
+                            write_content_size=False).compressobj()
+        return _Transform(c.compress, c.flush)
+
+    def decompressor(self):
+        d = self._import().ZstdDecompressor().decompressobj()
+        return _Transform(d.decompress)
+
+
+class _Lz4Codec(Codec):
+    """Codec that uses the lz4 frame format (default level 0,
+       which is the fastest)
+    """
+    name = "lz4"
+    module = "lz4.frame"
+
+    def compressor(self, level=None, threads=None):
+        if level is None:
+            level = 0
+
+        c = self._import().LZ4FrameCompressor(compression_level=int(level))
+        started = [False]
+
+        def _process(data):
+            if started[0]:
+                return c.compress(data)
+            else:
+                started[0] = True
+                return c.begin() + c.compress(data)
+
+        def _flush():
+            if started[0]:
+                return c.flush()
+            else:
+                started[0] = True
+                return c.begin() + c.flush()
+
+        return _Transform(_process, _flush)
+
+    def decompressor(self):
+        d = self._import().LZ4FrameDecompressor()
+        return _Transform(d.decompress)
+
+
+_codecs = {}
+
+_default_compression = {"compression_type": "bz2",
+                        "level": None,
+                        "threads": None}
+
+
+def register_codec(codec):
+    """Register the passed Codec so that it can be used to compress
+       and uncompress data. This replaces any existing codec with
+       the same name
+    """
+    if not isinstance(codec, Codec):
+        raise TypeError("The codec must be derived from Codec")
+
+    if codec.name is None:
+        raise ValueError("The codec must have a name")
+
+    _codecs[codec.name] = codec
+
+
+def get_codec(compression_type):
+    """Return the codec used for 'compression_type'. A
+       'compression_type' of None means no compression
+    """
+    if compression_type is None:
+        compression_type = "none"
+
+    try:
+        return _codecs[compression_type]
+    except KeyError:
+        raise ValueError("Unrecognised compression type '%s'. Available "
+                         "types are %s" % (compression_type,
+                                           list_codecs()))
+
+
+def list_codecs(include_unavailable=False):
+    """Return the names of the registered codecs. By default this
+       only includes the codecs whose modules are installed
+    """
+    return [name for (name, codec) in _codecs.items()
+            if include_unavailable or codec.is_available()]
+
+
+def set_default_compression(compression_type="bz2", level=None,
+                            threads=None):
+    """Set the codec (plus level and number of threads) used by
+       default to compress files and chunks
+    """
+    codec = get_codec(compression_type)
+
+    if not codec.is_available():
+        # raises an error explaining what needs to be installed
+        codec._import()
+
+    _default_compression["compression_type"] = codec.name
+    _default_compression["level"] = level
+    _default_compression["threads"] = threads
+
+
+def get_default_compression():
+    """Return a copy of the default compression settings, as a
+       dictionary of compression_type, level and threads
+    """
+    return dict(_default_compression)
+
+
+for _codec in [_NoneCodec(), _Bz2Codec(), _ZlibCodec(),
+               _ZstdCodec(), _Lz4Codec()]:
+    register_codec(_codec)
+
+
+# magic numbers of file formats that are already compressed (or
+# encrypted), and so are not worth compressing again. Each entry
+# is (offset, magic, file_format)
+_magic_numbers = []
+
+_compression_policy = {"min_size": 128,
+                       "sample_size": 65536,
+                       "num_samples": 4,
+                       "max_entropy": 7.95,
+                       "skip_ratio": 0.95,
+                       "cheap_ratio": 0.8,
+                       "cheap_codecs": [("lz4", 0), ("zstd", 1), ("zlib", 1)]}
+
+
+def register_magic_number(magic, file_format, offset=0):
+    """Register the bytes 'magic' found at 'offset' bytes into a file
+       as identifying a file of format 'file_format' that is already
+       compressed. Files in this format are not compressed again
+    """
+    if isinstance(magic, str):
+        magic = magic.encode("utf-8")
+
+    magic = bytes(magic)
+    offset = int(offset)
+
+    if len(magic) == 0 or offset < 0:
+        raise ValueError("The magic number must be at least one byte "
+                         "at a non-negative offset")
+
+    entry = (offset, magic, str(file_format))
+
+    if entry not in _magic_numbers:
+        _magic_numbers.append(entry)
+
+
+for (_offset, _magic, _format) in [
+        (0, b"\x1f\x8b\x08", "gz"),
+        (0, b"\x42\x5a\x68", "bz2"),
+        (0, b"\x50\x4b\x03\x04", "zip"),
+        (0, b"\x28\xb5\x2f\xfd", "zstd"),
+        (0, b"\x04\x22\x4d\x18", "lz4"),
+        (0, b"\xfd\x37\x7a\x58\x5a\x00", "xz"),
+        (0, b"\x37\x7a\xbc\xaf\x27\x1c", "7z"),
+        (0, b"\x52\x61\x72\x21\x1a\x07", "rar"),
+        (0, b"\xff\xd8\xff", "jpeg"),
+        (0, b"\x89PNG\r\n\x1a\n", "png"),
+        (0, b"GIF8", "gif"),
+        (8, b"WEBP", "webp"),
+        (4, b"ftyp", "mp4"),
+        (0, b"\x1a\x45\xdf\xa3", "mkv"),
+        (0, b"ID3", "mp3"),
+        (0, b"OggS", "ogg"),
+        (0, b"fLaC", "flac"),
+        (0, b"\x89HDF\r\n\x1a\n", "hdf5"),
+        (0, b"PAR1", "parquet"),
+        (0, b"\xfeAQT", "acquire_stream")]:
+    register_magic_number(_magic, _format, _offset)
+
+
+def get_file_format(filename=None, data=None):
+    """Return the name of the (already compressed) file format of
+       the passed file or data, as identified from its magic
+       number, or None if this is not a recognised format
+    """
+    length = max(offset + len(magic) for (offset, magic, _) in _magic_numbers)
+
+    if filename is not None:
+        with open(filename, "rb") as FILE:
+            start = FILE.read(length)
+    elif data is not None:
+        start = bytes(data[0:length])
+    else:
+        return None
+
+    for (offset, magic, file_format) in _magic_numbers:
+        if start[offset:offset+len(magic)] == magic:
+            return file_format
+
+    return None
+
+
+def set_compression_policy(min_size=None, sample_size=None, num_samples=None,
+                           max_entropy=None, skip_ratio=None,
+                           cheap_ratio=None, cheap_codecs=None):
+    """Set the policy used by choose_compression. Files smaller than
+       'min_size' bytes are not compressed. Otherwise 'num_samples'
+       blocks of 'sample_size' bytes, evenly spaced through the
+       file, are sampled. Data whose byte entropy is above
+       'max_entropy' bits per byte, or that a fast compressor
+       shrinks to more than 'skip_ratio' of its size, is not
+       compressed. Data that shrinks to more than 'cheap_ratio' of
+       its size is compressed with the first available of the
+       'cheap_codecs' (a list of (compression_type, level))
+    """
+    if min_size is not None:
+        _compression_policy["min_size"] = max(0, int(min_size))
+
+    if sample_size is not None:
+        sample_size = int(sample_size)
+        if sample_size < 1:
+            raise ValueError("The sample size must be at least 1 byte")
+        _compression_policy["sample_size"] = sample_size
+
+    if num_samples is not None:
+        num_samples = int(num_samples)
+        if num_samples < 1:
+            raise ValueError("The number of samples must be at least 1")
+        _compression_policy["num_samples"] = num_samples
+
+    if max_entropy is not None:
+        _compression_policy["max_entropy"] = float(max_entropy)
+
+    if skip_ratio is not None:
+        _compression_policy["skip_ratio"] = float(skip_ratio)
+
+    if cheap_ratio is not None:
+        _compression_policy["cheap_ratio"] = float(cheap_ratio)
+
+    if cheap_codecs is not None:
+        codecs = []
+        for (compression_type, level) in cheap_codecs:
+            codecs.append((get_codec(compression_type).name, level))
+        _compression_policy["cheap_codecs"] = codecs
+
+
+def get_compression_policy():
+    """Return a copy of the policy used by choose_compression"""
+    import copy as _copy
+    return _copy.deepcopy(_compression_policy)
+
+
+def _sample_blocks(filename=None, data=None, filesize=None):
+    """Internal function that returns a list of evenly spaced blocks
+       sampled from the passed file or data
+    """
+    sample_size = _compression_policy["sample_size"]
+    num_samples = _compression_policy["num_samples"]
+
+    if filesize is None:
+        if filename is not None:
+            import os as _os
+            filesize = _os.path.getsize(filename)
+        else:
+            filesize = len(data)
+
+    if filesize <= sample_size * num_samples:
+        # small enough to sample everything
+        starts = [0]
+        sample_size = filesize
+    elif num_samples == 1:
+        starts = [0]
+    else:
+        step = (filesize - sample_size) // (num_samples - 1)
+        starts = [i * step for i in range(0, num_samples)]
+
+    if filename is not None:
+        samples = []
+        with open(filename, "rb") as FILE:
+            for start in starts:
+                FILE.seek(start)
+                samples.append(FILE.read(sample_size))
+        return samples
+    else:
+        return [bytes(data[start:start+sample_size]) for start in starts]
+
+
+def _byte_counts(block):
+    """Internal function that returns the number of times that
+       each byte value appears in 'block'
+    """
+    import collections as _collections
+    counts = _collections.Counter(block)
+    return [counts.get(i, 0) for i in range(0, 256)]
+
+
+def estimate_compressibility(data):
+    """Estimate how compressible the passed data (or list of sampled
+       blocks of data) is. This returns a tuple of the estimated
+       compression ratio (compressed size / original size, using
+       a fast compressor) and the byte entropy (in bits per byte)
+    """
+    import math as _math
+    import zlib as _zlib
+
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = [bytes(data)]
+
+    total = sum(len(block) for block in data)
+
+    if total == 0:
+        return (1.0, 0.0)
+
+    counts = [0] * 256
+    compressed = 0
+
+    for block in data:
+        for (i, count) in enumerate(_byte_counts(block)):
+            counts[i] += count
+
+        compressed += len(_zlib.compress(block, 1))
+
+    entropy = 0.0
+
+    for count in counts:
+        if count > 0:
+            p = count / total
+            entropy -= p * _math.log2(p)
+
+    return (compressed / total, entropy)
+
+
+def choose_compression(filename=None, data=None, filesize=None,
+                       compression_type=None, level=None):
+    """Decide whether and how the passed file (or data) should be
+       compressed. If 'compression_type' is None then the default
+       codec is used, unless the data is only marginally
+       compressible, in which case a cheaper codec is chosen. Data
+       that is small, already compressed (as identified by its magic
+       number, see register_magic_number) or incompressible (as
+       estimated from sampled blocks) is not compressed.
+
+       This returns a dictionary of the chosen "compression_type"
+       ("none" if the data should not be compressed) and "level",
+       the "decision" that was made ("disabled", "too_small",
+       "already_compressed", "incompressible", "cheap_codec" or
+       "compressed"), the detected "file_format" and the
+       "estimated_ratio" and "entropy" of the sampled data
+    """
+    policy = _compression_policy
+
+    result = {"compression_type": "none",
+              "level": None,
+              "decision": None,
+              "file_format": None,
+              "estimated_ratio": None,
+              "entropy": None}
+
+    if compression_type is None:
+        default = get_default_compression()
+        compression_type = default["compression_type"]
+        if level is None:
+            level = default["level"]
+        is_default = True
+    else:
+        compression_type = get_codec(compression_type).name
+        is_default = False
+
+    if compression_type == "none":
+        result["decision"] = "disabled"
+        return result
+
+    if filesize is None:
+        if filename is not None:
+            import os as _os
+            filesize = _os.path.getsize(filename)
+        elif data is not None:
+            filesize = len(data)
+        else:
+            filesize = 0
+
+    if filesize < policy["min_size"]:
+        result["decision"] = "too_small"
+        return result
+
+    file_format = get_file_format(filename=filename, data=data)
+
+    if file_format is not None:
+        result["decision"] = "already_compressed"
+        result["file_format"] = file_format
+        return result
+
+    (ratio, entropy) = estimate_compressibility(
+                        _sample_blocks(filename=filename, data=data,
+                                       filesize=filesize))
+
+    result["estimated_ratio"] = ratio
+    result["entropy"] = entropy
+
+    if entropy > policy["max_entropy"] or ratio > policy["skip_ratio"]:
+        result["decision"] = "incompressible"
+        return result
+
+    if is_default and ratio > policy["cheap_ratio"]:
+        for (cheap_type, cheap_level) in policy["cheap_codecs"]:
+            if get_codec(cheap_type).is_available():
+                result["compression_type"] = cheap_type
+                result["level"] = cheap_level
+                result["decision"] = "cheap_codec"
+                return result
+
+    result["compression_type"] = compression_type
+    result["level"] = level
+    result["decision"] = "compressed"
+    return result
+
+
+def _transform_file(inputfile, outputfile, transform):
+    """Internal function that passes the contents of 'inputfile'
+       through 'transform' (a compressor or decompressor), writing
+       the result to 'outputfile', or to a tmpfile. This returns
+       the name of the file that was written
+    """
+    import os as _os
+    import tempfile as _tempfile
+
+    block_size = 1048576
+
+    # write to a tmpfile and then move to outputfile later...
+    (fd, tmpfile) = _tempfile.mkstemp(dir=".")
+    _os.close(fd)
+
+    try:
+        with open(inputfile, "rb") as IFILE:
+            with open(tmpfile, "wb") as OFILE:
+                # transform the data in MB blocks
+                data = IFILE.read(block_size)
+
+                while data:
+                    OFILE.write(transform.process(data))
+                    data = IFILE.read(block_size)
+
+                OFILE.write(transform.flush())
+    except Exception as e:
+        print(e)
+        # make sure we delete the temporary file
+        _os.unlink(tmpfile)
+        raise
+
+    if outputfile is None:
+        return tmpfile
+
+    try:
+        # move the tmpfile to the correct output name
+        _os.replace(tmpfile, outputfile)
+        return outputfile
+    except Exception as e:
+        print(e)
+        # we can't rename the file - just return the tmpfile name
+        return tmpfile
 
 
 def compress(inputfile=None, outputfile=None,
-             inputdata=None, compression_type="bz2"):
+             inputdata=None, compression_type="bz2",
+             level=None, threads=None):
     """Compress either the passed filename or filedata using the
        specified compression type. This will compress either to the
        file called 'outputfile', or to a tmpfile. The name of the
@@ -15,60 +619,22 @@ def compress(inputfile=None, outputfile=None,
             outputfile (str, default=None): Name of compressed file
             inputdata (str, default=None): Data to be compressed
             compression_type (str, default="bz2"): Compression type,
-            currently only bz2 supported
+            one of list_codecs()
+            level (int, default=None): Compression level
+            threads (int, default=None): Number of compression threads
+            (only used by codecs that support this, e.g. zstd)
        Returns:
             bytes: Compressed data
     """
-    import os as _os
-
-    if compression_type == "bz2":
-        import bz2 as _bz2
-
-        block_size = 1048576
-        if inputfile is not None:
-            IFILE = open(inputfile, "rb")
-
-            # compress to a tmpfile and then move to outputfile later...
-            import tempfile as _tempfile
-            (fd, bz2file) = _tempfile.mkstemp(dir=".")
-            _os.close(fd)
+    codec = get_codec(compression_type)
 
-            try:
-                OFILE = _bz2.BZ2File(bz2file, "wb", compresslevel=9)
-
-                # compress data in MB blocks
-                data = IFILE.read(block_size)
-
-                while data:
-                    OFILE.write(data)
-                    data = IFILE.read(block_size)
-
-                IFILE.close()
-                OFILE.close()
-            except Exception as e:
-                print(e)
-                # make sure we delete the temporary bz2file
-                _os.unlink(bz2file)
-                raise
-
-            if outputfile is None:
-                return bz2file
-
-            try:
-                # move the bz2file to the correct output name
-                _os.rename(bz2file, outputfile)
-                return outputfile
-            except Exception as e:
-                print(e)
-                # we can't rename the file - just return the bz2 name
-                return bz2file
-
-        elif inputdata is not None:
-            # compress the passed data and return
-            return _bz2.compress(inputdata)
-    else:
-        raise ValueError("Unrecognised compression type '%s'" %
-                         compression_type)
+    if inputfile is not None:
+        return _transform_file(inputfile, outputfile,
+                               codec.compressor(level=level,
+                                                threads=threads))
+    elif inputdata is not None:
+        # compress the passed data and return
+        return codec.compress(inputdata, level=level, threads=threads)
 
 
 def uncompress(inputfile=None, outputfile=None,
@@ -84,60 +650,17 @@ def uncompress(inputfile=None, outputfile=None,
             outputfile (str, default=None): Name of decompressed file
             inputdata (str, default=None): Data to be decompressed
             compression_type (str, default="bz2"): Compression type,
-            currently only bz2 supported
+            one of list_codecs()
        Returns:
             bytes: Decompressed data
     """
-    import os as _os
-
-    if compression_type == "bz2":
-        import bz2 as _bz2
+    codec = get_codec(compression_type)
 
-        block_size = 1048576
-        if inputfile is not None:
-            IFILE = _bz2.BZ2File(inputfile, "rb")
-
-            # compress to a tmpfile and then move to outputfile later...
-            import tempfile as _tempfile
-            (fd, bz2file) = _tempfile.mkstemp(dir=".")
-            _os.close(fd)
-
-            try:
-                OFILE = open(bz2file, "wb")
-
-                # compress data in MB blocks
-                data = IFILE.read(block_size)
-
-                while data:
-                    OFILE.write(data)
-                    data = IFILE.read(block_size)
-
-                IFILE.close()
-                OFILE.close()
-            except Exception as e:
-                print(e)
-                # make sure we delete the temporary bz2file
-                _os.unlink(bz2file)
-                raise
-
-            if outputfile is None:
-                return bz2file
-
-            try:
-                # move the bz2file to the correct output name
-                _os.rename(bz2file, outputfile)
-                return outputfile
-            except Exception as e:
-                print(e)
-                # we can't rename the file - just return the bz2 name
-                return bz2file
-
-        elif inputdata is not None:
-            # compress the passed data and return
-            return _bz2.decompress(inputdata)
-    else:
-        raise ValueError("Unrecognised compression type '%s'" %
-                         compression_type)
+    if inputfile is not None:
+        return _transform_file(inputfile, outputfile, codec.decompressor())
+    elif inputdata is not None:
+        # uncompress the passed data and return
+        return codec.decompress(inputdata)
 
 
 def create_new_file(filename, dir=None):
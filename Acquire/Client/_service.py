@@ -283,6 +283,22 @@ class Service:
         self._fail()
         return {}
 
+    def call_batch_function(self, calls):
+        """Call many functions on this service in a single request.
+           'calls' is a list of (function, args) pairs. This returns
+           a list of the return value, or the exception raised,
+           for each call
+        """
+        self._fail()
+        return []
+
+    async def acall_function(self, function, args=None):
+        """Coroutine version of call_function, which calls the function
+           using a non-blocking HTTP client
+        """
+        self._fail()
+        return {}
+
     def sign(self, message):
         """Sign the specified message"""
         self._fail()
@@ -2,6 +2,11 @@
 import os as _os
 import base64 as _base64
 import uuid as _uuid
+import time as _time
+import struct as _struct
+import threading as _threading
+
+from collections import OrderedDict as _OrderedDict
 
 from Acquire.Stubs import lazy_import as _lazy_import
 
@@ -15,8 +20,13 @@ _hashes = _lazy_import.lazy_module("cryptography.hazmat.primitives.hashes")
 _padding = _lazy_import.lazy_module(
             "cryptography.hazmat.primitives.asymmetric.padding")
 _fernet = _lazy_import.lazy_module("cryptography.fernet")
+_aead = _lazy_import.lazy_module(
+            "cryptography.hazmat.primitives.ciphers.aead")
+_hkdf = _lazy_import.lazy_module("cryptography.hazmat.primitives.kdf.hkdf")
 
-__all__ = ["PrivateKey", "PublicKey", "SymmetricKey", "get_private_key"]
+__all__ = ["PrivateKey", "PublicKey", "SymmetricKey", "get_private_key",
+           "set_session_key_options", "get_session_key_options",
+           "clear_session_keys"]
 
 
 def _bytes_to_string(b):
@@ -108,6 +118,389 @@ def get_private_key(key="default"):
         return privkey
 
 
+# Messages encrypted using a session key start with this marker,
+# and are laid out as
+#
+#   MAGIC | RSA-wrapped session key | nonce (12 bytes) | AES-GCM ciphertext
+#
+# The sender wraps a session key once and reuses it (and the wrapped
+# bytes) for all messages to the same public key until it expires. The
+# receiver caches the unwrapped session key against the wrapped bytes,
+# so in steady state neither side performs any RSA operations. Because
+# every message carries the wrapped key, any process holding the
+# private key can decrypt it, even if it has not seen the session before
+_SESSION_MAGIC = b"\xfeAQS"
+
+_session_lock = _threading.Lock()
+
+# the session keys used to encrypt messages, indexed by the
+# fingerprint of the public key of the recipient
+_session_keys = {}
+
+# the unwrapped session keys used to decrypt messages, indexed by
+# the fingerprint of the private key and the wrapped key bytes
+_session_key_cache = _OrderedDict()
+
+_session_key_options = {"ttl": 3600,
+                        "max_uses": 2**20,
+                        "cache_size": 256}
+
+
+def set_session_key_options(ttl=None, max_uses=None, cache_size=None):
+    """Set the options used for session-key encryption. A session
+       key is rotated after it has been used for 'ttl' seconds,
+       or to encrypt 'max_uses' messages. 'cache_size' is the
+       maximum number of unwrapped session keys that are cached
+       for decryption
+    """
+    with _session_lock:
+        if ttl is not None:
+            ttl = float(ttl)
+            if ttl <= 0:
+                raise ValueError("The session key TTL must be positive")
+            _session_key_options["ttl"] = ttl
+
+        if max_uses is not None:
+            max_uses = int(max_uses)
+            if max_uses < 1:
+                raise ValueError("A session key must be usable at least once")
+            _session_key_options["max_uses"] = max_uses
+
+        if cache_size is not None:
+            cache_size = int(cache_size)
+            if cache_size < 0:
+                raise ValueError("The cache size cannot be negative")
+            _session_key_options["cache_size"] = cache_size
+
+        _session_keys.clear()
+        _session_key_cache.clear()
+
+
+def get_session_key_options():
+    """Return a copy of the options used for session-key encryption"""
+    with _session_lock:
+        return dict(_session_key_options)
+
+
+def clear_session_keys():
+    """Forget all session keys, so that new keys are wrapped for
+       the next messages
+    """
+    with _session_lock:
+        _session_keys.clear()
+        _session_key_cache.clear()
+
+
+def _get_session_key(pubkey):
+    """Internal function that returns the (key, wrapped_key) session
+       key used to encrypt messages to 'pubkey', creating (and wrapping)
+       a new session key if there isn't one, or if the existing key
+       has expired or been used too many times
+    """
+    fingerprint = pubkey.fingerprint()
+    now = _time.monotonic()
+
+    with _session_lock:
+        try:
+            session = _session_keys[fingerprint]
+        except KeyError:
+            session = None
+
+        if session is not None:
+            if session["expires"] < now or \
+                    session["uses"] >= _session_key_options["max_uses"]:
+                session = None
+            else:
+                session["uses"] += 1
+                return (session["key"], session["wrapped"])
+
+        ttl = _session_key_options["ttl"]
+
+    key = _aead.AESGCM.generate_key(bit_length=256)
+    wrapped = pubkey._pubkey.encrypt(
+                    key,
+                    _padding.OAEP(
+                        mgf=_padding.MGF1(algorithm=_hashes.SHA256()),
+                        algorithm=_hashes.SHA256(),
+                        label=None))
+
+    with _session_lock:
+        _session_keys[fingerprint] = {"key": key, "wrapped": wrapped,
+                                      "expires": now + ttl, "uses": 1}
+
+    return (key, wrapped)
+
+
+def _unwrap_session_key(privkey, wrapped):
+    """Internal function that returns the session key in 'wrapped',
+       using the cached key if this has been unwrapped before
+    """
+    cache_key = (privkey.fingerprint(), wrapped)
+    now = _time.monotonic()
+
+    with _session_lock:
+        try:
+            (key, expires) = _session_key_cache[cache_key]
+        except KeyError:
+            key = None
+
+        if key is not None:
+            if expires >= now:
+                _session_key_cache.move_to_end(cache_key)
+                return key
+            else:
+                del _session_key_cache[cache_key]
+
+        ttl = _session_key_options["ttl"]
+
+    try:
+        key = privkey._privkey.decrypt(
+                    wrapped,
+                    _padding.OAEP(
+                        mgf=_padding.MGF1(algorithm=_hashes.SHA256()),
+                        algorithm=_hashes.SHA256(),
+                        label=None))
+    except Exception as e:
+        from Acquire.Crypto import DecryptionError
+        raise DecryptionError(
+            "Cannot decrypt the session key used to encrypt the "
+            "message: %s" % str(e))
+
+    with _session_lock:
+        cache_size = _session_key_options["cache_size"]
+
+        if cache_size > 0:
+            _session_key_cache[cache_key] = (key, now + ttl)
+
+            while len(_session_key_cache) > cache_size:
+                _session_key_cache.popitem(last=False)
+
+    return key
+
+
+# Streams encrypted by encrypt_stream start with a header of
+#
+#   MAGIC | mode | segment size (4 bytes) | salt (16 bytes) |
+#       RSA-wrapped session key (only for mode "P")
+#
+# followed by the segments. Each segment is a 4 byte length (whose top
+# bit is set for the last segment) then the AES-GCM ciphertext of up
+# to 'segment size' bytes of plaintext. A fresh data key is derived for
+# each stream from the key and salt, and the nonce of each segment is
+# its index plus the last-segment flag, so segments cannot be
+# reordered, dropped or truncated without detection
+_STREAM_MAGIC = b"\xfeAQT"
+
+_STREAM_SEGMENT_SIZE = 1024 * 1024
+
+_STREAM_LAST_FLAG = 0x80000000
+
+
+def _to_readable(src):
+    """Internal function that returns 'src' as something that can
+       be read from. This can be a file-like object or bytes
+    """
+    if isinstance(src, (bytes, bytearray, memoryview)):
+        from io import BytesIO as _BytesIO
+        return _BytesIO(bytes(src))
+    elif isinstance(src, str):
+        from io import BytesIO as _BytesIO
+        return _BytesIO(src.encode("utf-8"))
+    else:
+        return src
+
+
+def _read_exactly(src, size):
+    """Internal function that reads and returns up to 'size' bytes
+       from 'src', only returning fewer bytes at the end of the stream
+    """
+    data = src.read(size)
+
+    if data is None:
+        data = b""
+
+    if len(data) == size or len(data) == 0:
+        return data
+
+    parts = [data]
+    remaining = size - len(data)
+
+    while remaining > 0:
+        data = src.read(remaining)
+
+        if not data:
+            break
+
+        parts.append(data)
+        remaining -= len(data)
+
+    return b"".join(parts)
+
+
+def _read_segments(src, segment_size):
+    """Internal generator that yields (segment, is_last) for each
+       segment of 'segment_size' bytes from 'src'. 'src' is either
+       something that can be read from, or an iterable of bytes
+       (e.g. a generator of chunks). At least one (possibly empty)
+       segment is always yielded
+    """
+    src = _to_readable(src)
+
+    if hasattr(src, "read"):
+        def _segments():
+            while True:
+                segment = _read_exactly(src, segment_size)
+
+                if len(segment) == 0:
+                    return
+
+                yield segment
+    else:
+        def _segments():
+            buffer = bytearray()
+
+            for chunk in src:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode("utf-8")
+
+                buffer += chunk
+
+                while len(buffer) >= segment_size:
+                    yield bytes(buffer[0:segment_size])
+                    del buffer[0:segment_size]
+
+            if len(buffer) > 0:
+                yield bytes(buffer)
+
+    previous = None
+
+    for segment in _segments():
+        if previous is not None:
+            yield (previous, False)
+
+        previous = segment
+
+    if previous is None:
+        previous = b""
+
+    yield (previous, True)
+
+
+def _derive_stream_key(key, salt):
+    """Internal function that derives the per-stream data key"""
+    return _hkdf.HKDF(algorithm=_hashes.SHA256(), length=32, salt=salt,
+                      info=b"Acquire encrypt_stream",
+                      backend=_default_backend()).derive(key)
+
+
+def _stream_nonce(index, is_last):
+    """Internal function that returns the nonce of segment 'index'"""
+    return _struct.pack(">3xQ?", index, is_last)
+
+
+def _encrypt_stream(key, mode, src, dst, segment_size, extra_header=b""):
+    """Internal function that encrypts 'src' to 'dst' using a data key
+       derived from 'key', returning the number of bytes written
+    """
+    segment_size = int(segment_size)
+
+    if segment_size < 1 or segment_size >= _STREAM_LAST_FLAG - 16:
+        raise ValueError("Invalid segment size: %s" % segment_size)
+
+    salt = _os.urandom(16)
+    header = _STREAM_MAGIC + mode + _struct.pack(">I", segment_size) + \
+        salt + extra_header
+
+    aesgcm = _aead.AESGCM(_derive_stream_key(key, salt))
+
+    dst.write(header)
+    nbytes = len(header)
+
+    for (index, (segment, is_last)) in enumerate(
+                                    _read_segments(src, segment_size)):
+        data = aesgcm.encrypt(_stream_nonce(index, is_last), segment, header)
+
+        size = len(data)
+
+        if is_last:
+            size = size | _STREAM_LAST_FLAG
+
+        dst.write(_struct.pack(">I", size))
+        dst.write(data)
+        nbytes += 4 + len(data)
+
+    return nbytes
+
+
+def _read_stream_header(src):
+    """Internal function that reads the header of an encrypted
+       stream, returning the (mode, segment_size, salt)
+    """
+    header = _read_exactly(src, len(_STREAM_MAGIC) + 21)
+
+    if len(header) != len(_STREAM_MAGIC) + 21 or \
+            header[0:len(_STREAM_MAGIC)] != _STREAM_MAGIC:
+        from Acquire.Crypto import DecryptionError
+        raise DecryptionError("The data is not an encrypted stream")
+
+    start = len(_STREAM_MAGIC)
+    mode = header[start:start+1]
+    (segment_size,) = _struct.unpack(">I", header[start+1:start+5])
+    salt = header[start+5:start+21]
+
+    return (header, mode, segment_size, salt)
+
+
+def _decrypt_stream(key, header, segment_size, salt, src, dst):
+    """Internal function that decrypts the segments in 'src' (whose
+       header has already been read) to 'dst', returning the
+       number of bytes written
+    """
+    from Acquire.Crypto import DecryptionError
+
+    aesgcm = _aead.AESGCM(_derive_stream_key(key, salt))
+
+    index = 0
+    nbytes = 0
+
+    while True:
+        size = _read_exactly(src, 4)
+
+        if len(size) != 4:
+            raise DecryptionError(
+                "The encrypted stream has been truncated")
+
+        (size,) = _struct.unpack(">I", size)
+        is_last = (size & _STREAM_LAST_FLAG) != 0
+        size = size & ~_STREAM_LAST_FLAG
+
+        if size > segment_size + 16:
+            raise DecryptionError(
+                "Corrupted segment %d in the encrypted stream" % index)
+
+        data = _read_exactly(src, size)
+
+        try:
+            data = aesgcm.decrypt(_stream_nonce(index, is_last), data, header)
+        except Exception as e:
+            raise DecryptionError(
+                "Cannot decrypt segment %d of the encrypted stream: %s" %
+                (index, str(e)))
+
+        dst.write(data)
+        nbytes += len(data)
+        index += 1
+
+        if is_last:
+            break
+
+    if len(_read_exactly(src, 1)) != 0:
+        raise DecryptionError(
+            "There is unexpected data after the end of the encrypted stream")
+
+    return nbytes
+
+
 class PublicKey:
     """This is a holder for an in-memory public key"""
     def __init__(self, public_key=None):
@@ -176,16 +569,30 @@ class PublicKey:
         # return this signature as "AA:BB:CC:DD:EE:etc."
         return ":".join([h[i:i+2] for i in range(0, len(h), 2)])
 
-    def encrypt(self, message):
+    def encrypt(self, message, use_session_key=False):
         """Encrypt and return the passed message. For short messages this
            will use the private key directly. For longer messages,
            this will generate a random
            symmetric key, will encrypt the message using that, and will then
-           encrypt the symmetric key. This returns some bytes
+           encrypt the symmetric key. This returns some bytes.
+
+           If 'use_session_key' is True then the message is instead
+           encrypted using AES-GCM with a session key that is shared
+           by all messages to this key until it is rotated (see
+           set_session_key_options). This avoids any RSA operations
+           once the session key has been wrapped. Only use this if
+           the recipient can decrypt session-key messages
         """
         if isinstance(message, str):
             message = message.encode("utf-8")
 
+        if use_session_key:
+            (key, wrapped) = _get_session_key(self)
+            nonce = _os.urandom(12)
+            header = _SESSION_MAGIC + wrapped
+            return header + nonce + _aead.AESGCM(key).encrypt(
+                                                nonce, message, header)
+
         try:
             return self._pubkey.encrypt(
                         message,
@@ -215,6 +622,21 @@ class PublicKey:
         # is the token, because we are using 2048 bit (256 byte) keys
         return encrypted_key + token
 
+    def encrypt_stream(self, src, dst, segment_size=_STREAM_SEGMENT_SIZE):
+        """Encrypt all of the data read from 'src', writing the result
+           to 'dst'. 'src' can be a file-like object, bytes, or an
+           iterable of bytes (e.g. a generator of file chunks), while
+           'dst' must have a 'write' function. The data is encrypted
+           in authenticated segments of 'segment_size' bytes, so the
+           memory used does not depend on the amount of data. The
+           stream can be decrypted using PrivateKey.decrypt_stream.
+           This returns the number of bytes written to 'dst'
+        """
+        (key, wrapped) = _get_session_key(self)
+        return _encrypt_stream(key=key, mode=b"P", src=src, dst=dst,
+                               segment_size=segment_size,
+                               extra_header=wrapped)
+
     def verify(self, signature, message):
         """Verify that the message has been correctly signed"""
         if self._pubkey is None:
@@ -421,9 +843,40 @@ class PrivateKey:
         """
         return self.public_key().fingerprint()
 
-    def encrypt(self, message):
+    def encrypt(self, message, use_session_key=False):
         """Encrypt and return the passed message"""
-        return self.public_key().encrypt(message)
+        return self.public_key().encrypt(message,
+                                         use_session_key=use_session_key)
+
+    def encrypt_stream(self, src, dst, segment_size=_STREAM_SEGMENT_SIZE):
+        """Encrypt all of the data read from 'src' to 'dst'
+           (see PublicKey.encrypt_stream)
+        """
+        return self.public_key().encrypt_stream(src=src, dst=dst,
+                                                segment_size=segment_size)
+
+    def decrypt_stream(self, src, dst):
+        """Decrypt the stream of data read from 'src' that was encrypted
+           using encrypt_stream, writing the decrypted data to 'dst'.
+           Each segment is authenticated before it is written, and
+           this raises a DecryptionError if the stream has been
+           modified or truncated. This returns the number of bytes
+           written to 'dst'
+        """
+        src = _to_readable(src)
+        (header, mode, segment_size, salt) = _read_stream_header(src)
+
+        if mode != b"P":
+            from Acquire.Crypto import DecryptionError
+            raise DecryptionError(
+                "The stream was not encrypted using a public key")
+
+        wrapped = _read_exactly(src, self.key_size_in_bytes())
+        key = _unwrap_session_key(self, wrapped)
+
+        return _decrypt_stream(key=key, header=header + wrapped,
+                               segment_size=segment_size, salt=salt,
+                               src=src, dst=dst)
 
     def verify(self, signature, message):
         """Verify the passed signature is correct for the passed message"""
@@ -438,6 +891,9 @@ class PrivateKey:
             raise DecryptionError("You cannot decrypt a message "
                                   "with a null key!")
 
+        if message[0:len(_SESSION_MAGIC)] == _SESSION_MAGIC:
+            return self._decrypt_with_session_key(message)
+
         # try standard decryption
         try:
             message = self._privkey.decrypt(
@@ -491,6 +947,31 @@ class PrivateKey:
         except:
             return message
 
+    def _decrypt_with_session_key(self, message):
+        """Internal function used to decrypt a message that was
+           encrypted using a session key
+        """
+        key_size = self.key_size_in_bytes()
+        start = len(_SESSION_MAGIC)
+        header = message[0:start+key_size]
+        nonce = message[start+key_size:start+key_size+12]
+
+        key = _unwrap_session_key(self, header[start:])
+
+        try:
+            message = _aead.AESGCM(key).decrypt(
+                                nonce, message[start+key_size+12:], header)
+        except Exception as e:
+            from Acquire.Crypto import DecryptionError
+            raise DecryptionError(
+                    "Cannot decrypt the message using the "
+                    "session key: %s" % str(e))
+
+        try:
+            return message.decode("utf-8")
+        except:
+            return message
+
     def sign(self, message):
         """Return the signature for the passed message"""
         if self._privkey is None:
@@ -699,6 +1180,40 @@ class SymmetricKey:
         token = f.encrypt(message)
         return token
 
+    def encrypt_stream(self, src, dst, segment_size=_STREAM_SEGMENT_SIZE):
+        """Encrypt all of the data read from 'src' to 'dst'
+           (see PublicKey.encrypt_stream). The stream can be
+           decrypted using SymmetricKey.decrypt_stream
+        """
+        if self._symkey is None:
+            self._symkey = _generate_symmetric_key()
+
+        return _encrypt_stream(key=_base64.urlsafe_b64decode(self._symkey),
+                               mode=b"S", src=src, dst=dst,
+                               segment_size=segment_size)
+
+    def decrypt_stream(self, src, dst):
+        """Decrypt the stream of data read from 'src' that was encrypted
+           using encrypt_stream, writing the decrypted data to 'dst'
+           (see PrivateKey.decrypt_stream)
+        """
+        if self._symkey is None:
+            from Acquire.Crypto import DecryptionError
+            raise DecryptionError("You cannot decrypt a message "
+                                  "with a null key!")
+
+        src = _to_readable(src)
+        (header, mode, segment_size, salt) = _read_stream_header(src)
+
+        if mode != b"S":
+            from Acquire.Crypto import DecryptionError
+            raise DecryptionError(
+                "The stream was not encrypted using a symmetric key")
+
+        return _decrypt_stream(key=_base64.urlsafe_b64decode(self._symkey),
+                               header=header, segment_size=segment_size,
+                               salt=salt, src=src, dst=dst)
+
     def decrypt(self, message):
         """Decrypt and return the passed message"""
         if self._symkey is None:
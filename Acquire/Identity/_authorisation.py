@@ -386,10 +386,9 @@ class Authorisation:
            service has seen this authorisation. This records the
            UID of the authorisation to the object store and then
            verifies that the signature of the UID is correct.
-
-           There is a small race condition if the service asserts
-           the authorisation at the exact same time, but this is
-           a highly unlikely occurance. The aim is to prevent
+           The UID is recorded using a conditional write, so
+           only one use can succeed even if the same authorisation
+           is asserted at the same time. The aim is to prevent
            replay attacks.
         """
         if self.is_null():
@@ -407,32 +406,24 @@ class Authorisation:
             as _get_service_account_bucket
         from Acquire.ObjectStore import get_datetime_now_to_string \
             as _get_datetime_now_to_string
+        from Acquire.ObjectStore import PreconditionFailedError \
+            as _PreconditionFailedError
 
         bucket = _get_service_account_bucket()
         authkey = "auth_once/%s" % self._uid
         now = _get_datetime_now_to_string()
 
+        # Record this to the object store to prevent anyone else
+        # from using this authorisation on this service. This is
+        # a conditional write, so only the first use can succeed
         try:
-            data = _ObjectStore.get_string_object(bucket=bucket, key=authkey)
-        except:
-            data = None
-
-        if data is not None:
+            _ObjectStore.set_object_if_absent(bucket=bucket, key=authkey,
+                                              data=now.encode("utf-8"))
+        except _PreconditionFailedError:
             raise PermissionError(
                 "Cannot auth_once the authorisation as it has been used "
                 "before on this service!")
 
-        # This is the first time this authorisation has been seen.
-        # Record this to the object store to prevent anyone else
-        # from using this authorisation on this service. There is a
-        # small race condition here, but this would be extremely
-        # challenging to exploit, and mitigating it would be a
-        # significant performance problem. Ideally the object store
-        # would have a "test_and_set" to enable us to set only if
-        # the previous value is None
-        _ObjectStore.set_string_object(bucket=bucket, key=authkey,
-                                       string_data=now)
-
         # Now validate that the signature of the UID is correct
         public_cert = self._get_user_public_cert(scope=scope,
                                                  permissions=permissions)
@@ -8,11 +8,15 @@ by most of the other modules.
 """
 
 from ._objstore import *
+from ._objstore_cache import *
+from ._disk_cache import *
 from ._ospar import *
+from ._ospar_upload import *
 from ._osparregistry import *
 from ._encoding import *
 from ._function import *
 from ._mutex import *
+from ._lease_mutex import *
 from ._errors import *
 
 try:
@@ -0,0 +1,516 @@
+
+import hashlib as _hashlib
+import os as _os
+import threading as _threading
+import uuid as _uuid
+
+__all__ = ["enable_disk_cache", "disable_disk_cache",
+           "is_disk_cache_enabled", "get_disk_cache_statistics",
+           "clear_disk_cache"]
+
+_disk_cache_lock = _threading.RLock()
+
+# the on-disk cache of large objects, or None if this is disabled
+_disk_cache = None
+
+# the number of lock stripes used to serialise fills of the cache
+_num_stripes = 256
+
+
+def _read_file(path):
+    """Read and return the contents of the file at 'path' using
+       a memory map (so that the data is copied directly from the
+       page cache)
+    """
+    import mmap as _mmap
+
+    with open(path, "rb") as FILE:
+        if _os.fstat(FILE.fileno()).st_size == 0:
+            return b""
+
+        with _mmap.mmap(FILE.fileno(), 0, access=_mmap.ACCESS_READ) as mm:
+            return mm[:]
+
+
+def _get_default_directory():
+    """Return the default directory of the disk cache. This is in the
+       system temporary directory, named for the current user, so that
+       it is shared by all of this user's processes on this machine
+    """
+    import tempfile as _tempfile
+
+    try:
+        user = _os.getuid()
+    except AttributeError:
+        import getpass as _getpass
+        user = _getpass.getuser()
+
+    return _os.path.join(_tempfile.gettempdir(),
+                         "acquire_object_cache_%s" % user)
+
+
+def _create_private_directory(directory):
+    """Create (if needed) the directory 'directory' so that it can only
+       be used by the current user. As cached objects are served without
+       being downloaded again, this raises a PermissionError if the
+       directory is owned by another user, or if other users could
+       write to it (and so plant the contents of objects)
+    """
+    _os.makedirs(directory, mode=0o700, exist_ok=True)
+
+    try:
+        uid = _os.getuid()
+    except AttributeError:
+        # no posix users on this platform (the temporary directory
+        # is already private to the user)
+        return
+
+    import stat as _stat
+
+    st = _os.stat(directory)
+
+    if st.st_uid != uid:
+        raise PermissionError(
+            "Cannot use '%s' for the disk cache as it is owned by "
+            "another user" % directory)
+
+    if st.st_mode & (_stat.S_IWGRP | _stat.S_IWOTH):
+        raise PermissionError(
+            "Cannot use '%s' for the disk cache as it can be written "
+            "to by other users" % directory)
+
+    if _stat.S_IMODE(st.st_mode) != 0o700:
+        _os.chmod(directory, 0o700)
+
+
+class _FillLock:
+    """Lock that serialises the fill of an entry in the cache, both
+       between threads (using a striped threading.Lock) and between
+       processes that share the cache directory (using flock on a
+       striped lock file)
+    """
+    def __init__(self, cache, stripe):
+        self._lock = cache._stripes[stripe]
+        self._lockfile = _os.path.join(cache._directory, "locks",
+                                       "%02x" % stripe)
+        self._handle = None
+
+    def __enter__(self):
+        self._lock.acquire()
+
+        try:
+            import fcntl as _fcntl
+            self._handle = open(self._lockfile, "a")
+            _fcntl.flock(self._handle.fileno(), _fcntl.LOCK_EX)
+        except ImportError:
+            # no flock on this platform, so only lock between threads
+            self._handle = None
+        except:
+            self._lock.release()
+            raise
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if self._handle is not None:
+                self._handle.close()
+                self._handle = None
+        finally:
+            self._lock.release()
+
+
+class _DiskCache:
+    """A size-bounded cache of objects held as files in 'directory'.
+       Each entry is a file named by the hash of its cache ID (e.g.
+       the bucket, key and checksum of an object, or the URL of an
+       object read via a PAR). The least recently used entries are evicted
+       once more than 'max_bytes' are cached. Objects smaller
+       than 'min_object_size' are not cached
+    """
+    def __init__(self, directory, max_bytes, min_object_size):
+        self._directory = _os.path.abspath(directory)
+        self._max_bytes = int(max_bytes)
+        self._min_object_size = int(min_object_size)
+        self._stripes = [_threading.Lock() for _ in range(0, _num_stripes)]
+        self._stats = {"hits": 0, "misses": 0, "fills": 0,
+                       "evictions": 0, "revalidations": 0}
+
+        _create_private_directory(self._directory)
+        _os.makedirs(_os.path.join(self._directory, "locks"), exist_ok=True)
+
+        self._nbytes = self._scan_size()
+
+    def _hash(self, cache_id):
+        """Return the hash used to name the entry for 'cache_id'"""
+        return _hashlib.sha256(cache_id.encode("utf-8")).hexdigest()
+
+    def _path(self, cache_id):
+        """Return the path to the file for 'cache_id'"""
+        h = self._hash(cache_id)
+        return _os.path.join(self._directory, h[0:2], h)
+
+    def _fill_lock(self, cache_id):
+        """Return the lock that must be held to fill 'cache_id'"""
+        return _FillLock(self, int(self._hash(cache_id)[0:2], 16))
+
+    def _count(self, stat, n=1):
+        with _disk_cache_lock:
+            self._stats[stat] += n
+
+    def _entries(self):
+        """Return the (mtime, size, path) of every file in the cache"""
+        entries = []
+
+        for subdir in _os.scandir(self._directory):
+            if subdir.name == "locks" or not subdir.is_dir():
+                continue
+
+            for entry in _os.scandir(subdir.path):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        return entries
+
+    def _scan_size(self):
+        """Return the number of bytes held in the cache"""
+        return sum(entry[1] for entry in self._entries())
+
+    def _evict(self):
+        """Remove the least recently used entries until the cache is
+           below 90% of its maximum size. The directory is scanned, so
+           that space used by other processes is also counted.
+           Temporary files are only removed once they have been
+           abandoned for an hour
+        """
+        import time as _time
+
+        entries = sorted(self._entries())
+        nbytes = sum(entry[1] for entry in entries)
+        target = int(0.9 * self._max_bytes)
+        abandoned = _time.time() - 3600
+
+        for (mtime, size, path) in entries:
+            if nbytes <= target:
+                break
+
+            if path.endswith(".etag"):
+                # removed together with its entry
+                continue
+            elif path.endswith(".tmp") and mtime > abandoned:
+                continue
+
+            try:
+                _os.remove(path)
+                nbytes -= size
+            except OSError:
+                continue
+
+            if not path.endswith(".tmp"):
+                self._count("evictions")
+
+                try:
+                    etag_path = "%s.etag" % path
+                    etag_size = _os.path.getsize(etag_path)
+                    _os.remove(etag_path)
+                    nbytes -= etag_size
+                except OSError:
+                    pass
+
+        with _disk_cache_lock:
+            self._nbytes = nbytes
+
+    def _store(self, path, data, etag=None):
+        """Atomically write 'data' (and 'etag') to the entry at 'path'"""
+        _os.makedirs(_os.path.dirname(path), exist_ok=True)
+
+        tmpname = "%s.%s.tmp" % (path, _uuid.uuid4())
+
+        with open(tmpname, "wb") as FILE:
+            FILE.write(data)
+
+        _os.replace(tmpname, path)
+
+        nbytes = len(data)
+
+        if etag is not None:
+            tmpname = "%s.%s.tmp" % (path, _uuid.uuid4())
+
+            with open(tmpname, "w") as FILE:
+                FILE.write(etag)
+
+            _os.replace(tmpname, "%s.etag" % path)
+            nbytes += len(etag)
+
+        self._count("fills")
+
+        with _disk_cache_lock:
+            self._nbytes += nbytes
+            must_evict = self._nbytes > self._max_bytes
+
+        if must_evict:
+            self._evict()
+
+    def lookup(self, cache_id):
+        """Return the path to the cached file for 'cache_id', or
+           None if this is not cached. The entry is marked as
+           recently used
+        """
+        path = self._path(cache_id)
+
+        try:
+            _os.utime(path)
+        except OSError:
+            return None
+
+        return path
+
+    def get(self, cache_id, loader, checksum=None):
+        """Return the data for 'cache_id', calling 'loader()' to load
+           the data if it is not cached. Only one thread or process
+           loads each entry at a time - the others wait and then read
+           the cached copy. If 'checksum' is passed then the data is
+           only cached if its MD5 checksum matches
+        """
+        path = self.lookup(cache_id)
+
+        if path is not None:
+            try:
+                data = _read_file(path)
+                self._count("hits")
+                return data
+            except OSError:
+                # the entry was evicted between lookup and read
+                pass
+
+        with self._fill_lock(cache_id):
+            # another filler may have beaten us to it
+            path = self.lookup(cache_id)
+
+            if path is not None:
+                try:
+                    data = _read_file(path)
+                    self._count("hits")
+                    return data
+                except OSError:
+                    pass
+
+            self._count("misses")
+            data = loader()
+
+            if data is not None and len(data) >= self._min_object_size:
+                if checksum is None or \
+                        _hashlib.md5(data).hexdigest() == checksum:
+                    self._store(self._path(cache_id), data)
+
+        return data
+
+    def copy_to(self, cache_id, loader, filename, checksum=None):
+        """Write the data for 'cache_id' to the file 'filename', calling
+           'loader()' to load the data if it is not cached. A cached
+           entry is copied directly from its file
+        """
+        import shutil as _shutil
+
+        path = self.lookup(cache_id)
+
+        if path is not None:
+            try:
+                _shutil.copyfile(path, filename)
+                self._count("hits")
+                return
+            except OSError:
+                pass
+
+        data = self.get(cache_id, loader, checksum=checksum)
+
+        with open(filename, "wb") as FILE:
+            FILE.write(data)
+
+    def get_revalidated(self, cache_id, loader):
+        """Return the data for 'cache_id', where 'loader(etag)' loads
+           the data if it has changed from the cached version with
+           'etag'. The loader returns (data, new_etag), or (None, etag)
+           if the cached data is still valid
+        """
+        path = self.lookup(cache_id)
+        etag = None
+
+        if path is not None:
+            try:
+                with open("%s.etag" % path) as FILE:
+                    etag = FILE.read()
+            except OSError:
+                etag = None
+
+        (data, new_etag) = loader(etag)
+
+        if data is None:
+            try:
+                data = _read_file(path)
+                self._count("revalidations")
+                self._count("hits")
+                return data
+            except (OSError, TypeError):
+                # the entry was evicted - load it in full
+                (data, new_etag) = loader(None)
+
+        self._count("misses")
+
+        if new_etag is not None and len(data) >= self._min_object_size:
+            with self._fill_lock(cache_id):
+                self._store(self._path(cache_id), data, etag=new_etag)
+
+        return data
+
+    def statistics(self):
+        """Return a copy of the statistics of this cache"""
+        with _disk_cache_lock:
+            stats = dict(self._stats)
+            stats["bytes"] = self._nbytes
+
+        stats["max_bytes"] = self._max_bytes
+        stats["min_object_size"] = self._min_object_size
+        stats["directory"] = self._directory
+
+        return stats
+
+    def clear(self):
+        """Remove all entries from the cache"""
+        for (_, _, path) in self._entries():
+            try:
+                _os.remove(path)
+            except OSError:
+                pass
+
+        with _disk_cache_lock:
+            self._nbytes = 0
+
+
+def _get_disk_cache():
+    """Return the disk cache, or None if this is disabled"""
+    return _disk_cache
+
+
+def _get_cache_id(bucket, key):
+    """Return the (cache_id, checksum) of the disk cache entry for the
+       object at 'key' in 'bucket'. The ID includes the checksum of the
+       object, so an object that is overwritten (by any process) is
+       never served from the entry of its old contents. This returns
+       (None, None) if the object should not be cached on disk, i.e.
+       it has no stored checksum (which would have to be calculated
+       by streaming the whole object) or it is too small. This
+       raises an ObjectStoreError if there is no object at 'key'
+    """
+    from ._objstore import ObjectStore as _ObjectStore
+    from ._objstore_cache import _bucket_id
+
+    (size, checksum) = _ObjectStore.get_size_and_checksum(bucket, key,
+                                                          calculate=False)
+
+    cache = _disk_cache
+
+    if cache is None or checksum is None or \
+            size < cache._min_object_size:
+        return (None, None)
+
+    return ("key:%s/%s:%s" % (_bucket_id(bucket), key, checksum), checksum)
+
+
+def _get_object_from_disk(bucket, key, loader):
+    """Internal function used by ObjectStore.get_object to load the
+       object at 'key' in 'bucket' via the disk cache, if this is
+       enabled and the object is immutable
+    """
+    cache = _disk_cache
+
+    if cache is not None:
+        from ._objstore_cache import _get_policy
+
+        if _get_policy(key)[0] == "immutable":
+            try:
+                (cache_id, checksum) = _get_cache_id(bucket, key)
+            except Exception:
+                # let the loader raise the error for a missing object
+                cache_id = None
+
+            if cache_id is not None:
+                return cache.get(cache_id, lambda: loader(bucket, key),
+                                 checksum=checksum)
+
+    return loader(bucket, key)
+
+
+def enable_disk_cache(directory=None, max_bytes=1024*1024*1024,
+                      min_object_size=256*1024):
+    """Enable the on-disk cache of large objects, held in 'directory'
+       (by default a directory for this user in the system temporary
+       directory, so that it is shared by all of the user's processes
+       on this machine). The directory must only be writable by
+       this user, and is created with mode 0700 if needed. At most
+       'max_bytes' are cached, with the least recently used objects
+       evicted first. Objects smaller than 'min_object_size' are
+       not cached on disk.
+
+       The cache is used for immutable objects read by
+       ObjectStore.get_object (see set_object_cache_policy) and for
+       ObjectStore.get_object_as_file, in both cases keyed by the
+       key and the stored checksum of the object, and for reads via
+       BucketReader and ObjectReader (revalidated using the etag of
+       the object)
+    """
+    global _disk_cache
+
+    if directory is None:
+        directory = _get_default_directory()
+
+    max_bytes = int(max_bytes)
+
+    if max_bytes < 1:
+        raise ValueError("The size of the disk cache must be at least 1")
+
+    with _disk_cache_lock:
+        _disk_cache = _DiskCache(directory=directory, max_bytes=max_bytes,
+                                 min_object_size=min_object_size)
+
+
+def disable_disk_cache():
+    """Disable the disk cache. The cached files are left in place
+       so that they can be used if the cache is enabled again
+    """
+    global _disk_cache
+
+    with _disk_cache_lock:
+        _disk_cache = None
+
+
+def is_disk_cache_enabled():
+    """Return whether or not the disk cache is enabled"""
+    return _disk_cache is not None
+
+
+def get_disk_cache_statistics():
+    """Return a dictionary of the statistics of the disk cache, i.e.
+       the number of "hits", "misses", "fills", "evictions" and
+       "revalidations" (reads where the cached object was confirmed
+       as unchanged), plus the number of "bytes" cached. This
+       returns None if the disk cache is disabled
+    """
+    cache = _disk_cache
+
+    if cache is None:
+        return None
+    else:
+        return cache.statistics()
+
+
+def clear_disk_cache():
+    """Remove all objects from the disk cache"""
+    cache = _disk_cache
+
+    if cache is not None:
+        cache.clear()
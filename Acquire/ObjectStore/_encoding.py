@@ -195,7 +195,8 @@ def string_to_bytes(s):
        back converted from a string back to bytes. Note that
        this can only convert strings that were encoded using
        bytes_to_string - you cannot use this to convert
-       arbitrary strings to bytes
+       arbitrary strings to bytes. Data that is already bytes
+       (e.g. sent using the binary wire format) is returned as-is
 
        Args:
             s (str): base64 byte object to decode
@@ -205,6 +206,8 @@ def string_to_bytes(s):
     """
     if s is None:
         return None
+    elif isinstance(s, (bytes, bytearray)):
+        return bytes(s)
     else:
         return _base64.b64decode(s.encode("utf-8"))
 
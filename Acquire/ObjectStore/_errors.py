@@ -1,7 +1,7 @@
 
 
 __all__ = ["ObjectStoreError", "MutexTimeoutError", "EncodingError",
-           "RequestBucketError"]
+           "RequestBucketError", "PreconditionFailedError"]
 
 
 class ObjectStoreError(Exception):
@@ -12,6 +12,10 @@ class EncodingError(ObjectStoreError):
     pass
 
 
+class PreconditionFailedError(ObjectStoreError):
+    pass
+
+
 class MutexTimeoutError(Exception):
     pass
 
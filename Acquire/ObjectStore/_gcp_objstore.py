@@ -6,6 +6,8 @@ import json as _json
 import os as _os
 import copy as _copy
 
+from ._objstore_stream import _ObjectWriter
+
 __all__ = ["GCP_ObjectStore"]
 
 
@@ -58,6 +60,15 @@ def _clean_key(key):
 
     return key
 
+
+def _is_precondition_failure(e):
+    """Return whether or not the passed exception from the GCS client
+       is because the if_generation_match condition of a request
+       was not met
+    """
+    return e.__class__.__name__ in ["PreconditionFailed", "NotFound"]
+
+
 def _get_driver_details_from_par(par):
     """Internal function used to get the GCP driver details from the
        passed OSPar (pre-authenticated request)
@@ -104,6 +115,25 @@ def _get_driver_details_from_data(data):
     return details
 
 
+class _GCSObjectWriter(_ObjectWriter):
+    """Object writer that streams data to a GCS resumable upload.
+       The upload is only completed when the writer is closed - an
+       aborted upload is never completed, and is discarded by GCS
+    """
+    def __init__(self, blob_writer):
+        super().__init__()
+        self._writer = blob_writer
+
+    def _write(self, data):
+        self._writer.write(data)
+
+    def _commit(self):
+        self._writer.close()
+
+    def _abort(self):
+        self._writer = None
+
+
 class GCP_ObjectStore:
     """This is the backend that abstracts using the Google Cloud Platform
        object store
@@ -297,12 +327,23 @@ class GCP_ObjectStore:
             created_datetime = _get_datetime_now()
             expires_datetime = _get_datetime_now() + _datetime.timedelta(seconds=duration)
             bucket_obj = bucket["bucket"]
+            resumable_url = None
             if is_bucket:
                 url = bucket_obj.generate_signed_url(version='v4', expiration=expires_datetime, method=method)
             else:
                 blob = bucket_obj.blob(key)
                 url = blob.generate_signed_url(version='v4', expiration=expires_datetime, method=method)
 
+                if writeable:
+                    # a signed URL that lets the client start its own
+                    # resumable upload session, so that large files can
+                    # be uploaded in parts. This expires with the OSPar
+                    resumable_url = blob.generate_signed_url(
+                                        version='v4',
+                                        expiration=expires_datetime,
+                                        method="POST",
+                                        headers={"x-goog-resumable": "start"})
+
         except Exception as e:
             # couldn't create the preauthenticated request
             from Acquire.ObjectStore import ObjectStoreError
@@ -330,7 +371,8 @@ class GCP_ObjectStore:
                      expires_datetime=expires_datetime,
                      is_readable=readable,
                      is_writeable=writeable,
-                     driver_details=driver_details)
+                     driver_details=driver_details,
+                     resumable_url=resumable_url)
 
         _OSParRegistry.register(par=par,
                                 url_checksum=url_checksum,
@@ -428,6 +470,121 @@ class GCP_ObjectStore:
 
         return data
 
+    @staticmethod
+    def get_object_range(bucket, key, start, length=None):
+        """Return up to 'length' bytes of the data contained in the key
+           'key' in the passed bucket, starting from byte 'start',
+           using a ranged download
+
+           Args:
+                bucket (dict): Bucket containing data
+                key (str): Key for data in bucket
+                start (int): Offset of the first byte to read
+                length (int, default=None): Number of bytes to read,
+                or None to read to the end of the object
+           Returns:
+                bytes: Binary data
+
+        """
+        key = _clean_key(key)
+
+        if length is None:
+            end = None
+        else:
+            # the end of the range is inclusive
+            end = start + length - 1
+
+        blob = bucket["bucket"].blob(key)
+
+        try:
+            return blob.download_as_string(start=start, end=end)
+        except Exception as e:
+            if e.__class__.__name__ == "RequestRangeNotSatisfiable":
+                # the range starts beyond the end of the object
+                return b""
+
+            from Acquire.ObjectStore import ObjectStoreError
+            raise ObjectStoreError("No data at key '%s'" % key)
+
+    @staticmethod
+    def open_object_reader(bucket, key):
+        """Return a binary, seekable file-like object that streams
+           the data contained in the key 'key' in the passed bucket,
+           reading the current generation of the object using ranged
+           downloads
+
+           Args:
+                bucket (dict): Bucket containing data
+                key (str): Key for data in bucket
+           Returns:
+                io.BufferedReader: Stream of the binary data
+
+        """
+        from Acquire.ObjectStore._objstore_stream import _open_ranged_reader
+
+        key = _clean_key(key)
+
+        try:
+            blob = bucket["bucket"].get_blob(key)
+        except:
+            blob = None
+
+        if blob is None:
+            # this may be an old chunked object, which must be read
+            # in full
+            return _io.BytesIO(GCP_ObjectStore.get_object(bucket, key))
+
+        def _fetch(start, end):
+            # the end of the range is inclusive
+            return blob.download_as_string(start=start, end=end - 1)
+
+        return _open_ranged_reader(blob.size, _fetch)
+
+    @staticmethod
+    def open_object_writer(bucket, key):
+        """Return a binary file-like object that streams data to the
+           key 'key' in the passed bucket using a resumable upload,
+           which is only completed when the writer is closed
+
+           Args:
+                bucket (dict): Bucket to hold data
+                key (str): Key for data in bucket
+           Returns:
+                io.RawIOBase: Stream to write the binary data
+
+        """
+        key = _clean_key(key)
+
+        blob = bucket["bucket"].blob(key)
+        return _GCSObjectWriter(blob.open("wb"))
+
+    @staticmethod
+    def get_object_and_etag(bucket, key):
+        """Return the binary data contained in the key 'key' in the
+           passed bucket, together with its etag. The etag is the
+           generation number of the object, which GCS uses for
+           conditional requests
+
+           Args:
+                bucket (dict): Bucket containing data
+                key (str): Key for data in bucket
+           Returns:
+                tuple (bytes, str): Binary data and etag
+
+        """
+        key = _clean_key(key)
+
+        try:
+            # the blob is bound to its current generation, so the data
+            # downloaded is always the data for the returned etag
+            blob = bucket["bucket"].get_blob(key)
+            data = blob.download_as_string()
+        except:
+            from Acquire.ObjectStore import ObjectStoreError
+            raise ObjectStoreError("No data at key '%s'" % key)
+
+        return (data, str(blob.generation))
+
     @staticmethod
     def take_object(bucket, key):
         """Take (delete) the object from the object store, returning
@@ -451,34 +608,45 @@ class GCP_ObjectStore:
         return data
 
     @staticmethod
-    def get_all_object_names(bucket, prefix=None, without_prefix=False):
-        """Returns the names of all objects in the passed bucket
+    def iter_object_names(bucket, prefix=None, start_after=None,
+                          page_size=1000, without_prefix=False):
+        """Iterate over the names of all objects in the passed bucket
+           whose names start with 'prefix', in lexicographic order,
+           starting after the name 'start_after'. The names are
+           listed 'page_size' at a time, with the blob iterator
+           following the page tokens until every page has been read
 
            Args:
                 bucket (dict): Bucket containing data
                 prefix (str): Prefix for data
-                without_prefix (str): Whether or not to include the prefix
-                                      in the object name
+                start_after (str): Only return names after this name
+                page_size (int): Number of names to list per request
+                without_prefix (bool): Whether or not to remove the
+                prefix from the object names
            Returns:
-                list: List of all objects in bucket
+                generator: Names of the objects in the bucket
 
         """
         if prefix is not None:
             prefix = _clean_key(prefix)
 
-        blobs = bucket["bucket"].list_blobs(prefix=prefix)
-
-        names = []
-
         if without_prefix:
             prefix_len = len(prefix)
 
+        # 'start_offset' is inclusive, so names equal to start_after
+        # are skipped
+        blobs = bucket["bucket"].list_blobs(prefix=prefix,
+                                            start_offset=start_after,
+                                            page_size=int(page_size))
+
         for obj in blobs:
-            if prefix:
-                if obj.name.startswith(prefix):
-                    name = obj.name
-            else:
-                name = obj.name
+            name = obj.name
+
+            if prefix and not name.startswith(prefix):
+                continue
+
+            if start_after is not None and name <= start_after:
+                continue
 
             while name.endswith("/"):
                 name = name[0:-1]
@@ -493,9 +661,50 @@ class GCP_ObjectStore:
                     name = name[1:]
 
             if len(name) > 0:
-                names.append(name)
+                yield name
+
+    @staticmethod
+    def list_prefixes(bucket, prefix=None, delimiter="/"):
+        """Return the common prefixes and the immediate objects of the
+           keys in the passed bucket that start with 'prefix'. A common
+           prefix is the part of a key up to and including the first
+           'delimiter' after 'prefix'
+
+           Args:
+                bucket (dict): Bucket containing data
+                prefix (str): Prefix for data
+                delimiter (str): Delimiter between levels of keys
+           Returns:
+                tuple (list, list): Sorted common prefixes and objects
+
+        """
+        if prefix is not None:
+            prefix = _clean_key(prefix)
+
+        blobs = bucket["bucket"].list_blobs(prefix=prefix,
+                                            delimiter=delimiter)
+
+        # the prefixes are only filled in as the pages are read
+        names = [blob.name for blob in blobs]
 
-        return names
+        return (sorted(blobs.prefixes), sorted(names))
+
+    @staticmethod
+    def get_all_object_names(bucket, prefix=None, without_prefix=False):
+        """Returns the names of all objects in the passed bucket
+
+           Args:
+                bucket (dict): Bucket containing data
+                prefix (str): Prefix for data
+                without_prefix (str): Whether or not to include the prefix
+                                      in the object name
+           Returns:
+                list: List of all objects in bucket
+
+        """
+        return list(GCP_ObjectStore.iter_object_names(
+                                bucket=bucket, prefix=prefix,
+                                without_prefix=without_prefix))
 
     @staticmethod
     def set_object(bucket, key, data):
@@ -520,25 +729,157 @@ class GCP_ObjectStore:
         blob = bucket["bucket"].blob(key)
         blob.upload_from_string(data)
 
+    @staticmethod
+    def set_object_if_absent(bucket, key, data):
+        """Set the value of 'key' in 'bucket' to binary 'data' if (and
+           only if) there is no object at this key. This uploads with
+           if_generation_match=0, which only succeeds if there is no
+           live version of the object
+
+           Args:
+                bucket (dict): Bucket containing data
+                key (str): Key for data in bucket
+                data (bytes): Binary data to store in bucket
+
+           Returns:
+                str: The etag of the new object
+        """
+        if data is None:
+            data = b'0'
+
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+
+        key = _clean_key(key)
+
+        blob = bucket["bucket"].blob(key)
+
+        try:
+            blob.upload_from_string(data, if_generation_match=0)
+        except Exception as e:
+            if _is_precondition_failure(e):
+                from Acquire.ObjectStore import PreconditionFailedError
+                raise PreconditionFailedError(
+                    "There is already an object at key '%s'" % key)
+            raise
+
+        return str(blob.generation)
+
+    @staticmethod
+    def set_object_if_match(bucket, key, data, etag):
+        """Set the value of 'key' in 'bucket' to binary 'data' if (and
+           only if) the current object at this key has etag (generation)
+           'etag'
+
+           Args:
+                bucket (dict): Bucket containing data
+                key (str): Key for data in bucket
+                data (bytes): Binary data to store in bucket
+                etag (str): Etag of the object that will be replaced
+
+           Returns:
+                str: The etag of the new object
+        """
+        if data is None:
+            data = b'0'
+
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+
+        key = _clean_key(key)
+
+        blob = bucket["bucket"].blob(key)
+
+        try:
+            blob.upload_from_string(data, if_generation_match=int(etag))
+        except Exception as e:
+            if _is_precondition_failure(e):
+                from Acquire.ObjectStore import PreconditionFailedError
+                raise PreconditionFailedError(
+                    "The object at key '%s' does not match etag '%s'" %
+                    (key, etag))
+            raise
+
+        return str(blob.generation)
+
     @staticmethod
     def delete_all_objects(bucket, prefix=None):
-        """Deletes all objects...
+        """Deletes all objects whose names start with 'prefix' (or
+           all objects in the bucket if 'prefix' is None), using
+           batched delete requests
 
            Args:
                 bucket (dict): Bucket containing data
-                prefix (str, default=None): Prefix for data,
-                currently unused
+                prefix (str, default=None): Prefix for data
             Returns:
                 None
         """
-        blobs = bucket["bucket"].list_blobs()
+        from Acquire.ObjectStore._objstore import _raise_first_error
+
+        if prefix is not None:
+            prefix = _clean_key(prefix)
+
+        names = [blob.name for blob in
+                 bucket["bucket"].list_blobs(prefix=prefix)]
+
+        _raise_first_error(GCP_ObjectStore.delete_objects(bucket, names,
+                                                          clean_keys=False))
+
+    @staticmethod
+    def delete_objects(bucket, keys, max_workers=None, clean_keys=True):
+        """Delete the objects at the passed keys, sending the deletes
+           in batches of up to 100 requests. If a batch fails then
+           its keys are deleted one by one, using up to 'max_workers'
+           threads, to find which failed. The batches themselves are
+           sent one at a time, as a client can only build one batch
+           at a time. Keys that don't exist are not treated as errors
+
+           Args:
+                bucket (dict): Bucket containing data
+                keys (list): Keys of the objects to delete
+                max_workers (int, default=None): Maximum number of
+                threads used to delete the keys of a failed batch
+           Returns:
+                dict: The result for each key, which is None on
+                success, or the exception raised on failure
+        """
+        from Acquire.ObjectStore._objstore import _map_keys
+
+        results = {}
+        keys = list(keys)
+        batch_size = 100
+
+        if clean_keys:
+            keys = {_clean_key(key): key for key in keys}
+        else:
+            keys = {key: key for key in keys}
+
+        names = list(keys.keys())
+
+        for i in range(0, len(names), batch_size):
+            batch_names = names[i:i+batch_size]
+
+            try:
+                with bucket["client"].batch():
+                    for name in batch_names:
+                        bucket["bucket"].delete_blob(name)
+
+                batch_results = {name: None for name in batch_names}
+            except Exception:
+                batch_results = _map_keys(
+                    lambda name: GCP_ObjectStore.delete_object(bucket,
+                                                               name),
+                    batch_names, max_workers)
+
+            for (name, result) in batch_results.items():
+                results[keys[name]] = result
 
-        for blob in blobs:
-            blob.delete()
+        return results
 
     @staticmethod
     def delete_object(bucket, key):
-        """Removes the object at 'key'
+        """Removes the object at 'key'. Removing an object that
+           doesn't exist is not an error
 
            Args:
                 bucket (dict): Bucket containing data
@@ -548,18 +889,26 @@ class GCP_ObjectStore:
         """
         try:
             bucket["bucket"].blob(key).delete()
+        except Exception as e:
+            if e.__class__.__name__ == "NotFound":
+                return
 
-        except:
-            pass
+            from Acquire.ObjectStore import ObjectStoreError
+            raise ObjectStoreError(
+                "Unable to delete the object at '%s': %s" % (key, str(e)))
 
     @staticmethod
-    def get_size_and_checksum(bucket, key):
+    def get_size_and_checksum(bucket, key, calculate=True):
         """Return the object size (in bytes) and MD5 checksum of the
-           object in the passed bucket at the specified key
+           object in the passed bucket at the specified key. If the
+           store has no MD5 for the object then it is calculated by
+           streaming the object, or None is returned for the checksum
+           if 'calculate' is False
 
            Args:
                 bucket (dict): Bucket containing data
                 key (str): Key for object
+                calculate (bool): Whether to calculate a missing MD5
            Returns:
                 tuple (int, str): Size and MD5 checksum of object
 
@@ -573,6 +922,19 @@ class GCP_ObjectStore:
         except:
             from Acquire.ObjectStore import ObjectStoreError
             raise ObjectStoreError("No data at key '%s'" % key)
+
+        if checksum is None and not calculate:
+            return (int(content_length), None)
+
+        if checksum is None:
+            # composite objects have no MD5, so stream the object
+            # to calculate this
+            from Acquire.ObjectStore._objstore_stream import \
+                _stream_size_and_checksum
+
+            with GCP_ObjectStore.open_object_reader(bucket, key) as reader:
+                return _stream_size_and_checksum(reader)
+
         # the checksum is a base64 encoded Content-MD5 header
         # described as standard part of HTTP RFC 2616. Need to
         # convert this back to a hexdigest
@@ -0,0 +1,492 @@
+
+import datetime as _datetime
+import random as _random
+import threading as _threading
+import time as _time
+import weakref as _weakref
+
+from ._mutex import Mutex as _Mutex
+
+__all__ = ["LeaseMutex", "get_mutex_statistics", "reset_mutex_statistics"]
+
+# the smallest and largest time (in seconds) to back off between
+# attempts to take a contended lock
+_min_backoff = 0.01
+_max_backoff = 1.0
+
+# the number of seconds a ticket in a fair queue is valid for before
+# it must be refreshed by its waiter. Tickets of waiters that have
+# died are ignored (and removed) once this has passed
+_ticket_lease = 10.0
+
+_stats_lock = _threading.Lock()
+
+# the contention statistics for all mutexes, and for each key
+_stats = {"total": {}, "keys": {}}
+
+
+def _empty_statistics():
+    """Return a new, empty, set of mutex statistics"""
+    return {"acquisitions": 0,
+            "contended_acquisitions": 0,
+            "attempts": 0,
+            "takeovers": 0,
+            "timeouts": 0,
+            "renewals": 0,
+            "lost_leases": 0,
+            "wait_time": 0.0,
+            "max_wait_time": 0.0}
+
+
+def _record(key, wait_time=None, **counts):
+    """Internal function used to add to the statistics for 'key'"""
+    with _stats_lock:
+        if len(_stats["total"]) == 0:
+            _stats["total"] = _empty_statistics()
+
+        try:
+            key_stats = _stats["keys"][key]
+        except KeyError:
+            key_stats = _empty_statistics()
+            _stats["keys"][key] = key_stats
+
+        for stats in [_stats["total"], key_stats]:
+            for (name, count) in counts.items():
+                stats[name] += count
+
+            if wait_time is not None:
+                stats["wait_time"] += wait_time
+                stats["max_wait_time"] = max(stats["max_wait_time"],
+                                             wait_time)
+
+
+def get_mutex_statistics(key=None):
+    """Return a copy of the contention statistics of the LeaseMutexes
+       in this process. If 'key' is None then this returns the totals
+       for all mutexes, else the statistics for the mutex on 'key'.
+       The statistics are the number of "acquisitions" (and how many
+       of these were "contended_acquisitions"), the number of
+       conditional write "attempts", the number of "takeovers" of
+       expired leases, the number of "timeouts", the number of
+       background lease "renewals", the number of "lost_leases",
+       and the total and maximum time (in seconds) spent waiting
+    """
+    with _stats_lock:
+        if key is None:
+            stats = _stats["total"]
+        else:
+            stats = _stats["keys"].get(str(key), {})
+
+        if len(stats) == 0:
+            return _empty_statistics()
+        else:
+            return dict(stats)
+
+
+def reset_mutex_statistics():
+    """Reset all of the contention statistics"""
+    with _stats_lock:
+        _stats["total"] = {}
+        _stats["keys"] = {}
+
+
+def _renew_lease(mutex_ref, stop, interval):
+    """Run in a background thread to renew the lease of the referenced
+       mutex every 'interval' seconds until 'stop' is set. Only a weak
+       reference is held so that an abandoned mutex can still
+       be deleted (and so unlocked)
+    """
+    while not stop.wait(interval):
+        mutex = mutex_ref()
+
+        if mutex is None or not mutex._renew():
+            return
+
+        mutex = None
+
+
+class LeaseMutex(_Mutex):
+    """This is a drop-in replacement for Mutex that is built on the
+       conditional writes of the object store. An uncontended lock
+       is taken in a single conditional write, contended locks are
+       retried with exponential backoff and jitter, and (if
+       'auto_renew' is True) the lease is renewed in the background
+       for as long as the mutex is held. If 'fair' is True then
+       waiters take a ticket in a queue, and the lock is only
+       attempted by the waiter at the head of the queue.
+
+       This uses the same keys and lock format as Mutex, so the two
+       can safely be used to protect the same resource
+    """
+    def __init__(self, key=None, timeout=10, lease_time=10, bucket=None,
+                 auto_renew=True, fair=False):
+        """Create the mutex, blocking until the mutex for 'key' is
+           locked, or until 'timeout' seconds have passed (when
+           a MutexTimeoutError is raised). See Mutex for the
+           meaning of the other arguments
+        """
+        self._auto_renew = bool(auto_renew)
+        self._fair = bool(fair)
+        self._state_lock = _threading.RLock()
+        self._renew_stop = None
+        self._lease_time = None
+        self._ticket = None
+        self._ticket_expiry = None
+
+        super().__init__(key=key, timeout=timeout, lease_time=lease_time,
+                         bucket=bucket)
+
+    def __str__(self):
+        if self.expired():
+            return "LeaseMutex(%s, EXPIRED)" % self._key
+        else:
+            return "LeaseMutex(%s, is_locked=%s)" % (self._key,
+                                                     self.is_locked())
+
+    def _stats_key(self):
+        """Return the key under which statistics are recorded"""
+        return self._key[len("mutexes/"):]
+
+    def _queue_prefix(self):
+        """Return the prefix of the tickets in the fair queue"""
+        return "mutex_queues/%s/" % self._stats_key()
+
+    def _create_lockstring(self, lease_time):
+        """Return the end of a new lease of 'lease_time' seconds from
+           now, and the string that records this lease
+        """
+        from Acquire.ObjectStore import get_datetime_now as _get_datetime_now
+        from Acquire.ObjectStore import datetime_to_string \
+            as _datetime_to_string
+
+        end_lease = _get_datetime_now() + \
+            _datetime.timedelta(seconds=lease_time)
+
+        lockstring = "%s{}%s" % (self._secret,
+                                 _datetime_to_string(end_lease))
+
+        return (end_lease, lockstring)
+
+    def _try_acquire(self, lease_time):
+        """Make a single attempt to take the lock. This returns a tuple
+           of whether or not the lock was taken, and the number of
+           seconds remaining on the lease of the current holder
+        """
+        from Acquire.ObjectStore import ObjectStore as _ObjectStore
+        from Acquire.ObjectStore import PreconditionFailedError \
+            as _PreconditionFailedError
+        from Acquire.ObjectStore import get_datetime_now as _get_datetime_now
+        from Acquire.ObjectStore import string_to_datetime \
+            as _string_to_datetime
+
+        (end_lease, lockstring) = self._create_lockstring(lease_time)
+        lockdata = lockstring.encode("utf-8")
+
+        _record(self._stats_key(), attempts=1)
+
+        try:
+            etag = _ObjectStore.set_object_if_absent(self._bucket, self._key,
+                                                     lockdata)
+            self._set_held(etag, end_lease, lockstring)
+            return (True, 0)
+        except _PreconditionFailedError:
+            pass
+
+        try:
+            (holder, etag) = _ObjectStore.get_object_and_etag(self._bucket,
+                                                              self._key)
+            holder_end = _string_to_datetime(
+                                holder.decode("utf-8").split("{}")[-1])
+        except:
+            # the holder has just released the lock
+            return (False, 0)
+
+        remaining = (holder_end - _get_datetime_now()).total_seconds()
+
+        if remaining > 0:
+            return (False, remaining)
+
+        # the lease of the holder has expired, so take over the lock,
+        # unless someone else has beaten us to it
+        _record(self._stats_key(), attempts=1)
+
+        try:
+            etag = _ObjectStore.set_object_if_match(self._bucket, self._key,
+                                                    lockdata, etag)
+        except _PreconditionFailedError:
+            return (False, 0)
+
+        _record(self._stats_key(), takeovers=1)
+        self._set_held(etag, end_lease, lockstring)
+        return (True, 0)
+
+    def _set_held(self, etag, end_lease, lockstring):
+        """Record that we now hold the lock"""
+        with self._state_lock:
+            self._etag = etag
+            self._end_lease = end_lease
+            self._lockstring = lockstring
+            self._is_locked = 1
+
+    def _renew(self, lease_time=None):
+        """Renew the lease on this mutex, returning whether or not
+           the lease is still held. The lease is only renewed if
+           no-one else has taken the lock
+        """
+        from Acquire.ObjectStore import ObjectStore as _ObjectStore
+        from Acquire.ObjectStore import PreconditionFailedError \
+            as _PreconditionFailedError
+
+        with self._state_lock:
+            if self._is_locked == 0:
+                return False
+
+            if lease_time is None:
+                lease_time = self._lease_time
+
+            (end_lease, lockstring) = self._create_lockstring(lease_time)
+
+            try:
+                etag = _ObjectStore.set_object_if_match(
+                                        self._bucket, self._key,
+                                        lockstring.encode("utf-8"),
+                                        self._etag)
+            except _PreconditionFailedError:
+                _record(self._stats_key(), lost_leases=1)
+                return False
+            except Exception:
+                # a transient error - the lease is renewed next time
+                return True
+
+            self._etag = etag
+            self._end_lease = end_lease
+            self._lockstring = lockstring
+
+        _record(self._stats_key(), renewals=1)
+        return True
+
+    def _start_renewal(self):
+        """Start the background thread that renews the lease"""
+        if not self._auto_renew:
+            return
+
+        self._renew_stop = _threading.Event()
+
+        thread = _threading.Thread(
+                    target=_renew_lease,
+                    args=(_weakref.ref(self), self._renew_stop,
+                          self._lease_time / 3.0),
+                    daemon=True)
+        thread.start()
+
+    def _stop_renewal(self):
+        """Stop the background thread that renews the lease"""
+        if self._renew_stop is not None:
+            self._renew_stop.set()
+            self._renew_stop = None
+
+    def _refresh_ticket(self):
+        """Take (or refresh) our ticket in the fair queue"""
+        from Acquire.ObjectStore import ObjectStore as _ObjectStore
+
+        now = _time.time()
+
+        if self._ticket is None:
+            self._ticket = "%s%020d_%s" % (self._queue_prefix(),
+                                           int(now * 1e9), self._secret)
+        elif self._ticket_expiry - now > 0.5 * _ticket_lease:
+            return
+
+        self._ticket_expiry = now + _ticket_lease
+        _ObjectStore.set_string_object(self._bucket, self._ticket,
+                                       str(self._ticket_expiry))
+
+    def _leave_queue(self):
+        """Remove our ticket from the fair queue"""
+        from Acquire.ObjectStore import ObjectStore as _ObjectStore
+
+        if self._ticket is not None:
+            try:
+                _ObjectStore.delete_object(self._bucket, self._ticket)
+            except:
+                pass
+
+            self._ticket = None
+            self._ticket_expiry = None
+
+    def _is_first_in_queue(self):
+        """Return whether or not our ticket is at the head of the
+           fair queue. Tickets of waiters that have died are removed
+        """
+        from Acquire.ObjectStore import ObjectStore as _ObjectStore
+
+        self._refresh_ticket()
+
+        ahead = []
+
+        for name in _ObjectStore.iter_object_names(
+                                self._bucket, prefix=self._queue_prefix()):
+            if name >= self._ticket:
+                break
+
+            ahead.append(name)
+
+        if len(ahead) == 0:
+            return True
+
+        now = _time.time()
+        is_first = True
+        stale = []
+
+        for (name, value) in _ObjectStore.get_objects(self._bucket,
+                                                      ahead).items():
+            if isinstance(value, Exception):
+                # this waiter has just left the queue
+                continue
+
+            try:
+                expiry = float(value.decode("utf-8"))
+            except:
+                expiry = 0
+
+            if expiry < now:
+                stale.append(name)
+            else:
+                is_first = False
+
+        if len(stale) > 0:
+            _ObjectStore.delete_objects(self._bucket, stale)
+
+        return is_first
+
+    def _backoff(self, attempt, holder_remaining, remaining):
+        """Return the time to sleep before the next attempt. This is
+           exponential backoff with full jitter, that is never longer
+           than the time until the lease of the holder expires,
+           or than the time remaining before we time out
+        """
+        cap = min(_max_backoff, _min_backoff * (2 ** min(attempt, 16)))
+        wait = _random.uniform(_min_backoff, max(cap, _min_backoff))
+
+        if holder_remaining > 0:
+            wait = min(wait, holder_remaining + _min_backoff)
+
+        return max(0.0, min(wait, remaining))
+
+    def fully_unlock(self):
+        """This fully unlocks the mutex, removing all levels
+           of recursion and stopping the renewal of the lease
+
+           Returns:
+                None
+        """
+        if self._is_locked == 0:
+            return
+
+        self._stop_renewal()
+
+        from Acquire.ObjectStore import ObjectStore as _ObjectStore
+        from Acquire.ObjectStore import get_datetime_now as _get_datetime_now
+
+        with self._state_lock:
+            try:
+                (_, etag) = _ObjectStore.get_object_and_etag(self._bucket,
+                                                             self._key)
+            except:
+                etag = None
+
+            if etag is not None and etag == self._etag:
+                # we hold the mutex - delete the key
+                _ObjectStore.delete_object(self._bucket, self._key)
+
+            end_lease = self._end_lease
+            self._lockstring = None
+            self._etag = None
+            self._end_lease = None
+            self._is_locked = 0
+
+        if end_lease < _get_datetime_now():
+            from Acquire.ObjectStore import MutexTimeoutError
+            raise MutexTimeoutError("The lease on this mutex expired before "
+                                    "this mutex was unlocked!")
+
+    def lock(self, timeout=None, lease_time=None):
+        """Lock the mutex, blocking until the mutex is held, or until
+           'timeout' seconds have passed. If we time out, then an exception is
+           raised. The lock is held for a maximum of 'lease_time' seconds,
+           or until it is unlocked if the lease is automatically renewed.
+           Locking a mutex that is already held renews the lease
+
+           Args:
+                timeout (int): Number of seconds to block
+                lease_time (int): Number of seconds to hold the lock
+           Returns:
+                None
+        """
+        if timeout is None:
+            timeout = 10.0
+        else:
+            timeout = float(timeout)
+
+        if lease_time is None:
+            lease_time = 10.0
+        else:
+            lease_time = float(lease_time)
+
+        from Acquire.ObjectStore import MutexTimeoutError
+
+        with self._state_lock:
+            if self.is_locked():
+                if not self._renew(lease_time):
+                    self._stop_renewal()
+                    self._lockstring = None
+                    self._is_locked = 0
+                    raise MutexTimeoutError(
+                        "The lease on this mutex was lost before it "
+                        "could be renewed!")
+
+                self._is_locked += 1
+                return
+            elif self._is_locked > 0:
+                # the lease expired while the mutex was held
+                self._stop_renewal()
+                self._is_locked = 0
+
+        self._lease_time = lease_time
+
+        start = _time.monotonic()
+        endtime = start + timeout
+        attempt = 0
+
+        try:
+            while True:
+                holder_remaining = 0
+
+                if (not self._fair) or self._is_first_in_queue():
+                    (acquired, holder_remaining) = \
+                        self._try_acquire(lease_time)
+
+                    if acquired:
+                        wait_time = _time.monotonic() - start
+                        _record(self._stats_key(), wait_time=wait_time,
+                                acquisitions=1,
+                                contended_acquisitions=int(attempt > 0))
+                        self._start_renewal()
+                        return
+
+                remaining = endtime - _time.monotonic()
+
+                if remaining <= 0:
+                    break
+
+                _time.sleep(self._backoff(attempt, holder_remaining,
+                                          remaining))
+                attempt += 1
+        finally:
+            self._leave_queue()
+
+        _record(self._stats_key(), wait_time=_time.monotonic() - start,
+                timeouts=1)
+
+        raise MutexTimeoutError("Cannot acquire a mutex lock on the "
+                                "key '%s'" % self._key)
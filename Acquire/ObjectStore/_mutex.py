@@ -39,6 +39,7 @@ class Mutex:
         self._key = key
         self._secret = str(uuid.uuid4())
         self._is_locked = 0
+        self._etag = None
         self.lock(timeout, lease_time)
 
     def __del__(self):
@@ -192,6 +193,8 @@ class Mutex:
         from Acquire.ObjectStore import string_to_datetime \
             as _string_to_datetime
         from Acquire.ObjectStore import ObjectStore as _ObjectStore
+        from Acquire.ObjectStore import PreconditionFailedError \
+            as _PreconditionFailedError
 
         if self.is_locked():
             # renew the lease - if there is less than a second remaining
@@ -202,14 +205,25 @@ class Mutex:
                 self.fully_unlock()
                 self.lock(timeout, lease_time)
             else:
-                self._end_lease = now + _datetime.timedelta(seconds=lease_time)
-
-                self._lockstring = "%s{}%s" % (
-                    self._secret, _datetime_to_string(self._end_lease))
-
-                _ObjectStore.set_string_object(self._bucket, self._key,
-                                               self._lockstring)
-
+                end_lease = now + _datetime.timedelta(seconds=lease_time)
+                lockstring = "%s{}%s" % (
+                    self._secret, _datetime_to_string(end_lease))
+
+                # only renew if no-one else has taken the lock
+                try:
+                    self._etag = _ObjectStore.set_object_if_match(
+                                    self._bucket, self._key,
+                                    lockstring.encode("utf-8"), self._etag)
+                except _PreconditionFailedError:
+                    self._lockstring = None
+                    self._is_locked = 0
+                    from Acquire.ObjectStore import MutexTimeoutError
+                    raise MutexTimeoutError(
+                        "The lease on this mutex was lost before it "
+                        "could be renewed!")
+
+                self._end_lease = end_lease
+                self._lockstring = lockstring
                 self._is_locked += 1
 
             return
@@ -219,64 +233,53 @@ class Mutex:
 
         # This is the first time we are trying to get a lock
         while now < endtime:
+            self._end_lease = now + _datetime.timedelta(seconds=lease_time)
+
+            self._lockstring = "%s{}%s" % (
+                self._secret, _datetime_to_string(self._end_lease))
+
+            lockdata = self._lockstring.encode("utf-8")
+
+            # we hold the mutex if we are the one to create the key
+            try:
+                self._etag = _ObjectStore.set_object_if_absent(
+                                        self._bucket, self._key, lockdata)
+                self._is_locked = 1
+                return
+            except _PreconditionFailedError:
+                pass
+
             # does anyone else hold the lock?
             try:
-                holder = _ObjectStore.get_string_object(self._bucket,
-                                                        self._key)
+                (holder, etag) = _ObjectStore.get_object_and_etag(
+                                                    self._bucket, self._key)
+                holder = holder.decode("utf-8")
             except:
+                # the holder has just released the lock - try again
                 holder = None
 
-            is_held = True
-
-            if holder is None:
-                is_held = False
-            else:
+            if holder is not None:
                 end_lease = _string_to_datetime(holder.split("{}")[-1])
-                if now > end_lease:
-                    # the lease from the other holder has expired :-)
-                    is_held = False
-
-            if not is_held:
-                # no-one holds this mutex - try to hold it now
-                self._end_lease = now + _datetime.timedelta(seconds=lease_time)
-
-                self._lockstring = "%s{}%s" % (
-                    self._secret, _datetime_to_string(self._end_lease))
 
-                _ObjectStore.set_string_object(self._bucket, self._key,
-                                               self._lockstring)
-
-                holder = _ObjectStore.get_string_object(self._bucket,
-                                                        self._key)
-            else:
-                self._lockstring = None
-
-            if holder == self._lockstring:
-                # it looks like we are the holder - read and write again
-                # just to make sure
-                holder = _ObjectStore.get_string_object(self._bucket,
-                                                        self._key)
-
-                if holder == self._lockstring:
-                    # write again just to make sure
-                    _ObjectStore.set_string_object(self._bucket, self._key,
-                                                   self._lockstring)
-
-                    holder = _ObjectStore.get_string_object(self._bucket,
-                                                            self._key)
-
-            if holder == self._lockstring:
-                # we have read and written our secret to the object store
-                # three times. While a race condition is still possible,
-                # I'd hope it is now highly unlikely - we now hold the mutex
-                self._is_locked = 1
-                return
-
-            # only try the lock 4 times a second
-            _time.sleep(0.25)
+                if now > end_lease:
+                    # the lease from the other holder has expired :-),
+                    # so take the lock if no-one else has beaten us to it
+                    try:
+                        self._etag = _ObjectStore.set_object_if_match(
+                                        self._bucket, self._key,
+                                        lockdata, etag)
+                        self._is_locked = 1
+                        return
+                    except _PreconditionFailedError:
+                        pass
+
+                # only try the lock 4 times a second
+                _time.sleep(0.25)
 
             now = _get_datetime_now()
 
+        self._lockstring = None
+
         from Acquire.ObjectStore import MutexTimeoutError
         raise MutexTimeoutError("Cannot acquire a mutex lock on the "
                                 "key '%s'" % self._key)
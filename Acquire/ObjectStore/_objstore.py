@@ -12,6 +12,72 @@ __all__ = ["ObjectStore", "set_object_store_backend",
 
 _objstore_backend = None
 
+# the default number of concurrent requests made by the bulk
+# get_objects, set_objects and delete_objects functions
+_default_max_workers = 16
+
+
+def _map_keys(function, keys, max_workers=None):
+    """Internal function that calls 'function(key)' for each of the
+       passed keys on a bounded pool of at most 'max_workers' threads.
+       This returns a dictionary of the result for each key, or
+       the exception raised if the call failed for that key
+    """
+    keys = list(keys)
+
+    if max_workers is None:
+        max_workers = _default_max_workers
+
+    max_workers = min(int(max_workers), len(keys))
+
+    results = {}
+
+    if max_workers <= 1:
+        for key in keys:
+            try:
+                results[key] = function(key)
+            except Exception as e:
+                results[key] = e
+
+        return results
+
+    from concurrent.futures import ThreadPoolExecutor as _ThreadPoolExecutor
+
+    with _ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [(key, executor.submit(function, key)) for key in keys]
+
+        for (key, future) in futures:
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                results[key] = e
+
+    return results
+
+
+def _raise_first_error(results):
+    """Internal function that raises the first exception in the
+       passed per-key results of a bulk operation (if any)
+    """
+    for value in results.values():
+        if isinstance(value, Exception):
+            raise value
+
+
+def _invalidate_cached(bucket, key=None, prefix=None):
+    """Internal function that removes the object at 'key' (or all
+       objects whose keys start with 'prefix') from the object
+       cache, if the cache is enabled
+    """
+    from ._objstore_cache import _get_object_cache
+    cache = _get_object_cache()
+
+    if cache is not None:
+        if key is None:
+            cache.invalidate_prefix(bucket, prefix)
+        else:
+            cache.invalidate(bucket, key)
+
 
 def use_testing_object_store_backend(backend):
     from ._testing_objstore import Testing_ObjectStore as _Testing_ObjectStore
@@ -116,16 +182,119 @@ class ObjectStore:
     def get_object(bucket, key):
         """Return the binary data contained in the key 'key' in the
            passed bucket"""
-        return _objstore_backend.get_object(bucket, key)
+        from ._objstore_cache import _get_object_cache
+        from ._disk_cache import _get_disk_cache, _get_object_from_disk
+
+        if _get_disk_cache() is None:
+            loader = _objstore_backend.get_object
+        else:
+            def loader(bucket, key):
+                return _get_object_from_disk(bucket, key,
+                                             _objstore_backend.get_object)
+
+        cache = _get_object_cache()
+
+        if cache is None:
+            return loader(bucket, key)
+        else:
+            return cache.get_object(bucket, key, loader)
+
+    @staticmethod
+    def get_object_and_etag(bucket, key):
+        """Return the binary data contained in the key 'key' in the
+           passed bucket, together with its etag. Pass the etag to
+           set_object_if_match to only update the object if it
+           has not been changed since it was read
+        """
+        return _objstore_backend.get_object_and_etag(bucket, key)
+
+    @staticmethod
+    def get_object_range(bucket, key, start, length=None):
+        """Return up to 'length' bytes of the binary data contained in
+           the key 'key' in the passed bucket, starting from byte
+           'start'. This reads to the end of the object if 'length' is
+           None, and returns fewer bytes (or empty bytes) if the range
+           extends beyond the end of the object. This reads directly
+           from the object store, bypassing any cache
+        """
+        start = int(start)
+
+        if start < 0:
+            raise ValueError("The start of the range must be 0 or greater")
+
+        if length is not None:
+            length = int(length)
+
+            if length < 0:
+                raise ValueError("The length of the range must be 0 "
+                                 "or greater")
+            elif length == 0:
+                return b""
+
+        return _objstore_backend.get_object_range(bucket, key, start, length)
+
+    @staticmethod
+    def open_object_reader(bucket, key):
+        """Return a binary, seekable file-like object that streams the
+           data contained in the key 'key' in the passed bucket, so
+           that large objects can be read without holding the whole
+           object in memory. Use this as a context manager, e.g.
+
+           with ObjectStore.open_object_reader(bucket, key) as reader:
+               header = reader.read(16)
+
+           This reads directly from the object store, bypassing
+           any cache
+        """
+        return _objstore_backend.open_object_reader(bucket, key)
+
+    @staticmethod
+    def open_object_writer(bucket, key):
+        """Return a binary file-like object that streams data to the
+           key 'key' in the passed bucket, so that large objects can be
+           written without holding the whole object in memory. The
+           object is only written when the writer is closed. If the
+           writer is used as a context manager and an exception is
+           raised then the write is aborted, e.g.
+
+           with ObjectStore.open_object_writer(bucket, key) as writer:
+               writer.write(data)
+        """
+        writer = _objstore_backend.open_object_writer(bucket, key)
+        writer.add_commit_callback(lambda: _invalidate_cached(bucket, key))
+        return writer
 
     @staticmethod
     def get_object_as_file(bucket, key, filename):
         """Get the object contained in the key 'key' in the passed 'bucket'
-           and writing this to the file called 'filename'"""
-        data = ObjectStore.get_object(bucket, key)
+           and writing this to the file called 'filename'. If the disk
+           cache is enabled then the object is copied from the cache
+           if it holds this object with the same checksum"""
+        from ._disk_cache import _get_disk_cache
+        disk_cache = _get_disk_cache()
 
-        with open(filename, "wb") as FILE:
-            FILE.write(data)
+        if disk_cache is not None:
+            from ._disk_cache import _get_cache_id
+
+            # don't stream the object just to find its checksum, as
+            # it would then have to be downloaded again
+            try:
+                (cache_id, checksum) = _get_cache_id(bucket, key)
+            except Exception:
+                cache_id = None
+
+            if cache_id is not None:
+                disk_cache.copy_to(
+                    cache_id,
+                    lambda: _objstore_backend.get_object(bucket, key),
+                    filename, checksum=checksum)
+                return
+
+        import shutil as _shutil
+
+        with ObjectStore.open_object_reader(bucket, key) as reader:
+            with open(filename, "wb") as FILE:
+                _shutil.copyfileobj(reader, FILE)
 
     @staticmethod
     def get_string_object(bucket, key):
@@ -147,7 +316,10 @@ class ObjectStore:
         """Take (delete) the object from the object store, returning
            the object
         """
-        return _objstore_backend.take_object(bucket, key)
+        try:
+            return _objstore_backend.take_object(bucket, key)
+        finally:
+            _invalidate_cached(bucket, key)
 
     @staticmethod
     def take_string_object(bucket, key):
@@ -176,20 +348,123 @@ class ObjectStore:
         data = ObjectStore.take_string_object(bucket, key)
         return _json.loads(data)
 
+    @staticmethod
+    def iter_object_names(bucket, prefix=None, start_after=None,
+                          page_size=1000, without_prefix=False):
+        """Iterate over the names of all objects in the passed bucket
+           whose names start with 'prefix', in lexicographic order.
+           Only names after 'start_after' are returned, so an
+           interrupted listing can be resumed from the last name
+           seen. The names are listed from the object store
+           'page_size' at a time, so only one page of names is
+           held in memory
+        """
+        return _objstore_backend.iter_object_names(
+                                    bucket=bucket, prefix=prefix,
+                                    start_after=start_after,
+                                    page_size=page_size,
+                                    without_prefix=without_prefix)
+
     @staticmethod
     def get_all_object_names(bucket, prefix=None, without_prefix=False):
         """Returns the names of all objects in the passed bucket"""
-        return _objstore_backend.get_all_object_names(bucket, prefix,
-                                                      without_prefix)
+        return list(ObjectStore.iter_object_names(
+                                bucket=bucket, prefix=prefix,
+                                without_prefix=without_prefix))
+
+    @staticmethod
+    def list_prefixes(bucket, prefix=None, delimiter="/"):
+        """List one level of the keys in the passed bucket that start
+           with 'prefix'. This returns a tuple of the sorted list of
+           common prefixes (the part of each key up to and including
+           the first 'delimiter' after 'prefix', i.e. the
+           'child directories') and the sorted list of the names
+           of the objects that have no 'delimiter' after 'prefix'
+           (the 'immediate objects'). This only needs to read the
+           children of 'prefix', not every key below it
+        """
+        return _objstore_backend.list_prefixes(bucket=bucket, prefix=prefix,
+                                               delimiter=delimiter)
+
+    @staticmethod
+    def get_objects(bucket, keys, max_workers=None):
+        """Return the binary data contained in each of the passed 'keys'
+           in the passed bucket. The objects are fetched concurrently
+           using up to 'max_workers' threads. This returns a dictionary
+           of the data for each key. The value for a key that could
+           not be read is the exception that was raised
+        """
+        return _map_keys(lambda key: ObjectStore.get_object(bucket, key),
+                         keys, max_workers)
+
+    @staticmethod
+    def get_objects_from_json(bucket, keys, max_workers=None):
+        """Return the json-deserialised objects at each of the passed
+           'keys' in the passed bucket (see get_objects)
+        """
+        return _map_keys(
+                    lambda key: ObjectStore.get_object_from_json(bucket, key),
+                    keys, max_workers)
+
+    @staticmethod
+    def set_objects(bucket, objects, max_workers=None):
+        """Set the value of each key in the dictionary 'objects' in
+           'bucket' to its binary data. The objects are written
+           concurrently using up to 'max_workers' threads. This
+           returns a dictionary of the result for each key,
+           which is None on success, or the exception that was
+           raised if the key could not be written
+        """
+        return _map_keys(
+                    lambda key: ObjectStore.set_object(bucket, key,
+                                                       objects[key]),
+                    objects.keys(), max_workers)
+
+    @staticmethod
+    def set_objects_from_json(bucket, objects, max_workers=None):
+        """Set the value of each key in the dictionary 'objects' in
+           'bucket' to its json-encoded value (see set_objects)
+        """
+        return _map_keys(
+                    lambda key: ObjectStore.set_object_from_json(
+                                                bucket, key, objects[key]),
+                    objects.keys(), max_workers)
+
+    @staticmethod
+    def delete_objects(bucket, keys, max_workers=None):
+        """Delete the objects at each of the passed 'keys' in 'bucket'.
+           This uses the native batch delete of the object store if
+           there is one, or else deletes the objects concurrently
+           using up to 'max_workers' threads. This returns a
+           dictionary of the result for each key, which is None on
+           success (including if there was no object at the key), or
+           the exception that was raised if the key could not be
+           deleted. Pass the results to _raise_first_error to
+           raise the first error
+        """
+        keys = list(keys)
+
+        try:
+            delete_objects = _objstore_backend.delete_objects
+        except AttributeError:
+            delete_objects = None
+
+        if delete_objects is not None:
+            try:
+                return delete_objects(bucket, keys, max_workers=max_workers)
+            finally:
+                for key in keys:
+                    _invalidate_cached(bucket, key)
+
+        return _map_keys(lambda key: ObjectStore.delete_object(bucket, key),
+                         keys, max_workers)
 
     @staticmethod
     def get_all_objects(bucket, prefix=None):
         """Return all of the objects in the passed bucket"""
-        objects = {}
         names = ObjectStore.get_all_object_names(bucket, prefix)
-
-        for name in names:
-            objects[name] = ObjectStore.get_object(bucket, name)
+        objects = ObjectStore.get_objects(bucket, names)
+        _raise_first_error(objects)
 
         return objects
 
@@ -230,14 +505,48 @@ class ObjectStore:
     @staticmethod
     def set_object(bucket, key, data):
         """Set the value of 'key' in 'bucket' to binary 'data'"""
-        _objstore_backend.set_object(bucket, key, data)
+        try:
+            _objstore_backend.set_object(bucket, key, data)
+        finally:
+            _invalidate_cached(bucket, key)
 
     @staticmethod
     def set_object_from_file(bucket, key, filename):
         """Set the value of 'key' in 'bucket' to equal the contents
-           of the file located by 'filename'"""
-        ObjectStore.set_object(bucket, key,
-                               open(filename, 'rb').read())
+           of the file located by 'filename'. The file is streamed
+           to the object store, so is never read in full"""
+        import shutil as _shutil
+
+        with open(filename, "rb") as FILE:
+            with ObjectStore.open_object_writer(bucket, key) as writer:
+                _shutil.copyfileobj(FILE, writer)
+
+    @staticmethod
+    def set_object_if_absent(bucket, key, data):
+        """Atomically set the value of 'key' in 'bucket' to binary
+           'data' if (and only if) there is no object at this key.
+           This returns the etag of the new object, or raises a
+           PreconditionFailedError if the key has already been set
+        """
+        try:
+            return _objstore_backend.set_object_if_absent(bucket, key, data)
+        finally:
+            _invalidate_cached(bucket, key)
+
+    @staticmethod
+    def set_object_if_match(bucket, key, data, etag):
+        """Atomically set the value of 'key' in 'bucket' to binary
+           'data' if (and only if) the current object at this key
+           has etag 'etag' (as returned by get_object_and_etag or
+           by a previous conditional set). This returns the etag of
+           the new object, or raises a PreconditionFailedError if
+           the object has changed or been deleted
+        """
+        try:
+            return _objstore_backend.set_object_if_match(bucket, key,
+                                                         data, etag)
+        finally:
+            _invalidate_cached(bucket, key)
 
     @staticmethod
     def set_ins_object_from_json(bucket, key, data):
@@ -248,25 +557,15 @@ class ObjectStore:
            (either the set object or the value that was previously
            set
         """
-        from Acquire.ObjectStore import Mutex as _Mutex
-        m = _Mutex(bucket=bucket, key=key)
+        from Acquire.ObjectStore import PreconditionFailedError \
+            as _PreconditionFailedError
 
         try:
-            old_data = ObjectStore.get_object_from_json(bucket, key)
-        except:
-            old_data = None
-
-        if old_data is not None:
-            m.unlock()
-            return old_data
-        else:
-            try:
-                ObjectStore.set_object_from_json(bucket, key, data)
-            except:
-                m.unlock()
-                raise
-
+            ObjectStore.set_object_if_absent(
+                bucket, key, _json.dumps(data).encode("utf-8"))
             return data
+        except _PreconditionFailedError:
+            return ObjectStore.get_object_from_json(bucket, key)
 
     @staticmethod
     def set_ins_string_object(bucket, key, string_data):
@@ -276,25 +575,15 @@ class ObjectStore:
            key after the operation (either the set string, or the value
            that was previously set)
         """
-        from Acquire.ObjectStore import Mutex as _Mutex
-        m = _Mutex(bucket=bucket, key=key)
+        from Acquire.ObjectStore import PreconditionFailedError \
+            as _PreconditionFailedError
 
         try:
-            val = ObjectStore.get_string_object(bucket, key)
-        except:
-            val = None
-
-        if val is not None:
-            m.unlock()
-            return val
-        else:
-            try:
-                ObjectStore.set_string_object(bucket, key, string_data)
-            except:
-                m.unlock()
-                raise
-
+            ObjectStore.set_object_if_absent(bucket, key,
+                                             string_data.encode("utf-8"))
             return string_data
+        except _PreconditionFailedError:
+            return ObjectStore.get_string_object(bucket, key)
 
     @staticmethod
     def set_string_object(bucket, key, string_data):
@@ -311,12 +600,21 @@ class ObjectStore:
     @staticmethod
     def delete_all_objects(bucket, prefix=None):
         """Deletes all objects..."""
-        _objstore_backend.delete_all_objects(bucket, prefix)
+        try:
+            _objstore_backend.delete_all_objects(bucket, prefix)
+        finally:
+            _invalidate_cached(bucket, prefix=prefix)
 
     @staticmethod
     def delete_object(bucket, key):
-        """Removes the object at 'key'"""
-        _objstore_backend.delete_object(bucket, key)
+        """Removes the object at 'key'. Removing an object that doesn't
+           exist is not an error, but any other failure raises an
+           ObjectStoreError
+        """
+        try:
+            _objstore_backend.delete_object(bucket, key)
+        finally:
+            _invalidate_cached(bucket, key)
 
     @staticmethod
     def clear_all_except(bucket, keys):
@@ -337,11 +635,15 @@ class ObjectStore:
                 ObjectStore.delete_object(bucket, key)
 
     @staticmethod
-    def get_size_and_checksum(bucket, key):
+    def get_size_and_checksum(bucket, key, calculate=True):
         """Return the object size (in bytes) and checksum of the
-           object in the passed bucket at the specified key
+           object in the passed bucket at the specified key. Objects
+           without a stored checksum (e.g. multipart uploads) are
+           streamed to calculate it, unless 'calculate' is False,
+           in which case the checksum is returned as None
         """
-        return _objstore_backend.get_size_and_checksum(bucket, key)
+        return _objstore_backend.get_size_and_checksum(bucket, key,
+                                                       calculate=calculate)
 
 
 def set_object_store_backend(backend):
@@ -0,0 +1,362 @@
+
+import re as _re
+import threading as _threading
+import time as _time
+
+from collections import OrderedDict as _OrderedDict
+
+__all__ = ["enable_object_cache", "disable_object_cache",
+           "is_object_cache_enabled", "set_object_cache_policy",
+           "get_object_cache_policy", "get_object_cache_statistics",
+           "clear_object_cache"]
+
+_cache_lock = _threading.RLock()
+
+# the cache used by ObjectStore.get_object, or None if caching is disabled
+_object_cache = None
+
+_valid_policies = ["immutable", "ttl", "no_cache"]
+
+# the caching policy for keys that match each prefix pattern. A "*" in
+# a pattern matches any part of a key between "/"s (e.g. the UID of an
+# account), and a pattern that ends in "$" matches only whole keys.
+# The policy of the longest matching pattern is used, and keys that
+# don't match any pattern are not cached
+_policies = {
+    # committed transaction line items are never changed
+    "accounting/accounts/*/txns/": ("immutable", None),
+    # nor are the uploaded chunks of a file
+    "storage/file/*/data/": ("immutable", None),
+    # the balances of an account (hourly, daily, monthly, compacted
+    # and running) are changed on every transaction, so nothing in
+    # an account is cached unless it is opted in here...
+    "accounting/accounts/*": ("no_cache", None),
+    # ...apart from the account metadata itself
+    "accounting/accounts/*$": ("ttl", 10),
+    "accounting/account_group_acls/": ("ttl", 60),
+    "_service_key": ("ttl", 10),
+    "_trusted/uid/": ("ttl", 60),
+    "_trusted/url/": ("ttl", 60),
+    "storage/drive/*/info": ("ttl", 10)
+}
+
+# the compiled regular expression for each pattern
+_compiled = {}
+
+def _bucket_id(bucket):
+    """Return a hashable ID for the passed bucket"""
+    if isinstance(bucket, str):
+        return bucket
+
+    try:
+        return "%s/%s" % (bucket.get("namespace", ""), bucket["bucket_name"])
+    except:
+        return id(bucket)
+
+
+def _compile_pattern(pattern):
+    """Return the regular expression that matches the keys that
+       start with the passed pattern (or equal it, if it ends in "$")
+    """
+    try:
+        return _compiled[pattern]
+    except KeyError:
+        pass
+
+    if pattern.endswith("$"):
+        (parts, end) = (pattern[0:-1].split("*"), "$")
+    else:
+        (parts, end) = (pattern.split("*"), "")
+
+    regex = _re.compile("%s%s" % ("[^/]*".join([_re.escape(part)
+                                                for part in parts]), end))
+    _compiled[pattern] = regex
+    return regex
+
+
+def _get_policy(key):
+    """Return the (policy, ttl) that applies to the passed key"""
+    best = None
+
+    with _cache_lock:
+        for (pattern, policy) in _policies.items():
+            if best is not None and len(pattern) <= len(best[0]):
+                continue
+
+            if _compile_pattern(pattern).match(key):
+                best = (pattern, policy)
+
+    if best is None:
+        return ("no_cache", None)
+    else:
+        return best[1]
+
+
+class _ObjectCache:
+    """A read-through cache of objects, with least-recently-used
+       eviction once the cached data exceeds 'max_bytes'
+    """
+    def __init__(self, max_bytes, negative_ttl):
+        self._max_bytes = int(max_bytes)
+        self._negative_ttl = float(negative_ttl)
+        self._entries = _OrderedDict()
+        self._nbytes = 0
+        # incremented on every invalidation, so that an object that
+        # is written while it is being loaded is not cached
+        self._generation = 0
+        self._stats = {"hits": 0, "negative_hits": 0, "misses": 0,
+                       "uncached": 0, "evictions": 0, "invalidations": 0}
+
+    def _remove(self, cache_key):
+        """Remove the entry for 'cache_key' - the lock must be held"""
+        entry = self._entries.pop(cache_key, None)
+
+        if entry is not None:
+            self._nbytes -= entry[2]
+
+        return entry is not None
+
+    def _add(self, cache_key, data, expiry):
+        """Add an entry to the cache, evicting the least recently
+           used entries to make space - the lock must be held
+        """
+        size = len(cache_key[1])
+
+        if data is not None:
+            size += len(data)
+
+        if size > self._max_bytes:
+            return
+
+        if data is not None:
+            # large objects are left to the disk cache (if enabled)
+            from ._disk_cache import _get_disk_cache
+            disk_cache = _get_disk_cache()
+
+            if disk_cache is not None and \
+                    len(data) >= disk_cache._min_object_size:
+                return
+
+        self._remove(cache_key)
+
+        while self._nbytes + size > self._max_bytes:
+            (_, entry) = self._entries.popitem(last=False)
+            self._nbytes -= entry[2]
+            self._stats["evictions"] += 1
+
+        self._entries[cache_key] = (data, expiry, size)
+        self._nbytes += size
+
+    def get_object(self, bucket, key, loader):
+        """Return the object at 'key' in 'bucket', loading it by
+           calling 'loader(bucket, key)' if it is not in the cache
+        """
+        (policy, ttl) = _get_policy(key)
+
+        if policy == "no_cache":
+            with _cache_lock:
+                self._stats["uncached"] += 1
+
+            return loader(bucket, key)
+
+        cache_key = (_bucket_id(bucket), key)
+        now = _time.monotonic()
+
+        with _cache_lock:
+            entry = self._entries.get(cache_key)
+
+            if entry is not None:
+                if entry[1] is None or entry[1] > now:
+                    self._entries.move_to_end(cache_key)
+
+                    if entry[0] is None:
+                        self._stats["negative_hits"] += 1
+                        from Acquire.ObjectStore import ObjectStoreError
+                        raise ObjectStoreError("No object at key '%s'" % key)
+
+                    self._stats["hits"] += 1
+                    return entry[0]
+
+                self._remove(cache_key)
+
+            self._stats["misses"] += 1
+            generation = self._generation
+
+        from Acquire.ObjectStore import ObjectStoreError
+
+        try:
+            data = loader(bucket, key)
+        except ObjectStoreError:
+            if self._negative_ttl > 0:
+                negative_ttl = self._negative_ttl
+
+                if ttl is not None:
+                    negative_ttl = min(negative_ttl, ttl)
+
+                with _cache_lock:
+                    if generation == self._generation:
+                        self._add(cache_key, None, now + negative_ttl)
+
+            raise
+
+        if data is not None:
+            if ttl is None:
+                expiry = None
+            else:
+                expiry = now + ttl
+
+            with _cache_lock:
+                if generation == self._generation:
+                    self._add(cache_key, data, expiry)
+
+        return data
+
+    def invalidate(self, bucket, key):
+        """Remove any cached object at 'key' in 'bucket'"""
+        with _cache_lock:
+            self._generation += 1
+
+            if self._remove((_bucket_id(bucket), key)):
+                self._stats["invalidations"] += 1
+
+    def invalidate_prefix(self, bucket, prefix=None):
+        """Remove all cached objects in 'bucket' whose keys start
+           with 'prefix' (or all objects if 'prefix' is None)
+        """
+        bucket_id = _bucket_id(bucket)
+
+        if prefix is None:
+            prefix = ""
+
+        with _cache_lock:
+            self._generation += 1
+
+            for cache_key in list(self._entries.keys()):
+                if cache_key[0] == bucket_id and \
+                        cache_key[1].startswith(prefix):
+                    self._remove(cache_key)
+                    self._stats["invalidations"] += 1
+
+    def statistics(self):
+        """Return a copy of the statistics of this cache"""
+        with _cache_lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._nbytes
+            stats["max_bytes"] = self._max_bytes
+
+        return stats
+
+
+def _get_object_cache():
+    """Return the object cache, or None if caching is disabled"""
+    return _object_cache
+
+
+def enable_object_cache(max_bytes=64*1024*1024, negative_ttl=5):
+    """Enable the read-through cache of the objects read using
+       ObjectStore.get_object (and the functions that are built on
+       it). At most 'max_bytes' of data are cached, with the least
+       recently used objects evicted first. Missing keys are
+       remembered for 'negative_ttl' seconds (set this to 0 to
+       disable negative caching). Which keys are cached, and for
+       how long, is set using set_object_cache_policy. Objects are
+       invalidated when they are written or deleted through
+       ObjectStore, but writes made by other processes are only
+       seen once the cached object has expired. Any existing
+       cache is discarded
+    """
+    global _object_cache
+
+    max_bytes = int(max_bytes)
+
+    if max_bytes < 1:
+        raise ValueError("The size of the object cache must be at least 1")
+
+    with _cache_lock:
+        _object_cache = _ObjectCache(max_bytes=max_bytes,
+                                     negative_ttl=negative_ttl)
+
+
+def disable_object_cache():
+    """Disable (and discard) the object cache"""
+    global _object_cache
+
+    with _cache_lock:
+        _object_cache = None
+
+
+def is_object_cache_enabled():
+    """Return whether or not the object cache is enabled"""
+    return _object_cache is not None
+
+
+def set_object_cache_policy(prefix, policy, ttl=None):
+    """Set the caching policy for the keys that start with 'prefix'.
+       A "*" in the prefix matches any part of a key between "/"s,
+       and a prefix that ends in "$" matches only that key. The policy
+       is one of "immutable" (cached until evicted), "ttl" (cached
+       for 'ttl' seconds) or "no_cache". Set the policy to None
+       to remove the policy for this prefix. The policy of the
+       longest matching prefix is used for each key
+    """
+    if policy is None:
+        with _cache_lock:
+            _policies.pop(prefix, None)
+        return
+
+    policy = str(policy).lower()
+
+    if policy not in _valid_policies:
+        raise ValueError("Unrecognised object cache policy '%s'. Supported "
+                         "policies are %s" % (policy, _valid_policies))
+
+    if policy == "ttl":
+        if ttl is None or float(ttl) <= 0:
+            raise ValueError("You must set a positive 'ttl' for a "
+                             "'ttl' object cache policy")
+        ttl = float(ttl)
+    else:
+        ttl = None
+
+    with _cache_lock:
+        _policies[str(prefix)] = (policy, ttl)
+
+    clear_object_cache()
+
+
+def get_object_cache_policy(key=None):
+    """Return the (policy, ttl) that applies to 'key', or a copy
+       of all of the policies, indexed by prefix, if 'key' is None
+    """
+    if key is None:
+        with _cache_lock:
+            return dict(_policies)
+    else:
+        return _get_policy(key)
+
+
+def get_object_cache_statistics():
+    """Return a dictionary of the statistics of the object cache, i.e.
+       the number of "hits", "negative_hits" (missing keys), "misses",
+       "uncached" reads of keys that are not cached, "evictions" and
+       "invalidations", plus the number of "entries" and "bytes"
+       in the cache. This returns None if the cache is disabled
+    """
+    cache = _object_cache
+
+    if cache is None:
+        return None
+    else:
+        return cache.statistics()
+
+
+def clear_object_cache():
+    """Remove all objects from the object cache"""
+    cache = _object_cache
+
+    if cache is not None:
+        with _cache_lock:
+            cache._generation += 1
+            cache._entries.clear()
+            cache._nbytes = 0
@@ -0,0 +1,241 @@
+
+import io as _io
+
+__all__ = []
+
+# the size of each ranged GET made when reading an object as a stream
+_read_block_size = 8 * 1024 * 1024
+
+# the size of each part of a multipart upload. The last part may be
+# smaller. Objects smaller than this are uploaded in a single request
+_write_part_size = 16 * 1024 * 1024
+
+
+class _RangedReader(_io.RawIOBase):
+    """A raw, seekable stream over an object of 'size' bytes, that is
+       read using 'fetch(start, end)' to return the bytes in the
+       range [start, end). Wrap this in an io.BufferedReader so
+       that small reads are served from whole blocks
+    """
+    def __init__(self, size, fetch):
+        super().__init__()
+        self._size = int(size)
+        self._fetch = fetch
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=_io.SEEK_SET):
+        if whence == _io.SEEK_SET:
+            pos = offset
+        elif whence == _io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == _io.SEEK_END:
+            pos = self._size + offset
+        else:
+            raise ValueError("Invalid whence (%s)" % whence)
+
+        if pos < 0:
+            raise ValueError("Cannot seek to a negative position")
+
+        self._pos = pos
+        return self._pos
+
+    def size(self):
+        """Return the size of the object in bytes"""
+        return self._size
+
+    def readinto(self, b):
+        # never fetch more than one block in a single request
+        n = min(len(b), self._size - self._pos, _read_block_size)
+
+        if n <= 0:
+            return 0
+
+        data = self._fetch(self._pos, self._pos + n)
+        n = len(data)
+        b[0:n] = data
+        self._pos += n
+
+        return n
+
+
+def _open_ranged_reader(size, fetch):
+    """Return a buffered reader over the object of 'size' bytes that
+       is read using 'fetch(start, end)'
+    """
+    return _io.BufferedReader(_RangedReader(size, fetch),
+                              buffer_size=_read_block_size)
+
+
+class _ObjectWriter(_io.RawIOBase):
+    """Base class of the streams returned by open_object_writer. The
+       object is only committed when the stream is closed. If the
+       stream is used as a context manager and an exception is
+       raised, or if the stream is garbage collected without being
+       closed, then the write is aborted and nothing is committed
+    """
+    def __init__(self):
+        super().__init__()
+        self._on_commit = []
+        self._aborted = False
+        self._nbytes = 0
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self._nbytes
+
+    def write(self, b):
+        if self.closed:
+            raise ValueError("I/O operation on a closed object writer")
+
+        data = bytes(b)
+        self._write(data)
+        self._nbytes += len(data)
+
+        return len(data)
+
+    def add_commit_callback(self, callback):
+        """Add a function that is called once the object is committed"""
+        self._on_commit.append(callback)
+
+    def abort(self):
+        """Abort the write, so that nothing is committed"""
+        if self.closed:
+            return
+
+        self._aborted = True
+
+        try:
+            self._abort()
+        finally:
+            super().close()
+
+    def close(self):
+        """Close the stream, committing the object"""
+        if self.closed:
+            return
+
+        if self._aborted:
+            super().close()
+            return
+
+        try:
+            self._commit()
+        except:
+            self.abort()
+            raise
+
+        super().close()
+
+        for callback in self._on_commit:
+            callback()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def __del__(self):
+        try:
+            self.abort()
+        except:
+            pass
+
+    def _write(self, data):
+        raise NotImplementedError()
+
+    def _commit(self):
+        raise NotImplementedError()
+
+    def _abort(self):
+        raise NotImplementedError()
+
+
+class _MultipartWriter(_ObjectWriter):
+    """An object writer that buffers up to one part of data in memory,
+       uploading each complete part as part of a multipart upload.
+       Objects smaller than one part are written using a single
+       'put_object(data)'. Otherwise the upload is started with
+       'start_upload()' (returning an upload ID), each part is written
+       with 'upload_part(upload_id, part_num, data)' (returning the
+       part's etag), and the upload is finished with either
+       'commit_upload(upload_id, parts)' (passing the list of
+       (part_num, etag)) or 'abort_upload(upload_id)'
+    """
+    def __init__(self, put_object, start_upload, upload_part,
+                 commit_upload, abort_upload, part_size=None):
+        super().__init__()
+
+        if part_size is None:
+            part_size = _write_part_size
+
+        self._part_size = int(part_size)
+        self._put_object = put_object
+        self._start_upload = start_upload
+        self._upload_part = upload_part
+        self._commit_upload = commit_upload
+        self._abort_upload = abort_upload
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._parts = []
+
+    def _flush_part(self, data):
+        """Upload 'data' as the next part of the multipart upload"""
+        if self._upload_id is None:
+            self._upload_id = self._start_upload()
+
+        part_num = len(self._parts) + 1
+        etag = self._upload_part(self._upload_id, part_num, data)
+        self._parts.append((part_num, etag))
+
+    def _write(self, data):
+        self._buffer += data
+
+        while len(self._buffer) >= self._part_size:
+            part = bytes(self._buffer[0:self._part_size])
+            del self._buffer[0:self._part_size]
+            self._flush_part(part)
+
+    def _commit(self):
+        if self._upload_id is None:
+            self._put_object(bytes(self._buffer))
+        else:
+            if len(self._buffer) > 0:
+                self._flush_part(bytes(self._buffer))
+
+            self._commit_upload(self._upload_id, self._parts)
+
+        self._buffer = bytearray()
+
+    def _abort(self):
+        self._buffer = bytearray()
+
+        if self._upload_id is not None:
+            self._abort_upload(self._upload_id)
+            self._upload_id = None
+
+
+def _stream_size_and_checksum(stream):
+    """Return the size and MD5 checksum of the data read from
+       'stream', reading this one block at a time
+    """
+    from hashlib import md5 as _md5
+    md5 = _md5()
+    size = 0
+
+    for chunk in iter(lambda: stream.read(_read_block_size), b""):
+        md5.update(chunk)
+        size += len(chunk)
+
+    return (size, md5.hexdigest())
@@ -53,6 +53,62 @@ def _clean_key(key):
     return key
 
 
+def _iter_raw_names(bucket, prefix=None, start_after=None, page_size=1000):
+    """Iterate over the unmodified names of the objects in the passed
+       bucket that start with 'prefix' and sort after 'start_after',
+       listing 'page_size' names at a time and following
+       'next_start_with' until every page has been read
+
+       Args:
+            bucket (dict): Bucket containing data
+            prefix (str): Prefix for data (already cleaned)
+            start_after (str): Only return names after this name
+            page_size (int): Number of names to list per request
+       Returns:
+            generator: Names of the objects
+
+    """
+    # 'start' is inclusive, so names equal to start_after are skipped
+    start = start_after
+
+    while True:
+        kwargs = {"prefix": prefix, "limit": int(page_size)}
+
+        if start is not None:
+            kwargs["start"] = start
+
+        objects = bucket["client"].list_objects(bucket["namespace"],
+                                                bucket["bucket_name"],
+                                                **kwargs).data
+
+        for obj in objects.objects:
+            name = obj.name
+
+            if prefix and not name.startswith(prefix):
+                continue
+
+            if start_after is not None and name <= start_after:
+                continue
+
+            yield name
+
+        start = objects.next_start_with
+
+        if start is None:
+            break
+
+
+def _is_precondition_failure(e):
+    """Return whether or not the passed exception from the OCI client
+       is because the if-match or if-none-match condition of a
+       request was not met
+    """
+    try:
+        return e.status in [409, 412]
+    except:
+        return False
+
+
 def _get_object_url_for_region(region, uri):
     """Internal function used to get the full URL to the passed PAR URI
        for the specified region. This has the format;
@@ -588,6 +644,178 @@ class OCI_ObjectStore:
 
         return data
 
+    @staticmethod
+    def get_object_range(bucket, key, start, length=None):
+        """Return up to 'length' bytes of the data contained in the key
+           'key' in the passed bucket, starting from byte 'start',
+           using a ranged GET request
+
+           Args:
+                bucket (dict): Bucket containing data
+                key (str): Key for data in bucket
+                start (int): Offset of the first byte to read
+                length (int, default=None): Number of bytes to read,
+                or None to read to the end of the object
+           Returns:
+                bytes: Binary data
+
+        """
+        key = _clean_key(key)
+
+        if length is None:
+            byte_range = "bytes=%d-" % start
+        else:
+            byte_range = "bytes=%d-%d" % (start, start + length - 1)
+
+        try:
+            response = bucket["client"].get_object(bucket["namespace"],
+                                                   bucket["bucket_name"],
+                                                   key, range=byte_range)
+        except Exception as e:
+            if getattr(e, "status", None) == 416:
+                # the range starts beyond the end of the object
+                return b""
+
+            from Acquire.ObjectStore import ObjectStoreError
+            raise ObjectStoreError("No data at key '%s'" % key)
+
+        return b"".join(response.data.raw.stream(1024 * 1024,
+                                                 decode_content=False))
+
+    @staticmethod
+    def open_object_reader(bucket, key):
+        """Return a binary, seekable file-like object that streams
+           the data contained in the key 'key' in the passed bucket,
+           reading the object using ranged GET requests
+
+           Args:
+                bucket (dict): Bucket containing data
+                key (str): Key for data in bucket
+           Returns:
+                io.BufferedReader: Stream of the binary data
+
+        """
+        from Acquire.ObjectStore._objstore_stream import _open_ranged_reader
+
+        key = _clean_key(key)
+
+        try:
+            response = bucket["client"].head_object(bucket["namespace"],
+                                                    bucket["bucket_name"],
+                                                    key)
+        except:
+            # this may be an old chunked object, which must be read
+            # in full
+            return _io.BytesIO(OCI_ObjectStore.get_object(bucket, key))
+
+        size = int(response.headers["Content-Length"])
+
+        def _fetch(start, end):
+            response = bucket["client"].get_object(
+                                bucket["namespace"],
+                                bucket["bucket_name"], key,
+                                range="bytes=%d-%d" % (start, end - 1))
+
+            return b"".join(response.data.raw.stream(
+                                1024 * 1024, decode_content=False))
+
+        return _open_ranged_reader(size, _fetch)
+
+    @staticmethod
+    def open_object_writer(bucket, key):
+        """Return a binary file-like object that streams data to the
+           key 'key' in the passed bucket. Large objects are written
+           using a multipart upload, which is only committed when
+           the writer is closed
+
+           Args:
+                bucket (dict): Bucket to hold data
+                key (str): Key for data in bucket
+           Returns:
+                io.RawIOBase: Stream to write the binary data
+
+        """
+        from Acquire.ObjectStore._objstore_stream import _MultipartWriter
+
+        key = _clean_key(key)
+        client = bucket["client"]
+        namespace = bucket["namespace"]
+        bucket_name = bucket["bucket_name"]
+
+        def _put_object(data):
+            client.put_object(namespace, bucket_name, key, _io.BytesIO(data))
+
+        def _start_upload():
+            from oci.object_storage.models import \
+                CreateMultipartUploadDetails as _CreateMultipartUploadDetails
+
+            details = _CreateMultipartUploadDetails(object=key)
+            response = client.create_multipart_upload(namespace, bucket_name,
+                                                      details)
+            return response.data.upload_id
+
+        def _upload_part(upload_id, part_num, data):
+            response = client.upload_part(namespace, bucket_name, key,
+                                          upload_id, part_num,
+                                          _io.BytesIO(data))
+            return response.headers["etag"]
+
+        def _commit_upload(upload_id, parts):
+            from oci.object_storage.models import \
+                CommitMultipartUploadDetails \
+                as _CommitMultipartUploadDetails, \
+                CommitMultipartUploadPartDetails \
+                as _CommitMultipartUploadPartDetails
+
+            details = _CommitMultipartUploadDetails(
+                parts_to_commit=[_CommitMultipartUploadPartDetails(
+                                    part_num=part_num, etag=etag)
+                                 for (part_num, etag) in parts])
+
+            client.commit_multipart_upload(namespace, bucket_name, key,
+                                           upload_id, details)
+
+        def _abort_upload(upload_id):
+            client.abort_multipart_upload(namespace, bucket_name, key,
+                                          upload_id)
+
+        return _MultipartWriter(put_object=_put_object,
+                                start_upload=_start_upload,
+                                upload_part=_upload_part,
+                                commit_upload=_commit_upload,
+                                abort_upload=_abort_upload)
+
+    @staticmethod
+    def get_object_and_etag(bucket, key):
+        """Return the binary data contained in the key 'key' in the
+           passed bucket, together with its etag. Only single
+           (non-chunked) objects have an etag
+
+           Args:
+                bucket (dict): Bucket containing data
+                key (str): Key for data in bucket
+           Returns:
+                tuple (bytes, str): Binary data and etag
+
+        """
+        key = _clean_key(key)
+
+        try:
+            response = bucket["client"].get_object(bucket["namespace"],
+                                                   bucket["bucket_name"],
+                                                   key)
+        except:
+            from Acquire.ObjectStore import ObjectStoreError
+            raise ObjectStoreError("No data at key '%s'" % key)
+
+        data = b""
+
+        for chunk in response.data.raw.stream(1024 * 1024,
+                                              decode_content=False):
+            data += chunk
+
+        return (data, response.headers["etag"])
+
     @staticmethod
     def take_object(bucket, key):
         """Take (delete) the object from the object store, returning
@@ -611,35 +839,34 @@ class OCI_ObjectStore:
         return data
 
     @staticmethod
-    def get_all_object_names(bucket, prefix=None, without_prefix=False):
-        """Returns the names of all objects in the passed bucket
+    def iter_object_names(bucket, prefix=None, start_after=None,
+                          page_size=1000, without_prefix=False):
+        """Iterate over the names of all objects in the passed bucket
+           whose names start with 'prefix', in lexicographic order,
+           starting after the name 'start_after'. The names are
+           listed 'page_size' at a time, following 'next_start_with'
+           until every page has been read
 
            Args:
                 bucket (dict): Bucket containing data
                 prefix (str): Prefix for data
+                start_after (str): Only return names after this name
+                page_size (int): Number of names to list per request
+                without_prefix (bool): Whether or not to remove the
+                prefix from the object names
            Returns:
-                list: List of all objects in bucket
+                generator: Names of the objects in the bucket
 
         """
         if prefix is not None:
             prefix = _clean_key(prefix)
 
-        objects = bucket["client"].list_objects(bucket["namespace"],
-                                                bucket["bucket_name"],
-                                                prefix=prefix).data
-
-        names = []
-
         if without_prefix:
             prefix_len = len(prefix)
 
-        for obj in objects.objects:
-            if prefix:
-                if obj.name.startswith(prefix):
-                    name = obj.name
-            else:
-                name = obj.name
-
+        for name in _iter_raw_names(bucket, prefix=prefix,
+                                    start_after=start_after,
+                                    page_size=page_size):
             while name.endswith("/"):
                 name = name[0:-1]
 
@@ -653,9 +880,86 @@ class OCI_ObjectStore:
                     name = name[1:]
 
             if len(name) > 0:
-                names.append(name)
+                yield name
+
+    @staticmethod
+    def list_prefixes(bucket, prefix=None, delimiter="/"):
+        """Return the common prefixes and the immediate objects of the
+           keys in the passed bucket that start with 'prefix'. A common
+           prefix is the part of a key up to and including the first
+           'delimiter' after 'prefix'. OCI only supports "/" as a
+           native delimiter, so other delimiters are found by
+           scanning the names under 'prefix'
+
+           Args:
+                bucket (dict): Bucket containing data
+                prefix (str): Prefix for data
+                delimiter (str): Delimiter between levels of keys
+           Returns:
+                tuple (list, list): Sorted common prefixes and objects
+
+        """
+        if prefix is not None:
+            prefix = _clean_key(prefix)
+        else:
+            prefix = ""
+
+        prefixes = set()
+        names = []
+
+        if delimiter != "/":
+            for name in OCI_ObjectStore.iter_object_names(bucket=bucket,
+                                                          prefix=prefix):
+                idx = name.find(delimiter, len(prefix)) if delimiter else -1
+
+                if idx == -1:
+                    names.append(name)
+                else:
+                    prefixes.add(name[0:idx+len(delimiter)])
+
+            return (sorted(prefixes), names)
+
+        start = None
 
-        return names
+        while True:
+            kwargs = {"prefix": prefix, "delimiter": delimiter,
+                      "limit": 1000}
+
+            if start is not None:
+                kwargs["start"] = start
+
+            objects = bucket["client"].list_objects(bucket["namespace"],
+                                                    bucket["bucket_name"],
+                                                    **kwargs).data
+
+            for obj in objects.objects:
+                if obj.name.startswith(prefix):
+                    names.append(obj.name)
+
+            if objects.prefixes:
+                prefixes.update(objects.prefixes)
+
+            start = objects.next_start_with
+
+            if start is None:
+                break
+
+        return (sorted(prefixes), sorted(names))
+
+    @staticmethod
+    def get_all_object_names(bucket, prefix=None, without_prefix=False):
+        """Returns the names of all objects in the passed bucket
+
+           Args:
+                bucket (dict): Bucket containing data
+                prefix (str): Prefix for data
+           Returns:
+                list: List of all objects in bucket
+
+        """
+        return list(OCI_ObjectStore.iter_object_names(
+                                bucket=bucket, prefix=prefix,
+                                without_prefix=without_prefix))
 
     @staticmethod
     def set_object(bucket, key, data):
@@ -679,26 +983,108 @@ class OCI_ObjectStore:
                                     bucket["bucket_name"],
                                     key, f)
 
+    @staticmethod
+    def set_object_if_absent(bucket, key, data):
+        """Set the value of 'key' in 'bucket' to binary 'data' if (and
+           only if) there is no object at this key, using an
+           if-none-match request
+
+           Args:
+                bucket (dict): Bucket containing data
+                key (str): Key for data in bucket
+                data (bytes): Binary data to store in bucket
+
+           Returns:
+                str: The etag of the new object
+        """
+        if data is None:
+            data = b'0'
+
+        f = _io.BytesIO(data)
+
+        key = _clean_key(key)
+
+        try:
+            response = bucket["client"].put_object(bucket["namespace"],
+                                                   bucket["bucket_name"],
+                                                   key, f, if_none_match="*")
+        except Exception as e:
+            if _is_precondition_failure(e):
+                from Acquire.ObjectStore import PreconditionFailedError
+                raise PreconditionFailedError(
+                    "There is already an object at key '%s'" % key)
+            raise
+
+        return response.headers["etag"]
+
+    @staticmethod
+    def set_object_if_match(bucket, key, data, etag):
+        """Set the value of 'key' in 'bucket' to binary 'data' if (and
+           only if) the current object at this key has etag 'etag',
+           using an if-match request
+
+           Args:
+                bucket (dict): Bucket containing data
+                key (str): Key for data in bucket
+                data (bytes): Binary data to store in bucket
+                etag (str): Etag of the object that will be replaced
+
+           Returns:
+                str: The etag of the new object
+        """
+        if data is None:
+            data = b'0'
+
+        f = _io.BytesIO(data)
+
+        key = _clean_key(key)
+
+        try:
+            response = bucket["client"].put_object(bucket["namespace"],
+                                                   bucket["bucket_name"],
+                                                   key, f, if_match=etag)
+        except Exception as e:
+            if _is_precondition_failure(e) or getattr(e, "status",
+                                                      None) == 404:
+                from Acquire.ObjectStore import PreconditionFailedError
+                raise PreconditionFailedError(
+                    "The object at key '%s' does not match etag '%s'" %
+                    (key, etag))
+            raise
+
+        return response.headers["etag"]
+
     @staticmethod
     def delete_all_objects(bucket, prefix=None):
-        """Deletes all objects...
+        """Deletes all objects whose names start with 'prefix' (or
+           all objects in the bucket if 'prefix' is None). OCI has no
+           batch delete, so the objects are deleted concurrently
 
            Args:
                 bucket (dict): Bucket containing data
-                prefix (str, default=None): Prefix for data,
-                currently unused
+                prefix (str, default=None): Prefix for data
             Returns:
                 None
         """
+        from Acquire.ObjectStore._objstore import _map_keys, \
+            _raise_first_error
+
+        if prefix is not None:
+            prefix = _clean_key(prefix)
 
-        for obj in OCI_ObjectStore.get_all_object_names(bucket):
+        names = list(_iter_raw_names(bucket, prefix=prefix))
+
+        def _delete(name):
             bucket["client"].delete_object(bucket["namespace"],
                                            bucket["bucket_name"],
-                                           obj)
+                                           name)
+
+        _raise_first_error(_map_keys(_delete, names))
 
     @staticmethod
     def delete_object(bucket, key):
-        """Removes the object at 'key'
+        """Removes the object at 'key'. Removing an object that
+           doesn't exist is not an error
 
            Args:
                 bucket (dict): Bucket containing data
@@ -706,22 +1092,32 @@ class OCI_ObjectStore:
            Returns:
                 None
         """
+        key = _clean_key(key)
+
         try:
-            key = _clean_key(key)
             bucket["client"].delete_object(bucket["namespace"],
                                            bucket["bucket_name"],
                                            key)
-        except:
-            pass
+        except Exception as e:
+            if getattr(e, "status", None) == 404:
+                return
+
+            from Acquire.ObjectStore import ObjectStoreError
+            raise ObjectStoreError(
+                "Unable to delete the object at '%s': %s" % (key, str(e)))
 
     @staticmethod
-    def get_size_and_checksum(bucket, key):
+    def get_size_and_checksum(bucket, key, calculate=True):
         """Return the object size (in bytes) and MD5 checksum of the
-           object in the passed bucket at the specified key
+           object in the passed bucket at the specified key. If the
+           store has no MD5 for the object then it is calculated by
+           streaming the object, or None is returned for the checksum
+           if 'calculate' is False
 
            Args:
                 bucket (dict): Bucket containing data
                 key (str): Key for object
+                calculate (bool): Whether to calculate a missing MD5
            Returns:
                 tuple (int, str): Size and MD5 checksum of object
 
@@ -729,15 +1125,32 @@ class OCI_ObjectStore:
         key = _clean_key(key)
 
         try:
-            response = bucket["client"].get_object(bucket["namespace"],
-                                                   bucket["bucket_name"],
-                                                   key)
+            # only the headers are needed, so don't open a download
+            response = bucket["client"].head_object(bucket["namespace"],
+                                                    bucket["bucket_name"],
+                                                    key)
         except:
             from Acquire.ObjectStore import ObjectStoreError
             raise ObjectStoreError("No data at key '%s'" % key)
 
         content_length = response.headers["Content-Length"]
-        checksum = response.headers["Content-MD5"]
+
+        try:
+            checksum = response.headers["Content-MD5"]
+        except KeyError:
+            checksum = None
+
+        if checksum is None and not calculate:
+            return (int(content_length), None)
+
+        if checksum is None:
+            # objects written using a multipart upload have no MD5,
+            # so stream the object to calculate this
+            from Acquire.ObjectStore._objstore_stream import \
+                _stream_size_and_checksum
+
+            with OCI_ObjectStore.open_object_reader(bucket, key) as reader:
+                return _stream_size_and_checksum(reader)
 
         # the checksum is a base64 encoded Content-MD5 header
         # described as standard part of HTTP RFC 2616. Need to
@@ -41,6 +41,9 @@ class OSPar:
             calculation
             driver_details (str, default=None): Contains extra details for
             OSPar creation
+            resumable_url (str, default=None): URL used to start a
+            resumable upload to the object, for object stores that
+            need a separate URL for this
 
     """
     def __init__(self, url=None, key=None,
@@ -48,7 +51,8 @@ class OSPar:
                  expires_datetime=None,
                  is_readable=False,
                  is_writeable=False,
-                 driver_details=None):
+                 driver_details=None,
+                 resumable_url=None):
         """Construct an OSPar result by passing in the URL at which the
            object can be accessed, the UTC datetime when this expires,
            whether this is readable or writeable, and
@@ -67,6 +71,10 @@ class OSPar:
            the OSPar, and supplies extra details that are used by the
            driver to create, register and manage OSPars... You should
            not do anything with driver_details yourself
+
+           resumable_url is an optional second URL that starts a
+           resumable upload to the object. This is encrypted in the
+           same way as 'url', and expires at the same time
         """
         service_url = None
 
@@ -86,6 +94,9 @@ class OSPar:
 
             url = encrypt_key.encrypt(url)
 
+            if resumable_url is not None:
+                resumable_url = encrypt_key.encrypt(resumable_url)
+
             from Acquire.ObjectStore import create_uid as _create_uid
             self._uid = _create_uid()
 
@@ -97,6 +108,7 @@ class OSPar:
                 pass
 
         self._url = url
+        self._resumable_url = resumable_url
         self._key = key
         self._expires_datetime = expires_datetime
         self._service_url = service_url
@@ -228,6 +240,33 @@ class OSPar:
 
         return self._get_privkey(decrypt_key).decrypt(self._url)
 
+    def resumable_url(self, decrypt_key=None):
+        """Return the URL used to start a resumable upload to the
+           object, or None if the object store does not need a
+           separate URL for this. Like url, this raises a
+           PARTimeoutError if the OSPar has expired, and needs
+           the key used to decrypt the OSPar
+
+           Args:
+                decrypt_key (str, default=None): Key for decryption of data
+           Returns:
+                str: Decrypted URL, or None
+        """
+        try:
+            resumable_url = self._resumable_url
+        except AttributeError:
+            resumable_url = None
+
+        if resumable_url is None:
+            return None
+
+        if self.seconds_remaining(buffer=30) <= 0:
+            from Acquire.Client import PARTimeoutError
+            raise PARTimeoutError(
+                "The URL behind this OSPar has expired and is no longer valid")
+
+        return self._get_privkey(decrypt_key).decrypt(resumable_url)
+
     def service_url(self):
         """Return the URL of the service that created this OSPar
 
@@ -477,6 +516,10 @@ class OSPar:
             as _bytes_to_string
 
         data["url"] = _bytes_to_string(self._url)
+
+        if self._resumable_url is not None:
+            data["resumable_url"] = _bytes_to_string(self._resumable_url)
+
         data["uid"] = self._uid
         data["key"] = self._key
         data["expires_datetime"] = _datetime_to_string(self._expires_datetime)
@@ -525,6 +568,10 @@ class OSPar:
         par = OSPar()
 
         par._url = _string_to_bytes(data["url"])
+
+        if "resumable_url" in data:
+            par._resumable_url = _string_to_bytes(data["resumable_url"])
+
         par._key = data["key"]
         par._uid = data["uid"]
 
@@ -564,32 +611,58 @@ def _url_to_filepath(url):
 
 def _read_local(url):
     """Internal function used to read data from the local testing object
-       store
+       store. If the disk cache is enabled then the data is read
+       via the cache, using the modification time and size of
+       the file as its etag
 
        Args:
             url (str): URL from which to read data
        Returns:
             bytes: Data read from file
     """
-    with open("%s._data" % _url_to_filepath(url), "rb") as FILE:
-        return FILE.read()
+    filename = "%s._data" % _url_to_filepath(url)
 
+    from ._disk_cache import _get_disk_cache
+    disk_cache = _get_disk_cache()
 
-def _read_remote(url):
-    """Internal function used to read data from a remote URL
+    if disk_cache is None:
+        with open(filename, "rb") as FILE:
+            return FILE.read()
+
+    def _load(etag):
+        import os as _os
+        stat = _os.stat(filename)
+        new_etag = "%d-%d" % (stat.st_mtime_ns, stat.st_size)
+
+        if etag == new_etag:
+            return (None, etag)
+
+        with open(filename, "rb") as FILE:
+            return (FILE.read(), new_etag)
+
+    return disk_cache.get_revalidated("url:%s" % url, _load)
+
+
+def _get_remote(url, headers=None):
+    """Internal function used to GET the passed remote URL, raising
+       a PARReadError if this fails. A "304 Not Modified" response
+       is returned, as this is expected for a conditional GET
 
        Args:
             url (str): Remote URL from which to read data
+            headers (dict, default=None): Extra headers for the request
        Returns:
-            str: HTTP request content
-
+            response: The HTTP response
     """
     status_code = None
     response = None
 
     try:
-        from Acquire.Stubs import requests as _requests
-        response = _requests.get(url)
+        from Acquire.Service import http_get as _http_get
+        if headers is None:
+            response = _http_get(url)
+        else:
+            response = _http_get(url, headers=headers)
         status_code = response.status_code
     except Exception as e:
         from Acquire.Client import PARReadError
@@ -597,15 +670,106 @@ def _read_remote(url):
             "Cannot read the remote OSPar URL '%s' because of a possible "
             "nework issue: %s" % (url, str(e)))
 
-    output = response.content
+    if status_code not in [200, 304]:
+        from Acquire.Client import PARReadError
+        raise PARReadError(
+            "Failed to read data from the OSPar URL. HTTP status code = %s, "
+            "returned output: %s" % (status_code, response.content))
+
+    return response
+
+
+def _read_remote(url):
+    """Internal function used to read data from a remote URL. If the
+       disk cache is enabled then a cached copy of the data is
+       revalidated using its etag (If-None-Match), so that
+       unchanged data is not downloaded again
+
+       Args:
+            url (str): Remote URL from which to read data
+       Returns:
+            str: HTTP request content
+
+    """
+    from ._disk_cache import _get_disk_cache
+    disk_cache = _get_disk_cache()
+
+    if disk_cache is None:
+        response = _get_remote(url)
+
+        if response.status_code != 200:
+            from Acquire.Client import PARReadError
+            raise PARReadError(
+                "Failed to read data from the OSPar URL. HTTP status "
+                "code = %s" % response.status_code)
+
+        return response.content
+
+    def _load(etag):
+        if etag is None:
+            response = _get_remote(url)
+        else:
+            response = _get_remote(url, headers={"If-None-Match": etag})
+
+        if response.status_code == 304:
+            if etag is None:
+                from Acquire.Client import PARReadError
+                raise PARReadError(
+                    "Unexpected '304 Not Modified' response from the "
+                    "OSPar URL '%s'" % url)
+
+            return (None, etag)
+
+        try:
+            new_etag = response.headers["ETag"]
+        except Exception:
+            new_etag = None
+
+        return (response.content, new_etag)
+
+    return disk_cache.get_revalidated("url:%s" % url, _load)
+
+
+def _open_local(url):
+    """Internal function used to open the data in the local testing
+       object store for reading
+
+       Args:
+            url (str): URL from which to read data
+       Returns:
+            file: File object from which to read the data
+    """
+    return open("%s._data" % _url_to_filepath(url), "rb")
+
+
+def _open_remote(url):
+    """Internal function used to open a stream from which to read
+       the data at the passed remote URL, without loading
+       all of the data into memory
+
+       Args:
+            url (str): Remote URL from which to read data
+       Returns:
+            file: File-like object from which to read the data
+    """
+    try:
+        from Acquire.Service import http_get as _http_get
+        response = _http_get(url, stream=True)
+        status_code = response.status_code
+    except Exception as e:
+        from Acquire.Client import PARReadError
+        raise PARReadError(
+            "Cannot read the remote OSPar URL '%s' because of a possible "
+            "nework issue: %s" % (url, str(e)))
 
     if status_code != 200:
         from Acquire.Client import PARReadError
         raise PARReadError(
             "Failed to read data from the OSPar URL. HTTP status code = %s, "
-            "returned output: %s" % (status_code, output))
+            "returned output: %s" % (status_code, response.content))
 
-    return output
+    response.raw.decode_content = True
+    return response.raw
 
 
 def _list_local(url):
@@ -654,22 +818,24 @@ def _write_local(url, data):
 
        Args:
             url (str): URL to write data to
-            data (bytes): Data to write
+            data (bytes): Data to write (or file-like object to copy)
        Returns:
             None
     """
     filename = "%s._data" % _url_to_filepath(url)
 
-    try:
-        with open(filename, 'wb') as FILE:
-            FILE.write(data)
-            FILE.flush()
-    except:
-        dir = "/".join(filename.split("/")[0:-1])
+    dir = "/".join(filename.split("/")[0:-1])
+    if not _os.path.exists(dir):
         _os.makedirs(dir, exist_ok=True)
-        with open(filename, 'wb') as FILE:
+
+    with open(filename, 'wb') as FILE:
+        if hasattr(data, "read"):
+            import shutil as _shutil
+            _shutil.copyfileobj(data, FILE)
+        else:
             FILE.write(data)
-            FILE.flush()
+
+        FILE.flush()
 
 
 def _write_remote(url, data):
@@ -677,13 +843,13 @@ def _write_remote(url, data):
 
        Args:
             url (str): Remote URL to write data to
-            data (bytes): Data to write
+            data (bytes): Data to write (or file-like object to stream)
        Returns:
             None
     """
     try:
-        from Acquire.Stubs import requests as _requests
-        response = _requests.put(url, data=data)
+        from Acquire.Service import http_put as _http_put
+        response = _http_put(url, data=data)
         status_code = response.status_code
     except Exception as e:
         from Acquire.Client import PARWriteError
@@ -896,8 +1062,8 @@ class BucketWriter:
         else:
             self._par = None
 
-    def set_object(self, key, data):
-        """Set the value of 'key' in 'bucket' to binary 'data'"""
+    def _get_url(self, key):
+        """Return the URL used to write to 'key' in the bucket"""
         if self._par is None:
             from Acquire.Client import PARError
             raise PARError("You cannot write data to an empty OSPar")
@@ -908,9 +1074,13 @@ class BucketWriter:
         url = self._url
 
         if url.endswith("/"):
-            url = "%s%s" % (url, key)
+            return "%s%s" % (url, key)
         else:
-            url = "%s/%s" % (url, key)
+            return "%s/%s" % (url, key)
+
+    def set_object(self, key, data):
+        """Set the value of 'key' in 'bucket' to binary 'data'"""
+        url = self._get_url(key)
 
         if url.startswith("file://"):
             return _write_local(url, data)
@@ -919,10 +1089,16 @@ class BucketWriter:
 
     def set_object_from_file(self, key, filename):
         """Set the value of 'key' in 'bucket' to equal the contents
-           of the file located by 'filename'"""
-        with open(filename, "rb") as FILE:
-            data = FILE.read()
-            self.set_object(key, data)
+           of the file located by 'filename'. Large files are uploaded
+           in parts (see set_par_upload_options)"""
+        from ._ospar_upload import _upload_file
+
+        url = self._get_url(key)
+
+        if url.startswith("file://"):
+            _upload_file(url, filename, _write_local)
+        else:
+            _upload_file(url, filename, _write_remote)
 
     def set_string_object(self, key, string_data):
         """Set the value of 'key' in 'bucket' to the string 'string_data'"""
@@ -969,13 +1145,37 @@ class ObjectReader:
         else:
             return _read_remote(url)
 
-    def get_object_as_file(self, filename):
+    def get_object_as_file(self, filename, data_key=None):
         """Get the object contained in this OSPar and write this to
-           the file called 'filename'"""
-        objdata = self.get_object()
+           the file called 'filename'. If 'data_key' is passed then
+           the object is streamed through data_key.decrypt_stream,
+           so it must have been written using set_object_from_file
+           with the matching key
+        """
+        if data_key is None:
+            objdata = self.get_object()
 
-        with open(filename, "wb") as FILE:
-            FILE.write(objdata)
+            with open(filename, "wb") as FILE:
+                FILE.write(objdata)
+
+            return
+
+        if self._par is None:
+            from Acquire.Client import PARError
+            raise PARError("You cannot read data from an empty OSPar")
+
+        url = self._url
+
+        if url.startswith("file://"):
+            src = _open_local(url)
+        else:
+            src = _open_remote(url)
+
+        try:
+            with open(filename, "wb") as FILE:
+                data_key.decrypt_stream(src, FILE)
+        finally:
+            src.close()
 
     def get_string_object(self):
         """Return the object behind this OSPar as a string (raises exception
@@ -1019,6 +1219,7 @@ class ObjectWriter(ObjectReader):
 
             self._par = par
             self._url = par.url(decrypt_key)
+            self._resumable_url = par.resumable_url(decrypt_key)
         else:
             self._par = None
 
@@ -1037,12 +1238,48 @@ class ObjectWriter(ObjectReader):
         else:
             return _write_remote(url, data)
 
-    def set_object_from_file(self, filename):
+    def set_object_from_file(self, filename, data_key=None):
         """Set the value of the object behind this OSPar to equal the contents
-           of the file located by 'filename'"""
-        with open(filename, "rb") as FILE:
-            data = FILE.read()
-            self.set_object(data)
+           of the file located by 'filename'. If 'data_key' is passed
+           then the file is encrypted using data_key.encrypt_stream.
+           This is streamed via a temporary file, so that the memory
+           used does not depend on the size of the file. Large files
+           are uploaded in parts, several at once, and an interrupted
+           upload of an unencrypted file is resumed when this is
+           called again (see set_par_upload_options)
+        """
+        if self._par is None:
+            from Acquire.Client import PARError
+            raise PARError("You cannot write data to an empty OSPar")
+
+        from ._ospar_upload import _upload_file
+
+        url = self._url
+
+        if url.startswith("file://"):
+            write_function = _write_local
+        else:
+            write_function = _write_remote
+
+        resumable_url = self._resumable_url
+
+        if data_key is None:
+            _upload_file(url, filename, write_function,
+                         resumable_url=resumable_url)
+            return
+
+        import tempfile as _tempfile
+
+        with _tempfile.TemporaryDirectory() as tempdir:
+            tmpname = _os.path.join(tempdir, "encrypted")
+
+            with open(tmpname, "wb") as TMPFILE:
+                with open(filename, "rb") as FILE:
+                    data_key.encrypt_stream(FILE, TMPFILE)
+
+            # the encrypted data differs each time, so cannot be resumed
+            _upload_file(url, tmpname, write_function, resume=False,
+                         resumable_url=resumable_url)
 
     def set_string_object(self, string_data):
         """Set the value of the object behind this OSPar to the
@@ -0,0 +1,581 @@
+
+import os as _os
+import threading as _threading
+
+__all__ = ["set_par_upload_options", "get_par_upload_options"]
+
+_options_lock = _threading.Lock()
+
+_upload_options = {"multipart_threshold": 64 * 1024 * 1024,
+                   "part_size": 16 * 1024 * 1024,
+                   "workers": 4,
+                   "max_retries": 3,
+                   "state_dir": None}
+
+# the maximum number of parts in a multipart upload (the OCI limit)
+_max_parts = 10000
+
+# GCS resumable uploads must be sent in multiples of 256 KiB
+_gcs_chunk_granularity = 256 * 1024
+
+
+def set_par_upload_options(multipart_threshold=None, part_size=None,
+                           workers=None, max_retries=None, state_dir=None):
+    """Set the options used to upload files via a writeable OSPar.
+       Files of at least 'multipart_threshold' bytes are uploaded
+       in parts of 'part_size' bytes (the part size is increased
+       if the file would need more than 10000 parts), with up to
+       'workers' parts uploaded at once. Each part is retried up
+       to 'max_retries' times. The state of each multipart upload
+       is saved in 'state_dir' (by default a directory in the system
+       temporary directory), so that an upload that is interrupted
+       (e.g. because the client crashed) is resumed from the
+       parts that have already been uploaded
+    """
+    with _options_lock:
+        if multipart_threshold is not None:
+            multipart_threshold = int(multipart_threshold)
+            if multipart_threshold < 1:
+                raise ValueError("The multipart threshold must be at least 1")
+            _upload_options["multipart_threshold"] = multipart_threshold
+
+        if part_size is not None:
+            part_size = int(part_size)
+            if part_size < 1:
+                raise ValueError("The part size must be at least 1 byte")
+            _upload_options["part_size"] = part_size
+
+        if workers is not None:
+            workers = int(workers)
+            if workers < 1:
+                raise ValueError("The number of workers must be at least 1")
+            _upload_options["workers"] = workers
+
+        if max_retries is not None:
+            max_retries = int(max_retries)
+            if max_retries < 0:
+                raise ValueError("The number of retries cannot be negative")
+            _upload_options["max_retries"] = max_retries
+
+        if state_dir is not None:
+            _upload_options["state_dir"] = str(state_dir)
+
+
+def get_par_upload_options():
+    """Return a copy of the options used to upload files via an OSPar"""
+    with _options_lock:
+        return dict(_upload_options)
+
+
+def _raise_write_error(message):
+    """Raise a PARWriteError with the passed message"""
+    from Acquire.Client import PARWriteError
+    raise PARWriteError(message)
+
+
+def _check_status(response, expected, action):
+    """Raise a PARWriteError if the status code of 'response' is
+       not in 'expected'
+    """
+    if response.status_code not in expected:
+        _raise_write_error(
+            "Failed to %s. HTTP status code = %s, returned output: %s" %
+            (action, response.status_code, response.content))
+
+
+class _LocalMultipartUpload:
+    """Multipart upload to an object in the local testing object
+       store. Parts are written to a directory outside of the
+       bucket, and are concatenated into the object on commit
+    """
+    parallel = True
+
+    def __init__(self, url, size, state=None):
+        self._filename = "%s._data" % url[7:]
+
+        if state is None:
+            self._upload_dir = None
+        else:
+            self._upload_dir = state["upload_dir"]
+
+    def state(self):
+        return {"upload_dir": self._upload_dir}
+
+    def start(self):
+        import tempfile as _tempfile
+        root = _os.path.join(_tempfile.gettempdir(), "acquire_par_parts")
+        _os.makedirs(root, exist_ok=True)
+        self._upload_dir = _tempfile.mkdtemp(dir=root)
+
+    def uploaded_parts(self):
+        from Acquire.Crypto import Hash as _Hash
+
+        parts = {}
+
+        for name in _os.listdir(self._upload_dir):
+            if name.isdigit():
+                with open(_os.path.join(self._upload_dir, name), "rb") as F:
+                    parts[int(name)] = _Hash.md5(F.read())
+
+        return parts
+
+    def upload_part(self, part_num, data, md5):
+        import uuid as _uuid
+        path = _os.path.join(self._upload_dir, str(part_num))
+        tmpname = "%s.%s.tmp" % (path, _uuid.uuid4())
+
+        with open(tmpname, "wb") as FILE:
+            FILE.write(data)
+
+        _os.replace(tmpname, path)
+
+        return md5
+
+    def commit(self, parts):
+        import shutil as _shutil
+        import uuid as _uuid
+
+        _os.makedirs(_os.path.dirname(self._filename), exist_ok=True)
+        tmpname = "%s.%s._tmp" % (self._filename, _uuid.uuid4())
+
+        with open(tmpname, "wb") as FILE:
+            for (part_num, _) in parts:
+                path = _os.path.join(self._upload_dir, str(part_num))
+                with open(path, "rb") as PART:
+                    _shutil.copyfileobj(PART, FILE)
+
+        _os.replace(tmpname, self._filename)
+        _shutil.rmtree(self._upload_dir, ignore_errors=True)
+
+    def abort(self):
+        import shutil as _shutil
+        _shutil.rmtree(self._upload_dir, ignore_errors=True)
+
+
+class _OCIMultipartUpload:
+    """Multipart upload via an OCI pre-authenticated request. The
+       upload is created by a PUT to the PAR URL with the
+       'opc-multipart' header, which returns the URI to which
+       the parts are uploaded, and which is POSTed to commit
+    """
+    parallel = True
+
+    def __init__(self, url, size, state=None):
+        self._url = url
+
+        if state is None:
+            self._upload_url = None
+        else:
+            self._upload_url = state["upload_url"]
+
+    def state(self):
+        return {"upload_url": self._upload_url}
+
+    def start(self):
+        from Acquire.Service import http_put as _http_put
+        from urllib.parse import urlsplit as _urlsplit
+
+        response = _http_put(self._url, headers={"opc-multipart": "true"})
+        _check_status(response, [200], "create the multipart upload")
+
+        access_uri = response.json()["accessUri"]
+        url = _urlsplit(self._url)
+        self._upload_url = "%s://%s%s" % (url.scheme, url.netloc, access_uri)
+
+        if not self._upload_url.endswith("/"):
+            self._upload_url += "/"
+
+    def uploaded_parts(self):
+        from Acquire.Service import http_get as _http_get
+
+        parts = {}
+        page = None
+
+        while True:
+            if page is None:
+                response = _http_get(self._upload_url)
+            else:
+                response = _http_get(self._upload_url,
+                                     params={"page": page})
+
+            _check_status(response, [200], "list the uploaded parts")
+
+            for part in response.json():
+                parts[int(part["partNumber"])] = part["etag"]
+
+            page = response.headers.get("opc-next-page", None)
+
+            if page is None:
+                return parts
+
+    def upload_part(self, part_num, data, md5):
+        from Acquire.Service import http_put as _http_put
+        import base64 as _base64
+        import binascii as _binascii
+
+        content_md5 = _base64.b64encode(_binascii.unhexlify(md5))
+
+        response = _http_put("%s%d" % (self._upload_url, part_num),
+                             data=data,
+                             headers={"Content-MD5":
+                                      content_md5.decode("utf-8")})
+        _check_status(response, [200], "upload part %d" % part_num)
+
+        return response.headers["ETag"]
+
+    def commit(self, parts):
+        from Acquire.Service import http_post as _http_post
+
+        response = _http_post(self._upload_url)
+        _check_status(response, [200, 204], "commit the multipart upload")
+
+        return response.headers.get("opc-multipart-md5", None)
+
+    def abort(self):
+        from Acquire.Service import http_delete as _http_delete
+        _http_delete(self._upload_url)
+
+
+class _GCSResumableUpload:
+    """Resumable upload to GCS. The upload session is started by a POST
+       to the signed 'resumable_url' of the OSPar (which expires with
+       the OSPar), and the session URL that this returns is saved so
+       that an interrupted upload can be resumed. GCS needs the data of
+       a resumable upload to be sent in order, so the parts are uploaded
+       one at a time, and the upload is resumed from the last
+       complete part
+    """
+    parallel = False
+
+    def __init__(self, url, size, state=None):
+        self._url = url
+        self._size = int(size)
+        self._part_size = None
+
+        if state is None:
+            self._session_url = None
+        else:
+            self._session_url = state["session_url"]
+
+    def state(self):
+        return {"session_url": self._session_url}
+
+    def set_part_size(self, part_size):
+        self._part_size = part_size
+
+    def start(self):
+        from Acquire.Service import http_post as _http_post
+
+        response = _http_post(self._url,
+                              headers={"x-goog-resumable": "start"})
+        _check_status(response, [200, 201], "start the resumable upload")
+
+        self._session_url = response.headers["Location"]
+
+    def uploaded_parts(self):
+        from Acquire.Service import http_put as _http_put
+
+        response = _http_put(self._session_url, headers={
+                                "Content-Range": "bytes */%d" % self._size})
+
+        if response.status_code in [200, 201]:
+            # the upload is already complete
+            nbytes = self._size
+        elif response.status_code == 308:
+            try:
+                # the range of the received data, e.g. "bytes=0-1048575"
+                nbytes = int(response.headers["Range"].split("-")[-1]) + 1
+            except KeyError:
+                nbytes = 0
+        else:
+            _check_status(response, [308], "query the resumable upload")
+
+        return {i + 1: None for i in range(0, nbytes // self._part_size)}
+
+    def upload_part(self, part_num, data, md5):
+        from Acquire.Service import http_put as _http_put
+
+        start = (part_num - 1) * self._part_size
+        end = start + len(data) - 1
+
+        response = _http_put(self._session_url, data=data, headers={
+                    "Content-Range": "bytes %d-%d/%d" % (start, end,
+                                                         self._size)})
+        _check_status(response, [200, 201, 308], "upload part %d" % part_num)
+
+        return None
+
+    def commit(self, parts):
+        # the upload is completed by the upload of the last part
+        return None
+
+    def abort(self):
+        from Acquire.Service import http_delete as _http_delete
+
+        if self._session_url is not None:
+            _http_delete(self._session_url)
+
+
+def _get_multipart_upload_class(url, resumable_url=None):
+    """Return the class used to upload to 'url' (or 'resumable_url'
+       if the OSPar has one) in parts, or None if the object store
+       behind this URL does not support this
+    """
+    if resumable_url is not None:
+        return _GCSResumableUpload
+    elif url.startswith("file://"):
+        return _LocalMultipartUpload
+    elif "objectstorage" in url and "/p/" in url:
+        return _OCIMultipartUpload
+    else:
+        return None
+
+
+def _get_part_size(size, upload_class, part_size):
+    """Return the part size to use to upload a file of 'size' bytes"""
+    min_part_size = -(-size // _max_parts)
+    part_size = max(part_size, min_part_size)
+
+    if upload_class is _GCSResumableUpload:
+        part_size = _gcs_chunk_granularity * \
+            max(1, -(-part_size // _gcs_chunk_granularity))
+
+    return part_size
+
+
+def _get_state_filename(url, filename, state_dir):
+    """Return the name of the file used to save the state of the
+       upload of the local file 'filename' to 'url'. This depends on
+       the size and modification time of the file, so that a changed
+       file is never resumed
+    """
+    from Acquire.Crypto import Hash as _Hash
+
+    if state_dir is None:
+        import tempfile as _tempfile
+        state_dir = _os.path.join(_tempfile.gettempdir(),
+                                  "acquire_par_uploads")
+
+    stat = _os.stat(filename)
+    uid = _Hash.md5("%s|%s|%d|%d" % (url, _os.path.abspath(filename),
+                                     stat.st_size, stat.st_mtime_ns))
+
+    return _os.path.join(state_dir, "%s.json" % uid)
+
+
+def _load_state(state_filename):
+    """Return the saved state of an upload, or None if there is none"""
+    import json as _json
+
+    try:
+        with open(state_filename, "r") as FILE:
+            return _json.load(FILE)
+    except Exception:
+        return None
+
+
+def _save_state(state_filename, state):
+    """Save the state of an upload so that it can be resumed. The
+       state holds the URL of the upload, so is only readable
+       by this user
+    """
+    import json as _json
+
+    _os.makedirs(_os.path.dirname(state_filename), exist_ok=True)
+    tmpname = "%s.tmp" % state_filename
+
+    fd = _os.open(tmpname, _os.O_WRONLY | _os.O_CREAT | _os.O_TRUNC, 0o600)
+
+    with _os.fdopen(fd, "w") as FILE:
+        _json.dump(state, FILE)
+
+    _os.replace(tmpname, state_filename)
+
+
+def _multipart_md5(md5s):
+    """Return the checksum of a multipart object as reported by the
+       object store, i.e. the base64 MD5 of the concatenated MD5s of
+       the parts, followed by the number of parts
+    """
+    import base64 as _base64
+    import binascii as _binascii
+    import hashlib as _hashlib
+
+    md5 = _hashlib.md5()
+
+    for part_md5 in md5s:
+        md5.update(_binascii.unhexlify(part_md5))
+
+    return "%s-%d" % (_base64.b64encode(md5.digest()).decode("utf-8"),
+                      len(md5s))
+
+
+def _upload_file_in_parts(url, filename, resume=True, resumable_url=None):
+    """Upload the local file 'filename' to the passed OSPar 'url'
+       (or via its 'resumable_url', if it has one) using a multipart
+       upload, uploading several parts at once (if supported by the
+       object store) and retrying each part that fails. If 'resume'
+       is True then the state of the upload is saved, so that calling
+       this function again after a failure (or crash) only uploads
+       the parts that are missing. This returns False if the object
+       store behind 'url' does not support multipart uploads
+    """
+    upload_class = _get_multipart_upload_class(url, resumable_url)
+
+    if upload_class is None:
+        return False
+
+    if resumable_url is not None:
+        url = resumable_url
+
+    options = get_par_upload_options()
+    size = _os.path.getsize(filename)
+    part_size = _get_part_size(size, upload_class, options["part_size"])
+    nparts = max(1, -(-size // part_size))
+
+    if resume:
+        state_filename = _get_state_filename(url, filename,
+                                             options["state_dir"])
+        state = _load_state(state_filename)
+    else:
+        state_filename = None
+        state = None
+
+    upload = None
+    uploaded = {}
+
+    if state is not None:
+        try:
+            old_upload = upload_class(url, size, state=state["upload"])
+        except Exception:
+            old_upload = None
+
+        if old_upload is not None and state.get("part_size") == part_size:
+            try:
+                if upload_class is _GCSResumableUpload:
+                    old_upload.set_part_size(part_size)
+
+                uploaded = old_upload.uploaded_parts()
+                upload = old_upload
+            except Exception:
+                # the old upload has expired or was aborted - start again
+                uploaded = {}
+
+        if upload is None and old_upload is not None:
+            # the old upload cannot be resumed (e.g. because the part
+            # size has changed), so abort it rather than leave its
+            # parts behind in the object store
+            try:
+                old_upload.abort()
+            except Exception:
+                pass
+
+    if upload is None:
+        upload = upload_class(url, size)
+
+        if upload_class is _GCSResumableUpload:
+            upload.set_part_size(part_size)
+
+        upload.start()
+
+        if state_filename is not None:
+            _save_state(state_filename, {"part_size": part_size,
+                                         "upload": upload.state()})
+
+    max_retries = options["max_retries"]
+
+    def _upload_part(part_num):
+        """Read and upload the part 'part_num' (counting from 1)"""
+        import time as _time
+        from Acquire.Crypto import Hash as _Hash
+
+        with open(filename, "rb") as FILE:
+            FILE.seek((part_num - 1) * part_size)
+            data = FILE.read(part_size)
+
+        md5 = _Hash.md5(data)
+        attempt = 0
+
+        while True:
+            try:
+                return (upload.upload_part(part_num, data, md5), md5)
+            except Exception:
+                if attempt >= max_retries:
+                    raise
+
+                _time.sleep(0.25 * (2 ** attempt))
+                attempt += 1
+
+    todo = [i for i in range(1, nparts + 1) if i not in uploaded]
+    results = {}
+
+    if upload.parallel and options["workers"] > 1 and len(todo) > 1:
+        from concurrent.futures import ThreadPoolExecutor \
+            as _ThreadPoolExecutor
+
+        with _ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+            futures = {part_num: pool.submit(_upload_part, part_num)
+                       for part_num in todo}
+
+            errors = []
+
+            for (part_num, future) in futures.items():
+                try:
+                    results[part_num] = future.result()
+                except Exception as e:
+                    errors.append((part_num, e))
+
+        if len(errors) > 0:
+            _raise_write_error(
+                "Failed to upload %d of the %d parts of '%s' (the upload "
+                "can be resumed): %s" % (len(errors), nparts, filename,
+                                         str(errors[0][1])))
+    else:
+        for part_num in todo:
+            results[part_num] = _upload_part(part_num)
+
+    parts = []
+
+    for part_num in range(1, nparts + 1):
+        if part_num in results:
+            parts.append((part_num, results[part_num][0]))
+        else:
+            parts.append((part_num, uploaded[part_num]))
+
+    checksum = upload.commit(parts)
+
+    if checksum is not None and len(uploaded) == 0:
+        # check that the object store received the parts that were sent
+        expected = _multipart_md5([results[part_num][1]
+                                   for part_num in range(1, nparts + 1)])
+
+        if checksum != expected:
+            _raise_write_error(
+                "The multipart upload of '%s' is corrupted. The checksum "
+                "of the uploaded object is %s, but should be %s" %
+                (filename, checksum, expected))
+
+    if state_filename is not None:
+        try:
+            _os.remove(state_filename)
+        except OSError:
+            pass
+
+    return True
+
+
+def _upload_file(url, filename, write_function, resume=True,
+                 resumable_url=None):
+    """Upload the local file 'filename' to the OSPar 'url'. Large files
+       are uploaded in parts (see set_par_upload_options), using the
+       OSPar's 'resumable_url' if it has one, while smaller files are
+       streamed using 'write_function(url, FILE)'
+    """
+    if _os.path.getsize(filename) >= \
+            get_par_upload_options()["multipart_threshold"]:
+        if _upload_file_in_parts(url, filename, resume=resume,
+                                 resumable_url=resumable_url):
+            return
+
+    with open(filename, "rb") as FILE:
+        write_function(url, FILE)
@@ -4,15 +4,68 @@ import shutil as _shutil
 import datetime as _datetime
 import uuid as _uuid
 import json as _json
-import glob as _glob
 import threading
 import uuid as _uuid
 
+from ._objstore_stream import _ObjectWriter
+
 _rlock = threading.RLock()
 
 __all__ = ["Testing_ObjectStore"]
 
 
+def _get_file_signature(filename):
+    """Return a signature of the on-disk state of the object file
+       'filename', used to spot writes that did not update its etag
+    """
+    st = _os.stat(filename)
+    return "%d-%d-%d" % (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def _new_etag(filename):
+    """Give the object file 'filename' a new etag, and return it. Like
+       the generation of a GCS object, the etag changes on every write,
+       even if the same data is written again. The etag is stored,
+       with the signature of the file, in 'filename._etag'
+    """
+    etag = _uuid.uuid4().hex
+
+    with _rlock:
+        signature = _get_file_signature(filename)
+
+        with open("%s._etag" % filename, "w") as FILE:
+            FILE.write("%s %s" % (signature, etag))
+
+    return etag
+
+
+def _get_etag(filename):
+    """Return the etag of the object file 'filename'. A new etag is
+       created if the file has been written without one being made
+    """
+    with _rlock:
+        signature = _get_file_signature(filename)
+
+        try:
+            with open("%s._etag" % filename) as FILE:
+                (old_signature, etag) = FILE.read().split()
+
+            if old_signature == signature:
+                return etag
+        except (OSError, ValueError):
+            pass
+
+        return _new_etag(filename)
+
+
+def _remove_etag(filename):
+    """Remove the etag of the (deleted) object file 'filename'"""
+    try:
+        _os.remove("%s._etag" % filename)
+    except OSError:
+        pass
+
+
 def _get_driver_details_from_par(par):
     from Acquire.ObjectStore import datetime_to_string \
         as _datetime_to_string
@@ -44,6 +97,36 @@ def _get_driver_details_from_data(data):
     return details
 
 
+class _FileObjectWriter(_ObjectWriter):
+    """Object writer that streams data to a temporary file, which
+       is renamed to 'filename' when the object is committed
+    """
+    def __init__(self, filename):
+        super().__init__()
+        _os.makedirs(_os.path.dirname(filename), exist_ok=True)
+        self._filename = filename
+        self._tmpname = "%s.%s._tmp" % (filename, _uuid.uuid4())
+        self._file = open(self._tmpname, "wb")
+
+    def _write(self, data):
+        self._file.write(data)
+
+    def _commit(self):
+        self._file.close()
+
+        with _rlock:
+            _os.replace(self._tmpname, self._filename)
+            _new_etag(self._filename)
+
+    def _abort(self):
+        self._file.close()
+
+        try:
+            _os.remove(self._tmpname)
+        except OSError:
+            pass
+
+
 class Testing_ObjectStore:
     """This is a dummy object store that writes objects to
        the standard posix filesystem when running tests
@@ -232,6 +315,51 @@ class Testing_ObjectStore:
                 from Acquire.ObjectStore import ObjectStoreError
                 raise ObjectStoreError("No object at key '%s'" % key)
 
+    @staticmethod
+    def get_object_range(bucket, key, start, length=None):
+        """Return up to 'length' bytes of the data contained in the key
+           'key' in the passed bucket, starting from byte 'start'. This
+           reads to the end of the object if 'length' is None"""
+        try:
+            with open("%s/%s._data" % (bucket, key), "rb") as FILE:
+                FILE.seek(start)
+
+                if length is None:
+                    return FILE.read()
+                else:
+                    return FILE.read(length)
+        except FileNotFoundError:
+            from Acquire.ObjectStore import ObjectStoreError
+            raise ObjectStoreError("No object at key '%s'" % key)
+
+    @staticmethod
+    def open_object_reader(bucket, key):
+        """Return a binary, seekable file-like object that streams
+           the data contained in the key 'key' in the passed bucket"""
+        try:
+            return open("%s/%s._data" % (bucket, key), "rb")
+        except FileNotFoundError:
+            from Acquire.ObjectStore import ObjectStoreError
+            raise ObjectStoreError("No object at key '%s'" % key)
+
+    @staticmethod
+    def open_object_writer(bucket, key):
+        """Return a binary file-like object that streams data to the
+           key 'key' in the passed bucket. The data is written to a
+           temporary file that is renamed over the object when the
+           writer is closed
+        """
+        return _FileObjectWriter("%s/%s._data" % (bucket, key))
+
+    @staticmethod
+    def get_object_and_etag(bucket, key):
+        """Return the binary data contained in the key 'key' in the
+           passed bucket, together with the etag of that data"""
+
+        with _rlock:
+            data = Testing_ObjectStore.get_object(bucket, key)
+            return (data, _get_etag("%s/%s._data" % (bucket, key)))
+
     @staticmethod
     def take_object(bucket, key):
         """Take (delete) the object from the object store, returning
@@ -242,54 +370,155 @@ class Testing_ObjectStore:
             if _os.path.exists(filepath):
                 data = open(filepath, "rb").read()
                 _os.remove(filepath)
+                _remove_etag(filepath)
                 return data
             else:
                 from Acquire.ObjectStore import ObjectStoreError
                 raise ObjectStoreError("No object at key '%s'" % key)
 
     @staticmethod
-    def get_all_object_names(bucket, prefix=None, without_prefix=False):
-        """Returns the names of all objects in the passed bucket"""
-
-        root = bucket
+    def iter_object_names(bucket, prefix=None, start_after=None,
+                          page_size=1000, without_prefix=False):
+        """Iterate over the names of all objects in the passed bucket
+           whose names start with 'prefix', in lexicographic order,
+           starting after the name 'start_after'. The directories are
+           walked using os.scandir, and whole directories that sort
+           before 'start_after' are skipped without being read
+        """
+        if prefix is None:
+            prefix = ""
 
-        if prefix is not None:
-            root = "%s/%s" % (bucket, prefix)
+        # the directory to start the walk from, and the part of the
+        # prefix that must match the names in that directory
+        parts = prefix.split("/")
+        root = "/".join(parts[0:-1])
+        partial = parts[-1]
 
-        root_len = len(bucket) + 1
+        if len(root) > 0:
+            root = "%s/" % root
 
         if without_prefix:
             prefix_len = len(prefix)
 
-        subdir_names = _glob.glob("%s*" % root)
+        def _walk(dirname, key_root, match):
+            try:
+                entries = list(_os.scandir(dirname))
+            except OSError:
+                return
+
+            children = []
 
-        object_names = []
+            for entry in entries:
+                if entry.name.endswith("._data") and entry.is_file():
+                    # remove the ._data at the end
+                    children.append(("%s%s" % (key_root, entry.name[0:-6]),
+                                     False, entry.path))
+                elif entry.is_dir():
+                    # all keys in this directory start with name/
+                    children.append(("%s%s/" % (key_root, entry.name),
+                                     True, entry.path))
 
-        while True:
-            names = subdir_names
-            subdir_names = []
+            # sorting files by name and directories by name/ walks the
+            # keys in lexicographic order
+            children.sort()
 
-            for name in names:
-                if name.endswith("._data"):
-                    # remove the  ._data at the end
-                    name = name[root_len:-6]
-                    while name.endswith("/"):
-                        name = name[0:-1]
+            for (key, is_dir, path) in children:
+                if not key[len(key_root):].startswith(match):
+                    continue
 
-                    if without_prefix:
-                        name = name[prefix_len:]
-                        while name.startswith("/"):
-                            name = name[1:]
+                if start_after is not None and key <= start_after:
+                    if not (is_dir and start_after.startswith(key)):
+                        continue
 
-                    if len(name) > 0:
-                        object_names.append(name)
-                elif _os.path.isdir(name):
-                    subdir_names += _glob.glob("%s/*" % name)
+                if is_dir:
+                    yield from _walk(path, key, "")
+                    continue
 
-            if len(subdir_names) == 0:
-                break
+                name = key
 
-        return object_names
+                while name.endswith("/"):
+                    name = name[0:-1]
+
+                if start_after is not None and name <= start_after:
+                    continue
+
+                if without_prefix:
+                    name = name[prefix_len:]
+                    while name.startswith("/"):
+                        name = name[1:]
+
+                if len(name) > 0:
+                    yield name
+
+        yield from _walk("%s/%s" % (bucket, root), root, partial)
+
+    @staticmethod
+    def list_prefixes(bucket, prefix=None, delimiter="/"):
+        """Return the common prefixes and the immediate objects of the
+           keys in the passed bucket that start with 'prefix'. A common
+           prefix is the part of a key up to and including the first
+           'delimiter' after 'prefix'. For the default "/" delimiter
+           only the single directory holding 'prefix' is scanned
+        """
+        if prefix is None:
+            prefix = ""
+
+        if delimiter is None or len(delimiter) == 0:
+            return ([], Testing_ObjectStore.get_all_object_names(
+                                                bucket, prefix))
+
+        parts = prefix.split("/")
+        root = "/".join(parts[0:-1])
+
+        if len(root) > 0:
+            root = "%s/" % root
+
+        prefixes = set()
+        objects = []
+
+        def _scan(dirname, key_root):
+            try:
+                entries = list(_os.scandir(dirname))
+            except OSError:
+                return
+
+            for entry in entries:
+                if entry.name.endswith("._data") and entry.is_file():
+                    key = "%s%s" % (key_root, entry.name[0:-6])
+                    is_dir = False
+                elif entry.is_dir():
+                    key = "%s%s/" % (key_root, entry.name)
+                    is_dir = True
+                else:
+                    continue
+
+                if not key.startswith(prefix):
+                    continue
+
+                idx = key.find(delimiter, len(prefix))
+
+                if idx != -1:
+                    prefixes.add(key[0:idx+len(delimiter)])
+                elif is_dir:
+                    # the delimiter may be in the keys below this directory
+                    _scan(entry.path, key)
+                else:
+                    while key.endswith("/"):
+                        key = key[0:-1]
+
+                    if len(key) > 0:
+                        objects.append(key)
+
+        _scan("%s/%s" % (bucket, root), root)
+
+        return (sorted(prefixes), sorted(objects))
+
+    @staticmethod
+    def get_all_object_names(bucket, prefix=None, without_prefix=False):
+        """Returns the names of all objects in the passed bucket"""
+        return list(Testing_ObjectStore.iter_object_names(
+                                bucket=bucket, prefix=prefix,
+                                without_prefix=without_prefix))
 
     @staticmethod
     def set_object(bucket, key, data):
@@ -311,6 +540,72 @@ class Testing_ObjectStore:
                         FILE.write(data)
                     FILE.flush()
 
+            _new_etag(filename)
+
+    @staticmethod
+    def set_object_if_absent(bucket, key, data):
+        """Set the value of 'key' in 'bucket' to binary 'data' if (and
+           only if) there is no object at this key. The file is created
+           with O_EXCL so that only one writer can ever succeed.
+           This returns the etag of the new object
+        """
+        if data is None:
+            data = b""
+
+        filename = "%s/%s._data" % (bucket, key)
+
+        with _rlock:
+            _os.makedirs(_os.path.dirname(filename), exist_ok=True)
+
+            try:
+                fd = _os.open(filename,
+                              _os.O_WRONLY | _os.O_CREAT | _os.O_EXCL)
+            except FileExistsError:
+                from Acquire.ObjectStore import PreconditionFailedError
+                raise PreconditionFailedError(
+                    "There is already an object at key '%s'" % key)
+
+            with _os.fdopen(fd, "wb") as FILE:
+                FILE.write(data)
+                FILE.flush()
+
+            return _new_etag(filename)
+
+    @staticmethod
+    def set_object_if_match(bucket, key, data, etag):
+        """Set the value of 'key' in 'bucket' to binary 'data' if (and
+           only if) the etag of the current object at this key is
+           'etag'. The new data is written to a temporary file that
+           is then renamed over the old object. This returns the
+           etag of the new object
+        """
+        if data is None:
+            data = b""
+
+        filename = "%s/%s._data" % (bucket, key)
+
+        with _rlock:
+            try:
+                old_etag = _get_etag(filename)
+            except FileNotFoundError:
+                old_etag = None
+
+            if old_etag is None or old_etag != etag:
+                from Acquire.ObjectStore import PreconditionFailedError
+                raise PreconditionFailedError(
+                    "The object at key '%s' does not match etag '%s'" %
+                    (key, etag))
+
+            tmpname = "%s.%s._tmp" % (filename, _uuid.uuid4())
+
+            with open(tmpname, "wb") as FILE:
+                FILE.write(data)
+                FILE.flush()
+
+            _os.replace(tmpname, filename)
+
+            return _new_etag(filename)
+
     @staticmethod
     def delete_all_objects(bucket, prefix=None):
         """Deletes all objects..."""
@@ -321,16 +616,28 @@ class Testing_ObjectStore:
 
     @staticmethod
     def delete_object(bucket, key):
-        """Removes the object at 'key'"""
+        """Removes the object at 'key'. Removing an object that
+           doesn't exist is not an error
+        """
+        filename = "%s/%s._data" % (bucket, key)
+
         try:
-            _os.remove("%s/%s._data" % (bucket, key))
-        except:
+            _os.remove(filename)
+        except FileNotFoundError:
             pass
+        except Exception as e:
+            from Acquire.ObjectStore import ObjectStoreError
+            raise ObjectStoreError(
+                "Unable to delete the object at '%s': %s" % (key, str(e)))
+
+        _remove_etag(filename)
 
     @staticmethod
-    def get_size_and_checksum(bucket, key):
+    def get_size_and_checksum(bucket, key, calculate=True):
         """Return the object size (in bytes) and checksum of the
-           object in the passed bucket at the specified key
+           object in the passed bucket at the specified key. The
+           checksum of a local file is always calculated, whatever
+           the value of 'calculate'
         """
         filepath = "%s/%s._data" % (bucket, key)
 
@@ -6,6 +6,8 @@ the services used in the system. It is not likely to be user-facing
 """
 
 from ._function import *
+from ._http_pool import *
+from ._wire_format import *
 from ._get_session_info import *
 from ._get_services import *
 from ._get_service_account_bucket import *
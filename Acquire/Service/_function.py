@@ -2,9 +2,11 @@
 import json as _json
 from io import BytesIO as _BytesIO
 
-__all__ = ["call_function", "pack_arguments", "unpack_arguments",
-           "create_return_value", "pack_return_value", "unpack_return_value",
-           "exception_to_safe_exception", "exception_to_string"]
+__all__ = ["call_function", "acall_function", "call_batch_function",
+           "unpack_batch_results", "pack_arguments",
+           "unpack_arguments", "create_return_value", "pack_return_value",
+           "unpack_return_value", "exception_to_safe_exception",
+           "exception_to_string"]
 
 
 def _get_signing_certificate(fingerprint=None, private_cert=None):
@@ -94,14 +96,19 @@ def create_return_value(payload):
 
 def pack_return_value(function=None, payload=None, key=None,
                       response_key=None, public_cert=None,
-                      private_cert=None):
+                      private_cert=None, wire_format="json"):
     """Pack the passed result into a json string, optionally
        encrypting the result with the passed key, and optionally
        supplying a public response key, with which the function
        being called should encrypt the response. If public_cert is
        provided then we will ask the service to sign their response.
        Note that you can only ask the service to sign their response
-       if you provide a 'reponse_key' for them to encrypt it with too
+       if you provide a 'reponse_key' for them to encrypt it with too.
+       If 'wire_format' is "binary" then the result is packed into
+       the binary wire format, in which the encrypted data and any
+       bytes in the payload are sent as raw bytes rather than base64,
+       and the result is encrypted using a reusable session key
+       rather than a fresh RSA-wrapped key
     """
     try:
         sign_result = key["sign_with_service_key"]
@@ -114,6 +121,7 @@ def pack_return_value(function=None, payload=None, key=None,
     from Acquire.ObjectStore import bytes_to_string as _bytes_to_string
     from Acquire.ObjectStore import get_datetime_now_to_string \
         as _get_datetime_now_to_string
+    from ._wire_format import _wire_dumps
 
     result = {}
 
@@ -147,32 +155,38 @@ def pack_return_value(function=None, payload=None, key=None,
     else:
         response = {}
 
-        result_data = key.encrypt(_json.dumps(result).encode("utf-8"))
+        # peers that use the binary wire format can all decrypt
+        # session-key messages, so the session key is negotiated
+        # together with the wire format
+        result_data = key.encrypt(_wire_dumps(result, wire_format),
+                                  use_session_key=(wire_format == "binary"))
 
         if sign_result:
             # sign using the signing certificate for this service
             signature = _get_signing_certificate(
                             fingerprint=sign_result,
                             private_cert=private_cert).sign(result_data)
-            response["signature"] = _bytes_to_string(signature)
+            response["signature"] = signature
 
-        response["data"] = _bytes_to_string(result_data)
+        # bytes are base64-encoded by the json wire format
+        response["data"] = result_data
         response["encrypted"] = True
         response["fingerprint"] = key.fingerprint()
         response["synctime"] = now
         result = response
 
-    result = _json.dumps(result).encode("utf-8")
+    result = _wire_dumps(result, wire_format)
 
     return result
 
 
 def pack_arguments(function=None, args=None, key=None,
-                   response_key=None, public_cert=None):
+                   response_key=None, public_cert=None, wire_format="json"):
     """Pack the passed arguments, optionally encrypted using the passed key"""
     return pack_return_value(function=function, payload=args,
                              key=key, response_key=response_key,
-                             public_cert=public_cert)
+                             public_cert=public_cert,
+                             wire_format=wire_format)
 
 
 def exception_to_safe_exception(e):
@@ -216,7 +230,8 @@ def unpack_arguments(args, key=None, public_cert=None, is_return_value=False,
 
 
        Args:
-        args (str) : should be a JSON encoded UTF-8
+        args (str) : should be a JSON encoded UTF-8 string, or
+                     bytes packed using the binary wire format
     """
     if not (args and len(args) > 0):
         if is_return_value:
@@ -224,13 +239,15 @@ def unpack_arguments(args, key=None, public_cert=None, is_return_value=False,
         else:
             return (None, None, None)
 
-    # args should be a json-encoded utf-8 string
+    # args should be a json-encoded utf-8 string or binary wire message
+    from ._wire_format import _wire_loads
+
     try:
-        data = _json.loads(args)
+        data = _wire_loads(args)
     except Exception as e:
         from Acquire.Service import UnpackingError
         raise UnpackingError("Cannot decode json from '%s' : %s" %
-                             (data, str(e)))
+                             (args, str(e)))
 
     while not isinstance(data, dict):
         if not (data and len(data) > 0):
@@ -284,7 +301,7 @@ def unpack_arguments(args, key=None, public_cert=None, is_return_value=False,
             raise UnpackingError(
                 "Cannot unpack the result of %s on %s as it should be "
                 "signed, but it isn't! (only encrypted results are signed) "
-                "Response == %s" % (function, service, _json.dumps(data)))
+                "Response == %s" % (function, service, data))
 
         try:
             signature = _string_to_bytes(data["signature"])
@@ -358,12 +375,11 @@ class _UnicodeDecodeError(Exception):
     pass
 
 
-def _unpack_and_raise(function, service, exdata):
-    """This function unpacks the exception whose data is in 'exdata',
-       and raises it in the current thread. Additional information
-       is added to the error message to include the remote function
-       that was called (function) and the service on which it
-       was called.
+def _unpack_exception(function, service, exdata):
+    """This function unpacks and returns the exception whose data is
+       in 'exdata'. Additional information is added to the error
+       message to include the remote function that was called
+       (function) and the service on which it was called.
 
        The exdata should be a dictionary containing:
 
@@ -395,12 +411,19 @@ def _unpack_and_raise(function, service, exdata):
         from Acquire.Service import RemoteFunctionCallError
         from Acquire.Service import exception_to_string \
             as _exception_to_string
-        raise RemoteFunctionCallError(
+        ex = RemoteFunctionCallError(
             "An exception occurred while calling '%s' on '%s'\n\n"
             "CAUSE: %s\n\nEXDATA: %s" %
             (function, service, _exception_to_string(e), exdata))
 
-    raise ex
+    return ex
+
+
+def _unpack_and_raise(function, service, exdata):
+    """This function unpacks the exception whose data is in 'exdata',
+       and raises it in the current thread (see _unpack_exception)
+    """
+    raise _unpack_exception(function, service, exdata)
 
 
 def exception_to_string(e):
@@ -414,24 +437,85 @@ def exception_to_string(e):
     return "".join(lines)
 
 
-def call_function(service_url, function=None, args=None, args_key=None,
-                  response_key=None, public_cert=None):
-    """Call the remote function called 'function' at 'service_url' passing
-       in named function arguments in 'kwargs'. If 'args_key' is supplied,
-       then encrypt the arguments using 'args'. If 'response_key'
-       is supplied, then tell the remote server to encrypt the response
-       using the public version of 'response_key', so that we can
-       decrypt it in the response. If 'public_cert' is supplied then
-       we will ask the service to sign their response using their
-       service signing certificate, and we will validate the
-       signature using 'public_cert'
+def _pack_batch_calls(calls):
+    """Internal function that packs the list of (function, args)
+       'calls' into the arguments of the "batch" function
+    """
+    packed = []
+
+    for call in calls:
+        if isinstance(call, dict):
+            function = call.get("function", None)
+            args = call.get("args", None)
+        else:
+            (function, args) = call
+
+        if function == "batch":
+            from Acquire.Service import PackingError
+            raise PackingError("You cannot nest batch function calls")
+
+        if args is None:
+            args = {}
+
+        packed.append({"function": function, "args": args})
+
+    return {"calls": packed}
+
+
+def unpack_batch_results(results, service=None):
+    """Unpack the 'results' returned by calling the "batch" function
+       on 'service'. This returns a list with one entry per call,
+       in the order the calls were made. The entry is either the
+       return value of the call, or the exception that it raised
+       (which is returned, not raised)
+    """
+    try:
+        results = results["results"]
+    except:
+        from Acquire.Service import UnpackingError
+        raise UnpackingError(
+            "The batch call on %s did not return any results: %s" %
+            (service, results))
+
+    unpacked = []
+
+    for result in results:
+        function = result.get("function", None)
+        payload = result.get("result", {})
+
+        try:
+            status = payload["status"]
+        except:
+            status = None
+
+        if status == 0:
+            unpacked.append(payload.get("return", None))
+        elif "exception" in payload:
+            unpacked.append(_unpack_exception(function, service,
+                                              payload["exception"]))
+        else:
+            from Acquire.Service import RemoteFunctionCallError
+            unpacked.append(RemoteFunctionCallError(
+                "Calling %s on %s exited with status %s: %s" %
+                (function, service, status, payload)))
+
+    return unpacked
+
+
+def _prepare_call(service_url, function, args, args_key, response_key,
+                  public_cert, wire_format="json"):
+    """Internal function used by call_function and acall_function to
+       prepare the call of 'function' on 'service_url'. This returns
+       a tuple of (result, args_json, response_key). If the function
+       is on this service then it is called locally, and 'result' is
+       the (unpacked) return value. Otherwise 'args_json' holds the
+       arguments, packed using 'wire_format', that should be posted
+       to the service
     """
     if args is None:
         args = {}
 
     from Acquire.Service import is_running_service as _is_running_service
-    from Acquire.ObjectStore import get_datetime_now_to_string \
-        as _get_datetime_now_to_string
 
     service = None
 
@@ -446,7 +530,8 @@ def call_function(service_url, function=None, args=None, args_key=None,
             if service.canonical_url() == service_url:
                 result = service._call_local_function(function=function,
                                                       args=args)
-                return unpack_return_value(return_value=result)
+                return (unpack_return_value(return_value=result),
+                        None, None)
 
     response_key = _get_key(response_key)
 
@@ -454,26 +539,44 @@ def call_function(service_url, function=None, args=None, args_key=None,
         args_json = pack_arguments(function=function,
                                    args=args, key=args_key,
                                    response_key=response_key.public_key(),
-                                   public_cert=public_cert)
+                                   public_cert=public_cert,
+                                   wire_format=wire_format)
     else:
         args_json = pack_arguments(function=function,
-                                   args=args, key=args_key)
+                                   args=args, key=args_key,
+                                   wire_format=wire_format)
 
-    response = None
-    try:
-        from Acquire.Stubs import requests as _requests
-        response = _requests.post(service_url, data=args_json, timeout=60.0)
-    except Exception as e:
-        from Acquire.Service import RemoteFunctionCallError
-        raise RemoteFunctionCallError(
-            "Cannot call remote function '%s' at '%s' because of a possible "
-            "network issue: requests exeption = '%s'" %
-            (function, service_url, str(e)))
+    return (None, args_json, response_key)
+
+
+def _get_headers(wire_format):
+    """Internal function that returns the HTTP headers used to post
+       arguments packed in 'wire_format'
+    """
+    if wire_format == "binary":
+        return {"Content-Type": "application/octet-stream"}
+    else:
+        return {"Content-Type": "application/json"}
 
-    args = None
-    args_json = None
-    args_key = None
 
+def _is_wire_format_rejected(response, wire_format):
+    """Internal function that returns whether or not the service
+       did not understand the wire format of the request. Services
+       always reply using the wire format of the request, so a
+       service that replies in json to a binary request is one that
+       could not unpack the arguments (and so did not call the function)
+    """
+    from ._wire_format import is_binary_wire_format as _is_binary
+
+    return wire_format == "binary" and response.status_code == 200 and \
+        not _is_binary(response.content)
+
+
+def _unpack_response(response, service_url, function, response_key,
+                     public_cert):
+    """Internal function used by call_function and acall_function
+       to validate and unpack the response returned by the service
+    """
     if response.status_code != 200:
         from Acquire.Service import RemoteFunctionCallError
         raise RemoteFunctionCallError(
@@ -482,7 +585,11 @@ def call_function(service_url, function=None, args=None, args_key=None,
             (function, service_url,
              response.status_code, str(response.content)))
 
-    if response.encoding == "utf-8" or response.encoding is None:
+    from ._wire_format import is_binary_wire_format as _is_binary
+
+    if _is_binary(response.content):
+        result = response.content
+    elif response.encoding == "utf-8" or response.encoding is None:
         result = response.content.decode("utf-8")
     else:
         from Acquire.Service import RemoteFunctionCallError
@@ -495,3 +602,145 @@ def call_function(service_url, function=None, args=None, args_key=None,
     return unpack_return_value(return_value=result, key=response_key,
                                public_cert=public_cert,
                                function=function, service=service_url)
+
+
+def _call_function(service_url, function, args, args_key, response_key,
+                   public_cert):
+    """Internal generator that performs the steps of calling 'function'
+       on 'service_url' that are shared by call_function and
+       acall_function, leaving the HTTP post to the caller. This yields
+       the (data, headers) of each request that must be posted to the
+       service, and is sent back the response (or has the exception
+       raised by the post thrown into it). This returns the unpacked
+       return value of the function.
+
+       The arguments are sent using the binary wire format unless the
+       service does not support it, in which case the call is
+       repeated using json (see set_wire_format)
+    """
+    from ._wire_format import get_wire_format as _get_wire_format
+    from ._wire_format import set_wire_format as _set_wire_format
+
+    wire_format = _get_wire_format(service_url)
+
+    while True:
+        (result, args_json, response_key) = _prepare_call(
+                                                service_url=service_url,
+                                                function=function, args=args,
+                                                args_key=args_key,
+                                                response_key=response_key,
+                                                public_cert=public_cert,
+                                                wire_format=wire_format)
+
+        if args_json is None:
+            return result
+
+        response = None
+        try:
+            response = yield (args_json, _get_headers(wire_format))
+        except Exception as e:
+            from Acquire.Service import RemoteFunctionCallError
+            raise RemoteFunctionCallError(
+                "Cannot call remote function '%s' at '%s' because of a "
+                "possible network issue: requests exeption = '%s'" %
+                (function, service_url, str(e)))
+
+        if _is_wire_format_rejected(response, wire_format):
+            wire_format = "json"
+            _set_wire_format(wire_format, service_url)
+        else:
+            break
+
+    args = None
+    args_json = None
+    args_key = None
+
+    return _unpack_response(response=response, service_url=service_url,
+                            function=function, response_key=response_key,
+                            public_cert=public_cert)
+
+
+def call_function(service_url, function=None, args=None, args_key=None,
+                  response_key=None, public_cert=None):
+    """Call the remote function called 'function' at 'service_url' passing
+       in named function arguments in 'kwargs'. If 'args_key' is supplied,
+       then encrypt the arguments using 'args'. If 'response_key'
+       is supplied, then tell the remote server to encrypt the response
+       using the public version of 'response_key', so that we can
+       decrypt it in the response. If 'public_cert' is supplied then
+       we will ask the service to sign their response using their
+       service signing certificate, and we will validate the
+       signature using 'public_cert'.
+
+       The arguments are sent using the binary wire format unless the
+       service does not support it, in which case the call is
+       repeated using json (see set_wire_format)
+    """
+    from ._http_pool import http_post as _http_post
+
+    call = _call_function(service_url=service_url, function=function,
+                          args=args, args_key=args_key,
+                          response_key=response_key,
+                          public_cert=public_cert)
+
+    try:
+        (data, headers) = next(call)
+
+        while True:
+            try:
+                response = _http_post(service_url, data=data,
+                                      headers=headers, timeout=60.0)
+            except Exception as e:
+                (data, headers) = call.throw(e)
+            else:
+                (data, headers) = call.send(response)
+    except StopIteration as e:
+        return e.value
+
+
+async def acall_function(service_url, function=None, args=None,
+                         args_key=None, response_key=None, public_cert=None):
+    """Coroutine version of call_function. This sends the request
+       using a non-blocking HTTP client, so that a single event
+       loop can have many calls in flight at once. The number of
+       concurrent calls to each service is bounded (see
+       set_http_pool_options)
+    """
+    from ._http_pool import ahttp_post as _ahttp_post
+
+    call = _call_function(service_url=service_url, function=function,
+                          args=args, args_key=args_key,
+                          response_key=response_key,
+                          public_cert=public_cert)
+
+    try:
+        (data, headers) = next(call)
+
+        while True:
+            try:
+                response = await _ahttp_post(service_url, data=data,
+                                             headers=headers, timeout=60.0)
+            except Exception as e:
+                (data, headers) = call.throw(e)
+            else:
+                (data, headers) = call.send(response)
+    except StopIteration as e:
+        return e.value
+
+
+def call_batch_function(service_url, calls, args_key=None,
+                        response_key=None, public_cert=None):
+    """Call many functions on the service at 'service_url' in a single
+       request. 'calls' is a list of (function, args) pairs. The
+       calls are packed into a single "batch" call, so that the
+       arguments are encrypted (and the response signed) only once.
+       The calls are run in order on the service, and this returns
+       a list of the return value, or the exception raised, for
+       each call (see unpack_batch_results)
+    """
+    result = call_function(service_url=service_url, function="batch",
+                           args=_pack_batch_calls(calls),
+                           args_key=args_key, response_key=response_key,
+                           public_cert=public_cert)
+
+    return unpack_batch_results(result, service=service_url)
@@ -0,0 +1,412 @@
+import os as _os
+import threading as _threading
+import weakref as _weakref
+
+__all__ = ["http_get", "http_post", "http_put", "http_delete",
+           "ahttp_get", "ahttp_post", "ahttp_put",
+           "set_http_pool_options", "get_http_pool_options",
+           "get_http_pool_statistics", "clear_http_pool",
+           "aclose_http_pool"]
+
+_pool_lock = _threading.RLock()
+
+# one requests.Session per (scheme, host) for this process
+_sessions = {}
+
+# the PID of the process that created the sessions - sessions cannot
+# be shared across a fork, so they are thrown away if this changes
+_sessions_pid = None
+
+# count of the requests made through each session
+_request_counts = {}
+
+_pool_options = {"pool_size": 10,
+                 "max_retries": 3,
+                 "backoff_factor": 0.25,
+                 "retry_status": [502, 503, 504],
+                 "max_concurrency": 64}
+
+# the aiohttp session, per-host semaphores and number of requests in
+# flight for each event loop
+_async_state = _weakref.WeakKeyDictionary()
+
+# whether or not the warning that aiohttp is not installed has been given
+_warned_no_aiohttp = False
+
+
+def _get_host_key(url):
+    """Return the (scheme, host) key used to identify the pool
+       for the passed URL
+    """
+    from urllib.parse import urlsplit as _urlsplit
+    parts = _urlsplit(url)
+    return (parts.scheme.lower(), parts.netloc.lower())
+
+
+def _create_session(requests):
+    """Create a new requests.Session that is configured with a
+       keep-alive connection pool and retries with backoff
+    """
+    from requests.adapters import HTTPAdapter as _HTTPAdapter
+    from urllib3.util.retry import Retry as _Retry
+
+    max_retries = _pool_options["max_retries"]
+
+    # only retry failed connections for all methods (the request cannot
+    # have been received). Status and read retries are only made for
+    # idempotent methods (i.e. not POST), so that a function is never
+    # called twice
+    retry = _Retry(total=max_retries,
+                   connect=max_retries,
+                   read=max_retries,
+                   status=max_retries,
+                   backoff_factor=_pool_options["backoff_factor"],
+                   status_forcelist=_pool_options["retry_status"],
+                   raise_on_status=False)
+
+    adapter = _HTTPAdapter(pool_connections=1,
+                           pool_maxsize=_pool_options["pool_size"],
+                           max_retries=retry)
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    return session
+
+
+def _get_session(url):
+    """Return the pooled session that should be used to communicate
+       with the host in 'url'. This returns None if 'requests' has
+       been replaced by something that doesn't support sessions
+       (e.g. the mocked requests used in testing)
+    """
+    from Acquire.Stubs import requests as _requests
+
+    try:
+        _requests.Session
+    except Exception:
+        return None
+
+    global _sessions_pid
+
+    key = _get_host_key(url)
+
+    with _pool_lock:
+        pid = _os.getpid()
+
+        if _sessions_pid != pid:
+            _sessions.clear()
+            _request_counts.clear()
+            _sessions_pid = pid
+
+        try:
+            session = _sessions[key]
+        except KeyError:
+            session = _create_session(_requests)
+            _sessions[key] = session
+
+        _request_counts[key] = _request_counts.get(key, 0) + 1
+
+    return session
+
+
+def _request(method, url, **kwargs):
+    """Perform the HTTP request 'method' on 'url', using the pooled
+       session for the host if this is available
+    """
+    session = _get_session(url)
+
+    if session is None:
+        from Acquire.Stubs import requests as _requests
+        return getattr(_requests, method)(url, **kwargs)
+    else:
+        return getattr(session, method)(url, **kwargs)
+
+
+def http_get(url, **kwargs):
+    """GET 'url' using the per-host keep-alive connection pool"""
+    return _request("get", url, **kwargs)
+
+
+def http_post(url, data=None, **kwargs):
+    """POST 'data' to 'url' using the per-host keep-alive
+       connection pool
+    """
+    return _request("post", url, data=data, **kwargs)
+
+
+def http_put(url, data=None, **kwargs):
+    """PUT 'data' to 'url' using the per-host keep-alive
+       connection pool
+    """
+    return _request("put", url, data=data, **kwargs)
+
+
+def http_delete(url, **kwargs):
+    """DELETE 'url' using the per-host keep-alive connection pool"""
+    return _request("delete", url, **kwargs)
+
+
+class _AsyncResponse:
+    """The parts of a response to an asynchronous request that are
+       needed by the callers of ahttp_get, ahttp_post and ahttp_put
+       (matching the attributes of a requests.Response)
+    """
+    def __init__(self, status_code, content, encoding):
+        self.status_code = status_code
+        self.content = content
+        self.encoding = encoding
+
+
+def _get_async_state():
+    """Return the aiohttp session and semaphores for the running
+       event loop
+    """
+    import asyncio as _asyncio
+    loop = _asyncio.get_event_loop()
+
+    with _pool_lock:
+        try:
+            return _async_state[loop]
+        except KeyError:
+            state = {"session": None, "semaphores": {}, "in_flight": 0}
+            _async_state[loop] = state
+            return state
+
+
+def _get_async_session(state):
+    """Return the aiohttp session that should be used for asynchronous
+       requests in this event loop. This returns None if aiohttp
+       is not installed (see the "async" extra of the package), or
+       if 'requests' has been replaced (e.g. by the mocked requests
+       used in testing), in which case the synchronous pooled
+       requests are run in an executor
+    """
+    from Acquire.Stubs import requests as _requests
+
+    try:
+        _requests.Session
+    except Exception:
+        return None
+
+    try:
+        import aiohttp as _aiohttp
+    except ImportError:
+        global _warned_no_aiohttp
+
+        if not _warned_no_aiohttp:
+            _warned_no_aiohttp = True
+            import warnings as _warnings
+            _warnings.warn(
+                "aiohttp is not installed, so asynchronous requests are "
+                "made using blocking requests in a thread pool. Install "
+                "acquire[async] to make non-blocking requests")
+
+        return None
+
+    session = state["session"]
+
+    if session is None or session.closed:
+        connector = _aiohttp.TCPConnector(
+                        limit=0,
+                        limit_per_host=_pool_options["max_concurrency"])
+        session = _aiohttp.ClientSession(connector=connector)
+        state["session"] = session
+
+    return session
+
+
+async def _arequest(method, url, data=None, headers=None, timeout=None):
+    """Coroutine that performs the HTTP request 'method' on 'url'. No
+       more than 'max_concurrency' requests to the same host are
+       in flight at any one time from this event loop. The requests
+       that are in flight at the same time share an aiohttp session
+       (and so its connections), which is closed once the last of
+       them has completed, so that no session is left open when
+       the event loop is closed
+    """
+    state = _get_async_state()
+    state["in_flight"] += 1
+
+    try:
+        return await _arequest_in_flight(state, method, url, data=data,
+                                         headers=headers, timeout=timeout)
+    finally:
+        state["in_flight"] -= 1
+
+        if state["in_flight"] == 0:
+            session = state["session"]
+            state["session"] = None
+
+            if session is not None:
+                await session.close()
+
+
+async def _arequest_in_flight(state, method, url, data=None, headers=None,
+                              timeout=None):
+    """Coroutine that performs the request for _arequest, using the
+       session and semaphores in 'state'
+    """
+    import asyncio as _asyncio
+
+    key = _get_host_key(url)
+
+    try:
+        semaphore = state["semaphores"][key]
+    except KeyError:
+        semaphore = _asyncio.Semaphore(_pool_options["max_concurrency"])
+        state["semaphores"][key] = semaphore
+
+    async with semaphore:
+        session = _get_async_session(state)
+
+        if session is None:
+            import functools as _functools
+            loop = _asyncio.get_event_loop()
+            return await loop.run_in_executor(
+                        None, _functools.partial(_request, method, url,
+                                                 data=data, headers=headers,
+                                                 timeout=timeout))
+
+        import aiohttp as _aiohttp
+
+        if timeout is not None:
+            timeout = _aiohttp.ClientTimeout(total=timeout)
+
+        async with session.request(method.upper(), url, data=data,
+                                   headers=headers,
+                                   timeout=timeout) as response:
+            content = await response.read()
+            return _AsyncResponse(status_code=response.status,
+                                  content=content,
+                                  encoding=response.charset)
+
+
+async def ahttp_get(url, headers=None, timeout=None):
+    """Coroutine version of http_get"""
+    return await _arequest("get", url, headers=headers, timeout=timeout)
+
+
+async def ahttp_post(url, data=None, headers=None, timeout=None):
+    """Coroutine version of http_post"""
+    return await _arequest("post", url, data=data, headers=headers,
+                           timeout=timeout)
+
+
+async def ahttp_put(url, data=None, headers=None, timeout=None):
+    """Coroutine version of http_put"""
+    return await _arequest("put", url, data=data, headers=headers,
+                           timeout=timeout)
+
+
+async def aclose_http_pool():
+    """Close the asynchronous connection pool of the running event
+       loop. The pool is closed automatically once there are no
+       requests in flight, so this only needs to be called to
+       close the connections of requests that are still running
+    """
+    state = _get_async_state()
+    session = state["session"]
+    state["session"] = None
+
+    if session is not None:
+        await session.close()
+
+
+def set_http_pool_options(pool_size=None, max_retries=None,
+                          backoff_factor=None, retry_status=None,
+                          max_concurrency=None):
+    """Set the options used to create the per-host connection pools.
+       'pool_size' is the maximum number of keep-alive connections
+       held open to each host, 'max_retries' the number of times
+       a failed connection is retried, with a delay between retries
+       of backoff_factor * (2 ** (retry - 1)) seconds. 'retry_status'
+       is the list of HTTP status codes that trigger a retry
+       of an idempotent request. 'max_concurrency' is the maximum
+       number of asynchronous requests to the same host that can
+       be in flight at once from an event loop. Any existing pools
+       are closed so that the new options take effect
+    """
+    with _pool_lock:
+        if max_concurrency is not None:
+            max_concurrency = int(max_concurrency)
+            if max_concurrency < 1:
+                raise ValueError("The maximum concurrency must be at least 1")
+            _pool_options["max_concurrency"] = max_concurrency
+            # new semaphores are created on the next asynchronous call
+            for state in _async_state.values():
+                state["semaphores"] = {}
+
+        if pool_size is not None:
+            pool_size = int(pool_size)
+            if pool_size < 1:
+                raise ValueError("The pool size must be at least 1")
+            _pool_options["pool_size"] = pool_size
+
+        if max_retries is not None:
+            max_retries = int(max_retries)
+            if max_retries < 0:
+                raise ValueError("The number of retries cannot be negative")
+            _pool_options["max_retries"] = max_retries
+
+        if backoff_factor is not None:
+            _pool_options["backoff_factor"] = float(backoff_factor)
+
+        if retry_status is not None:
+            _pool_options["retry_status"] = [int(x) for x in retry_status]
+
+        clear_http_pool()
+
+
+def get_http_pool_options():
+    """Return a copy of the options used to create the connection pools"""
+    import copy as _copy
+    with _pool_lock:
+        return _copy.deepcopy(_pool_options)
+
+
+def get_http_pool_statistics():
+    """Return a dictionary of statistics for the connection pool to
+       each host, indexed by "scheme://host". Each entry holds the
+       number of "requests" made, the number of "new_connections"
+       that had to be opened, and the number of requests that were
+       able to reuse a kept-alive connection ("reused_connections")
+    """
+    stats = {}
+
+    with _pool_lock:
+        for key, session in _sessions.items():
+            num_requests = _request_counts.get(key, 0)
+            num_connections = 0
+
+            # http and https are mounted on the same adapter
+            adapters = {id(a): a for a in session.adapters.values()}
+
+            for adapter in adapters.values():
+                try:
+                    pools = adapter.poolmanager.pools
+                    for pool_key in pools.keys():
+                        num_connections += pools[pool_key].num_connections
+                except Exception:
+                    pass
+
+            stats["%s://%s" % key] = {
+                "requests": num_requests,
+                "new_connections": num_connections,
+                "reused_connections": max(0, num_requests - num_connections)}
+
+    return stats
+
+
+def clear_http_pool():
+    """Close all of the pooled connections and clear the statistics"""
+    with _pool_lock:
+        for session in _sessions.values():
+            try:
+                session.close()
+            except Exception:
+                pass
+
+        _sessions.clear()
+        _request_counts.clear()
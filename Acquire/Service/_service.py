@@ -875,6 +875,73 @@ class Service:
                               public_cert=self.public_certificate(),
                               response_key=_get_private_key("function"))
 
+    def call_batch_function(self, calls):
+        """Call many functions on this service in a single request.
+           'calls' is a list of (function, args) pairs. This returns
+           a list of the return value, or the exception raised,
+           for each call, in the order the calls were made
+        """
+        from ._function import unpack_batch_results as _unpack_batch_results
+        from ._function import _pack_batch_calls
+
+        result = self.call_function(function="batch",
+                                    args=_pack_batch_calls(calls))
+
+        return _unpack_batch_results(result, service=self.service_url())
+
+    async def acall_function(self, function, args=None):
+        """Coroutine version of call_function. This calls the function
+           'func' on this service using the non-blocking
+           Acquire.Service.acall_function
+        """
+        if self.is_null():
+            from Acquire.Service import RemoteFunctionCallError
+            raise RemoteFunctionCallError(
+                "You cannot call the function '%s' on a null service!" %
+                function)
+
+        import asyncio as _asyncio
+        from Acquire.Crypto import get_private_key as _get_private_key
+        from ._function import acall_function as _acall_function
+
+        loop = _asyncio.get_event_loop()
+
+        if self.should_refresh_keys():
+            # refreshing the keys is a blocking call to the service,
+            # so is run in the default executor
+            await loop.run_in_executor(None, self.refresh_keys)
+
+        from Acquire.Service import ServiceAccountMissingKeyError
+
+        try:
+            return await _acall_function(
+                                service_url=self.service_url(),
+                                function=function,
+                                args=args,
+                                args_key=self.public_key(),
+                                public_cert=self.public_certificate(),
+                                response_key=_get_private_key("function"))
+
+        except ServiceAccountMissingKeyError:
+            # the service's keys have changed - fetch new keys from
+            # the registry and try again
+            pass
+
+        from Acquire.Service import refetch_trusted_service \
+            as _refetch_trusted_service
+        service = await loop.run_in_executor(None, _refetch_trusted_service,
+                                             self)
+
+        from copy import copy as _copy
+        self.__dict__ = _copy(service.__dict__)
+
+        return await _acall_function(service_url=self.service_url(),
+                                     function=function,
+                                     args=args,
+                                     args_key=self.public_key(),
+                                     public_cert=self.public_certificate(),
+                                     response_key=_get_private_key("function"))
+
     def sign(self, message):
         """Sign the specified message"""
         if self.is_null():
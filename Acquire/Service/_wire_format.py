@@ -0,0 +1,198 @@
+
+import json as _json
+import struct as _struct
+import threading as _threading
+
+__all__ = ["set_wire_format", "get_wire_format", "is_binary_wire_format"]
+
+# The binary wire format is a framed message of
+#
+#   MAGIC | tag (8 bytes) | header length (4 bytes) | JSON header |
+#       [blob length (8 bytes) | blob] * number of blobs
+#
+# Every bytes value in the message is moved out of the JSON header
+# into a raw blob, so that ciphertext, signatures and file chunks are
+# sent without base64 encoding. The first byte of MAGIC is not valid
+# UTF-8, so it can never be confused with a JSON message.
+# Each blob is referenced in the header by {_BLOB_KEY: "tag:index"},
+# where the tag is random for each message. A dict in the data that
+# happens to look like a reference is therefore never mistaken for one
+_MAGIC = b"\xffAQ2"
+
+_BLOB_KEY = "_acquire_blob"
+
+_TAG_SIZE = 8
+
+_wire_formats_lock = _threading.Lock()
+
+# the wire format to use for each service URL. Services not in this
+# dictionary are called using the default wire format
+_wire_formats = {}
+
+_default_wire_format = "binary"
+
+
+def _validate_wire_format(wire_format):
+    """Return the validated name of the passed wire format"""
+    if wire_format is None:
+        return "json"
+
+    wire_format = str(wire_format).lower()
+
+    if wire_format not in ["json", "binary"]:
+        from Acquire.Service import PackingError
+        raise PackingError("Unrecognised wire format '%s'. Supported "
+                           "formats are 'json' and 'binary'" % wire_format)
+
+    return wire_format
+
+
+def set_wire_format(wire_format, service_url=None):
+    """Set the wire format ("binary" or "json") used to send function
+       calls to the service at 'service_url'. If 'service_url' is None
+       then this sets the default wire format for all services.
+       Services that don't understand the binary format are detected
+       automatically, and switched to "json"
+    """
+    global _default_wire_format
+
+    wire_format = _validate_wire_format(wire_format)
+
+    with _wire_formats_lock:
+        if service_url is None:
+            _default_wire_format = wire_format
+            _wire_formats.clear()
+        else:
+            _wire_formats[service_url] = wire_format
+
+
+def get_wire_format(service_url=None):
+    """Return the wire format that will be used to send function calls
+       to the service at 'service_url'
+    """
+    with _wire_formats_lock:
+        if service_url is not None:
+            try:
+                return _wire_formats[service_url]
+            except KeyError:
+                pass
+
+        return _default_wire_format
+
+
+def is_binary_wire_format(data):
+    """Return whether or not the passed message data has been
+       packed using the binary wire format
+    """
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return bytes(data[0:len(_MAGIC)]) == _MAGIC
+    else:
+        return False
+
+
+def _wire_dumps(obj, wire_format="json"):
+    """Internal function that serialises 'obj' into the passed
+       wire format, returning the utf-8 bytes. Any bytes values
+       are base64-encoded in the "json" format, and are sent as
+       raw blobs in the "binary" format
+    """
+    wire_format = _validate_wire_format(wire_format)
+
+    if wire_format == "json":
+        def _default(value):
+            if isinstance(value, (bytes, bytearray)):
+                from Acquire.ObjectStore import bytes_to_string \
+                    as _bytes_to_string
+                return _bytes_to_string(bytes(value))
+
+            raise TypeError("Object of type %s is not JSON serializable" %
+                            value.__class__.__name__)
+
+        return _json.dumps(obj, default=_default).encode("utf-8")
+
+    import os as _os
+
+    tag = _os.urandom(_TAG_SIZE)
+    prefix = "%s:" % tag.hex()
+    blobs = []
+
+    def _default(value):
+        if isinstance(value, (bytes, bytearray)):
+            blobs.append(bytes(value))
+            return {_BLOB_KEY: "%s%d" % (prefix, len(blobs) - 1)}
+
+        raise TypeError("Object of type %s is not JSON serializable" %
+                        value.__class__.__name__)
+
+    header = _json.dumps(obj, default=_default).encode("utf-8")
+
+    parts = [_MAGIC, tag, _struct.pack(">I", len(header)), header]
+
+    for blob in blobs:
+        parts.append(_struct.pack(">Q", len(blob)))
+        parts.append(blob)
+
+    return b"".join(parts)
+
+
+def _wire_loads(data):
+    """Internal function that deserialises the passed data, which
+       may be in either the "json" or "binary" wire format
+    """
+    if not is_binary_wire_format(data):
+        return _json.loads(data)
+
+    data = memoryview(data)
+
+    try:
+        start = len(_MAGIC)
+        tag = bytes(data[start:start+_TAG_SIZE])
+
+        if len(tag) != _TAG_SIZE:
+            raise ValueError("The tag is truncated")
+
+        start += _TAG_SIZE
+        (header_size,) = _struct.unpack(">I", data[start:start+4])
+        start += 4
+        header = bytes(data[start:start+header_size])
+
+        if len(header) != header_size:
+            raise ValueError("The header is truncated")
+
+        start += header_size
+
+        blobs = []
+
+        while start < len(data):
+            (blob_size,) = _struct.unpack(">Q", data[start:start+8])
+            start += 8
+            blob = bytes(data[start:start+blob_size])
+
+            if len(blob) != blob_size:
+                raise ValueError("Blob %d is truncated" % len(blobs))
+
+            blobs.append(blob)
+            start += blob_size
+    except Exception as e:
+        from Acquire.Service import UnpackingError
+        raise UnpackingError(
+            "Cannot decode the binary wire format message: %s" % str(e))
+
+    prefix = "%s:" % tag.hex()
+
+    def _object_hook(d):
+        if len(d) == 1 and _BLOB_KEY in d:
+            ref = d[_BLOB_KEY]
+
+            if isinstance(ref, str) and ref.startswith(prefix):
+                try:
+                    return blobs[int(ref[len(prefix):])]
+                except Exception:
+                    from Acquire.Service import UnpackingError
+                    raise UnpackingError(
+                        "Invalid blob reference '%s' in the binary wire "
+                        "format message" % ref)
+
+        return d
+
+    return _json.loads(header.decode("utf-8"), object_hook=_object_hook)
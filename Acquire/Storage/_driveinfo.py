@@ -8,6 +8,9 @@ _fileinfo_root = "storage/file"
 _uploader_root = "storage/uploader"
 _downloader_root = "storage/downloader"
 
+# the maximum number of bytes of a file returned by a single read_range
+_max_read_range = 8 * 1024 * 1024
+
 
 def _validate_file_upload(par, file_bucket, file_key, objsize, checksum):
     """Call this function to signify that the file associated with
@@ -335,10 +338,14 @@ class DriveInfo:
         except:
             pass
 
-    def upload_chunk(self, file_uid, chunk_index, secret, chunk, checksum):
+    def upload_chunk(self, file_uid, chunk_index, secret, chunk, checksum,
+                     compression="bz2", uncompressed_size=None):
         """Upload a chunk of the file with UID 'file_uid'. This is the
            chunk at index 'chunk_idx', which is set equal to 'chunk'
-           (validated with 'checksum'). The passed secret is used to
+           (validated with 'checksum'), and which has been compressed
+           using the codec 'compression' from 'uncompressed_size' bytes
+           (this is recorded so that ranges of the file can be mapped
+           onto chunks). The passed secret is used to
            authenticate this upload. The secret should be the
            multi_md5 has of the shared secret with the concatenated
            drive_uid, file_uid and chunk_index
@@ -372,9 +379,20 @@ class DriveInfo:
                 "Invalid checksum for chunk: %s versus %s" %
                 (check, checksum))
 
+        # the service only records the codec - it doesn't need to
+        # have the codec's module installed
+        from Acquire.Client import get_codec as _get_codec
+        compression = _get_codec(compression).name
+
         meta = {"filesize": len(chunk),
                 "checksum": checksum,
-                "compression": "bz2"}
+                "compression": compression}
+
+        if compression == "none":
+            uncompressed_size = len(chunk)
+
+        if uncompressed_size is not None:
+            meta["uncompressed_size"] = int(uncompressed_size)
 
         file_key = data["filekey"]
         chunk_index = int(chunk_index)
@@ -659,6 +677,87 @@ class DriveInfo:
         # return the filemeta, and either the filedata, ospar or downloader
         return (filemeta, filedata, ospar, downloader)
 
+    def read_range(self, filename, offset, length, authorisation=None,
+                   version=None, par=None, identifiers=None):
+        """Read up to 'length' bytes of the file called 'filename',
+           starting from byte 'offset' of the uncompressed file. The
+           range is capped at _max_read_range bytes. This returns
+           a tuple of (filemeta, data, chunks). For uncompressed files,
+           'data' holds the bytes that were read. For chunked files,
+           'chunks' is a list of (chunk_index, chunk_offset, meta,
+           chunk) for the (still compressed) chunks that overlap the
+           range, so that the client can decompress them and slice
+           out the range. Both are None if the range cannot be mapped
+           onto the stored file (the file is compressed as a single
+           object, or is a chunked file uploaded by an older client),
+           in which case the whole file must be downloaded
+        """
+        from Acquire.Storage import FileInfo as _FileInfo
+        from Acquire.ObjectStore import ObjectStore as _ObjectStore
+
+        offset = int(offset)
+        length = int(length)
+
+        if offset < 0 or length < 0:
+            raise ValueError("The offset and length of the range to "
+                             "read must be 0 or greater")
+
+        (drive_acl, identifiers) = self._resolve_acl(
+                    authorisation=authorisation,
+                    resource="read_range %s %s" % (self._drive_uid, filename),
+                    par=par, identifiers=identifiers)
+
+        fileinfo = _FileInfo.load(drive=self,
+                                  filename=filename,
+                                  version=version,
+                                  identifiers=identifiers,
+                                  upstream=drive_acl)
+
+        filemeta = fileinfo.get_filemeta()
+        file_acl = filemeta.acl()
+
+        if not file_acl.is_readable():
+            raise PermissionError(
+                "You do not have read permissions for the file. Your file "
+                "permissions are %s" % str(file_acl))
+
+        length = min(length, _max_read_range)
+        file_key = fileinfo.version()._file_key()
+        file_bucket = self._get_file_bucket(file_key)
+
+        if fileinfo.version().is_chunked():
+            offsets = fileinfo.version().chunk_offsets(file_bucket)
+
+            if offsets is None:
+                return (filemeta, None, None)
+
+            import bisect as _bisect
+
+            end = min(offset + length, offsets[-1])
+            chunks = []
+
+            # the chunk containing 'offset', then every chunk up
+            # to the one containing the end of the range
+            i = _bisect.bisect_right(offsets, offset) - 1
+
+            while 0 <= i < len(offsets) - 1 and offsets[i] < end:
+                meta = _ObjectStore.get_object_from_json(
+                                file_bucket, "%s/meta/%d" % (file_key, i))
+                chunk = _ObjectStore.get_object(
+                                file_bucket, "%s/data/%d" % (file_key, i))
+                chunks.append((i, offsets[i], meta, chunk))
+                i += 1
+
+            return (filemeta, None, chunks)
+
+        elif fileinfo.version().is_compressed():
+            return (filemeta, None, None)
+
+        else:
+            data = _ObjectStore.get_object_range(file_bucket, file_key,
+                                                 offset, length)
+            return (filemeta, data, None)
+
     def is_opened_by_owner(self):
         """Return whether or not this drive was opened and authorised
            by one of the drive owners
@@ -803,10 +902,17 @@ class DriveInfo:
             # return to the user
             from Acquire.Storage import FileInfo as _FileInfo
 
+            # read the metadata of all of the files concurrently
+            datas = _ObjectStore.get_objects_from_json(metadata_bucket,
+                                                       names)
+
             for name in names:
                 try:
-                    data = _ObjectStore.get_object_from_json(metadata_bucket,
-                                                             name)
+                    data = datas[name]
+
+                    if isinstance(data, Exception):
+                        raise data
+
                     fileinfo = _FileInfo.from_data(data,
                                                    identifiers=identifiers,
                                                    upstream=drive_acl)
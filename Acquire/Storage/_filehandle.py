@@ -2,60 +2,6 @@
 __all__ = ["FileHandle"]
 
 
-_magic_dict = {
-    b"\x1f\x8b\x08": "gz",
-    b"\x42\x5a\x68": "bz2",
-    b"\x50\x4b\x03\x04": "zip"
-    }
-
-
-_max_magic_len = max(len(x) for x in _magic_dict)
-
-
-def _should_compress(filename, filesize):
-    """Return whether or not the passed file is worth compressing.
-       It is not worth compressing very small files (<128 bytes) or
-       already-compressed files
-
-       Args:
-            filename (str): Filename
-            filesize (int): Size of file in bytes
-       Returns:
-            bool: True if file should be compressed, else
-            False
-    """
-    if filesize < 128:
-        return False
-
-    with open(filename, "rb") as FILE:
-        file_start = FILE.read(_max_magic_len)
-
-    for magic in _magic_dict.keys():
-        if file_start.startswith(magic):
-            return False
-
-    return True
-
-
-def _bz2compress(inputfile, outputfile=None):
-    """Compress 'inputfile', writing the output to 'outputfile'
-       If 'outputfile' is None, then this will create a new filename
-       in the current directory for the file. This returns
-       the filename for the compressed file
-
-       Args:
-            inputfile (str): File to compress
-            outputfile (str, default=None): Name for compressed
-            file
-       Returns:
-            str: Filename of compressed file
-
-    """
-    from Acquire.Client import compress as _compress
-    return _compress(inputfile=inputfile, outputfile=outputfile,
-                     compression_type="bz2")
-
-
 class FileHandle:
     """This class holds all of the information about a file that is
        held in a Drive, including its size
@@ -70,13 +16,20 @@ class FileHandle:
             aclrules (str, default=None): ACL rules for handle
             drive_uid (str, default=None): UID for drive
             compress (bool, default=True): Should files be compressed
+            compression_type (str, default=None): Codec used to compress
+            the file (see Acquire.Client.list_codecs). If None then the
+            default set via Acquire.Client.set_default_compression is used
+            (or a cheaper codec if the file is only marginally
+            compressible - see Acquire.Client.choose_compression)
+            compression_level (int, default=None): Compression level
             local_cutoff (int, default=None): Size of file to be held
             locally by the handle (bytes)
 
     """
     def __init__(self, filename=None, remote_filename=None,
                  aclrules=None, drive_uid=None,
-                 compress=True, local_cutoff=None):
+                 compress=True, local_cutoff=None,
+                 compression_type=None, compression_level=None):
         """Construct a handle for the local file 'filename'. This will
            create the initial version of the file that can be uploaded
            to the storage service. If the file is less than
@@ -86,6 +39,8 @@ class FileHandle:
         self._local_filename = None
         self._local_filedata = None
         self._compression = None
+        self._compression_decision = None
+        self._compression_ratio = None
         self._compressed_filename = None
         self._drive_uid = drive_uid
         self._aclrules = None
@@ -109,33 +64,86 @@ class FileHandle:
 
             (filesize, cksum) = _get_filesize_and_checksum(filename=filename)
 
-            if compress and _should_compress(filename=filename,
-                                             filesize=filesize):
-                import bz2 as _bz2
+            from Acquire.Client import choose_compression \
+                as _choose_compression
+            from Acquire.Client import get_default_compression \
+                as _get_default_compression
+
+            if compress:
+                # sample the file to decide whether or not (and how)
+                # it is worth compressing
+                decision = _choose_compression(
+                                        filename=filename,
+                                        filesize=filesize,
+                                        compression_type=compression_type,
+                                        level=compression_level)
+            else:
+                decision = {"compression_type": "none",
+                            "decision": "disabled",
+                            "estimated_ratio": None}
+
+            self._compression_decision = decision["decision"]
+            self._compression_ratio = decision["estimated_ratio"]
+
+            if decision["compression_type"] != "none":
+                from Acquire.Client import compress as _compress
+                compression_type = decision["compression_type"]
+                compression_level = decision["level"]
+                threads = _get_default_compression()["threads"]
+                original_size = filesize
+
                 if filesize < local_cutoff:
                     # this is not big, so better to compress in memory
                     from Acquire.Access import get_size_and_checksum \
                         as _get_size_and_checksum
-                    data = open(filename, "rb").read()
-                    data = _bz2.compress(data)
-                    (filesize, cksum) = _get_size_and_checksum(data=data)
-                    self._local_filedata = data
-                    self._compression = "bz2"
+                    with open(filename, "rb") as FILE:
+                        original = FILE.read()
+
+                    data = _compress(inputdata=original,
+                                     compression_type=compression_type,
+                                     level=compression_level,
+                                     threads=threads)
+
+                    if len(data) < original_size:
+                        (filesize, cksum) = _get_size_and_checksum(data=data)
+                        self._local_filedata = data
+                        self._compression = compression_type
+                    else:
+                        # the sample was misleading - send uncompressed
+                        self._local_filedata = original
                 else:
-                    # this is a bigger file, so compress on disk
+                    # this is a bigger file, so compress on disk, one
+                    # block at a time. The compressed file is then
+                    # streamed (and encrypted) by the OSPar writer, so
+                    # the whole file is never held in memory
                     try:
-                        self._compressed_filename = _bz2compress(
-                                                        inputfile=filename)
+                        self._compressed_filename = _compress(
+                                        inputfile=filename,
+                                        compression_type=compression_type,
+                                        level=compression_level,
+                                        threads=threads)
                     except:
                         pass
 
                     if self._compressed_filename is not None:
-                        self._compression = "bz2"
-                        (filesize, cksum) = _get_filesize_and_checksum(
+                        if _os.path.getsize(self._compressed_filename) \
+                                < original_size:
+                            self._compression = compression_type
+                            (filesize, cksum) = _get_filesize_and_checksum(
                                             filename=self._compressed_filename)
+                        else:
+                            # the sample was misleading - send uncompressed
+                            _os.unlink(self._compressed_filename)
+                            self._compressed_filename = None
+
+                if self._compression is None:
+                    self._compression_decision = "incompressible"
+                else:
+                    self._compression_ratio = filesize / original_size
             elif filesize < local_cutoff:
                 # this is small enough to hold in memory
-                self._local_filedata = open(filename, "rb").read()
+                with open(filename, "rb") as FILE:
+                    self._local_filedata = FILE.read()
 
             if self._compressed_filename is None:
                 self._local_filename = filename
@@ -193,6 +201,27 @@ class FileHandle:
         """
         return self._compression
 
+    def compression_decision(self):
+        """Return the decision made about whether or not to compress
+           the file (see Acquire.Client.choose_compression), e.g.
+           "compressed", "already_compressed" or "incompressible"
+
+           Returns:
+                str: Compression decision
+        """
+        return self._compression_decision
+
+    def compression_ratio(self):
+        """Return the measured compression ratio (compressed size
+           divided by original size) of the file, or the ratio
+           estimated from sampling the file if it was not
+           compressed. This is None if the ratio was not measured
+
+           Returns:
+                float: Compression ratio
+        """
+        return self._compression_ratio
+
     def is_localdata(self):
         """Return whether or not this file is so small that the data
            is held in memory
@@ -218,8 +247,9 @@ class FileHandle:
         """
         if decompress and self.is_compressed():
             if self._local_filedata is not None:
-                import bz2 as _bz2
-                return _bz2.decompress(self._local_filedata)
+                from Acquire.Client import uncompress as _uncompress
+                return _uncompress(inputdata=self._local_filedata,
+                                   compression_type=self._compression)
             else:
                 return None
         else:
@@ -327,6 +357,12 @@ class FileHandle:
             if self._compression is not None:
                 data["compression"] = self._compression
 
+            if self._compression_decision is not None:
+                data["compression_decision"] = self._compression_decision
+
+            if self._compression_ratio is not None:
+                data["compression_ratio"] = self._compression_ratio
+
         return data
 
     @staticmethod
@@ -355,6 +391,12 @@ class FileHandle:
             if "compression" in data:
                 f._compression = data["compression"]
 
+            if "compression_decision" in data:
+                f._compression_decision = data["compression_decision"]
+
+            if "compression_ratio" in data:
+                f._compression_ratio = float(data["compression_ratio"])
+
             if "aclrules" in data:
                 from Acquire.Storage import ACLRules as _ACLRules
                 f._aclrules = _ACLRules.from_data(data["aclrules"])
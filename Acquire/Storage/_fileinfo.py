@@ -12,7 +12,8 @@ class VersionInfo:
     """This class holds specific info about a version of a file"""
     def __init__(self, filesize=None, checksum=None,
                  aclrules=None, is_chunked=False, compression=None,
-                 identifiers=None):
+                 identifiers=None, compression_decision=None,
+                 compression_ratio=None):
         """Construct the version of the file that has the passed
            size and checksum, was uploaded by the specified user,
            and that has the specified aclrules, and whether or not
@@ -48,6 +49,8 @@ class VersionInfo:
             self._nchunks = 0
             self._checksum = None
             self._compression = None
+            self._compression_decision = None
+            self._compression_ratio = None
             self._datetime = _get_datetime_now()
             self._file_uid = "%s/%s" % (_datetime_to_string(self._datetime),
                                         _create_uid(short_uid=True))
@@ -86,6 +89,8 @@ class VersionInfo:
                                         _create_uid(short_uid=True))
             self._user_guid = str(user_guid)
             self._compression = compression
+            self._compression_decision = compression_decision
+            self._compression_ratio = compression_ratio
             self._aclrules = aclrules
             self._nchunks = None
 
@@ -151,6 +156,12 @@ class VersionInfo:
         from Acquire.Crypto import Hash as _Hash
         from hashlib import md5 as _md5
         md5 = _md5()
+        compressions = set()
+
+        # the offset of the start of each chunk in the uncompressed
+        # file, used to map ranges of the file onto chunks. This can
+        # only be built if every chunk recorded its uncompressed size
+        offsets = [0]
 
         for i in range(0, nchunks):
             key = meta_keys[i]
@@ -159,11 +170,53 @@ class VersionInfo:
 
             size += meta["filesize"]
             md5.update(meta["checksum"].encode("utf-8"))
+            compressions.add(meta.get("compression", "bz2"))
+
+            if offsets is not None:
+                if "uncompressed_size" in meta:
+                    offsets.append(offsets[-1] + meta["uncompressed_size"])
+                else:
+                    offsets = None
 
         self._filesize = size
         self._checksum = md5.hexdigest()
         self._nchunks = nchunks
 
+        if offsets is not None:
+            _ObjectStore.set_object_from_json(
+                            bucket=file_bucket,
+                            key="%s/index" % self._file_key(),
+                            data={"offsets": offsets})
+
+        # record the codec if all chunks used the same one. Otherwise
+        # the codec recorded in each chunk's metadata must be used
+        if len(compressions) == 1:
+            compression = compressions.pop()
+
+            if compression != "none":
+                self._compression = compression
+
+    def chunk_offsets(self, file_bucket):
+        """Return the offsets in the uncompressed file of the start of
+           each chunk of this chunked file, plus the size of the
+           uncompressed file as the last entry. This returns None if
+           the file is not chunked, is still being uploaded, or was
+           uploaded by a client that did not record the size of
+           each chunk
+        """
+        if not self.is_chunked() or self.is_uploading():
+            return None
+
+        from Acquire.ObjectStore import ObjectStore as _ObjectStore
+
+        try:
+            index = _ObjectStore.get_object_from_json(
+                                bucket=file_bucket,
+                                key="%s/index" % self._file_key())
+            return index["offsets"]
+        except:
+            return None
+
     def num_chunks(self):
         """Return the number of chunks used for this file. This is
            equal to 1 for unchunked files, or for files that
@@ -210,6 +263,25 @@ class VersionInfo:
         else:
             return self._compression
 
+    def compression_decision(self):
+        """Return the decision made about whether or not to compress
+           this version of the file, or None if this is not known
+        """
+        if self.is_null():
+            return None
+        else:
+            return self._compression_decision
+
+    def compression_ratio(self):
+        """Return the measured (or, if not compressed, estimated)
+           compression ratio of this version of the file, or None
+           if this is not known
+        """
+        if self.is_null():
+            return None
+        else:
+            return self._compression_ratio
+
     def datetime(self):
         """Return the datetime when this version was created"""
         if self.is_null():
@@ -268,6 +340,12 @@ class VersionInfo:
             if self._compression is not None:
                 data["compression"] = self._compression
 
+            if self._compression_decision is not None:
+                data["compression_decision"] = self._compression_decision
+
+            if self._compression_ratio is not None:
+                data["compression_ratio"] = self._compression_ratio
+
         return data
 
     @staticmethod
@@ -300,6 +378,9 @@ class VersionInfo:
             else:
                 v._compression = None
 
+            v._compression_decision = data.get("compression_decision", None)
+            v._compression_ratio = data.get("compression_ratio", None)
+
             if "nchunks" in data:
                 v._nchunks = int(data["nchunks"])
             else:
@@ -397,6 +478,10 @@ class FileInfo:
                                   checksum=filehandle.checksum(),
                                   identifiers=identifiers,
                                   compression=filehandle.compression_type(),
+                                  compression_decision=(
+                                      filehandle.compression_decision()),
+                                  compression_ratio=(
+                                      filehandle.compression_ratio()),
                                   aclrules=filehandle.aclrules())
 
             self._latest_version = version
@@ -424,6 +509,9 @@ class FileInfo:
                              uploaded_by=version.uploaded_by(),
                              uploaded_when=version.datetime(),
                              compression=version.compression_type(),
+                             compression_decision=(
+                                 version.compression_decision()),
+                             compression_ratio=version.compression_ratio(),
                              aclrules=version.aclrules())
 
         filemeta.resolve_acl(identifiers=identifiers,
@@ -8,7 +8,8 @@ class FileMeta:
     """
     def __init__(self, filename=None, uid=None, filesize=None,
                  checksum=None, uploaded_by=None, uploaded_when=None,
-                 compression=None, aclrules=None):
+                 compression=None, aclrules=None,
+                 compression_decision=None, compression_ratio=None):
         """Construct, specifying the filename, and then optionally
            other useful data
         """
@@ -19,6 +20,8 @@ class FileMeta:
         self._user_guid = uploaded_by
         self._datetime = uploaded_when
         self._compression = compression
+        self._compression_decision = compression_decision
+        self._compression_ratio = compression_ratio
         self._acl = None
         self._aclrules = None
         self._creds = None
@@ -63,6 +66,8 @@ class FileMeta:
         self._user_guid = None
         self._datetime = None
         self._compression = None
+        self._compression_decision = None
+        self._compression_ratio = None
         self._aclrules = None
         self._creds = None
         self._drive_metadata = None
@@ -209,6 +214,27 @@ class FileMeta:
         else:
             return self._compression
 
+    def compression_decision(self):
+        """If known, return the decision made about whether or not
+           to compress this file, e.g. "compressed", "cheap_codec",
+           "too_small", "already_compressed" or "incompressible"
+        """
+        if self.is_null():
+            return None
+        else:
+            return self._compression_decision
+
+    def compression_ratio(self):
+        """If known, return the compression ratio (compressed size
+           divided by original size) of this file. If the file was
+           not compressed then this is the ratio estimated when
+           deciding not to compress it
+        """
+        if self.is_null():
+            return None
+        else:
+            return self._compression_ratio
+
     def uploaded_by(self):
         """If known, return the GUID of the user who uploaded
            this version of the file
@@ -327,6 +353,12 @@ class FileMeta:
         if self._compression is not None:
             data["compression"] = self._compression
 
+        if self._compression_decision is not None:
+            data["compression_decision"] = self._compression_decision
+
+        if self._compression_ratio is not None:
+            data["compression_ratio"] = self._compression_ratio
+
         try:
             acl = self._acl
         except:
@@ -380,6 +412,12 @@ class FileMeta:
             if "compression" in data:
                 f._compression = data["compression"]
 
+            if "compression_decision" in data:
+                f._compression_decision = data["compression_decision"]
+
+            if "compression_ratio" in data:
+                f._compression_ratio = float(data["compression_ratio"])
+
             if "acl" in data:
                 from Acquire.Client import ACLRule as _ACLRule
                 f._acl = _ACLRule.from_data(data["acl"])
@@ -1,6 +1,6 @@
 
 from Acquire.ObjectStore import string_to_decimal, string_to_datetime, \
-    list_to_string, ObjectStore, Mutex, datetime_to_string
+    list_to_string, ObjectStore, LeaseMutex, datetime_to_string
 
 from Acquire.Service import get_service_account_bucket
 
@@ -158,7 +158,7 @@ def run(args):
     credit_notes = list_to_string(credit_notes)
 
     receipt_key = "accounting/cashed_cheque/%s" % info["uid"]
-    mutex = Mutex(receipt_key, bucket=bucket)
+    mutex = LeaseMutex(receipt_key, bucket=bucket)
 
     try:
         receipted = ObjectStore.get_object_from_json(bucket, receipt_key)
@@ -0,0 +1,47 @@
+
+from Acquire.Service import get_this_service, get_service_account_bucket
+
+from Acquire.Accounting import Account
+
+from Acquire.Identity import Authorisation
+
+from Acquire.ObjectStore import string_to_datetime
+
+
+def run(args):
+    """This function is called to fill in all of the missing daily
+       and monthly balance snapshots of every account, so that
+       historical balances can be found in a few reads. This should
+       be called periodically (e.g. daily) by an admin of the
+       accounting service
+
+       Args:
+            args (dict): contains the admin authorisation, and
+            (optionally) the time up to which to write snapshots
+
+        Returns:
+            dict: contains the number of snapshots that were written
+    """
+    try:
+        authorisation = Authorisation.from_data(args["authorisation"])
+    except:
+        raise PermissionError(
+            "Only an authorised admin can compact the account balances")
+
+    service = get_this_service(need_private_access=True)
+    service.assert_admin_authorised(
+            authorisation, "compact_balances %s" % service.uid())
+
+    try:
+        until = string_to_datetime(args["until"])
+    except:
+        until = None
+
+    bucket = get_service_account_bucket()
+
+    num_snapshots = Account.compact_all_balances(until=until, bucket=bucket)
+
+    return_value = {}
+    return_value["num_snapshots"] = num_snapshots
+
+    return return_value
@@ -0,0 +1,119 @@
+
+from Acquire.Service import get_service_account_bucket
+
+from Acquire.Accounting import Accounts
+
+from Acquire.Identity import Authorisation
+
+from Acquire.ObjectStore import string_to_datetime
+
+# the maximum number of transactions returned by a single call
+_max_page_size = 1000
+
+
+class StatementError(Exception):
+    pass
+
+
+def run(args):
+    """This function is called to return one page of the statement
+       of the transactions recorded in an account between two times.
+       The next page is requested by passing back the returned
+       'start_after' key
+
+       Args:
+            args (dict): data for statement query
+
+        Returns:
+            dict: contains the keys of the transactions in this page
+                and, if there may be more transactions, the key
+                after which to start the next page
+    """
+
+    try:
+        account_name = str(args["account_name"])
+    except:
+        account_name = None
+
+    try:
+        account_uid = str(args["account_uid"])
+    except:
+        account_uid = None
+
+    try:
+        authorisation = Authorisation.from_data(args["authorisation"])
+    except:
+        authorisation = None
+
+    if account_name is None:
+        raise StatementError("You must supply the account_name")
+
+    if authorisation is None:
+        raise StatementError("You must supply a valid authorisation")
+
+    try:
+        start_datetime = string_to_datetime(args["start_datetime"])
+    except:
+        start_datetime = None
+
+    try:
+        end_datetime = string_to_datetime(args["end_datetime"])
+    except:
+        end_datetime = None
+
+    try:
+        codes = [str(code) for code in args["codes"]]
+    except:
+        codes = None
+
+    try:
+        start_after = str(args["start_after"])
+    except:
+        start_after = None
+
+    try:
+        page_size = min(int(args["page_size"]), _max_page_size)
+    except:
+        page_size = _max_page_size
+
+    if page_size < 1:
+        raise StatementError("The page_size must be at least 1")
+
+    # load the account
+    bucket = get_service_account_bucket()
+    accounts = Accounts(user_guid=authorisation.user_guid())
+    account = accounts.get_account(account_name, bucket=bucket)
+
+    # make sure that this is the account that was asked for, and not
+    # another account that has since been given the same name
+    if account_uid is not None and account_uid != account.uid():
+        raise StatementError(
+            "The UID of account '%s' (%s) does not match the requested "
+            "UID (%s)" % (account_name, account.uid(), account_uid))
+
+    # validate the authorisation for this account
+    authorisation.verify(resource="get_statement %s" % account.uid())
+
+    transactions = account.iter_transactions(start_datetime=start_datetime,
+                                             end_datetime=end_datetime,
+                                             codes=codes,
+                                             page_size=page_size,
+                                             start_after=start_after,
+                                             bucket=bucket)
+
+    keys = []
+
+    for transaction in transactions:
+        keys.append(transaction.to_key())
+
+        if len(keys) == page_size:
+            break
+
+    return_value = {}
+
+    return_value["transactions"] = keys
+
+    if len(keys) == page_size:
+        return_value["start_after"] = keys[-1]
+
+    return return_value
@@ -15,6 +15,9 @@ def accounting_functions(function, args):
     if function == "cash_cheque":
         from accounting.cash_cheque import run as _cash_cheque
         return _cash_cheque(args)
+    elif function == "compact_balances":
+        from accounting.compact_balances import run as _compact_balances
+        return _compact_balances(args)
     elif function == "create_account":
         from accounting.create_account import run as _create_account
         return _create_account(args)
@@ -27,6 +30,9 @@ def accounting_functions(function, args):
     elif function == "get_info":
         from accounting.get_info import run as _get_info
         return _get_info(args)
+    elif function == "get_statement":
+        from accounting.get_statement import run as _get_statement
+        return _get_statement(args)
     elif function == "perform":
         from accounting.perform import run as _perform
         return _perform(args)
@@ -53,6 +53,8 @@ def _route_function(function, args, additional_functions=None):
     if function is None:
         from admin.root import run as _root
         return _root(args)
+    elif function in ["batch", "admin/batch"]:
+        return _route_batch(args, additional_functions)
     elif function == "admin/dump_keys":
         from admin.dump_keys import run as _dump_keys
         return _dump_keys(args)
@@ -109,6 +111,60 @@ def _route_function(function, args, additional_functions=None):
         return _route_function("admin/%s" % function, args)
 
 
+def _route_batch(args, additional_functions=None):
+    """Internal function that routes each of the calls in a batch
+       to the actual code to run. The calls are run in order, and
+       an exception raised by one call does not stop the others.
+       This returns a dictionary containing the list of return
+       values (or exceptions) of all of the calls
+
+       Args:
+        args (dict): contains "calls", the list of {"function", "args"}
+        to run
+        additional_functions (function, optional): another function used to
+        process the function and arguments
+
+        Returns:
+            dict : containing the "results" of the calls
+    """
+    from Acquire.Service import create_return_value
+
+    try:
+        calls = args["calls"]
+    except:
+        calls = None
+
+    if not isinstance(calls, list):
+        raise TypeError("A batch call must be passed a list of 'calls'")
+
+    results = []
+
+    for call in calls:
+        try:
+            function = call["function"]
+        except:
+            function = None
+
+        try:
+            if function in ["batch", "admin/batch"]:
+                raise LookupError("You cannot nest batch function calls")
+
+            try:
+                call_args = call["args"]
+            except:
+                call_args = {}
+
+            result = _route_function(function, call_args,
+                                     additional_functions)
+        except Exception as e:
+            result = e
+
+        results.append({"function": function,
+                        "result": create_return_value(payload=result)})
+
+    return {"results": results}
+
+
 def _handle(function=None, additional_functions=None, args={}):
     """This function routes calls to sub-functions, thereby allowing
        a single identity function to stay hot for longer. If you want
@@ -163,10 +219,19 @@ def _base_handler(additional_functions=None, ctx=None, data=None, loop=None):
     from Acquire.Service import push_is_running_service, \
         pop_is_running_service, unpack_arguments, \
         get_service_private_key, pack_return_value, \
-        create_return_value
+        create_return_value, is_binary_wire_format
 
     push_is_running_service()
 
+    if hasattr(data, "read"):
+        data = data.read()
+
+    # reply using the same wire format as the request
+    if is_binary_wire_format(data):
+        wire_format = "binary"
+    else:
+        wire_format = "json"
+
     result = None
 
     try:
@@ -189,9 +254,11 @@ def _base_handler(additional_functions=None, ctx=None, data=None, loop=None):
     result = create_return_value(payload=result)
 
     try:
-        result = pack_return_value(payload=result, key=keys)
+        result = pack_return_value(payload=result, key=keys,
+                                   wire_format=wire_format)
     except Exception as e:
-        result = pack_return_value(payload=create_return_value(e))
+        result = pack_return_value(payload=create_return_value(e),
+                                   wire_format=wire_format)
 
     pop_is_running_service()
     return result
@@ -86,8 +86,7 @@ def run(args):
         return_value["filemeta"] = filemeta.to_data()
 
     if filedata is not None:
-        from Acquire.ObjectStore import bytes_to_string as _bytes_to_string
-        return_value["filedata"] = _bytes_to_string(filedata)
+        return_value["filedata"] = filedata
 
     if par is not None:
         return_value["download_par"] = par.to_data()
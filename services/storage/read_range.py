@@ -0,0 +1,73 @@
+
+from Acquire.Identity import Authorisation
+
+from Acquire.Storage import DriveInfo, PARRegistry
+
+
+def run(args):
+    """Read a range of bytes from a file. This returns the bytes
+       directly for uncompressed files, or the compressed chunks that
+       overlap the range for chunked files. Neither is returned if
+       the range cannot be mapped onto the stored file, in which case
+       the whole file must be downloaded
+    """
+
+    drive_uid = args["drive_uid"]
+    filename = args["filename"]
+    offset = int(args["offset"])
+    length = int(args["length"])
+
+    try:
+        authorisation = Authorisation.from_data(args["authorisation"])
+    except:
+        authorisation = None
+
+    try:
+        par_uid = args["par_uid"]
+    except:
+        par_uid = None
+
+    try:
+        secret = args["secret"]
+    except:
+        secret = None
+
+    if "version" in args:
+        version = str(args["version"])
+    else:
+        version = None
+
+    if par_uid is not None:
+        registry = PARRegistry()
+        (par, identifiers) = registry.load(par_uid=par_uid, secret=secret)
+    else:
+        par = None
+        identifiers = None
+
+    drive = DriveInfo(drive_uid=drive_uid)
+
+    (filemeta, data, chunks) = drive.read_range(filename=filename,
+                                                offset=offset,
+                                                length=length,
+                                                authorisation=authorisation,
+                                                version=version,
+                                                par=par,
+                                                identifiers=identifiers)
+
+    return_value = {}
+
+    return_value["filemeta"] = filemeta.to_data()
+
+    if data is not None:
+        # sent as raw bytes by the binary wire format, and as
+        # a base64 string by the json wire format
+        return_value["data"] = data
+
+    if chunks is not None:
+        return_value["chunks"] = [{"index": index,
+                                   "offset": offset,
+                                   "meta": meta,
+                                   "chunk": chunk}
+                                  for (index, offset, meta, chunk) in chunks]
+
+    return return_value
@@ -37,6 +37,9 @@ def storage_functions(function, args):
     elif function == "open_uploader":
         from storage.open_uploader import run as _open_uploader
         return _open_uploader(args)
+    elif function == "read_range":
+        from storage.read_range import run as _read_range
+        return _read_range(args)
     elif function == "resolve_par":
         from storage.resolve_par import run as _resolve_par
         return _resolve_par(args)
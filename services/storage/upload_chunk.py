@@ -13,9 +13,23 @@ def run(args):
     data = string_to_bytes(args["data"])
     checksum = str(args["checksum"])
 
+    try:
+        # older clients always compressed chunks using bz2
+        compression = str(args["compression"])
+    except:
+        compression = "bz2"
+
+    try:
+        # older clients do not send the size of the uncompressed chunk
+        uncompressed_size = int(args["uncompressed_size"])
+    except:
+        uncompressed_size = None
+
     drive = DriveInfo(drive_uid=drive_uid)
 
     drive.upload_chunk(file_uid=file_uid, chunk_index=chunk_idx,
-                       secret=secret, chunk=data, checksum=checksum)
+                       secret=secret, chunk=data, checksum=checksum,
+                       compression=compression,
+                       uncompressed_size=uncompressed_size)
 
     return True
@@ -51,5 +51,9 @@ setuptools.setup(
         "pyyaml>=3.0",
         "requests>=2.10",
         "qrcode[pil]>=5.0"
-    ]
+    ],
+    extras_require={
+        # non-blocking HTTP requests for the asynchronous client calls
+        "async": ["aiohttp>=3.0"]
+    }
 )
@@ -345,3 +345,377 @@ def test_pending_transactions(random_transaction):
     assert(starting_balance2.balance() + value == ending_balance2.balance())
     assert(starting_balance2.liability() == ending_balance2.liability())
     assert(starting_balance1.receivable() == ending_balance1.receivable())
+
+
+def test_running_balance(account1, account2, bucket):
+    from Acquire.ObjectStore import ObjectStore
+
+    transaction = Transaction(create_decimal(10), "running balance")
+
+    authorisation = Authorisation(resource=transaction.fingerprint(),
+                                  testing_key=testing_key,
+                                  testing_user_guid=account1.group_name())
+
+    Ledger.perform(transaction=transaction, debit_account=account1,
+                   credit_account=account2, authorisation=authorisation,
+                   bucket=bucket)
+
+    balance = account1.balance()
+
+    # the running balance agrees with the transactions
+    assert(account1.verify_balance())
+    assert(account2.verify_balance())
+    assert(account1.balance(now=get_datetime_now()) == balance)
+
+    # break the running balance, and then repair it
+    key = account1._running_balance_key()
+    ObjectStore.set_object_from_json(
+                    bucket, key, {"balance": Balance().to_data(),
+                                  "version": 1})
+
+    assert(account1.balance() == Balance())
+    assert(not account1.verify_balance())
+    assert(account1.balance() == Balance())
+    assert(not account1.verify_balance(repair=True))
+    assert(account1.verify_balance())
+    assert(account1.balance() == balance)
+
+    # a missing running balance is recreated from the transactions
+    ObjectStore.delete_object(bucket, key)
+    assert(account1.balance() == balance)
+    assert(account1.verify_balance())
+
+
+def test_running_balance_pending(account1, bucket, monkeypatch):
+    import Acquire.Accounting._account as _account
+    from Acquire.Accounting import AccountError, TransactionInfo
+    from Acquire.ObjectStore import ObjectStore
+
+    balance = account1.balance()
+
+    item_keys = [key for key in ObjectStore.get_all_object_names(
+                            bucket, "%s/" % account1._transactions_key())
+                 if TransactionInfo.from_key(key).is_debit()]
+    rescinds = account1._get_rescinded_line_items(item_keys[0:2])
+    (written, lost) = list(rescinds.keys())
+
+    # simulate a writer that crashed after writing one line item, and
+    # another that crashed before writing its line item
+    account1._begin_line_items([written, lost], bucket=bucket)
+    ObjectStore.set_object_from_json(bucket, written,
+                                     rescinds[written].to_data())
+
+    # items that are still pending are not yet in the balance
+    assert(account1.balance() == balance)
+    assert(account1.verify_balance())
+
+    # stale pending items are reconciled from what was written
+    monkeypatch.setattr(_account, "_pending_timeout", -1)
+
+    reconciled = account1.balance()
+    assert(reconciled != balance)
+    assert(reconciled == account1._sum_all_transactions(bucket=bucket))
+    assert(account1._load_running_balance(bucket)[0]["pending"] == {})
+    assert(account1.verify_balance())
+
+    # a writer must not write an item once it could be reconciled
+    with pytest.raises(AccountError):
+        account1._record_line_item(lost, rescinds[lost], bucket=bucket)
+
+    assert(not ObjectStore.get_all_object_names(bucket, lost))
+    assert(account1.balance() == reconciled)
+    assert(account1._load_running_balance(bucket)[0]["pending"] == {})
+    assert(account1.verify_balance())
+
+
+
+def test_running_balance_contended(account1, account2, bucket,
+                                   monkeypatch):
+    import Acquire.Accounting._account as _account
+    from Acquire.Accounting import AccountError, TransactionInfo
+    from Acquire.ObjectStore import ObjectStore, PreconditionFailedError
+
+    transaction = Transaction(create_decimal(1), "contended balance")
+
+    authorisation = Authorisation(resource=transaction.fingerprint(),
+                                  testing_key=testing_key,
+                                  testing_user_guid=account1.group_name())
+
+    records = Ledger.perform(transaction=transaction, debit_account=account1,
+                             credit_account=account2,
+                             authorisation=authorisation, bucket=bucket)
+
+    debit_uid = records[0].debit_note().uid()
+    item_key = [key for key in ObjectStore.get_all_object_names(
+                            bucket, "%s/" % account1._transactions_key())
+                if TransactionInfo.from_key(key).is_debit() and
+                TransactionInfo.from_key(key).uid() in debit_uid][0]
+    (item_key, line_item) = list(
+        account1._get_rescinded_line_items([item_key]).items())[0]
+
+    balance = account1.balance()
+
+    set_object_if_match = ObjectStore.set_object_if_match
+    attempts = []
+
+    def _contended(bucket, key, data, etag):
+        attempts.append(key)
+        raise PreconditionFailedError("someone else got there first")
+
+    monkeypatch.setattr(_account, "_max_balance_attempts", 3)
+    monkeypatch.setattr(_account, "_min_backoff", 0.001)
+    monkeypatch.setattr(_account, "_max_backoff", 0.001)
+    monkeypatch.setattr(ObjectStore, "set_object_if_match", _contended)
+
+    # the writer gives up before writing anything
+    with pytest.raises(AccountError):
+        account1._record_line_item(item_key, line_item, bucket=bucket)
+
+    assert(len(attempts) == 3)
+    assert(not ObjectStore.get_all_object_names(bucket, item_key))
+
+    # a writer that gives up after writing leaves the item pending...
+    monkeypatch.setattr(ObjectStore, "set_object_if_match",
+                        set_object_if_match)
+    current = account1._begin_line_items([item_key], bucket=bucket)
+    ObjectStore.set_object_from_json(bucket, item_key, line_item.to_data())
+
+    monkeypatch.setattr(ObjectStore, "set_object_if_match", _contended)
+
+    with pytest.raises(AccountError):
+        account1._apply_line_items([item_key], current=current,
+                                   bucket=bucket)
+
+    monkeypatch.setattr(ObjectStore, "set_object_if_match",
+                        set_object_if_match)
+
+    pending = account1._load_running_balance(bucket)[0]["pending"]
+    assert(list(pending.keys()) == [item_key])
+    assert(account1.balance() == balance)
+
+    # ...which is then reconciled by a reader
+    monkeypatch.setattr(_account, "_pending_timeout", -1)
+    assert(account1.balance() != balance)
+    assert(account1._load_running_balance(bucket)[0]["pending"] == {})
+    assert(account1.verify_balance())
+
+def test_perform_batch(account1, account2, bucket, monkeypatch):
+    from Acquire.Accounting import InsufficientFundsError
+
+    push_is_running_service()
+    try:
+        accounts = Accounts(user_guid=account1_user)
+        account3 = Account(name="Batch Account",
+                           description="Account for batch transactions",
+                           group_name=accounts.name(), bucket=bucket)
+    finally:
+        pop_is_running_service()
+
+    def _transfer(debit_account, credit_account, value):
+        transaction = Transaction(value, "batch transaction")
+        auth = Authorisation(resource=transaction.fingerprint(),
+                             testing_key=testing_key,
+                             testing_user_guid=debit_account.group_name())
+        return (debit_account, credit_account, transaction, auth)
+
+    start1 = account1.balance()
+    start2 = account2.balance()
+
+    transfers = [_transfer(account1, account2, create_decimal(i + 1))
+                 for i in range(0, 20)]
+    transfers += [_transfer(account2, account3, create_decimal(0.5))
+                  for i in range(0, 10)]
+    transfers.append(_transfer(account1, account3, create_decimal(0)))
+
+    records = Ledger.perform_batch(transfers, bucket=bucket)
+
+    assert(len(records) == 30)
+
+    for (record, transfer) in zip(records, transfers):
+        assert(record.debit_account_uid() == transfer[0].uid())
+        assert(record.credit_account_uid() == transfer[1].uid())
+        assert(record.transaction() == transfer[2])
+        assert(Ledger.load_transaction(record.uid(), bucket) == record)
+
+    assert(len(set(record.uid() for record in records)) == 30)
+
+    assert(account1.balance() == start1 + create_decimal(-210))
+    assert(account2.balance() == start2 + create_decimal(205))
+    assert(account3.balance() == Balance(balance=5))
+
+    for account in [account1, account2, account3]:
+        assert(account.verify_balance())
+
+    # provisional transfers are recorded as liabilities and receivables
+    transfers = [_transfer(account2, account3, create_decimal(1))
+                 for i in range(0, 3)]
+
+    records = Ledger.perform_batch(transfers, is_provisional=True,
+                                   bucket=bucket)
+
+    assert(len(records) == 3)
+    assert(all(record.is_provisional() for record in records))
+    assert(len(set(record.debit_note().receipt_by()
+                   for record in records)) == 1)
+    assert(account3.balance() == Balance(balance=5, receivable=3))
+    assert(account3.verify_balance())
+
+    # account3 cannot cover this debit, so the whole batch fails
+    start1 = account1.balance()
+    start2 = account2.balance()
+
+    transfers = [_transfer(account1, account2, create_decimal(1)),
+                 _transfer(account3, account2, create_decimal(10))]
+
+    with pytest.raises(InsufficientFundsError):
+        Ledger.perform_batch(transfers, bucket=bucket)
+
+    # a failure to credit rescinds all of the debits
+    def _failing_batch_credit(self, *args, **kwargs):
+        raise IOError("Cannot credit the account")
+
+    monkeypatch.setattr(Account, "_batch_credit", _failing_batch_credit)
+
+    transfers = [_transfer(account1, account2, create_decimal(1)),
+                 _transfer(account3, account1, create_decimal(2))]
+
+    with pytest.raises(IOError):
+        Ledger.perform_batch(transfers, bucket=bucket)
+
+    assert(account1.balance() == start1)
+    assert(account2.balance() == start2)
+    assert(account3.balance() == Balance(balance=5, receivable=3))
+
+    for account in [account1, account2, account3]:
+        assert(account.verify_balance())
+
+
+def test_iter_transactions(account1, bucket):
+    from Acquire.Accounting import TransactionCode
+
+    push_is_running_service()
+    try:
+        accounts = Accounts(user_guid=account1_user)
+        account = Account(name="Statement Account",
+                          description="Account for statements",
+                          group_name=accounts.name(), bucket=bucket)
+    finally:
+        pop_is_running_service()
+
+    def _perform(debit_account, credit_account, value):
+        transaction = Transaction(value, "statement transaction")
+        auth = Authorisation(resource=transaction.fingerprint(),
+                             testing_key=testing_key,
+                             testing_user_guid=debit_account.group_name())
+        Ledger.perform(transaction=transaction, debit_account=debit_account,
+                       credit_account=credit_account, authorisation=auth,
+                       bucket=bucket)
+
+    for i in range(0, 5):
+        _perform(account1, account, create_decimal(i + 1))
+
+    middle = get_datetime_now()
+
+    for i in range(0, 3):
+        _perform(account, account1, create_decimal(0.5))
+
+    statement = list(account.iter_transactions(bucket=bucket))
+
+    assert(len(statement) == 8)
+    assert(statement == sorted(statement, key=lambda t: t.datetime()))
+    assert([t.is_credit() for t in statement] == [True] * 5 + [False] * 3)
+
+    # the balance agrees with the statement
+    total = Balance()
+    for transaction in statement:
+        total = total + transaction
+
+    assert(total == account.balance())
+
+    # page through the listing and resume after a transaction
+    assert(list(account.iter_transactions(page_size=2,
+                                          bucket=bucket)) == statement)
+
+    resumed = list(account.iter_transactions(
+                            start_after=statement[3].to_key(), bucket=bucket))
+    assert(resumed == statement[4:])
+
+    # filter by time and by transaction code
+    assert(list(account.iter_transactions(start_datetime=middle,
+                                          bucket=bucket)) == statement[5:])
+    assert(list(account.iter_transactions(end_datetime=middle,
+                                          bucket=bucket)) == statement[0:5])
+
+    debits = list(account.iter_transactions(codes=[TransactionCode.DEBIT],
+                                            bucket=bucket))
+    assert(debits == statement[5:])
+    assert(list(account.iter_transactions(codes=["CR"],
+                                          bucket=bucket)) == statement[0:5])
+
+    # a transaction at a whole second is listed before the transactions
+    # later in the same second, even though its key sorts after theirs
+    from Acquire.Accounting import LineItem, TransactionInfo
+    from Acquire.ObjectStore import datetime_to_string
+
+    second = datetime.datetime(2001, 1, 1, 0, 0, 1,
+                               tzinfo=datetime.timezone.utc)
+    times = [second, second + datetime.timedelta(microseconds=300000),
+             second + datetime.timedelta(seconds=1)]
+
+    for (i, t) in enumerate(times):
+        uid = "%s/%08d" % (datetime_to_string(t), i)
+        item_key = "%s/%s/%s" % (
+                        account._transactions_key(), uid,
+                        TransactionInfo.encode(TransactionCode.CREDIT,
+                                               create_decimal(1)))
+        account._record_line_item(item_key,
+                                  LineItem(uid=uid, authorisation=None),
+                                  bucket=bucket)
+
+    early = list(account.iter_transactions(end_datetime=times[-1],
+                                           bucket=bucket))
+    assert([t.datetime() for t in early] == times)
+    assert(list(account.iter_transactions(end_datetime=times[-1],
+                                          page_size=1,
+                                          bucket=bucket)) == early)
+
+    for i in range(0, 3):
+        assert(list(account.iter_transactions(
+                            end_datetime=times[-1],
+                            start_after=early[i].to_key(),
+                            bucket=bucket)) == early[i + 1:])
+
+
+def test_find_last_key_before(bucket, monkeypatch):
+    from Acquire.Accounting._account import _find_last_key_before
+    from Acquire.ObjectStore import ObjectStore, ObjectStoreError
+
+    prefix = "test_find_last_key_before/"
+
+    for key in ["2018-11", "2019-01", "2019-03", "2020-02"]:
+        ObjectStore.set_string_object(bucket, prefix + key, key)
+
+    def _find(before):
+        return _find_last_key_before(bucket=bucket, prefix=prefix,
+                                     delimiters=["-", "/"],
+                                     before=prefix + before)
+
+    assert(_find("2019-02") == prefix + "2019-01")
+    assert(_find("2020-02") == prefix + "2020-02")
+    assert(_find("2018-10") is None)
+
+    # a missing prefix means there is no earlier key...
+    def _missing(*args, **kwargs):
+        raise ObjectStoreError("No such prefix")
+
+    monkeypatch.setattr(ObjectStore, "list_prefixes", _missing)
+    assert(_find("2019-02") is None)
+
+    # ...but any other error must not be mistaken for one
+    def _forbidden(*args, **kwargs):
+        raise PermissionError("Not allowed to list the bucket")
+
+    monkeypatch.setattr(ObjectStore, "list_prefixes", _forbidden)
+
+    with pytest.raises(PermissionError):
+        _find("2019-02")
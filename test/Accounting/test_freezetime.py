@@ -350,3 +350,121 @@ def test_parallel_transaction(account1, account2, bucket):
 
     assert(account1.balance() == start1 + total1)
     assert(account2.balance() == start2 + total2)
+
+
+def test_balance_snapshots(bucket):
+    if not have_freezetime:
+        return
+
+    from Acquire.ObjectStore import ObjectStore
+
+    with freeze_time(start_time) as _frozen_datetime:
+        push_is_running_service()
+        accounts = Accounts(user_guid=account1_user)
+        debit_account = Account(name="Snapshot Debit",
+                                description="Account to debit snapshots",
+                                group_name=accounts.name())
+        debit_account.set_overdraft_limit(account1_overdraft_limit)
+        credit_account = Account(name="Snapshot Credit",
+                                 description="Account to credit snapshots",
+                                 group_name=accounts.name())
+        pop_is_running_service()
+
+    # transactions spread over three months, followed by a dormant period
+    times = [start_time + datetime.timedelta(days=i, hours=1)
+             for i in range(0, 90, 9)]
+
+    balances = []
+    total = create_decimal(0)
+
+    for (i, transaction_time) in enumerate(times):
+        with freeze_time(transaction_time) as _frozen_datetime:
+            transaction = Transaction(i + 1, "snapshot transaction %d" % i)
+
+            auth = Authorisation(
+                        resource=transaction.fingerprint(),
+                        testing_key=testing_key,
+                        testing_user_guid=debit_account.group_name())
+
+            Ledger.perform(transaction=transaction,
+                           debit_account=debit_account,
+                           credit_account=credit_account,
+                           authorisation=auth, bucket=bucket)
+
+            total += transaction.value()
+            balances.append(Balance(balance=total))
+
+    assert(credit_account.balance() == balances[-1])
+
+    # historical balances are found from the daily and monthly snapshots
+    for (transaction_time, balance) in zip(times, balances):
+        account = Account(uid=credit_account.uid())
+        later = transaction_time + datetime.timedelta(days=2)
+        assert(account.balance(now=later) == balance)
+
+    later = times[-1] + datetime.timedelta(days=120)
+    assert(Account(uid=credit_account.uid()).balance(now=later) ==
+           balances[-1])
+
+    nwritten = credit_account.compact_balances()
+    assert(nwritten > 0)
+    assert(credit_account.compact_balances() == 0)
+
+    # every day and month since the first transaction now has a snapshot
+    day_keys = ObjectStore.get_all_object_names(
+                        bucket, "%s/" % credit_account._daily_balance_key())
+    assert(len(day_keys) >= (get_datetime_now() - start_time).days)
+
+    # remove some snapshots, so that they are recalculated
+    for key in day_keys[::3]:
+        ObjectStore.delete_object(bucket, key)
+
+    for (transaction_time, balance) in zip(times, balances):
+        account = Account(uid=credit_account.uid())
+        later = transaction_time + datetime.timedelta(hours=1)
+        assert(account.balance(now=later) == balance)
+
+    assert(credit_account.compact_balances() == 0)
+
+    # a fresh account whose first transaction is exactly at midnight
+    # at the start of the month has that transaction in its snapshots.
+    # Transactions are never performed at the top of the hour, so the
+    # line item is written directly
+    from Acquire.Accounting import LineItem, TransactionInfo, \
+        TransactionCode
+    from Acquire.ObjectStore import datetime_to_string
+
+    month_start = start_time.replace(day=1, hour=0, minute=0, second=0,
+                                     microsecond=0)
+
+    push_is_running_service()
+    accounts = Accounts(user_guid=account1_user)
+    fresh_account = Account(name="Snapshot Fresh",
+                            description="Account to compact snapshots",
+                            group_name=accounts.name())
+    pop_is_running_service()
+
+    uid = "%s/%s" % (datetime_to_string(month_start), "0123abcd")
+    item_key = "%s/%s/%s" % (
+                    fresh_account._transactions_key(), uid,
+                    TransactionInfo.encode(TransactionCode.CREDIT,
+                                           create_decimal(5)))
+
+    fresh_account._record_line_item(
+                    item_key, LineItem(uid=uid, authorisation=None),
+                    bucket=bucket)
+
+    until = month_start + datetime.timedelta(days=9, hours=12)
+
+    Account.compact_all_balances(until=until)
+
+    day_keys = ObjectStore.get_all_object_names(
+                    bucket, "%s/" % fresh_account._daily_balance_key())
+    month_keys = ObjectStore.get_all_object_names(
+                    bucket, "%s/" % fresh_account._monthly_balance_key())
+
+    assert(len(day_keys) == 10)
+    assert(len(month_keys) == 1)
+    assert(fresh_account._load_balance_snapshot(month_keys[0], bucket) ==
+           Balance(balance=5))
+    assert(fresh_account.compact_balances(until=until) == 0)
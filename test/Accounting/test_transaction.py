@@ -95,3 +95,78 @@ def test_split(random_large_value):
     total = Transaction.round(total)
 
     assert(total == Transaction.round(value))
+
+
+def test_transaction_keys():
+    import datetime
+    from Acquire.Accounting import TransactionInfo, TransactionCode, \
+        TransactionKeys, Balance
+    from Acquire.ObjectStore import datetime_to_string, get_datetime_now
+
+    codes = [TransactionCode.CREDIT, TransactionCode.DEBIT,
+             TransactionCode.CURRENT_LIABILITY,
+             TransactionCode.ACCOUNT_RECEIVABLE,
+             TransactionCode.RECEIVED_RECEIPT, TransactionCode.SENT_RECEIPT,
+             TransactionCode.RECEIVED_REFUND, TransactionCode.SENT_REFUND]
+
+    start = get_datetime_now().replace(microsecond=0)
+
+    keys = []
+
+    for i in range(0, 500):
+        code = codes[i % len(codes)]
+        value = create_decimal(1000.0 * random.random())
+        receipted_value = None
+
+        if code in [TransactionCode.RECEIVED_RECEIPT,
+                    TransactionCode.SENT_RECEIPT]:
+            receipted_value = create_decimal(float(value) * random.random())
+        elif code in [TransactionCode.CURRENT_LIABILITY,
+                      TransactionCode.ACCOUNT_RECEIVABLE] and i % 3 == 0:
+            # rescinded liabilities have negative values
+            value = -value
+
+        # include times with a whole number of seconds
+        datetime_key = start + datetime.timedelta(
+                                    seconds=i // 2,
+                                    microseconds=(i % 2) * random.randint(
+                                                            1, 999999))
+
+        keys.append("account/txns/%s/%s/%s" % (
+                        datetime_to_string(datetime_key), "uid%03d" % i,
+                        TransactionInfo.encode(code, value, receipted_value)))
+
+    infos = [TransactionInfo.from_key(key) for key in keys]
+
+    expect = Balance()
+    for info in infos:
+        expect = expect + info
+
+    transaction_keys = TransactionKeys(keys)
+    assert(len(transaction_keys) == len(keys))
+    assert(transaction_keys.sum() == expect)
+
+    # keys without the account prefix are decoded in the same way
+    assert(TransactionKeys(
+            [key[len("account/txns/"):] for key in keys]).sum() == expect)
+
+    assert(TransactionKeys([]).sum() == Balance())
+
+    for (lower, upper) in [(0, 100), (57, 58), (101, 333), (400, 500)]:
+        start_datetime = infos[lower].datetime()
+        end_datetime = infos[upper - 1].datetime()
+
+        expect = Balance()
+        for info in infos:
+            if info.datetime() > start_datetime and \
+                    info.datetime() <= end_datetime:
+                expect = expect + info
+
+        filtered = transaction_keys.filter(start_datetime=start_datetime,
+                                           end_datetime=end_datetime)
+
+        assert(len(filtered) == upper - lower - 1)
+        assert(filtered.sum() == expect)
+
+    with pytest.raises(ValueError):
+        TransactionKeys(["account/txns/not_a_transaction"])
@@ -0,0 +1,295 @@
+
+import pytest
+import threading
+import time
+
+from Acquire.Client import ParallelChunkUploader, ParallelChunkDownloader
+
+
+class _Storage:
+    """A thread-safe stand-in for the storage service, that stores
+       the uploaded chunks in memory. Each call sleeps for
+       'delay(chunk_index)' so that chunks complete out of order.
+       The file is being uploaded until the uploader is closed
+    """
+    def __init__(self, delay=None, fail=None):
+        self._lock = threading.Lock()
+        self.chunks = {}
+        self.completed = []
+        self.closed = None
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._delay = delay
+        self._fail = fail
+
+    def call_function(self, function, args):
+        chunk_index = args.get("chunk_index")
+
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        try:
+            if self._delay is not None and chunk_index is not None:
+                time.sleep(self._delay(chunk_index))
+
+            if self._fail is not None and chunk_index is not None:
+                self._fail(chunk_index)
+
+            return getattr(self, "_%s" % function)(args)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _upload_chunk(self, args):
+        with self._lock:
+            self.chunks[args["chunk_index"]] = (args["data"],
+                                                args["checksum"],
+                                                args["compression"])
+            self.completed.append(args["chunk_index"])
+
+        return {}
+
+    def _close_uploader(self, args):
+        with self._lock:
+            self.closed = len(self.chunks)
+
+        return {}
+
+    def _download_chunk(self, args):
+        import json
+        from Acquire.ObjectStore import bytes_to_string
+
+        chunk_index = args["chunk_index"]
+
+        with self._lock:
+            if chunk_index in self.chunks:
+                (chunk, checksum, compression) = self.chunks[chunk_index]
+                return {"chunk": bytes_to_string(chunk),
+                        "meta": json.dumps({"checksum": checksum,
+                                            "compression": compression})}
+            elif self.closed is not None and chunk_index == self.closed:
+                return {"num_chunks": self.closed}
+            else:
+                # not uploaded yet (or beyond the end of the file)
+                return {}
+
+    def _close_downloader(self, args):
+        return {}
+
+    def reader(self, delay=None, fail=None):
+        """Return a new service that reads the chunks of this one"""
+        reader = _Storage(delay=delay, fail=fail)
+        reader._lock = self._lock
+        reader.chunks = self.chunks
+        reader.closed = self.closed
+        return reader
+
+    def data(self):
+        """Return the uncompressed data of all of the uploaded chunks"""
+        from Acquire.Client import uncompress
+        from Acquire.Crypto import Hash
+
+        data = b""
+
+        for i in range(0, len(self.chunks)):
+            (chunk, checksum, compression) = self.chunks[i]
+            assert(Hash.md5(chunk) == checksum)
+            data += uncompress(inputdata=chunk, compression_type=compression)
+
+        return data
+
+
+def _uploader(storage, workers, max_retries=3):
+    uploader = ParallelChunkUploader(drive_uid="drive", file_uid="file",
+                                     workers=workers,
+                                     max_retries=max_retries)
+    uploader._service = storage
+    return uploader
+
+
+def _data(nlines=2000):
+    return "".join("This is line %d of the file\n" % i
+                   for i in range(0, nlines)).encode("utf-8")
+
+
+def test_parallel_upload_out_of_order(tmpdir):
+    # later chunks in each group of eight complete first
+    storage = _Storage(delay=lambda i: 0.002 * (7 - (i % 8)))
+
+    data = _data()
+    filename = str(tmpdir.join("input"))
+
+    with open(filename, "wb") as FILE:
+        FILE.write(data)
+
+    uploader = _uploader(storage, workers=4)
+    uploader.upload_file(filename, chunk_size=1024)
+    uploader.close()
+
+    nchunks = (len(data) + 1023) // 1024
+
+    assert(sorted(storage.completed) == list(range(0, nchunks)))
+    assert(storage.completed != sorted(storage.completed))
+    assert(1 < storage.max_in_flight <= 4)
+
+    # the file is only finalised once every chunk has been uploaded
+    assert(storage.closed == nchunks)
+    assert(storage.data() == data)
+    assert(not uploader.is_open())
+    assert(uploader._executor is None)
+
+
+def test_parallel_upload_retries():
+    failures = []
+
+    def _fail_once(chunk_index):
+        if chunk_index == 3 and len(failures) == 0:
+            failures.append(chunk_index)
+            raise ConnectionError("dropped the connection")
+
+    storage = _Storage(delay=lambda i: 0.001 * (i % 3), fail=_fail_once)
+
+    data = _data(500)
+    uploader = _uploader(storage, workers=3)
+
+    for i in range(0, len(data), 1000):
+        uploader.upload(data[i:i+1000])
+
+    uploader.close()
+
+    assert(failures == [3])
+    assert(storage.data() == data)
+
+
+def test_parallel_upload_error():
+    def _forbidden(chunk_index):
+        if chunk_index == 5:
+            raise PermissionError("cannot upload chunk 5")
+
+    storage = _Storage(delay=lambda i: 0.001 * (i % 4), fail=_forbidden)
+
+    data = _data(500)
+    uploader = _uploader(storage, workers=4)
+
+    uploader.upload(data[0:500])
+    executor = uploader._executor
+
+    # the error is raised by a later upload, or else by close
+    with pytest.raises(PermissionError):
+        for i in range(500, len(data), 500):
+            uploader.upload(data[i:i+500])
+
+        uploader.close()
+
+    if uploader._executor is not None:
+        with pytest.raises(PermissionError):
+            uploader.close()
+
+    # the pool is shut down, the failed chunk is not retried, and
+    # the file is never finalised
+    assert(executor._shutdown)
+    assert(5 not in storage.chunks)
+    assert(storage.closed is None)
+    assert(uploader._executor is None)
+    assert(not uploader.is_open())
+    assert(storage.in_flight == 0)
+
+
+def _downloader(storage, workers):
+    downloader = ParallelChunkDownloader(drive_uid="drive", file_uid="file",
+                                         workers=workers)
+    downloader._service = storage
+    return downloader
+
+
+def _upload(storage, data, close=True):
+    uploader = _uploader(storage, workers=2)
+
+    for i in range(0, len(data), 1024):
+        uploader.upload(data[i:i+1024])
+
+    if close:
+        uploader.close()
+    else:
+        uploader.wait()
+
+    return uploader
+
+
+def test_parallel_download_out_of_order(tmpdir):
+    storage = _Storage()
+    data = _data()
+    _upload(storage, data)
+
+    # later chunks in each window complete first
+    reader = storage.reader(delay=lambda i: 0.002 * (7 - (i % 8)))
+    downloader = _downloader(reader, workers=4)
+
+    filename = downloader.download(filename="output", dir=str(tmpdir))
+
+    with open(filename, "rb") as FILE:
+        assert(FILE.read() == data)
+
+    assert(1 < reader.max_in_flight <= 4)
+    assert(reader.in_flight == 0)
+    assert(not downloader.is_open())
+
+
+def test_parallel_download_while_uploading(tmpdir):
+    storage = _Storage()
+    data = _data()
+    half = 8 * 1024
+
+    uploader = _upload(storage, data[0:half], close=False)
+
+    downloader = _downloader(storage.reader(), workers=4)
+    filename = downloader.download(filename="output", dir=str(tmpdir))
+
+    # the download stops at the first chunk that is not uploaded yet
+    with open(filename, "rb") as FILE:
+        assert(FILE.read() == data[0:half])
+
+    assert(downloader.is_open())
+
+    # and is resumed from there once more chunks are uploaded
+    for i in range(half, len(data), 1024):
+        uploader.upload(data[i:i+1024])
+
+    uploader.close()
+
+    downloader._service = storage.reader(delay=lambda i: 0.001 * (i % 3))
+    assert(downloader.download() == filename)
+
+    with open(filename, "rb") as FILE:
+        assert(FILE.read() == data)
+
+    assert(not downloader.is_open())
+
+
+def test_parallel_download_error(tmpdir):
+    from Acquire.Storage import FileValidationError
+
+    storage = _Storage()
+    data = _data()
+    _upload(storage, data)
+
+    # corrupt the fifth chunk
+    (chunk, checksum, compression) = storage.chunks[4]
+    storage.chunks[4] = (chunk, "0" * len(checksum), compression)
+
+    reader = storage.reader(delay=lambda i: 0.001 * (i % 4))
+    downloader = _downloader(reader, workers=4)
+
+    with pytest.raises(FileValidationError):
+        downloader.download(filename="output", dir=str(tmpdir))
+
+    # the pool has shut down, and only the chunks before the bad
+    # chunk have been written
+    assert(reader.in_flight == 0)
+    assert(downloader.is_open())
+
+    with open(downloader.local_filename(), "rb") as FILE:
+        assert(FILE.read() == data[0:4 * 1024])
+
+    downloader.close()
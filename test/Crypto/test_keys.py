@@ -5,7 +5,9 @@ import random
 import os
 
 from Acquire.Crypto import PublicKey, PrivateKey, SymmetricKey, \
-                           SignatureVerificationError
+                           SignatureVerificationError, DecryptionError, \
+                           set_session_key_options, get_session_key_options, \
+                           clear_session_keys
 
 
 def test_keys():
@@ -94,3 +96,99 @@ def test_keys():
     assert(symkey == symkey2)
 
     assert(long_message == symkey2.decrypt(c))
+
+
+def test_session_keys():
+    privkey = PrivateKey()
+    pubkey = privkey.public_key()
+
+    clear_session_keys()
+
+    message = "Hello World"
+    long_message = str([random.getrandbits(8) for _ in range(4096)])
+
+    c1 = pubkey.encrypt(message, use_session_key=True)
+    c2 = pubkey.encrypt(long_message, use_session_key=True)
+
+    # the same wrapped session key is reused by both messages
+    key_size = privkey.key_size_in_bytes()
+    assert(c1[0:4+key_size] == c2[0:4+key_size])
+
+    assert(privkey.decrypt(c1) == message)
+    assert(privkey.decrypt(c2) == long_message)
+
+    # a new process (empty cache) can still decrypt the message
+    clear_session_keys()
+    assert(privkey.decrypt(c2) == long_message)
+
+    # the session key is rotated after it has been used 'max_uses' times
+    old = get_session_key_options()
+    set_session_key_options(max_uses=1)
+
+    c3 = pubkey.encrypt(message, use_session_key=True)
+    c4 = pubkey.encrypt(message, use_session_key=True)
+    assert(c3[0:4+key_size] != c4[0:4+key_size])
+    assert(privkey.decrypt(c4) == message)
+
+    set_session_key_options(max_uses=old["max_uses"])
+
+    # tampering is detected
+    c5 = c2[0:-1] + bytes([c2[-1] ^ 1])
+
+    with pytest.raises(DecryptionError):
+        privkey.decrypt(c5)
+
+    # only the intended recipient can decrypt
+    with pytest.raises(DecryptionError):
+        PrivateKey().decrypt(c1)
+
+
+def test_stream_encryption():
+    from io import BytesIO
+
+    privkey = PrivateKey()
+    pubkey = privkey.public_key()
+    symkey = SymmetricKey()
+
+    data = os.urandom(10000)
+
+    for (enc, dec) in [(pubkey, privkey), (privkey, privkey),
+                       (symkey, symkey)]:
+        encrypted = BytesIO()
+        enc.encrypt_stream(BytesIO(data), encrypted, segment_size=1024)
+
+        decrypted = BytesIO()
+        nbytes = dec.decrypt_stream(BytesIO(encrypted.getvalue()), decrypted)
+
+        assert(nbytes == len(data))
+        assert(decrypted.getvalue() == data)
+
+        # chunks can be passed from a generator
+        chunks = (data[i:i+777] for i in range(0, len(data), 777))
+        encrypted = BytesIO()
+        enc.encrypt_stream(chunks, encrypted, segment_size=1024)
+
+        decrypted = BytesIO()
+        dec.decrypt_stream(encrypted.getvalue(), decrypted)
+        assert(decrypted.getvalue() == data)
+
+        encrypted = encrypted.getvalue()
+
+        # truncating the stream at a segment boundary is detected
+        with pytest.raises(DecryptionError):
+            dec.decrypt_stream(encrypted[0:-(len(data) % 1024) - 20],
+                               BytesIO())
+
+        # as is modifying any segment
+        tampered = bytearray(encrypted)
+        tampered[len(tampered) // 2] ^= 1
+
+        with pytest.raises(DecryptionError):
+            dec.decrypt_stream(bytes(tampered), BytesIO())
+
+    # empty streams are supported
+    encrypted = BytesIO()
+    symkey.encrypt_stream(b"", encrypted)
+    decrypted = BytesIO()
+    symkey.decrypt_stream(encrypted.getvalue(), decrypted)
+    assert(decrypted.getvalue() == b"")
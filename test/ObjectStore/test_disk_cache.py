@@ -0,0 +1,224 @@
+
+import pytest
+import threading
+import time
+
+from Acquire.ObjectStore import ObjectStore, enable_disk_cache, \
+    disable_disk_cache, get_disk_cache_statistics, clear_disk_cache, \
+    set_object_cache_policy
+from Acquire.ObjectStore._disk_cache import _get_disk_cache
+from Acquire.ObjectStore._ospar import _read_local
+from Acquire.Service import get_service_account_bucket, \
+    push_is_running_service, pop_is_running_service
+
+
+@pytest.fixture(scope="module")
+def bucket(tmpdir_factory):
+    d = tmpdir_factory.mktemp("objstore_disk")
+    push_is_running_service()
+    bucket = get_service_account_bucket(str(d))
+    pop_is_running_service()
+
+    set_object_cache_policy("disk_test/immutable/", "immutable")
+    enable_disk_cache(directory=str(tmpdir_factory.mktemp("disk_cache")),
+                      max_bytes=5000, min_object_size=100)
+
+    yield bucket
+
+    disable_disk_cache()
+    set_object_cache_policy("disk_test/immutable/", None)
+
+
+def _write_behind_cache(bucket, key, data):
+    with open("%s/%s._data" % (bucket, key), "wb") as FILE:
+        FILE.write(data)
+
+
+def test_disk_cache(bucket, tmpdir):
+    clear_disk_cache()
+
+    big = b"a" * 1000
+    ObjectStore.set_object(bucket, "disk_test/immutable/big", big)
+    ObjectStore.set_object(bucket, "disk_test/immutable/small", b"small")
+
+    for i in range(0, 3):
+        assert(ObjectStore.get_object(bucket, "disk_test/immutable/big") ==
+               big)
+        assert(ObjectStore.get_object(bucket, "disk_test/immutable/small") ==
+               b"small")
+
+    stats = get_disk_cache_statistics()
+    assert(stats["fills"] == 1)
+    assert(stats["hits"] == 2)
+
+    # the cached object is only used while its checksum is unchanged,
+    # even if it is changed by another process
+    _write_behind_cache(bucket, "disk_test/immutable/big", b"b" * 1000)
+    assert(ObjectStore.get_object(bucket, "disk_test/immutable/big") ==
+           b"b" * 1000)
+
+    # mutable objects are cached by checksum
+    filename = str(tmpdir.join("output"))
+    ObjectStore.set_object(bucket, "disk_test/mutable", big)
+
+    ObjectStore.get_object_as_file(bucket, "disk_test/mutable", filename)
+    ObjectStore.get_object_as_file(bucket, "disk_test/mutable", filename)
+    assert(open(filename, "rb").read() == big)
+
+    stats = get_disk_cache_statistics()
+    assert(stats["fills"] == 3)
+    assert(stats["hits"] == 3)
+
+    ObjectStore.set_object(bucket, "disk_test/mutable", b"c" * 1000)
+    ObjectStore.get_object_as_file(bucket, "disk_test/mutable", filename)
+    assert(open(filename, "rb").read() == b"c" * 1000)
+    assert(get_disk_cache_statistics()["fills"] == 4)
+
+
+def test_disk_cache_overwrite_and_delete(bucket, tmpdir):
+    from Acquire.ObjectStore import ObjectStoreError
+
+    clear_disk_cache()
+
+    # the chunks of a file are immutable by default
+    key = "storage/file/abc/data/0"
+    filename = str(tmpdir.join("chunk"))
+
+    hits = get_disk_cache_statistics()["hits"]
+
+    ObjectStore.set_object(bucket, key, b"o" * 1000)
+    assert(ObjectStore.get_object(bucket, key) == b"o" * 1000)
+    assert(ObjectStore.get_object(bucket, key) == b"o" * 1000)
+    assert(get_disk_cache_statistics()["hits"] == hits + 1)
+
+    # a new value is never served from the entry for the old value
+    ObjectStore.set_object(bucket, key, b"n" * 1000)
+    assert(ObjectStore.get_object(bucket, key) == b"n" * 1000)
+    ObjectStore.get_object_as_file(bucket, key, filename)
+    assert(open(filename, "rb").read() == b"n" * 1000)
+
+    ObjectStore.take_object(bucket, key)
+
+    with pytest.raises(ObjectStoreError):
+        ObjectStore.get_object(bucket, key)
+
+    ObjectStore.set_object(bucket, key, b"p" * 1000)
+    ObjectStore.delete_objects(bucket, [key])
+
+    with pytest.raises(ObjectStoreError):
+        ObjectStore.get_object(bucket, key)
+
+    with pytest.raises(ObjectStoreError):
+        ObjectStore.get_object_as_file(bucket, key, filename)
+
+
+def test_disk_cache_revalidation(bucket):
+    clear_disk_cache()
+
+    url = "file://%s/disk_test/reader" % bucket
+    ObjectStore.set_object(bucket, "disk_test/reader", b"d" * 1000)
+
+    assert(_read_local(url) == b"d" * 1000)
+    assert(_read_local(url) == b"d" * 1000)
+    assert(get_disk_cache_statistics()["revalidations"] == 1)
+
+    # make sure that the modification time changes
+    time.sleep(0.01)
+    ObjectStore.set_object(bucket, "disk_test/reader", b"e" * 1001)
+    assert(_read_local(url) == b"e" * 1001)
+    assert(get_disk_cache_statistics()["revalidations"] == 1)
+
+
+def test_disk_cache_eviction_and_fills(bucket):
+    clear_disk_cache()
+
+    for i in range(0, 10):
+        key = "disk_test/immutable/%d" % i
+        ObjectStore.set_object(bucket, key, b"x" * 1000)
+        ObjectStore.get_object(bucket, key)
+
+    stats = get_disk_cache_statistics()
+    assert(stats["bytes"] <= 5000)
+    assert(stats["evictions"] > 0)
+
+    # concurrent readers only load the object once
+    cache = _get_disk_cache()
+    loads = []
+
+    def _loader():
+        loads.append(1)
+        time.sleep(0.1)
+        return b"y" * 1000
+
+    results = []
+
+    def _read():
+        results.append(cache.get("concurrent", _loader))
+
+    threads = [threading.Thread(target=_read) for _ in range(0, 8)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    assert(len(loads) == 1)
+    assert(results == [b"y" * 1000] * 8)
+
+
+def test_disk_cache_directory(tmpdir, monkeypatch):
+    import os
+    import stat
+    from Acquire.ObjectStore._disk_cache import _DiskCache, \
+        _get_default_directory
+
+    # the default directory is private to this user
+    assert(str(os.getuid()) in os.path.basename(_get_default_directory()))
+
+    directory = str(tmpdir.join("private"))
+    _DiskCache(directory, max_bytes=5000, min_object_size=100)
+    assert(stat.S_IMODE(os.stat(directory).st_mode) == 0o700)
+
+    # a directory that other users can write to is never used
+    shared = str(tmpdir.join("shared"))
+    os.makedirs(shared)
+    os.chmod(shared, 0o777)
+
+    with pytest.raises(PermissionError):
+        _DiskCache(shared, max_bytes=5000, min_object_size=100)
+
+    # nor is a directory owned by another user
+    monkeypatch.setattr(os, "getuid", lambda: os.stat(directory).st_uid + 1)
+
+    with pytest.raises(PermissionError):
+        _DiskCache(directory, max_bytes=5000, min_object_size=100)
+
+
+def test_disk_cache_without_checksum(bucket, tmpdir, monkeypatch):
+    clear_disk_cache()
+
+    from Acquire.ObjectStore import _objstore
+
+    backend = _objstore._objstore_backend
+    calls = []
+
+    def _no_checksum(bucket, key, calculate=True):
+        # like a multipart upload, which has no stored MD5
+        calls.append(calculate)
+        return (1000, None)
+
+    monkeypatch.setattr(backend, "get_size_and_checksum", _no_checksum)
+
+    data = b"f" * 1000
+    ObjectStore.set_object(bucket, "disk_test/multipart", data)
+
+    fills = get_disk_cache_statistics()["fills"]
+
+    filename = str(tmpdir.join("multipart"))
+    ObjectStore.get_object_as_file(bucket, "disk_test/multipart", filename)
+    assert(open(filename, "rb").read() == data)
+
+    # the object was not streamed to find its checksum
+    assert(calls == [False])
+    assert(get_disk_cache_statistics()["fills"] == fills)
@@ -0,0 +1,205 @@
+
+from Acquire.ObjectStore import LeaseMutex, Mutex, MutexTimeoutError, \
+    get_mutex_statistics, reset_mutex_statistics, datetime_to_datetime
+from Acquire.Service import get_service_account_bucket, \
+    push_is_running_service, pop_is_running_service
+
+import Acquire.ObjectStore
+import datetime
+import importlib
+import pytest
+import threading
+import time
+import weakref
+
+_lease_mutex = importlib.import_module("Acquire.ObjectStore._lease_mutex")
+_mutex = importlib.import_module("Acquire.ObjectStore._mutex")
+
+
+class FakeClock:
+    """A clock that only moves when it is told to, so that the tests
+       do not depend on how quickly they run. Sleeping advances the
+       clock (unless 'advance_on_sleep' is False), and only yields
+       to the other threads in real time
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._now = 1600000000.0
+        self.advance_on_sleep = True
+
+    def time(self):
+        with self._lock:
+            return self._now
+
+    def monotonic(self):
+        return self.time()
+
+    def advance(self, seconds):
+        with self._lock:
+            self._now += seconds
+
+    def sleep(self, seconds):
+        if self.advance_on_sleep:
+            self.advance(seconds)
+
+        time.sleep(0.001)
+
+    def get_datetime_now(self):
+        return datetime_to_datetime(datetime.datetime.fromtimestamp(
+                                    self.time(), datetime.timezone.utc))
+
+
+@pytest.fixture(scope="session")
+def bucket(tmpdir_factory):
+    d = tmpdir_factory.mktemp("objstore")
+    push_is_running_service()
+    bucket = get_service_account_bucket(str(d))
+    pop_is_running_service()
+    return bucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(_lease_mutex, "_time", clock)
+    monkeypatch.setattr(_mutex, "_time", clock)
+    monkeypatch.setattr(Acquire.ObjectStore, "get_datetime_now",
+                        clock.get_datetime_now)
+    return clock
+
+
+def test_lease_mutex(bucket, clock):
+    reset_mutex_statistics()
+
+    m = LeaseMutex("test_lease_mutex", bucket=bucket)
+    assert(m.is_locked())
+    m.lock()
+    m.unlock()
+    assert(m.is_locked())
+
+    # the old and new engines exclude each other
+    with pytest.raises(MutexTimeoutError):
+        Mutex("test_lease_mutex", timeout=0.3, bucket=bucket)
+
+    with pytest.raises(MutexTimeoutError):
+        LeaseMutex("test_lease_mutex", timeout=0.3, bucket=bucket)
+
+    m.unlock()
+    assert(not m.is_locked())
+
+    m2 = LeaseMutex("test_lease_mutex", timeout=0.3, bucket=bucket)
+    assert(m2.is_locked())
+    m2.unlock()
+
+    stats = get_mutex_statistics("test_lease_mutex")
+    assert(stats["acquisitions"] == 2)
+    assert(stats["timeouts"] == 1)
+    assert(stats["contended_acquisitions"] == 0)
+    assert(stats["attempts"] > stats["acquisitions"])
+    assert(get_mutex_statistics()["acquisitions"] >= 2)
+
+
+def test_lease_mutex_renewal(bucket, clock):
+    reset_mutex_statistics()
+
+    m = LeaseMutex("test_lease_renewal", lease_time=0.6, bucket=bucket,
+                   auto_renew=False)
+
+    # renewing the lease before it expires keeps the mutex held
+    for i in range(0, 3):
+        clock.advance(0.4)
+        assert(m._renew())
+
+    assert(m.is_locked())
+    assert(not m.expired())
+    assert(get_mutex_statistics("test_lease_renewal")["renewals"] == 3)
+
+    with pytest.raises(MutexTimeoutError):
+        LeaseMutex("test_lease_renewal", timeout=0.3, bucket=bucket)
+
+    m.unlock()
+
+    # the background renewal renews every interval until it is stopped
+    class _Stop:
+        def __init__(self, count):
+            self._count = count
+
+        def wait(self, interval):
+            clock.advance(interval)
+            self._count -= 1
+            return self._count < 0
+
+    m = LeaseMutex("test_lease_renewal", lease_time=0.6, bucket=bucket,
+                   auto_renew=False)
+    _lease_mutex._renew_lease(weakref.ref(m), _Stop(4), 0.2)
+    assert(not m.expired())
+    assert(get_mutex_statistics("test_lease_renewal")["renewals"] == 7)
+    m.unlock()
+
+    m = LeaseMutex("test_lease_renewal", bucket=bucket)
+    assert(m._renew_stop is not None)
+    m.unlock()
+    assert(m._renew_stop is None)
+
+    # without renewal the lease expires and can be taken over
+    m = LeaseMutex("test_lease_renewal", lease_time=0.25, bucket=bucket,
+                   auto_renew=False)
+    clock.advance(0.3)
+    assert(m.expired())
+
+    m2 = LeaseMutex("test_lease_renewal", bucket=bucket)
+    assert(m2.is_locked())
+    assert(get_mutex_statistics("test_lease_renewal")["takeovers"] == 1)
+
+    with pytest.raises(MutexTimeoutError):
+        m.unlock()
+
+    m2.unlock()
+
+
+def test_lease_mutex_fair(bucket, clock):
+    # waiters spin without moving the clock, so that the only change
+    # in time is between the waiters taking their tickets
+    clock.advance_on_sleep = False
+
+    m = LeaseMutex("test_lease_fair", bucket=bucket, fair=True)
+
+    order = []
+
+    def _wait(i):
+        w = LeaseMutex("test_lease_fair", timeout=10, bucket=bucket,
+                       fair=True)
+        order.append(i)
+        w.unlock()
+
+    def _num_tickets():
+        from Acquire.ObjectStore import ObjectStore
+        return len(ObjectStore.get_all_object_names(
+                                bucket, "mutex_queues/test_lease_fair/"))
+
+    threads = []
+
+    for i in range(0, 3):
+        thread = threading.Thread(target=_wait, args=(i,))
+        thread.start()
+        threads.append(thread)
+
+        # make sure that each waiter has taken its ticket before the
+        # next waiter takes a (later) ticket
+        deadline = time.monotonic() + 10
+
+        while _num_tickets() <= i and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        clock.advance(1)
+
+    m.unlock()
+
+    for thread in threads:
+        thread.join()
+
+    assert(order == [0, 1, 2])
+
+    stats = get_mutex_statistics("test_lease_fair")
+    assert(stats["contended_acquisitions"] == 3)
+    assert(stats["max_wait_time"] > 0)
@@ -1,7 +1,8 @@
 
 import pytest
 
-from Acquire.ObjectStore import ObjectStore, ObjectStoreError
+from Acquire.ObjectStore import ObjectStore, ObjectStoreError, \
+    PreconditionFailedError
 from Acquire.Service import get_service_account_bucket, \
     push_is_running_service, pop_is_running_service, \
     is_running_service
@@ -95,3 +96,289 @@ def test_objstore(bucket):
     test_value2 = ObjectStore.get_string_object(new_bucket2, test_key)
 
     assert(test_value == test_value2)
+
+
+def test_iter_object_names(bucket):
+    keys = ["iter/%04d" % i for i in range(0, 25)]
+    keys += ["iter/sub/%d" % i for i in range(0, 5)]
+    keys.sort()
+
+    for key in reversed(keys):
+        ObjectStore.set_string_object(bucket, key, key)
+
+    names = list(ObjectStore.iter_object_names(bucket, "iter/",
+                                               page_size=7))
+    assert(names == keys)
+
+    names = list(ObjectStore.iter_object_names(bucket, "iter/",
+                                               start_after="iter/0019"))
+    assert(names == keys[20:])
+
+    names = list(ObjectStore.iter_object_names(bucket, "iter/",
+                                               start_after="iter/sub/2",
+                                               without_prefix=True))
+    assert(names == ["sub/3", "sub/4"])
+
+    assert(sorted(ObjectStore.get_all_object_names(bucket, "iter")) == keys)
+
+
+def test_list_prefixes(bucket):
+    keys = ["tree/a", "tree/b/1", "tree/b/2", "tree/c/d/3",
+            "tree/2024-05-01T03", "tree/2024-06-02T04"]
+
+    for key in keys:
+        ObjectStore.set_string_object(bucket, key, key)
+
+    (prefixes, names) = ObjectStore.list_prefixes(bucket, "tree/")
+    assert(prefixes == ["tree/b/", "tree/c/"])
+    assert(names == ["tree/2024-05-01T03", "tree/2024-06-02T04", "tree/a"])
+
+    (prefixes, names) = ObjectStore.list_prefixes(bucket, "tree/b")
+    assert(prefixes == ["tree/b/"])
+    assert(names == [])
+
+    (prefixes, names) = ObjectStore.list_prefixes(bucket, "tree/2024-",
+                                                  delimiter="-")
+    assert(prefixes == ["tree/2024-05-", "tree/2024-06-"])
+    assert(names == [])
+
+
+def test_bulk_objects(bucket):
+    objects = {"bulk/%d" % i: ("value %d" % i).encode("utf-8")
+               for i in range(0, 20)}
+
+    results = ObjectStore.set_objects(bucket, objects, max_workers=4)
+    assert(results == {key: None for key in objects.keys()})
+
+    keys = list(objects.keys()) + ["bulk/missing"]
+    results = ObjectStore.get_objects(bucket, keys, max_workers=4)
+
+    for key, value in objects.items():
+        assert(results[key] == value)
+
+    assert(isinstance(results["bulk/missing"], ObjectStoreError))
+
+    ObjectStore.set_objects_from_json(bucket, {"bulk/json": {"a": 1}})
+    results = ObjectStore.get_objects_from_json(bucket, ["bulk/json"])
+    assert(results["bulk/json"] == {"a": 1})
+
+    results = ObjectStore.delete_objects(bucket, objects.keys())
+    assert(results == {key: None for key in objects.keys()})
+
+    assert(ObjectStore.get_all_object_names(bucket, "bulk/") == ["bulk/json"])
+
+
+
+def test_delete_objects(bucket):
+    import os
+    from Acquire.ObjectStore._objstore import _raise_first_error
+
+    existing = ["delete/%d" % i for i in range(0, 10)]
+    missing = ["delete/missing/%d" % i for i in range(0, 5)]
+
+    ObjectStore.set_objects(bucket, {key: b"x" for key in existing})
+
+    # deleting a key that doesn't exist is not an error
+    keys = existing[0:5] + missing + existing[5:]
+    results = ObjectStore.delete_objects(bucket, keys, max_workers=4)
+    assert(results == {key: None for key in keys})
+    assert(ObjectStore.get_all_object_names(bucket, "delete/") == [])
+
+    ObjectStore.delete_object(bucket, missing[0])
+
+    # but any other failure is returned for its key
+    ObjectStore.set_objects(bucket, {key: b"x" for key in existing})
+    os.makedirs("%s/delete/broken._data" % bucket)
+
+    keys = existing + missing + ["delete/broken"]
+    results = ObjectStore.delete_objects(bucket, keys, max_workers=4)
+
+    assert(isinstance(results["delete/broken"], ObjectStoreError))
+    assert({key: value for (key, value) in results.items()
+            if key != "delete/broken"} ==
+           {key: None for key in existing + missing})
+
+    with pytest.raises(ObjectStoreError):
+        _raise_first_error(results)
+
+    with pytest.raises(ObjectStoreError):
+        ObjectStore.delete_object(bucket, "delete/broken")
+
+    os.rmdir("%s/delete/broken._data" % bucket)
+
+def test_conditional_writes(bucket):
+    key = "conditional/value"
+
+    etag = ObjectStore.set_object_if_absent(bucket, key, b"first")
+
+    with pytest.raises(PreconditionFailedError):
+        ObjectStore.set_object_if_absent(bucket, key, b"second")
+
+    (data, read_etag) = ObjectStore.get_object_and_etag(bucket, key)
+    assert(data == b"first")
+    assert(read_etag == etag)
+
+    new_etag = ObjectStore.set_object_if_match(bucket, key, b"second", etag)
+    assert(new_etag != etag)
+    assert(ObjectStore.get_object(bucket, key) == b"second")
+
+    # the old etag is now stale
+    with pytest.raises(PreconditionFailedError):
+        ObjectStore.set_object_if_match(bucket, key, b"third", etag)
+
+    with pytest.raises(PreconditionFailedError):
+        ObjectStore.set_object_if_match(bucket, "conditional/missing",
+                                        b"data", etag)
+
+    # writing back the same data gives a new etag (no ABA)
+    aba_etag = ObjectStore.set_object_if_match(bucket, key, b"first",
+                                               new_etag)
+    assert(aba_etag not in [etag, new_etag])
+
+    with pytest.raises(PreconditionFailedError):
+        ObjectStore.set_object_if_match(bucket, key, b"third", etag)
+
+    # as does a plain overwrite with the same data
+    ObjectStore.set_object(bucket, key, b"first")
+    assert(ObjectStore.get_object_and_etag(bucket, key)[1] != aba_etag)
+
+    assert(ObjectStore.get_all_object_names(bucket, "conditional/") ==
+           ["conditional/value"])
+
+    assert(ObjectStore.set_ins_string_object(bucket, "conditional/ins",
+                                             "one") == "one")
+    assert(ObjectStore.set_ins_string_object(bucket, "conditional/ins",
+                                             "two") == "one")
+
+
+def test_object_streams(bucket, tmpdir):
+    data = bytes(range(0, 256)) * 100
+
+    with ObjectStore.open_object_writer(bucket, "streams/data") as writer:
+        for i in range(0, len(data), 1000):
+            writer.write(data[i:i+1000])
+
+        # nothing is visible until the writer is closed
+        with pytest.raises(ObjectStoreError):
+            ObjectStore.get_object(bucket, "streams/data")
+
+    assert(ObjectStore.get_object(bucket, "streams/data") == data)
+    assert(ObjectStore.get_all_object_names(bucket, "streams/") ==
+           ["streams/data"])
+
+    with ObjectStore.open_object_reader(bucket, "streams/data") as reader:
+        assert(reader.read(10) == data[0:10])
+        reader.seek(5000)
+        assert(reader.read(300) == data[5000:5300])
+        assert(reader.read() == data[5300:])
+
+    # aborted writes leave the old object in place
+    with pytest.raises(KeyError):
+        with ObjectStore.open_object_writer(bucket, "streams/data") as writer:
+            writer.write(b"partial")
+            raise KeyError()
+
+    assert(ObjectStore.get_object(bucket, "streams/data") == data)
+    assert(ObjectStore.get_all_object_names(bucket, "streams/") ==
+           ["streams/data"])
+
+    with pytest.raises(ObjectStoreError):
+        ObjectStore.open_object_reader(bucket, "streams/missing")
+
+    infile = str(tmpdir.join("input"))
+    outfile = str(tmpdir.join("output"))
+
+    with open(infile, "wb") as FILE:
+        FILE.write(data)
+
+    ObjectStore.set_object_from_file(bucket, "streams/file", infile)
+    ObjectStore.get_object_as_file(bucket, "streams/file", outfile)
+    assert(open(outfile, "rb").read() == data)
+
+
+def test_multipart_writer():
+    from Acquire.ObjectStore._objstore_stream import _MultipartWriter, \
+        _open_ranged_reader
+
+    store = {}
+    uploads = {}
+
+    def _put_object(data):
+        store["object"] = data
+
+    def _start_upload():
+        uploads["upload"] = {}
+        return "upload"
+
+    def _upload_part(upload_id, part_num, data):
+        uploads[upload_id][part_num] = data
+        return "etag%d" % part_num
+
+    def _commit_upload(upload_id, parts):
+        upload = uploads.pop(upload_id)
+        store["object"] = b"".join(upload[part_num] for (part_num, _) in parts)
+
+    def _abort_upload(upload_id):
+        uploads.pop(upload_id)
+
+    def _writer():
+        return _MultipartWriter(_put_object, _start_upload, _upload_part,
+                                _commit_upload, _abort_upload, part_size=10)
+
+    with _writer() as writer:
+        writer.write(b"small")
+
+    assert(store["object"] == b"small")
+    assert(len(uploads) == 0)
+
+    data = b"0123456789" * 5 + b"abc"
+
+    with _writer() as writer:
+        writer.write(data)
+        assert(len(uploads["upload"]) == 5)
+
+    assert(store["object"] == data)
+    assert(len(uploads) == 0)
+
+    writer = _writer()
+    writer.write(data * 2)
+    writer.abort()
+
+    assert(store["object"] == data)
+    assert(len(uploads) == 0)
+
+    fetches = []
+
+    def _fetch(start, end):
+        fetches.append((start, end))
+        return data[start:end]
+
+    reader = _open_ranged_reader(len(data), _fetch)
+    reader.seek(20)
+    assert(reader.read(5) == data[20:25])
+    assert(reader.read() == data[25:])
+    assert(len(fetches) == 1)
+
+
+def test_object_range(bucket):
+    data = bytes(range(0, 256)) * 4
+
+    ObjectStore.set_object(bucket, "ranges/data", data)
+
+    assert(ObjectStore.get_object_range(bucket, "ranges/data", 0, 10) ==
+           data[0:10])
+    assert(ObjectStore.get_object_range(bucket, "ranges/data", 500, 100) ==
+           data[500:600])
+    assert(ObjectStore.get_object_range(bucket, "ranges/data", 1000) ==
+           data[1000:])
+    assert(ObjectStore.get_object_range(bucket, "ranges/data", 1000, 100) ==
+           data[1000:])
+    assert(ObjectStore.get_object_range(bucket, "ranges/data", 2000, 10) ==
+           b"")
+    assert(ObjectStore.get_object_range(bucket, "ranges/data", 10, 0) == b"")
+
+    with pytest.raises(ValueError):
+        ObjectStore.get_object_range(bucket, "ranges/data", -1, 10)
+
+    with pytest.raises(ObjectStoreError):
+        ObjectStore.get_object_range(bucket, "ranges/missing", 0, 10)
@@ -0,0 +1,143 @@
+
+import pytest
+import time
+
+from Acquire.ObjectStore import ObjectStore, ObjectStoreError, \
+    enable_object_cache, disable_object_cache, set_object_cache_policy, \
+    get_object_cache_policy, get_object_cache_statistics, clear_object_cache
+from Acquire.Service import get_service_account_bucket, \
+    push_is_running_service, pop_is_running_service
+
+
+@pytest.fixture(scope="module")
+def bucket(tmpdir_factory):
+    d = tmpdir_factory.mktemp("objstore_cache")
+    push_is_running_service()
+    bucket = get_service_account_bucket(str(d))
+    pop_is_running_service()
+
+    set_object_cache_policy("cache_test/immutable/", "immutable")
+    set_object_cache_policy("cache_test/ttl/", "ttl", ttl=0.3)
+    set_object_cache_policy("cache_test/*/private", "no_cache")
+    enable_object_cache(max_bytes=1024, negative_ttl=60)
+
+    yield bucket
+
+    disable_object_cache()
+
+    for prefix in ["cache_test/immutable/", "cache_test/ttl/",
+                   "cache_test/*/private"]:
+        set_object_cache_policy(prefix, None)
+
+
+def _write_behind_cache(bucket, key, data):
+    """Change an object without going through ObjectStore, as
+       if it was written by another process
+    """
+    with open("%s/%s._data" % (bucket, key), "wb") as FILE:
+        FILE.write(data)
+
+
+def test_object_cache_policies(bucket):
+    assert(get_object_cache_policy("cache_test/immutable/a") ==
+           ("immutable", None))
+    assert(get_object_cache_policy("cache_test/ttl/private") ==
+           ("no_cache", None))
+    assert(get_object_cache_policy("accounting/accounts/abc/txns/x") ==
+           ("immutable", None))
+    assert(get_object_cache_policy("accounting/accounts/abc/balance/x") ==
+           ("no_cache", None))
+    assert(get_object_cache_policy("accounting/accounts/abc") ==
+           ("ttl", 10))
+
+    # all of the other (mutable) keys of an account are never cached
+    for balance in ["running_balance", "compacted_balance",
+                    "daily_balance/2026-10", "monthly_balance/2026",
+                    "some_new_key"]:
+        assert(get_object_cache_policy("accounting/accounts/abc/%s" %
+                                       balance) == ("no_cache", None))
+    assert(get_object_cache_policy("some/other/key") == ("no_cache", None))
+
+    with pytest.raises(ValueError):
+        set_object_cache_policy("cache_test/", "sometimes")
+
+    with pytest.raises(ValueError):
+        set_object_cache_policy("cache_test/", "ttl")
+
+
+def test_object_cache(bucket):
+    clear_object_cache()
+
+    ObjectStore.set_object(bucket, "cache_test/immutable/a", b"a")
+    ObjectStore.set_object(bucket, "cache_test/ttl/b", b"b")
+    ObjectStore.set_object(bucket, "cache_test/ttl/private", b"c")
+
+    for i in range(0, 3):
+        assert(ObjectStore.get_object(bucket, "cache_test/immutable/a") ==
+               b"a")
+        assert(ObjectStore.get_string_object(bucket, "cache_test/ttl/b") ==
+               "b")
+        assert(ObjectStore.get_object(bucket, "cache_test/ttl/private") ==
+               b"c")
+
+    stats = get_object_cache_statistics()
+    assert(stats["misses"] == 2)
+    assert(stats["hits"] == 4)
+    assert(stats["uncached"] == 3)
+
+    # writes through ObjectStore invalidate the cache
+    ObjectStore.set_object(bucket, "cache_test/immutable/a", b"A")
+    assert(ObjectStore.get_object(bucket, "cache_test/immutable/a") == b"A")
+
+    # writes by others are only seen once the TTL has expired
+    _write_behind_cache(bucket, "cache_test/ttl/b", b"B")
+    _write_behind_cache(bucket, "cache_test/immutable/a", b"AA")
+    assert(ObjectStore.get_object(bucket, "cache_test/ttl/b") == b"b")
+    time.sleep(0.35)
+    assert(ObjectStore.get_object(bucket, "cache_test/ttl/b") == b"B")
+    assert(ObjectStore.get_object(bucket, "cache_test/immutable/a") == b"A")
+
+    # missing keys are cached until they are written
+    with pytest.raises(ObjectStoreError):
+        ObjectStore.get_object(bucket, "cache_test/immutable/missing")
+
+    with pytest.raises(ObjectStoreError):
+        ObjectStore.get_object(bucket, "cache_test/immutable/missing")
+
+    assert(get_object_cache_statistics()["negative_hits"] == 1)
+
+    ObjectStore.set_object(bucket, "cache_test/immutable/missing", b"m")
+    assert(ObjectStore.get_object(bucket, "cache_test/immutable/missing") ==
+           b"m")
+
+    ObjectStore.delete_object(bucket, "cache_test/immutable/missing")
+
+    with pytest.raises(ObjectStoreError):
+        ObjectStore.get_object(bucket, "cache_test/immutable/missing")
+
+    ObjectStore.delete_all_objects(bucket, "cache_test/")
+    assert(get_object_cache_statistics()["entries"] == 0)
+
+
+def test_object_cache_eviction(bucket):
+    clear_object_cache()
+
+    data = b"x" * 200
+
+    for i in range(0, 10):
+        ObjectStore.set_object(bucket, "cache_test/immutable/%d" % i, data)
+        ObjectStore.get_object(bucket, "cache_test/immutable/%d" % i)
+
+    stats = get_object_cache_statistics()
+    assert(stats["bytes"] <= 1024)
+    assert(stats["evictions"] > 0)
+
+    # the most recently used object is still cached
+    hits = stats["hits"]
+    ObjectStore.get_object(bucket, "cache_test/immutable/9")
+    assert(get_object_cache_statistics()["hits"] == hits + 1)
+
+    # objects that are too large are never cached
+    ObjectStore.set_object(bucket, "cache_test/immutable/big", data * 10)
+    ObjectStore.get_object(bucket, "cache_test/immutable/big")
+    assert(get_object_cache_statistics()["bytes"] <= 1024)
@@ -110,3 +110,184 @@ def test_par(bucket):
         value = par.read(privkey).get_string_object()
 
         assert(keyvals[key] == value)
+
+
+def test_par_encrypted_stream(bucket, tmpdir):
+    import os
+    from Acquire.Crypto import SymmetricKey
+
+    privkey = get_private_key()
+    pubkey = privkey.public_key()
+
+    key = "stream/" + str(uuid.uuid4())
+    ObjectStore.set_string_object(bucket, key, "placeholder")
+
+    par = ObjectStore.create_par(bucket, key=key, readable=True,
+                                 writeable=True, duration=60,
+                                 encrypt_key=pubkey)
+
+    data = os.urandom(100000)
+    infile = str(tmpdir.join("input"))
+    outfile = str(tmpdir.join("output"))
+
+    with open(infile, "wb") as FILE:
+        FILE.write(data)
+
+    data_key = SymmetricKey()
+
+    par.write(privkey).set_object_from_file(infile, data_key=data_key)
+
+    # the object is only stored encrypted
+    assert(ObjectStore.get_object(bucket, key) != data)
+
+    par.read(privkey).get_object_as_file(outfile, data_key=data_key)
+
+    with open(outfile, "rb") as FILE:
+        assert(FILE.read() == data)
+
+
+def test_par_multipart_upload(bucket, tmpdir, monkeypatch):
+    import os
+    from Acquire.Client import PARWriteError
+    from Acquire.ObjectStore import set_par_upload_options, \
+        get_par_upload_options
+    from Acquire.ObjectStore._ospar_upload import _LocalMultipartUpload
+
+    privkey = get_private_key()
+    pubkey = privkey.public_key()
+
+    key = "multipart/" + str(uuid.uuid4())
+    ObjectStore.set_string_object(bucket, key, "placeholder")
+
+    par = ObjectStore.create_par(bucket, key=key, readable=True,
+                                 writeable=True, duration=60,
+                                 encrypt_key=pubkey)
+
+    data = os.urandom(100000)
+    infile = str(tmpdir.join("input"))
+
+    with open(infile, "wb") as FILE:
+        FILE.write(data)
+
+    options = get_par_upload_options()
+
+    try:
+        set_par_upload_options(multipart_threshold=1000, part_size=10000,
+                               workers=4, max_retries=0,
+                               state_dir=str(tmpdir.join("state")))
+
+        # fail the upload of one of the parts
+        upload_part = _LocalMultipartUpload.upload_part
+        uploaded = []
+
+        def _failing_upload_part(self, part_num, data, md5):
+            if part_num == 5:
+                raise IOError("Network failure")
+
+            uploaded.append(part_num)
+            return upload_part(self, part_num, data, md5)
+
+        monkeypatch.setattr(_LocalMultipartUpload, "upload_part",
+                            _failing_upload_part)
+
+        with pytest.raises(PARWriteError):
+            par.write(privkey).set_object_from_file(infile)
+
+        assert(sorted(uploaded) == [1, 2, 3, 4, 6, 7, 8, 9, 10])
+        assert(ObjectStore.get_string_object(bucket, key) == "placeholder")
+
+        # resuming the upload only uploads the missing part
+        def _counting_upload_part(self, part_num, data, md5):
+            uploaded.append(part_num)
+            return upload_part(self, part_num, data, md5)
+
+        monkeypatch.setattr(_LocalMultipartUpload, "upload_part",
+                            _counting_upload_part)
+        uploaded.clear()
+
+        par.write(privkey).set_object_from_file(infile)
+
+        assert(uploaded == [5])
+        assert(ObjectStore.get_object(bucket, key) == data)
+        assert(os.listdir(str(tmpdir.join("state"))) == [])
+
+        # parts that fail are retried
+        failures = []
+
+        def _flaky_upload_part(self, part_num, data, md5):
+            if part_num not in failures:
+                failures.append(part_num)
+                raise IOError("Network failure")
+
+            return upload_part(self, part_num, data, md5)
+
+        monkeypatch.setattr(_LocalMultipartUpload, "upload_part",
+                            _flaky_upload_part)
+        set_par_upload_options(max_retries=1)
+
+        data = os.urandom(50000)
+
+        with open(infile, "wb") as FILE:
+            FILE.write(data)
+
+        par.write(privkey).set_object_from_file(infile)
+
+        assert(sorted(failures) == [1, 2, 3, 4, 5])
+        assert(ObjectStore.get_object(bucket, key) == data)
+
+        # an upload that cannot be resumed because the part size has
+        # changed is aborted, rather than left behind
+        monkeypatch.setattr(_LocalMultipartUpload, "upload_part",
+                            _failing_upload_part)
+        set_par_upload_options(max_retries=0)
+
+        with pytest.raises(PARWriteError):
+            par.write(privkey).set_object_from_file(infile)
+
+        aborted = []
+        abort = _LocalMultipartUpload.abort
+
+        def _counting_abort(self):
+            aborted.append(self._upload_dir)
+            return abort(self)
+
+        monkeypatch.setattr(_LocalMultipartUpload, "upload_part",
+                            upload_part)
+        monkeypatch.setattr(_LocalMultipartUpload, "abort", _counting_abort)
+        set_par_upload_options(part_size=20000)
+
+        par.write(privkey).set_object_from_file(infile)
+
+        assert(len(aborted) == 1)
+        assert(not os.path.exists(aborted[0]))
+        assert(ObjectStore.get_object(bucket, key) == data)
+    finally:
+        set_par_upload_options(**options)
+
+
+def test_par_resumable_url():
+    privkey = get_private_key()
+    pubkey = privkey.public_key()
+
+    expires = datetime.datetime.now(datetime.timezone.utc) + \
+        datetime.timedelta(seconds=3600)
+
+    par = OSPar(url="https://example.com/object", key="object",
+                encrypt_key=pubkey, expires_datetime=expires,
+                is_writeable=True,
+                resumable_url="https://example.com/object?resumable")
+
+    assert(par.url(privkey) == "https://example.com/object")
+    assert(par.resumable_url(privkey) ==
+           "https://example.com/object?resumable")
+
+    par = OSPar.from_data(par.to_data())
+    assert(par.resumable_url(privkey) ==
+           "https://example.com/object?resumable")
+
+    par = OSPar(url="https://example.com/object", key="object",
+                encrypt_key=pubkey, expires_datetime=expires,
+                is_writeable=True)
+
+    assert(par.resumable_url(privkey) is None)
+    assert("resumable_url" not in par.to_data())
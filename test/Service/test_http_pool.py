@@ -0,0 +1,138 @@
+import pytest
+import threading
+import asyncio
+import requests
+
+import Acquire.Stubs
+
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+from Acquire.Service import http_get, http_post, clear_http_pool, \
+    get_http_pool_statistics, set_http_pool_options, get_http_pool_options, \
+    ahttp_post, aclose_http_pool
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _EchoHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _reply(self, data):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._reply(b"hello")
+
+    def do_POST(self):
+        length = int(self.headers["Content-Length"])
+        self._reply(self.rfile.read(length))
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def server_url():
+    server = _ThreadingHTTPServer(("127.0.0.1", 0), _EchoHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:%d" % server.server_port
+    server.shutdown()
+
+
+def test_http_pool(server_url, monkeypatch):
+    # make sure we use the real requests rather than the mocked version
+    monkeypatch.setattr(Acquire.Stubs, "requests", requests)
+    clear_http_pool()
+
+    for i in range(0, 5):
+        response = http_post("%s/function" % server_url,
+                             data=b"message %d" % i, timeout=10)
+        assert(response.status_code == 200)
+        assert(response.content == b"message %d" % i)
+
+    response = http_get(server_url, timeout=10)
+    assert(response.content == b"hello")
+
+    stats = get_http_pool_statistics()[server_url]
+
+    assert(stats["requests"] == 6)
+    assert(stats["new_connections"] == 1)
+    assert(stats["reused_connections"] == 5)
+
+    clear_http_pool()
+    assert(len(get_http_pool_statistics()) == 0)
+
+
+def test_async_http_pool(server_url, monkeypatch):
+    monkeypatch.setattr(Acquire.Stubs, "requests", requests)
+
+    async def _post_all():
+        try:
+            return await asyncio.gather(
+                *[ahttp_post("%s/function" % server_url,
+                             data=b"message %d" % i, timeout=10)
+                  for i in range(0, 20)])
+        finally:
+            await aclose_http_pool()
+
+    loop = asyncio.new_event_loop()
+    try:
+        responses = loop.run_until_complete(_post_all())
+    finally:
+        loop.close()
+
+    for i, response in enumerate(responses):
+        assert(response.status_code == 200)
+        assert(response.content == b"message %d" % i)
+
+
+def test_async_http_pool_closes(server_url, monkeypatch):
+    from Acquire.Service import _http_pool
+
+    monkeypatch.setattr(Acquire.Stubs, "requests", requests)
+
+    sessions = []
+
+    async def _post():
+        response = await ahttp_post("%s/function" % server_url,
+                                    data=b"message", timeout=10)
+        sessions.append(_http_pool._get_async_state()["session"])
+        return response
+
+    async def _post_all():
+        # the session is shared by the requests in flight, and is
+        # closed without calling aclose_http_pool
+        responses = await asyncio.gather(*[_post() for i in range(0, 5)])
+        assert(_http_pool._get_async_state()["session"] is None)
+        return responses
+
+    loop = asyncio.new_event_loop()
+    try:
+        responses = loop.run_until_complete(_post_all())
+    finally:
+        loop.close()
+
+    assert([r.content for r in responses] == [b"message"] * 5)
+    assert(all(session is None or session.closed for session in sessions))
+
+
+def test_http_pool_options():
+    old = get_http_pool_options()
+
+    set_http_pool_options(pool_size=4, max_retries=1)
+    options = get_http_pool_options()
+    assert(options["pool_size"] == 4)
+    assert(options["max_retries"] == 1)
+
+    with pytest.raises(ValueError):
+        set_http_pool_options(pool_size=0)
+
+    set_http_pool_options(pool_size=old["pool_size"],
+                          max_retries=old["max_retries"])
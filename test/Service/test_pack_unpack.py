@@ -4,7 +4,7 @@ import pytest
 from Acquire.Crypto import PrivateKey, get_private_key
 from Acquire.Service import pack_arguments, unpack_arguments
 from Acquire.Service import pack_return_value, unpack_return_value
-from Acquire.Service import create_return_value
+from Acquire.Service import create_return_value, is_binary_wire_format
 from Acquire.ObjectStore import string_to_bytes, bytes_to_string
 
 import random
@@ -99,3 +99,60 @@ def test_pack_unpack_args_returnvals():
     with pytest.raises(PermissionError):
         result = unpack_return_value(function=func, return_value=packed_result,
                                      key=privkey, public_cert=pubkey)
+
+
+def test_pack_unpack_binary_wire_format():
+    privkey = get_private_key("testing")
+    pubkey = privkey.public_key()
+
+    # dicts that look like blob references are sent as they are
+    args = {"message": "Hello, this is a message",
+            "chunk": b"\x00\xff binary data \xfe" * 100,
+            "chunks": [b"one", b"two"],
+            "lookalikes": [{"_acquire_blob": 0},
+                           {"_acquire_blob": "0"},
+                           {"_acquire_blob": "0000000000000000:0"},
+                           {"_acquire_blob": 1, "other": b"three"}]}
+
+    func = "test_function"
+
+    packed = pack_arguments(function=func, args=args, wire_format="binary")
+
+    assert(is_binary_wire_format(packed))
+
+    (f, unpacked, keys) = unpack_arguments(args=packed)
+
+    assert(f == func)
+    assert(unpacked == args)
+
+    packed = pack_arguments(function=func, args=args,
+                            key=pubkey, response_key=pubkey,
+                            public_cert=pubkey, wire_format="binary")
+
+    assert(is_binary_wire_format(packed))
+
+    (f, unpacked, keys) = unpack_arguments(function=func, args=packed,
+                                           key=privkey)
+
+    assert(unpacked == args)
+
+    return_value = create_return_value({"chunk": args["chunk"]})
+
+    packed_result = pack_return_value(function=func,
+                                      payload=return_value, key=keys,
+                                      private_cert=privkey,
+                                      wire_format="binary")
+
+    result = unpack_return_value(return_value=packed_result,
+                                 key=privkey, public_cert=pubkey)
+
+    assert(result["chunk"] == args["chunk"])
+
+    # the json wire format sends bytes as base64 strings
+    packed = pack_arguments(function=func, args=args, wire_format="json")
+
+    assert(not is_binary_wire_format(packed))
+
+    (f, unpacked, keys) = unpack_arguments(args=packed)
+
+    assert(string_to_bytes(unpacked["chunk"]) == args["chunk"])
@@ -21,3 +21,61 @@ def test_filehandle():
     assert(f1.local_filedata() == f2.local_filedata())
     assert(f1.fingerprint() == f2.fingerprint())
     assert(f1.drive_uid() == f2.drive_uid())
+
+
+@pytest.mark.parametrize("compression_type", ["bz2", "zlib", "zstd", "lz4"])
+def test_filehandle_compression(compression_type):
+    from Acquire.Client import list_codecs
+
+    if compression_type not in list_codecs():
+        pytest.skip("The %s codec is not installed" % compression_type)
+
+    filename = __file__
+
+    f = FileHandle(filename=filename, drive_uid="test_uid",
+                   compression_type=compression_type)
+
+    assert(f.is_compressed())
+    assert(f.compression_type() == compression_type)
+    assert(f.local_filedata(decompress=True) == open(filename, "rb").read())
+
+    f = FileHandle(filename=filename, drive_uid="test_uid",
+                   compression_type="none")
+
+    assert(not f.is_compressed())
+    assert(f.local_filedata() == open(filename, "rb").read())
+
+
+def test_filehandle_adaptive_compression(tmpdir):
+    import os
+    from Acquire.Client import choose_compression
+
+    random_file = str(tmpdir.join("random.dat"))
+    with open(random_file, "wb") as FILE:
+        FILE.write(os.urandom(300000))
+
+    f = FileHandle(filename=random_file, drive_uid="test_uid")
+    assert(not f.is_compressed())
+    assert(f.compression_decision() == "incompressible")
+    assert(f.compression_ratio() > 0.95)
+
+    png_file = str(tmpdir.join("image.png"))
+    with open(png_file, "wb") as FILE:
+        FILE.write(b"\x89PNG\r\n\x1a\n" + b"x" * 1000)
+
+    f = FileHandle(filename=png_file, drive_uid="test_uid")
+    assert(not f.is_compressed())
+    assert(f.compression_decision() == "already_compressed")
+
+    f = FileHandle(filename=__file__, drive_uid="test_uid")
+    assert(f.is_compressed())
+    assert(f.compression_decision() == "compressed")
+    assert(f.compression_ratio() < 0.7)
+
+    f2 = FileHandle.from_data(f.to_data())
+    assert(f2.compression_decision() == f.compression_decision())
+    assert(f2.compression_ratio() == f.compression_ratio())
+
+    decision = choose_compression(data=b"tiny")
+    assert(decision["compression_type"] == "none")
+    assert(decision["decision"] == "too_small")
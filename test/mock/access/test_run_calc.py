@@ -4,6 +4,7 @@ from Acquire.Identity import Authorisation
 from Acquire.Client import Account, deposit, Cheque, Service, \
                            Drive, StorageCreds
 from Acquire.Compute import Cluster
+from Acquire.Accounting import TransactionCode
 
 import pytest
 
@@ -33,6 +34,14 @@ def test_run_calc(aaai_services, authenticated_user):
 
     assert(account.balance() >= 100.0)
 
+    # the deposit is on the account statement, which is paged
+    statement = list(account.statement())
+    assert(len(statement) > 0)
+    assert(list(account.statement(page_size=1)) == statement)
+
+    credits = list(account.statement(codes=[TransactionCode.CREDIT]))
+    assert(credits == [t for t in statement if t.is_credit()])
+
     # Upload a directory that will contain all of the input
     creds = StorageCreds(user=user, service_url="storage")
     drive = Drive(name="sim", creds=creds, autocreate=True)
@@ -54,3 +54,15 @@ def test_service(service_url, aaai_services):
 
     service.call_function(
         function="dump_keys", args={"authorisation": auth.to_data()})
+
+    # now call several functions in a single batch request
+    results = service.call_batch_function(
+                        [("admin/test", None),
+                         ("no_such_function", {}),
+                         (None, None)])
+
+    assert(len(results) == 3)
+    assert("service" in results[0])
+    assert(isinstance(results[1], LookupError))
+    assert(Service.from_data(results[2]["service_info"]).uid() ==
+           service.uid())
@@ -65,11 +65,11 @@ class MockedRequests:
         self.encoding = encoding
 
     @staticmethod
-    def get(url, data, timeout=None):
+    def get(url, data, headers=None, timeout=None):
         return MockedRequests._perform(url, data, is_post=False)
 
     @staticmethod
-    def post(url, data, timeout=None):
+    def post(url, data, headers=None, timeout=None):
         return MockedRequests._perform(url, data, is_post=True)
 
     @staticmethod
@@ -26,7 +26,9 @@ def test_chunking(authenticated_user, tempdir):
     uploader = drive.chunk_upload("test_chunking.py")
 
     uploader.upload("This is some text\n")
+    uploader.set_compression("zlib")
     uploader.upload("Here is")
+    uploader.set_compression("none")
     uploader.upload(" some more!\n")
 
     uploader.close()
@@ -54,3 +56,101 @@ def test_chunking(authenticated_user, tempdir):
 
     assert(lines[0] == "This is some text\n")
     assert(lines[1] == "Here is some more!\n")
+
+
+def test_parallel_chunking(authenticated_user, tempdir):
+    import os
+    from Acquire.Client import ParallelChunkUploader, \
+        ParallelChunkDownloader
+
+    drive_name = "test_parallel_chunking"
+    creds = StorageCreds(user=authenticated_user, service_url="storage")
+
+    drive = Drive(name=drive_name, creds=creds)
+
+    local = os.path.join(tempdir, "parallel_input")
+
+    with open(local, "w") as FILE:
+        for i in range(0, 1000):
+            FILE.write("This is line %d of the file\n" % i)
+
+    # a single worker, as the mocked services are not thread-safe
+    uploader = drive.chunk_upload("parallel.txt", workers=1)
+
+    assert(isinstance(uploader, ParallelChunkUploader))
+
+    uploader.upload_file(local, chunk_size=4096)
+    uploader.close()
+
+    filename = drive.download("parallel.txt", dir=tempdir)
+
+    assert(_same_file(local, filename))
+
+    downloader = drive.chunk_download("parallel.txt", dir=tempdir, workers=1)
+
+    assert(isinstance(downloader, ParallelChunkDownloader))
+
+    filename = downloader.download()
+
+    assert(not downloader.is_open())
+    assert(_same_file(local, filename))
+
+
+def test_read_range(authenticated_user, tempdir, monkeypatch):
+    import os
+    from Acquire.Client import File
+
+    downloads = []
+    read_from_download = File._read_from_download
+
+    def _read_from_download(self, *args, **kwargs):
+        downloads.append(self.metadata().name())
+        return read_from_download(self, *args, **kwargs)
+
+    monkeypatch.setattr(File, "_read_from_download", _read_from_download)
+
+    drive_name = "test_read_range"
+    creds = StorageCreds(user=authenticated_user, service_url="storage")
+
+    drive = Drive(name=drive_name, creds=creds)
+
+    data = "".join("This is line %d of the file\n" % i
+                   for i in range(0, 1000)).encode("utf-8")
+
+    local = os.path.join(tempdir, "read_range_input")
+
+    with open(local, "wb") as FILE:
+        FILE.write(data)
+
+    # an uncompressed file is read directly from the object store
+    filemeta = drive.upload(local, uploaded_name="plain.txt",
+                            compression_type="none")
+    f = filemeta.open()
+
+    assert(f.read(100, 50) == data[100:150])
+    assert(f.read(len(data) - 10) == data[-10:])
+    assert(f.read(len(data) + 10, 10) == b"")
+
+    # a file compressed as a single object is downloaded in full
+    filemeta = drive.upload(local, uploaded_name="compressed.txt")
+    f = filemeta.open()
+
+    assert(f.read(100, 50) == data[100:150])
+
+    # a chunked file only transfers the chunks that overlap the range
+    uploader = drive.chunk_upload("chunked.txt")
+
+    for i in range(0, len(data), 4096):
+        uploader.upload(data[i:i+4096])
+
+    uploader.close()
+
+    filemeta = drive.list_files(filename="chunked.txt")[0]
+    f = filemeta.open()
+
+    assert(f.read(4000, 200) == data[4000:4200])
+    assert(f.read(10000, 20000) == data[10000:30000])
+    assert(f.read(len(data) - 5) == data[-5:])
+    assert(f.read() == data)
+
+    assert(downloads == ["compressed.txt"])
@@ -2,6 +2,7 @@
 
 import pytest
 import os
+import asyncio
 
 from Acquire.Client import Drive, StorageCreds, ACLRules
 from Acquire.ObjectStore import OSPar
@@ -100,6 +101,26 @@ def test_drives(authenticated_user, tempdir):
 
     assert(data1 == data2)
 
+    # the asynchronous API should give the same results
+    loop = asyncio.new_event_loop()
+    try:
+        afiles = loop.run_until_complete(
+                        drive.alist_files(include_metadata=True))
+        assert(len(afiles) == 1)
+        assert(afiles[0].uid() == filemeta.uid())
+
+        filename = loop.run_until_complete(
+                        afiles[0].open().adownload(dir=tempdir))
+    finally:
+        loop.close()
+
+    with open(filename, "rb") as FILE:
+        data1 = FILE.read()
+
+    os.unlink(filename)
+
+    assert(data1 == data2)
+
     assert(files[0].uid() == filemeta.uid())
     assert(files[0].filesize() == filemeta.filesize())
     assert(files[0].checksum() == filemeta.checksum())